@@ -156,3 +156,66 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+
+# Columnar storage for datasets uploaded to the stats app
+STATS_DATASET_ROOT = os.path.join(BASE_DIR, 'dataset_store')
+# Memory ceiling for decoded dataset columns kept in each worker process
+STATS_DATAFRAME_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Upload ingestion: rows read per chunk, and the highest distinct/rows ratio
+# for which a text column is stored as a pandas category
+STATS_INGEST_CHUNK_ROWS = 100000
+STATS_INGEST_CATEGORY_MAX_RATIO = 0.5
+# Per-column plot generation pool: 'thread' or 'process', and its size
+# (1 builds plots in the request thread). Every web worker gets its own pool;
+# with 'process' each pool child re-imports Django, pandas and Plotly (well
+# over 100 MB apiece), so only choose it when few workers serve the stats pages
+STATS_PLOT_EXECUTOR = 'thread'
+STATS_PLOT_WORKERS = 4
+# Serialized figure cache: in-memory budget per process, spillover directory
+# (None keeps figures in memory only) and its disk budget
+STATS_PLOT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+STATS_PLOT_CACHE_DIR = os.path.join(BASE_DIR, 'plot_cache')
+STATS_PLOT_CACHE_DISK_MAX_BYTES = 1024 * 1024 * 1024
+# Memory budget for cached correlation matrices in each worker process
+STATS_CORRELATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Memory budget for the distinct-value indexes behind the filter pickers
+# (including those of derived columns) in each worker process
+STATS_VALUE_INDEX_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Memory budget for the filter masks shared by requests on the same dataset
+# in each worker process
+STATS_TERM_MASK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Row sampling for comparison charts: sample size, rows guaranteed to each
+# category when stratifying, and the seed that keeps samples reproducible
+STATS_SAMPLE_MAX_ROWS = 100000
+STATS_SAMPLE_MIN_PER_STRATUM = 50
+STATS_SAMPLE_SEED = 42
+# Background insight jobs: jobs run at once per web process, and the silence
+# (in seconds) after which a pending or running job is considered lost
+STATS_JOB_WORKERS = 2
+STATS_JOB_STALE_SECONDS = 600
+# Language model used for dataset insights and the analysis chat: client
+# ('openrouter', 'stub' for offline use, or the dotted path of a client
+# factory), endpoint, key and model, and how long (seconds) and within what
+# memory budget answers are cached per dataset
+STATS_LLM_CLIENT = 'openrouter'
+STATS_LLM_BASE_URL = 'https://openrouter.ai/api/v1'
+STATS_LLM_API_KEY = env('api_key', default=None)
+STATS_LLM_MODEL = 'deepseek/deepseek-r1-zero:free'
+STATS_LLM_CACHE_TTL = 24 * 60 * 60
+STATS_LLM_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# Analysis chat: token budget of the dataset description sent with every
+# message, recent messages sent verbatim, length of the summary of older
+# messages, and idle days after which stored conversations are deleted
+STATS_CHAT_CONTEXT_MAX_TOKENS = 1500
+STATS_CHAT_MAX_MESSAGES = 8
+STATS_CHAT_SUMMARY_MAX_CHARS = 2000
+STATS_CHAT_RETENTION_DAYS = 7
+# Analysis backend of the filter view: 'memory' (pandas), 'sqlite' (an
+# indexed SQLite copy of the dataset, queried out of memory) or 'auto', which
+# uses SQLite from STATS_SQL_MIN_ROWS rows; columns indexed in the SQLite copy
+STATS_ANALYSIS_BACKEND = 'auto'
+STATS_SQL_MIN_ROWS = 1000000
+STATS_SQL_INDEXED_COLUMNS = 64
+
+# Rows read per chunk when exporting a dataset (CSV / Excel / Parquet)
+STATS_EXPORT_CHUNK_ROWS = 50000
@@ -1,6 +1,7 @@
-from django.db import connection
+from django.db import connection, transaction
 import json
 from .models import CustomForm
+from .form_stats import record_added, record_removed
 
 
 def table_exists(table_name):
@@ -130,6 +131,15 @@ def get_form(form_name):
         return cursor.fetchall()
 
 
+def count_records(form_name):
+    """Number of records submitted to a form, counted in SQL."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM `{form_name}`"
+        )
+        return cursor.fetchone()[0]
+
+
 
 def delete_form(form_name):
     with connection.cursor() as cursor:
@@ -147,12 +157,15 @@ def insert_record_with_fields(table_name, fields, values):
         fields (list): List of field names
         values (list): List of values corresponding to fields
     """
-    with connection.cursor() as cursor:
+    with transaction.atomic(), connection.cursor() as cursor:
         fields_str = ', '.join(fields)
         placeholders = ', '.join(['%s'] * len(fields))
         
         sql = f"INSERT INTO `{table_name}` ({fields_str}) VALUES ({placeholders})"
         cursor.execute(sql, values)
+
+        # Keep the form's running statistics in step with its table
+        record_added(table_name, cursor.lastrowid)
         
         return True
 
@@ -166,7 +179,8 @@ def add_record(form_name, records: list):
 
 
 def remove_record(form_name, record_id):
-    with connection.cursor() as cursor:
+    with transaction.atomic(), connection.cursor() as cursor:
+        record_removed(form_name, record_id)
         cursor.execute(
             f"DELETE FROM `{form_name}` WHERE id = %s",
             [record_id]
@@ -0,0 +1,261 @@
+"""
+Running statistics of form submissions.
+
+Each submission updates the statistics of its form as it is inserted: the
+record count, submissions per day, the count and sums of every numeric
+field and the value frequencies of the other fields. Reading them costs a
+few small queries whatever the number of records, so the form pages can
+show live statistics without scanning the form table.
+
+Forms whose statistics were never computed (created before they existed)
+are rebuilt from their table once, on first use.
+"""
+import math
+from datetime import date
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import CustomForm, FormStatistics, FormFieldStatistics, FormValueCount, FormDailyCount
+
+# Declared column types whose values are summed
+NUMERIC_TYPES = ('INTEGER', 'DECIMAL', 'BOOLEAN')
+# Declared column types whose value frequencies are counted (in addition to the non-numeric ones)
+COUNTED_NUMERIC_TYPES = ('BOOLEAN',)
+# Most frequent values reported per field
+TOP_VALUES = 5
+# Days of submission counts reported
+RECENT_DAYS = 30
+
+
+def _field_types(cursor, form_name):
+    """Declared type of each field of a form table, without ``id`` and ``created_at``."""
+    cursor.execute(f"PRAGMA table_info(`{form_name}`)")
+    return {
+        column[1]: column[2].upper().split('(')[0]
+        for column in cursor.fetchall()
+        if column[1] not in ('id', 'created_at')
+    }
+
+
+def _is_numeric(declared):
+    return declared in NUMERIC_TYPES
+
+
+def _is_counted(declared):
+    return not _is_numeric(declared) or declared in COUNTED_NUMERIC_TYPES
+
+
+def _value_key(value):
+    """Text a value is counted under."""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return str(value)
+
+
+def _increment(model, lookup, defaults, **changes):
+    """Add ``changes`` to the counters of the row matching ``lookup``, creating it from ``defaults``."""
+    if not model.objects.filter(**lookup).update(**{name: F(name) + change for name, change in changes.items()}):
+        model.objects.create(**lookup, **defaults)
+
+
+def _apply_record(form, field_types, record, sign):
+    """Add (``sign`` 1) or remove (``sign`` -1) one stored record to the statistics of ``form``."""
+    FormStatistics.objects.filter(form=form).update(row_count=F('row_count') + sign)
+
+    created_at = record.get('created_at')
+    if created_at:
+        day = date.fromisoformat(str(created_at)[:10])
+        if sign > 0:
+            _increment(FormDailyCount, {'form': form, 'day': day}, {'count': 1}, count=1)
+        else:
+            FormDailyCount.objects.filter(form=form, day=day).update(count=F('count') - 1)
+
+    for field, declared in field_types.items():
+        value = record.get(field)
+        if value is None:
+            continue
+        if _is_numeric(declared) and isinstance(value, (int, float)):
+            stats = FormFieldStatistics.objects.filter(form=form, field=field).first()
+            if stats is None:
+                if sign > 0:
+                    FormFieldStatistics.objects.create(form=form, field=field, count=1, shift=float(value))
+            else:
+                delta = float(value) - stats.shift
+                FormFieldStatistics.objects.filter(pk=stats.pk).update(
+                    count=F('count') + sign,
+                    total=F('total') + sign * delta,
+                    total_squares=F('total_squares') + sign * delta * delta,
+                )
+        if _is_counted(declared):
+            lookup = {'form': form, 'field': field, 'value': _value_key(value)}
+            if sign > 0:
+                _increment(FormValueCount, lookup, {'count': 1}, count=1)
+            else:
+                FormValueCount.objects.filter(**lookup).update(count=F('count') - 1)
+                FormValueCount.objects.filter(**lookup, count__lte=0).delete()
+
+
+def _read_record(cursor, form_name, record_id):
+    cursor.execute(f"SELECT * FROM `{form_name}` WHERE id = %s", [record_id])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+
+def _get_form(form_name):
+    return CustomForm.objects.filter(name=form_name).order_by('id').first()
+
+
+def record_added(form_name, record_id):
+    """
+    Add a record that was just inserted into a form table to the form's statistics.
+
+    Call it in the transaction of the insert, so concurrent submissions are
+    counted one after the other.
+
+    Args:
+        form_name (str): The form (table) name
+        record_id (int): ``id`` of the new record
+    """
+    form = _get_form(form_name)
+    if form is None:
+        return
+    if not FormStatistics.objects.filter(form=form).exists():
+        # Also counts the new record
+        rebuild_form_statistics(form)
+        return
+    with connection.cursor() as cursor:
+        record = _read_record(cursor, form_name, record_id)
+        if record is not None:
+            _apply_record(form, _field_types(cursor, form_name), record, 1)
+
+
+def record_removed(form_name, record_id):
+    """
+    Remove a record about to be deleted from a form table from the form's statistics.
+
+    Args:
+        form_name (str): The form (table) name
+        record_id (int): ``id`` of the record, which must still exist
+    """
+    form = _get_form(form_name)
+    if form is None or not FormStatistics.objects.filter(form=form).exists():
+        return
+    with connection.cursor() as cursor:
+        record = _read_record(cursor, form_name, record_id)
+        if record is not None:
+            _apply_record(form, _field_types(cursor, form_name), record, -1)
+
+
+def rebuild_form_statistics(form):
+    """
+    Recompute the statistics of a form from its table, with aggregate queries.
+
+    Args:
+        form (CustomForm): The form
+    """
+    form_name = form.name
+    with transaction.atomic(), connection.cursor() as cursor:
+        FormStatistics.objects.filter(form=form).delete()
+        FormFieldStatistics.objects.filter(form=form).delete()
+        FormValueCount.objects.filter(form=form).delete()
+        FormDailyCount.objects.filter(form=form).delete()
+
+        field_types = _field_types(cursor, form_name)
+        cursor.execute(f"SELECT COUNT(*) FROM `{form_name}`")
+        row_count = cursor.fetchone()[0]
+
+        cursor.execute(
+            f"SELECT date(created_at) AS day, COUNT(*) FROM `{form_name}` "
+            f"WHERE created_at IS NOT NULL GROUP BY day"
+        )
+        FormDailyCount.objects.bulk_create([
+            FormDailyCount(form=form, day=date.fromisoformat(day), count=count)
+            for day, count in cursor.fetchall() if day
+        ])
+
+        field_statistics = []
+        for field, declared in field_types.items():
+            if _is_numeric(declared):
+                is_number = f"typeof(`{field}`) IN ('integer', 'real')"
+                # The first value is the shift, as when the statistics are built submission by submission
+                cursor.execute(f"SELECT `{field}` FROM `{form_name}` WHERE {is_number} ORDER BY id LIMIT 1")
+                first = cursor.fetchone()
+                if first is not None:
+                    shift = float(first[0])
+                    cursor.execute(
+                        f"SELECT COUNT(*), TOTAL(`{field}` - {shift!r}), "
+                        f"TOTAL((`{field}` - {shift!r}) * (`{field}` - {shift!r})) "
+                        f"FROM `{form_name}` WHERE {is_number}"
+                    )
+                    count, total, total_squares = cursor.fetchone()
+                    field_statistics.append(FormFieldStatistics(
+                        form=form, field=field, count=count, shift=shift, total=total, total_squares=total_squares
+                    ))
+            if _is_counted(declared):
+                cursor.execute(
+                    f"SELECT `{field}`, COUNT(*) FROM `{form_name}` WHERE `{field}` IS NOT NULL GROUP BY `{field}`"
+                )
+                counts = {}
+                for value, count in cursor.fetchall():
+                    # Values equal as text (1 and 1.0 in a boolean field) are counted together
+                    counts[_value_key(value)] = counts.get(_value_key(value), 0) + count
+                FormValueCount.objects.bulk_create([
+                    FormValueCount(form=form, field=field, value=value, count=count)
+                    for value, count in counts.items()
+                ])
+        FormFieldStatistics.objects.bulk_create(field_statistics)
+        FormStatistics.objects.create(form=form, row_count=row_count)
+
+
+def form_statistics(form, top=TOP_VALUES, days=RECENT_DAYS):
+    """
+    Live statistics of a form's submissions.
+
+    Args:
+        form (CustomForm): The form
+        top (int): Most frequent values reported per counted field
+        days (int): Most recent days of submission counts reported
+
+    Returns:
+        dict: ``row_count``, ``daily_counts`` (list of (ISO day, count), oldest
+        first) and ``fields``: field -> dict with ``count``, ``mean`` and
+        ``std`` for numeric fields and/or ``unique_values`` and
+        ``top_values`` (list of (value, count)) for counted ones
+    """
+    statistics = FormStatistics.objects.filter(form=form).first()
+    if statistics is None:
+        rebuild_form_statistics(form)
+        statistics = FormStatistics.objects.get(form=form)
+
+    with connection.cursor() as cursor:
+        field_types = _field_types(cursor, form.name)
+    fields = {field: {} for field in field_types}
+
+    for stats in FormFieldStatistics.objects.filter(form=form, count__gt=0):
+        if stats.field not in fields:
+            continue
+        n = stats.count
+        mean = stats.shift + stats.total / n
+        variance = max(stats.total_squares - stats.total * stats.total / n, 0.0) / (n - 1) if n > 1 else None
+        fields[stats.field].update({
+            'count': n,
+            'mean': mean,
+            'std': math.sqrt(variance) if variance is not None else None,
+        })
+
+    for field, declared in field_types.items():
+        if not _is_counted(declared):
+            continue
+        values = FormValueCount.objects.filter(form=form, field=field)
+        fields[field]['unique_values'] = values.count()
+        fields[field]['top_values'] = list(values.order_by('-count', 'value').values_list('value', 'count')[:top])
+
+    daily_counts = FormDailyCount.objects.filter(form=form, count__gt=0).order_by('-day').values_list('day', 'count')
+    return {
+        'row_count': statistics.row_count,
+        'daily_counts': [(day.isoformat(), count) for day, count in reversed(daily_counts[:days])],
+        'fields': fields,
+    }
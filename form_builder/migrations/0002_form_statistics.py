@@ -0,0 +1,129 @@
+# Generated by Django 5.1 on 2026-10-18 19:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("form_builder", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FormStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("row_count", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "form",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="statistics",
+                        to="form_builder.customform",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="FormDailyCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "form",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_counts",
+                        to="form_builder.customform",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("form", "day")},
+            },
+        ),
+        migrations.CreateModel(
+            name="FormFieldStatistics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("field", models.CharField(max_length=255)),
+                ("count", models.PositiveIntegerField(default=0)),
+                ("shift", models.FloatField(default=0)),
+                ("total", models.FloatField(default=0)),
+                ("total_squares", models.FloatField(default=0)),
+                (
+                    "form",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="field_statistics",
+                        to="form_builder.customform",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("form", "field")},
+            },
+        ),
+        migrations.CreateModel(
+            name="FormValueCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("field", models.CharField(max_length=255)),
+                ("value", models.TextField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "form",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="value_counts",
+                        to="form_builder.customform",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["form", "field", "-count"],
+                        name="form_builde_form_id_de6b57_idx",
+                    )
+                ],
+                "unique_together": {("form", "field", "value")},
+            },
+        ),
+    ]
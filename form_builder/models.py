@@ -28,3 +28,57 @@ class CustomForm(models.Model):
     def __str__(self):
         return self.name
 
+
+
+class FormStatistics(models.Model):
+    """Running statistics of a form's submissions; its presence means they are up to date"""
+    form = models.OneToOneField(CustomForm, related_name='statistics', on_delete=models.CASCADE)
+    row_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Statistics of {self.form.name}"
+
+
+class FormFieldStatistics(models.Model):
+    """Count and sums of a numeric form field; values are summed relative to ``shift`` to keep precision"""
+    form = models.ForeignKey(CustomForm, related_name='field_statistics', on_delete=models.CASCADE)
+    field = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    shift = models.FloatField(default=0)  # First value seen
+    total = models.FloatField(default=0)  # Sum of (value - shift)
+    total_squares = models.FloatField(default=0)  # Sum of (value - shift) ** 2
+
+    class Meta:
+        unique_together = [('form', 'field')]
+
+    def __str__(self):
+        return f"{self.form.name}.{self.field}"
+
+
+class FormValueCount(models.Model):
+    """Submissions of a form holding a value in a field"""
+    form = models.ForeignKey(CustomForm, related_name='value_counts', on_delete=models.CASCADE)
+    field = models.CharField(max_length=255)
+    value = models.TextField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('form', 'field', 'value')]
+        indexes = [models.Index(fields=['form', 'field', '-count'])]
+
+    def __str__(self):
+        return f"{self.form.name}.{self.field} = {self.value}"
+
+
+class FormDailyCount(models.Model):
+    """Submissions of a form per (UTC) day"""
+    form = models.ForeignKey(CustomForm, related_name='daily_counts', on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('form', 'day')]
+
+    def __str__(self):
+        return f"{self.form.name} on {self.day}"
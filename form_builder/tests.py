@@ -1,3 +1,68 @@
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from .cursor_db import insert_record_with_fields, remove_record
+from .form_stats import form_statistics, rebuild_form_statistics
+from .models import CustomForm
+
+
+class FormStatisticsTests(TestCase):
+    def setUp(self):
+        self.form = CustomForm.objects.create(name='donations')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE `donations` ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+                "amount DECIMAL(10,2), region VARCHAR(100), active BOOLEAN)"
+            )
+
+    def submit(self, amount, region, active):
+        insert_record_with_fields('donations', ['amount', 'region', 'active'], [amount, region, active])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT MAX(id) FROM `donations`")
+            return cursor.fetchone()[0]
+
+    def assertMatchesRebuild(self, statistics):
+        rebuild_form_statistics(self.form)
+        rebuilt = form_statistics(self.form)
+        self.assertEqual(statistics['row_count'], rebuilt['row_count'])
+        self.assertEqual(statistics['daily_counts'], rebuilt['daily_counts'])
+        for field, expected in rebuilt['fields'].items():
+            actual = statistics['fields'][field]
+            self.assertEqual(sorted(actual), sorted(expected), field)
+            for key, value in expected.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(actual[key], value, msg=f"{field} {key}")
+                else:
+                    self.assertEqual(actual[key], value, f"{field} {key}")
+
+    def test_statistics_follow_submissions(self):
+        self.submit(10, 'north', True)
+        self.submit(20.5, 'south', False)
+        self.submit(30, 'north', True)
+        self.submit(None, 'east', True)
+
+        statistics = form_statistics(self.form)
+
+        self.assertEqual(statistics['row_count'], 4)
+        self.assertEqual(statistics['fields']['amount']['count'], 3)
+        self.assertAlmostEqual(statistics['fields']['amount']['mean'], 20.1666666667)
+        self.assertAlmostEqual(statistics['fields']['amount']['std'], 10.0041658)
+        self.assertEqual(statistics['fields']['region']['top_values'][0], ('north', 2))
+        self.assertEqual(statistics['fields']['active']['unique_values'], 2)
+        self.assertEqual(sum(count for _, count in statistics['daily_counts']), 4)
+        self.assertMatchesRebuild(statistics)
+
+    def test_removed_records_are_taken_out(self):
+        self.submit(10, 'north', True)
+        removed = self.submit(20, 'south', False)
+        self.submit(30, 'north', True)
+
+        remove_record('donations', removed)
+
+        statistics = form_statistics(self.form)
+        self.assertEqual(statistics['row_count'], 2)
+        self.assertEqual(statistics['fields']['amount']['mean'], 20)
+        self.assertEqual(statistics['fields']['region']['top_values'], [('north', 2)])
+        self.assertEqual(statistics['fields']['region']['unique_values'], 1)
+        self.assertMatchesRebuild(statistics)
@@ -10,6 +10,7 @@ from django.urls import reverse_lazy
 from django.views import generic
 from .forms import CustomSurveyForm
 from .form_utils import create_dynamic_form
+from .form_stats import form_statistics
 from django.db import connection
 from utility.permissioms import form_criteria_add_perm, form_criteria_edit_perm, form_criteria_delete_perm
 from django.contrib.auth.decorators import user_passes_test
@@ -66,6 +67,8 @@ class FormDetailView(View):
                 'records': page_obj.object_list,
                 'fields': ['ID', 'Created At'] + form_fields,  # Include default columns
                 'page_obj': page_obj,
+                # Maintained as records are submitted, so reading them does not scan the table
+                'statistics': form_statistics(form),
             }
             return render(request, 'form_builder/form_detail.html', context)
         except CustomForm.DoesNotExist:
@@ -0,0 +1,325 @@
+"""
+Server-side aggregation for distribution charts.
+
+``px.histogram`` and ``px.box`` embed every raw value of a column in the
+figure and let the browser do the binning, so the HTML grows with the row
+count. The helpers here bin and summarize the column with NumPy and build
+figures from the aggregates only (bin edges and counts, quartiles), so the
+payload stays the same size whatever the number of rows. Two-column density
+charts are binned the same way into a grid of counts, replacing scatter plots
+of large comparisons.
+"""
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+DEFAULT_BINS = 50
+BOX_IQR_FACTOR = 1.5
+
+# Raw points drawn by a scatter plot before it is replaced by a density grid
+SCATTER_MAX_POINTS = 10000
+# Bins per axis of a density grid when none are given: about 2 * rows^(1/3)
+MIN_DENSITY_BINS = 10
+MAX_DENSITY_BINS = 100
+# Counts are shown on a log scale when the busiest cell holds this many
+# times the median count of non-empty cells
+LOG_SCALE_RATIO = 100
+
+
+def _values(series):
+    """Non-null values as float64 (numbers) or int64 nanoseconds (datetimes)."""
+    series = series.dropna()
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        if getattr(series.dt, 'tz', None) is not None:
+            series = series.dt.tz_convert(None)
+        return series.to_numpy(dtype='datetime64[ns]').view('int64'), True
+    return series.to_numpy(dtype='float64'), False
+
+
+def histogram_bins(series, bins=DEFAULT_BINS):
+    """
+    Bin a numeric or datetime column.
+
+    Integer columns spanning fewer values than ``bins`` get one bin per
+    integer, so codes and counts are not split across bins.
+
+    Args:
+        series: Column to bin; nulls are ignored
+        bins: Number of bins
+
+    Returns:
+        dict: ``edges`` (bins + 1 values) and ``counts`` (bins values); for
+        datetime columns the edges are Timestamps
+    """
+    values, is_datetime = _values(series)
+    if not len(values):
+        return {'edges': np.array([]), 'counts': np.array([], dtype='int64')}
+
+    if (not is_datetime and pd.api.types.is_integer_dtype(series.dtype)
+            and values.max() - values.min() < bins):
+        edges = np.arange(values.min() - 0.5, values.max() + 1.5)
+        counts, edges = np.histogram(values, bins=edges)
+    else:
+        counts, edges = np.histogram(values, bins=bins)
+
+    if is_datetime:
+        edges = pd.to_datetime(edges.astype('int64'))
+    return {'edges': edges, 'counts': counts}
+
+
+def histogram_trace(series, bins=DEFAULT_BINS, name=None, **kwargs):
+    """
+    Bar trace drawing the histogram of a column from its bin counts.
+
+    Extra keyword arguments are passed to ``go.Bar``.
+    """
+    return binned_histogram_trace(histogram_bins(series, bins), name if name is not None else str(series.name), **kwargs)
+
+
+def binned_histogram_trace(binned, name, **kwargs):
+    """Bar trace of a histogram already binned (see ``histogram_bins``)."""
+    edges, counts = binned['edges'], binned['counts']
+    if isinstance(edges, pd.DatetimeIndex):
+        widths = np.diff(edges.asi8) / 1e6  # Plotly measures date axes in milliseconds
+        centers = edges[:-1] + (edges[1:] - edges[:-1]) / 2
+        bounds = "%{customdata[0]} - %{customdata[1]}"
+    else:
+        widths = np.diff(edges)
+        centers = edges[:-1] + widths / 2
+        bounds = "%{customdata[0]:.4g} - %{customdata[1]:.4g}"
+    return go.Bar(
+        x=centers,
+        y=counts,
+        width=widths,
+        name=name,
+        customdata=np.column_stack([edges[:-1], edges[1:]]) if len(counts) else None,
+        hovertemplate=bounds + "<br>count: %{y}<extra></extra>",
+        **kwargs
+    )
+
+
+def box_summary(series):
+    """
+    Quartiles, fences and mean of a numeric column, as drawn by a box plot.
+
+    Fences are the most extreme values within 1.5 IQR of the quartiles.
+
+    Returns:
+        dict or None when the column has no values
+    """
+    values, _ = _values(series)
+    if not len(values):
+        return None
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - BOX_IQR_FACTOR * iqr) & (values <= q3 + BOX_IQR_FACTOR * iqr)]
+    return {
+        'q1': float(q1),
+        'median': float(median),
+        'q3': float(q3),
+        'lowerfence': float(inside.min()),
+        'upperfence': float(inside.max()),
+        'mean': float(values.mean()),
+    }
+
+
+def box_trace(series, name=None, orientation='v', **kwargs):
+    """
+    Box trace built from precomputed quartiles instead of the raw values.
+
+    Extra keyword arguments are passed to ``go.Box``.
+    """
+    name = name if name is not None else str(series.name)
+    summary = box_summary(series)
+    if summary is None:
+        return go.Box(name=name, orientation=orientation, **kwargs)
+    position = {'y': [name]} if orientation == 'h' else {'x': [name]}
+    return go.Box(
+        name=name,
+        orientation=orientation,
+        boxpoints=False,
+        **position,
+        **{key: [value] for key, value in summary.items()},
+        **kwargs
+    )
+
+
+def histogram_figure(series, title=None, bins=DEFAULT_BINS, x_title=None, box=False):
+    """
+    Histogram figure of a numeric or datetime column.
+
+    Args:
+        series: Column to plot
+        title: Figure title
+        bins: Number of bins
+        x_title: X axis title, defaults to the column name
+        box: Draw a box plot of the column above the histogram (numeric only)
+
+    Returns:
+        go.Figure
+    """
+    x_title = x_title if x_title is not None else str(series.name)
+    if box and not pd.api.types.is_datetime64_any_dtype(series.dtype):
+        fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.2, 0.8], vertical_spacing=0.03)
+        fig.add_trace(box_trace(series, name=x_title, orientation='h', showlegend=False), row=1, col=1)
+        fig.add_trace(histogram_trace(series, bins, name=x_title, showlegend=False), row=2, col=1)
+        fig.update_yaxes(showticklabels=False, row=1, col=1)
+        fig.update_xaxes(title_text=x_title, row=2, col=1)
+        fig.update_yaxes(title_text='count', row=2, col=1)
+    else:
+        return binned_histogram_figure(histogram_bins(series, bins), title, x_title)
+    fig.update_layout(title=title, bargap=0)
+    return fig
+
+
+def binned_histogram_figure(binned, title=None, x_title=''):
+    """Histogram figure from bin edges and counts computed elsewhere (e.g. in SQL)."""
+    fig = go.Figure(binned_histogram_trace(binned, name=x_title, showlegend=False))
+    fig.update_layout(xaxis_title=x_title, yaxis_title='count', title=title, bargap=0)
+    return fig
+
+
+def density_bin_count(rows):
+    """Bins per axis of a density grid for ``rows`` points."""
+    return int(np.clip(round(2 * np.cbrt(rows)), MIN_DENSITY_BINS, MAX_DENSITY_BINS))
+
+
+def _axis_edges(values, integer, bins):
+    low, high = values.min(), values.max()
+    if integer and high - low < bins:
+        return np.arange(low - 0.5, high + 1.5)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+def _bin_index(values, edges):
+    """Index of the equal-width bin of each value; the last bin includes its right edge."""
+    bins = len(edges) - 1
+    index = ((values - edges[0]) * (bins / (edges[-1] - edges[0]))).astype('int64')
+    np.clip(index, 0, bins - 1, out=index)
+    return index
+
+
+def histogram2d_bins(x, y, bins=None):
+    """
+    Count the rows of two numeric or datetime columns on a grid.
+
+    Only rows where both columns have a value are counted. The bins are
+    equal-width and found with one arithmetic pass and a ``bincount``,
+    instead of the searches done by ``np.histogram2d``. Integer columns
+    spanning fewer values than ``bins`` get one bin per integer.
+
+    Args:
+        x, y: Columns of the same frame
+        bins: Bins per axis; defaults to ``density_bin_count`` of the row count
+
+    Returns:
+        dict: ``x_edges``, ``y_edges`` and ``counts`` (x bins by y bins);
+        datetime edges are Timestamps
+    """
+    both = (x.notna() & y.notna()).to_numpy()
+    x_values, x_datetime = _values(x[both])
+    y_values, y_datetime = _values(y[both])
+    if not len(x_values):
+        return {'x_edges': np.array([]), 'y_edges': np.array([]), 'counts': np.zeros((0, 0), dtype='int64')}
+    bins = bins or density_bin_count(len(x_values))
+
+    x_values = x_values.astype('float64')
+    y_values = y_values.astype('float64')
+    x_edges = _axis_edges(x_values, not x_datetime and pd.api.types.is_integer_dtype(x.dtype), bins)
+    y_edges = _axis_edges(y_values, not y_datetime and pd.api.types.is_integer_dtype(y.dtype), bins)
+    ny = len(y_edges) - 1
+    cells = _bin_index(x_values, x_edges) * ny + _bin_index(y_values, y_edges)
+    counts = np.bincount(cells, minlength=(len(x_edges) - 1) * ny).reshape(-1, ny)
+
+    if x_datetime:
+        x_edges = pd.to_datetime(x_edges.astype('int64'))
+    if y_datetime:
+        y_edges = pd.to_datetime(y_edges.astype('int64'))
+    return {'x_edges': x_edges, 'y_edges': y_edges, 'counts': counts}
+
+
+def _centers(edges):
+    return edges[:-1] + (edges[1:] - edges[:-1]) / 2
+
+
+def _use_log_scale(counts):
+    filled = counts[counts > 0]
+    return bool(len(filled)) and filled.max() >= LOG_SCALE_RATIO * np.median(filled)
+
+
+def density_trace(binned, log=False, x_title='x', y_title='y', **kwargs):
+    """
+    Heatmap trace drawing the counts of ``histogram2d_bins``.
+
+    Empty cells are left transparent. On a log scale the colors follow
+    log10 of the counts, while the color bar and hover text show the counts.
+
+    Extra keyword arguments are passed to ``go.Heatmap``.
+    """
+    counts = binned['counts'].T  # rows of the heatmap are y bins
+    z = np.where(counts > 0, counts, np.nan).astype('float64')
+    hover = f"{x_title}: %{{x}}<br>{y_title}: %{{y}}<br>count: "
+    if log:
+        z = np.log10(z)
+        top = int(np.ceil(np.nanmax(z))) if counts.any() else 0
+        ticks = np.arange(top + 1)
+        kwargs.setdefault('colorbar', {'tickvals': ticks, 'ticktext': [f"{10 ** int(t):,}" for t in ticks]})
+        kwargs['customdata'] = counts
+        hover += "%{customdata}"
+    else:
+        hover += "%{z}"
+    return go.Heatmap(
+        x=_centers(binned['x_edges']),
+        y=_centers(binned['y_edges']),
+        z=z,
+        hovertemplate=hover + "<extra></extra>",
+        **kwargs
+    )
+
+
+def density_figure(x, y, title=None, bins=None, log=None, colorscale=None, marginals=False):
+    """
+    Density chart of two numeric or datetime columns, binned on the server.
+
+    The payload holds one value per grid cell, so its size and render time
+    do not depend on the number of rows.
+
+    Args:
+        x, y: Columns of the same frame
+        title: Figure title
+        bins: Bins per axis; adapts to the row count when omitted
+        log: Color cells by log10 of their count; None decides from the spread
+            of the counts
+        colorscale: Plotly colorscale for the cells
+        marginals: Draw the counts per x bin above and per y bin to the right
+
+    Returns:
+        go.Figure
+    """
+    x_title, y_title = str(x.name), str(y.name)
+    binned = histogram2d_bins(x, y, bins)
+    if log is None:
+        log = _use_log_scale(binned['counts'])
+    trace = density_trace(binned, log=log, x_title=x_title, y_title=y_title, colorscale=colorscale)
+
+    if not marginals or not binned['counts'].size:
+        fig = go.Figure(trace)
+        fig.update_layout(xaxis_title=x_title, yaxis_title=y_title)
+    else:
+        fig = make_subplots(rows=2, cols=2, shared_xaxes=True, shared_yaxes=True,
+                            column_widths=[0.8, 0.2], row_heights=[0.2, 0.8],
+                            horizontal_spacing=0.02, vertical_spacing=0.02)
+        x_edges, y_edges = binned['x_edges'], binned['y_edges']
+        fig.add_trace(go.Bar(x=_centers(x_edges), y=binned['counts'].sum(axis=1), showlegend=False,
+                             hovertemplate="%{x}<br>count: %{y}<extra></extra>"), row=1, col=1)
+        fig.add_trace(go.Bar(y=_centers(y_edges), x=binned['counts'].sum(axis=0), orientation='h', showlegend=False,
+                             hovertemplate="%{y}<br>count: %{x}<extra></extra>"), row=2, col=2)
+        fig.add_trace(trace, row=2, col=1)
+        fig.update_layout(bargap=0)
+        fig.update_xaxes(title_text=x_title, row=2, col=1)
+        fig.update_yaxes(title_text=y_title, row=2, col=1)
+    fig.update_layout(title=title)
+    return fig
@@ -0,0 +1,144 @@
+"""
+In-process caches shared by the stats views.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATAFRAME_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the total size of its entries.
+
+    Args:
+        max_bytes: Upper bound for the summed size of all cached values
+        sizeof: Callable returning the size of a value in bytes
+        name: Label used in log messages
+        on_evict: Optional callable ``on_evict(key, value)`` run for every
+            entry pushed out to make room (outside the cache lock)
+    """
+
+    def __init__(self, max_bytes, sizeof=None, name='cache', on_evict=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 1)
+        self.name = name
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return a cached value and mark it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, size=None):
+        """
+        Cache a value, evicting least recently used entries to make room.
+
+        Returns:
+            bool: False if the value is larger than the whole cache and was not stored
+        """
+        size = self.sizeof(value) if size is None else size
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self.rejected += 1
+                return False
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                evicted_key, (evicted_value, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+                evicted.append((evicted_key, evicted_value))
+                logger.debug(f"{self.name}: evicted {evicted_key!r}")
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+
+        if self.on_evict is not None:
+            for evicted_key, evicted_value in evicted:
+                self.on_evict(evicted_key, evicted_value)
+        return True
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def pop(self, key):
+        """Remove a key from the cache if present."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current usage."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'rejected': self.rejected,
+            }
+
+
+def _series_nbytes(series):
+    return int(series.memory_usage(index=False, deep=True))
+
+
+_dataframe_cache = None
+_dataframe_cache_lock = threading.Lock()
+
+
+def get_dataframe_cache():
+    """
+    Return the process-wide cache of dataset columns.
+
+    Entries are keyed by ``(dataset fingerprint, column name)`` so every view
+    working on the same dataset shares the decoded columns. The memory ceiling
+    is configured with ``STATS_DATAFRAME_CACHE_MAX_BYTES``.
+    """
+    global _dataframe_cache
+    if _dataframe_cache is None:
+        with _dataframe_cache_lock:
+            if _dataframe_cache is None:
+                _dataframe_cache = LRUCache(
+                    max_bytes=getattr(settings, 'STATS_DATAFRAME_CACHE_MAX_BYTES', DEFAULT_DATAFRAME_CACHE_MAX_BYTES),
+                    sizeof=_series_nbytes,
+                    name='dataframe cache'
+                )
+    return _dataframe_cache
@@ -0,0 +1,287 @@
+"""
+Dataset context and conversation memory for the analysis chat.
+
+The system prompt of a chat is built once per dataset from its stored
+profile (no rows are loaded) and cached by fingerprint. It lists the
+columns with a one-line summary each, within a token budget, so wide
+datasets do not inflate every request.
+
+Conversations live in ``ChatConversation`` rows; the session only keeps
+the conversation id. The latest ``STATS_CHAT_MAX_MESSAGES`` messages are
+sent verbatim, and older ones are folded into a short running summary that
+is bounded by ``STATS_CHAT_SUMMARY_MAX_CHARS``. The cost of a follow-up turn
+is then the model call alone, and neither the session nor the prompt grows
+with the length of the conversation.
+
+Settings:
+    STATS_CHAT_CONTEXT_MAX_TOKENS: Token budget of the dataset context
+    STATS_CHAT_MAX_MESSAGES: Recent messages sent verbatim
+    STATS_CHAT_SUMMARY_MAX_CHARS: Length of the summary of older messages
+    STATS_CHAT_RETENTION_DAYS: Idle days after which conversations are deleted
+"""
+import logging
+import math
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .caching import LRUCache
+from .dataset_store import get_dataset_profile, get_session_dataset
+from .models import ChatConversation
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'analysis_chat'
+
+DEFAULT_CHAT_CONTEXT_MAX_TOKENS = 1500
+DEFAULT_CHAT_MAX_MESSAGES = 8
+DEFAULT_CHAT_SUMMARY_MAX_CHARS = 2000
+DEFAULT_CHAT_RETENTION_DAYS = 7
+CONTEXT_CACHE_MAX_BYTES = 4 * 1024 * 1024
+# Characters of each folded message kept in the summary
+SUMMARY_MESSAGE_CHARS = {'user': 150, 'assistant': 250}
+TOP_VALUES_IN_CONTEXT = 3
+
+NO_DATA_PROMPT = """أنت مساعد محلل بيانات ذكي.
+حالياً لا تتوفر بيانات للتحليل.
+يُرجى إعلام المستخدم أنه يحتاج إلى تحميل البيانات أولاً.
+التزم باللغة العربية فقط في الردود.
+"""
+
+CHAT_RULES = """قواعد مهمة:
+1. الردود يجب أن تكون باللغة العربية فقط
+2. لا تعطي أي كود برمجي إلا إذا طُلب منك ذلك صراحةً
+3. ركز على الشرح البسيط والواضح
+4. قدم رؤى عملية من البيانات
+5. تجنب المصطلحات الفنية المعقدة
+
+أنواع المساعدة التي يمكنك تقديمها:
+- شرح أنماط البيانات
+- تفسير الإحصائيات
+- تحليل العلاقات بين المتغيرات
+- الإجابة على أسئلة التحليل
+"""
+
+
+def estimate_tokens(text):
+    """
+    Rough token count of a text.
+
+    Counts UTF-8 bytes, about four per token for English and fewer for
+    Arabic, so the estimate errs on the high side for both.
+    """
+    return math.ceil(len(text.encode('utf-8')) / 4)
+
+
+def _number(value):
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def describe_column(name, column):
+    """One-line summary of a column profile."""
+    missing = f", missing {column['missing_percent']}%" if column['missing'] else ''
+    if column['kind'] == 'numeric':
+        return (f"- {name} (numeric): mean {_number(column['mean'])}, median {_number(column['median'])}, "
+                f"min {_number(column['min'])}, max {_number(column['max'])}{missing}")
+    if column['kind'] == 'datetime':
+        return f"- {name} (date): from {column['min']} to {column['max']}{missing}"
+    top = ', '.join(f"{label} ({count})" for label, count in column['top_values'][:TOP_VALUES_IN_CONTEXT])
+    return f"- {name} ({column['type']}): {column['unique_count']} distinct values, most common: {top}{missing}"
+
+
+class DatasetChatContext:
+    """
+    System prompt describing one dataset to the chat model.
+
+    Attributes:
+        fingerprint: Fingerprint of the dataset described
+        text: The system prompt
+        tokens: Estimated size of ``text`` in tokens
+        omitted_columns: Columns left out to stay within the budget
+    """
+
+    def __init__(self, fingerprint, text, omitted_columns=0):
+        self.fingerprint = fingerprint
+        self.text = text
+        self.tokens = estimate_tokens(text)
+        self.omitted_columns = omitted_columns
+
+    @property
+    def nbytes(self):
+        return len(self.text.encode('utf-8'))
+
+
+def build_dataset_context(profile, fingerprint=None, max_tokens=None):
+    """
+    Build the chat context of a dataset from its profile.
+
+    Column summaries are added in dataset order until the budget is reached;
+    the column names are always listed in full.
+
+    Args:
+        profile: Dataset profile (see ``profiling``)
+        fingerprint: Fingerprint of the dataset
+        max_tokens: Token budget; defaults to ``STATS_CHAT_CONTEXT_MAX_TOKENS``
+
+    Returns:
+        DatasetChatContext
+    """
+    if max_tokens is None:
+        max_tokens = getattr(settings, 'STATS_CHAT_CONTEXT_MAX_TOKENS', DEFAULT_CHAT_CONTEXT_MAX_TOKENS)
+    columns = profile['columns']
+    header = f"""أنت مساعد متخصص في تحليل البيانات.
+مهمتك هي مساعدة المستخدم في فهم وتحليل بياناته.
+
+نظرة عامة على البيانات:
+- عدد الصفوف: {profile['row_count']}
+- الأعمدة: {', '.join(columns)}
+
+{CHAT_RULES}
+ملخص الأعمدة:
+"""
+    budget = max_tokens - estimate_tokens(header)
+    lines = []
+    for name, column in columns.items():
+        line = describe_column(name, column)
+        cost = estimate_tokens(line + '\n')
+        if cost > budget:
+            break
+        lines.append(line)
+        budget -= cost
+    omitted = len(columns) - len(lines)
+    if omitted:
+        lines.append(f"- ({omitted} more columns not summarized)")
+    return DatasetChatContext(fingerprint, header + '\n'.join(lines) + '\n', omitted)
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    """Process-wide cache of dataset chat contexts, keyed by fingerprint and budget."""
+    global _context_cache
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                _context_cache = LRUCache(
+                    max_bytes=CONTEXT_CACHE_MAX_BYTES,
+                    sizeof=lambda context: context.nbytes,
+                    name='chat context cache'
+                )
+    return _context_cache
+
+
+def get_dataset_context(dataset):
+    """Chat context of a ``Dataset``, built on first use."""
+    max_tokens = getattr(settings, 'STATS_CHAT_CONTEXT_MAX_TOKENS', DEFAULT_CHAT_CONTEXT_MAX_TOKENS)
+    key = (dataset.fingerprint, max_tokens)
+    cache = get_context_cache()
+    context = cache.get(key)
+    if context is None:
+        context = build_dataset_context(get_dataset_profile(dataset), dataset.fingerprint, max_tokens)
+        cache.set(key, context)
+        logger.debug(f"Built chat context of dataset {dataset.fingerprint} ({context.tokens} tokens)")
+    return context
+
+
+def _max_messages():
+    return max(2, int(getattr(settings, 'STATS_CHAT_MAX_MESSAGES', DEFAULT_CHAT_MAX_MESSAGES)))
+
+
+def _summary_max_chars():
+    return int(getattr(settings, 'STATS_CHAT_SUMMARY_MAX_CHARS', DEFAULT_CHAT_SUMMARY_MAX_CHARS))
+
+
+def _prune_conversations():
+    days = getattr(settings, 'STATS_CHAT_RETENTION_DAYS', DEFAULT_CHAT_RETENTION_DAYS)
+    deleted, _ = ChatConversation.objects.filter(updated_at__lt=timezone.now() - timedelta(days=days)).delete()
+    if deleted:
+        logger.info(f"Deleted {deleted} idle chat conversations")
+
+
+def get_session_conversation(request, dataset=None):
+    """
+    Return the session's conversation about its current dataset.
+
+    A new conversation is started when there is none yet, or when the
+    stored one is about another dataset.
+
+    Args:
+        request: Current request
+        dataset: The session's ``Dataset`` (looked up if omitted); None when
+            no dataset is loaded
+    """
+    dataset = dataset if dataset is not None else get_session_dataset(request)
+    dataset_id = dataset.id if dataset is not None else None
+    key = request.session.get(SESSION_KEY)
+    if key:
+        conversation = ChatConversation.objects.filter(key=key).first()
+        if conversation is not None and conversation.dataset_id == dataset_id:
+            return conversation
+        ChatConversation.objects.filter(key=key).delete()
+
+    _prune_conversations()
+    conversation = ChatConversation.objects.create(key=uuid.uuid4().hex, dataset=dataset)
+    request.session[SESSION_KEY] = conversation.key
+    request.session.modified = True
+    return conversation
+
+
+def conversation_messages(conversation):
+    """
+    Messages that carry a conversation into the next model call.
+
+    Returns:
+        list: A system message with the summary of older turns (if any),
+        followed by the recent messages
+    """
+    messages = []
+    if conversation.summary:
+        messages.append({"role": "system", "content": f"ملخص المحادثة السابقة:\n{conversation.summary}"})
+    return messages + list(conversation.messages)
+
+
+def _fold(summary, messages):
+    """Add folded messages to the summary, dropping its oldest lines past the limit."""
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        limit = SUMMARY_MESSAGE_CHARS.get(message['role'], 150)
+        text = ' '.join(message['content'].split())
+        if len(text) > limit:
+            text = text[:limit].rstrip() + '…'
+        lines.append(f"{message['role']}: {text}")
+    max_chars = _summary_max_chars()
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return '\n'.join(lines)
+
+
+def record_turn(conversation, user_message, assistant_message):
+    """
+    Store one exchange, folding the oldest messages into the summary.
+
+    Args:
+        conversation: ``ChatConversation``
+        user_message: Message sent to the model for the user
+        assistant_message: The model's answer as shown to the user
+    """
+    messages = list(conversation.messages) + [
+        {"role": "user", "content": user_message},
+        {"role": "assistant", "content": assistant_message},
+    ]
+    excess = len(messages) - _max_messages()
+    if excess > 0:
+        # Fold whole exchanges so the kept messages start with a user turn
+        excess += excess % 2
+        conversation.summary = _fold(conversation.summary, messages[:excess])
+        messages = messages[excess:]
+    conversation.messages = messages
+    conversation.save(update_fields=['messages', 'summary', 'updated_at'])
@@ -0,0 +1,344 @@
+"""
+Correlation matrices computed with NumPy and cached per dataset view.
+
+``DataFrame.corr()`` loops over every pair of columns and was recomputed by
+each view that reports correlations. Here the Pearson coefficients of all
+pairs come from a few matrix products over the column values and their
+validity mask. Like pandas, each pair uses the rows where both columns have
+a value (pairwise-complete). Matrices are cached by dataset fingerprint, row
+selection and columns. When a view asks for a cached matrix plus one column
+(such as a transformed column), only the new row and column are computed.
+The strongest pairs of a wide dataset are found one block of columns at a
+time without building the whole matrix.
+
+Settings:
+    STATS_CORRELATION_CACHE_MAX_BYTES: Memory budget of the matrix cache
+"""
+import heapq
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .caching import LRUCache
+from .dataset_store import get_session_dataset, load_dataframe, open_dataset
+from .row_selection import load_session_selection, session_selection_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORRELATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_BLOCK_SIZE = 64
+
+_VARIANCE_TOLERANCE = 1e-12
+
+
+def _column_values(df, columns):
+    """
+    Columns as a float64 matrix centred on their means.
+
+    Returns:
+        tuple: (values with missing entries set to 0, validity mask)
+    """
+    values = np.empty((len(df), len(columns)), dtype='float64')
+    for i, col in enumerate(columns):
+        values[:, i] = df[col].to_numpy(dtype='float64', na_value=np.nan)
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=0)
+    values[~valid] = 0.0
+    # Centring first avoids cancellation in the sums of squares below
+    mean = np.divide(values.sum(axis=0), counts, out=np.zeros(len(columns)), where=counts > 0)
+    values -= mean
+    values[~valid] = 0.0
+    # Constant columns become exact zeros, so their variance is not rounding noise
+    low = np.where(valid, values, np.inf).min(axis=0, initial=np.inf)
+    high = np.where(valid, values, -np.inf).max(axis=0, initial=-np.inf)
+    values[:, low == high] = 0.0
+    return values, valid
+
+
+def _cross_correlation(a, a_valid, b, b_valid, min_periods=1):
+    """
+    Pairwise-complete Pearson coefficients between the columns of two blocks.
+
+    Args:
+        a, b: Centred values (rows x columns) with missing entries set to 0
+        a_valid, b_valid: Validity masks of ``a`` and ``b``
+        min_periods: Fewest complete rows a pair needs
+
+    Returns:
+        tuple: (coefficients, complete row counts), both ``a`` columns x ``b`` columns
+    """
+    sxy = a.T @ b
+    if a_valid.all() and b_valid.all():
+        n = np.full(sxy.shape, float(len(a)))
+        sx = a.sum(axis=0)[:, None]
+        sy = b.sum(axis=0)[None, :]
+        sxx = np.einsum('ij,ij->j', a, a)[:, None]
+        syy = np.einsum('ij,ij->j', b, b)[None, :]
+    else:
+        av = a_valid.astype('float64')
+        bv = b_valid.astype('float64')
+        n = av.T @ bv
+        # Sums over the rows where both columns of the pair have a value
+        sx = a.T @ bv
+        sy = av.T @ b
+        sxx = (a * a).T @ bv
+        syy = av.T @ (b * b)
+    return correlation_from_sums(n, sx, sy, sxx, syy, sxy, min_periods), n.astype('int64')
+
+
+def correlation_from_sums(n, sx, sy, sxx, syy, sxy, min_periods=1):
+    """
+    Pearson coefficients from the sums over the complete rows of each pair.
+
+    The sums should be of values centred on (roughly) their means, so the
+    variances do not suffer from cancellation.
+
+    Args:
+        n: Complete rows of each pair
+        sx, sy: Sums of the two columns
+        sxx, syy: Sums of their squares
+        sxy: Sums of their products
+        min_periods: Fewest complete rows a pair needs
+
+    Returns:
+        np.ndarray: Coefficients; NaN where a pair has too few rows or no variance
+    """
+    n, sx, sy, sxx, syy, sxy = np.broadcast_arrays(*(np.asarray(v, dtype='float64') for v in (n, sx, sy, sxx, syy, sxy)))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    # Variance at rounding-error level means the column is constant over the pair's rows
+    flat = ~(var_x > _VARIANCE_TOLERANCE * sxx) | ~(var_y > _VARIANCE_TOLERANCE * syy)
+    corr[(n < max(min_periods, 2)) | flat] = np.nan
+    np.clip(corr, -1.0, 1.0, out=corr)
+    return corr
+
+
+class CorrelationMatrix:
+    """
+    Pearson correlation matrix of a set of columns.
+
+    Attributes:
+        columns: Column names, in matrix order
+        matrix: Coefficients; NaN where a pair has too few values or no variance
+        counts: Number of complete rows behind each coefficient
+    """
+
+    def __init__(self, columns, matrix, counts):
+        self.columns = list(columns)
+        self.matrix = matrix
+        self.counts = counts
+        self.matrix.flags.writeable = False
+        self.counts.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.counts.nbytes
+
+    def select(self, columns):
+        """The matrix of ``columns`` (all in this matrix), in that order."""
+        positions = {column: i for i, column in enumerate(self.columns)}
+        index = np.ix_(*[[positions[column] for column in columns]] * 2)
+        return CorrelationMatrix(columns, self.matrix[index], self.counts[index])
+
+    def to_frame(self):
+        """The matrix as a DataFrame, as ``DataFrame.corr()`` returns it."""
+        return pd.DataFrame(self.matrix, index=self.columns, columns=self.columns)
+
+    def pairs(self, threshold=0.0):
+        """
+        Column pairs whose absolute correlation exceeds ``threshold``.
+
+        Returns:
+            list: ``(col1, col2, corr)`` tuples for the upper triangle, in row order
+        """
+        rows, cols = np.triu_indices(len(self.columns), k=1)
+        values = self.matrix[rows, cols]
+        with np.errstate(invalid='ignore'):
+            keep = np.abs(values) > threshold
+        return [(self.columns[i], self.columns[j], float(value))
+                for i, j, value in zip(rows[keep], cols[keep], values[keep])]
+
+
+def compute_correlation(df, columns=None, min_periods=1):
+    """
+    Correlation matrix of numeric columns, equivalent to ``df[columns].corr()``.
+
+    Args:
+        df: DataFrame holding the columns
+        columns: Columns to correlate; defaults to the numeric columns of ``df``
+        min_periods: Fewest complete rows a pair needs
+
+    Returns:
+        CorrelationMatrix
+    """
+    columns = list(columns) if columns is not None else list(df.select_dtypes(include=['number']).columns)
+    values, valid = _column_values(df, columns)
+    matrix, counts = _cross_correlation(values, valid, values, valid, min_periods)
+    # Same convention as pandas: 1 on the diagonal unless the column has no variance
+    diagonal = np.diag_indices(len(columns))
+    matrix[diagonal] = np.where(np.isnan(matrix[diagonal]), np.nan, 1.0)
+    return CorrelationMatrix(columns, matrix, counts)
+
+
+def update_correlation(corr, df, column, min_periods=1):
+    """
+    Recompute the row and column of one changed (or added) column.
+
+    Args:
+        corr: Existing ``CorrelationMatrix``
+        df: DataFrame with the new values of ``column`` and the other columns of ``corr``
+        column: Column whose values changed
+
+    Returns:
+        CorrelationMatrix: New matrix; ``corr`` is left untouched
+    """
+    columns = list(corr.columns)
+    if column not in columns:
+        columns.append(column)
+    size = len(columns)
+    matrix = np.full((size, size), np.nan)
+    counts = np.zeros((size, size), dtype='int64')
+    old = len(corr.columns)
+    matrix[:old, :old] = corr.matrix
+    counts[:old, :old] = corr.counts
+
+    index = columns.index(column)
+    target, target_valid = _column_values(df, [column])
+    values, valid = _column_values(df, columns)
+    row, row_counts = _cross_correlation(target, target_valid, values, valid, min_periods)
+    matrix[index, :] = matrix[:, index] = row[0]
+    counts[index, :] = counts[:, index] = row_counts[0]
+    if not np.isnan(matrix[index, index]):
+        matrix[index, index] = 1.0
+    return CorrelationMatrix(columns, matrix, counts)
+
+
+def top_correlated_pairs(df, k=10, columns=None, min_abs=0.0, min_periods=1, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    The ``k`` column pairs with the strongest correlation.
+
+    Coefficients are computed for one block of columns at a time, so memory
+    stays proportional to ``block_size`` times the number of columns.
+
+    Args:
+        df: DataFrame holding the columns
+        k: Number of pairs to return
+        columns: Columns to consider; defaults to the numeric columns of ``df``
+        min_abs: Only return pairs whose absolute correlation exceeds this
+        min_periods: Fewest complete rows a pair needs
+        block_size: Number of columns correlated against the rest per step
+
+    Returns:
+        list: dicts with 'col1', 'col2', 'corr' and 'count', strongest first
+    """
+    columns = list(columns) if columns is not None else list(df.select_dtypes(include=['number']).columns)
+    values, valid = _column_values(df, columns)
+    best = []  # min-heap of (abs corr, col1, col2, corr, count)
+    for start in range(0, len(columns), block_size):
+        stop = min(start + block_size, len(columns))
+        # Only pairs (i, j) with j > i: the block against itself and the columns after it
+        block, block_counts = _cross_correlation(
+            values[:, start:stop], valid[:, start:stop], values[:, start:], valid[:, start:], min_periods
+        )
+        rows, cols = np.nonzero(np.triu(np.ones(block.shape, dtype=bool), k=1))
+        strength = np.abs(block[rows, cols])
+        keep = ~np.isnan(strength) & (strength > min_abs)
+        rows, cols, strength = rows[keep], cols[keep], strength[keep]
+        if len(strength) > k:
+            top = np.argpartition(strength, -k)[-k:]
+            rows, cols, strength = rows[top], cols[top], strength[top]
+        for i, j, value in zip(rows, cols, strength):
+            item = (float(value), start + i, start + j, float(block[i, j]), int(block_counts[i, j]))
+            if len(best) < k:
+                heapq.heappush(best, item)
+            elif item[0] > best[0][0]:
+                heapq.heapreplace(best, item)
+
+    return [
+        {'col1': columns[i], 'col2': columns[j], 'corr': corr, 'count': count}
+        for _, i, j, corr, count in sorted(best, reverse=True)
+    ]
+
+
+_correlation_cache = None
+_correlation_cache_lock = threading.Lock()
+
+
+def get_correlation_cache():
+    """
+    Return the process-wide cache of correlation matrices.
+
+    Keys are ``(dataset fingerprint, row selection key, columns)``.
+    """
+    global _correlation_cache
+    if _correlation_cache is None:
+        with _correlation_cache_lock:
+            if _correlation_cache is None:
+                _correlation_cache = LRUCache(
+                    max_bytes=getattr(settings, 'STATS_CORRELATION_CACHE_MAX_BYTES', DEFAULT_CORRELATION_CACHE_MAX_BYTES),
+                    sizeof=lambda corr: corr.nbytes,
+                    name='correlation cache'
+                )
+    return _correlation_cache
+
+
+def _cached_without_one(cache, key, columns):
+    """
+    A cached matrix of all of ``columns`` but one.
+
+    Returns:
+        tuple: (CorrelationMatrix, the missing column), or (None, None)
+    """
+    if len(columns) < 3:
+        return None, None
+    for position, column in enumerate(columns):
+        subset = key + (tuple(columns[:position] + columns[position + 1:]),)
+        # Membership first, so the probes do not count as cache misses
+        corr = cache.get(subset) if subset in cache else None
+        if corr is not None:
+            return corr, column
+    return None, None
+
+
+def get_session_correlation(request, columns=None, filtered=True):
+    """
+    Correlation matrix of the session's dataset, computed once per view.
+
+    When the matrix of all the columns but one is cached (a column was just
+    added, e.g. a transformed one), only the new column's coefficients are
+    computed (see ``update_correlation``).
+
+    Args:
+        request: Current request
+        columns: Columns to correlate; defaults to the numeric columns
+        filtered: Apply the session's row selection (the active filters)
+
+    Returns:
+        CorrelationMatrix or None if no dataset is attached to the session
+    """
+    dataset = get_session_dataset(request)
+    if dataset is None:
+        return None
+    columns = list(columns) if columns is not None else open_dataset(dataset).numeric_columns()
+    selection = session_selection_key(request, dataset) if filtered else None
+    key = (dataset.fingerprint, selection, tuple(columns))
+
+    cache = get_correlation_cache()
+    corr = cache.get(key)
+    if corr is None:
+        df = load_session_selection(request, columns) if selection else load_dataframe(dataset, columns)
+        base, added = _cached_without_one(cache, key[:2], columns)
+        if base is not None:
+            corr = update_correlation(base, df, added).select(columns)
+            logger.debug(f"Added {added} to the cached correlations of dataset {dataset.fingerprint}")
+        else:
+            corr = compute_correlation(df, columns)
+            logger.debug(f"Computed correlations of {len(columns)} columns for dataset {dataset.fingerprint}")
+        cache.set(key, corr)
+    return corr
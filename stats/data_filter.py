@@ -10,6 +10,12 @@ import io
 import base64
 import json
 from django.http import JsonResponse
+from .dataset_store import get_session_dataset, get_session_profile, load_dataframe
+from .ingestion import observed_value_counts
+from .profiling import infer_column_type, profile_column
+from .filter_engine import FilterMasks, string_match_mask
+from .row_selection import encode_selection, decode_selection
+from .aggregation import SCATTER_MAX_POINTS, density_figure, histogram_figure, box_trace
 class ColumnAnalyzer:
     """
     Analyzes column properties and determines appropriate operations based on data type.
@@ -18,86 +24,70 @@ class ColumnAnalyzer:
     @staticmethod
     def get_column_type(df: pd.DataFrame, column_name: str) -> str:
         """
-        Determine the column type (numeric, categorical, datetime, boolean).
+        Determine the column type (numeric, categorical, datetime).
         
         Args:
             df: DataFrame containing the column
             column_name: Name of the column to analyze
             
         Returns:
-            str: Column type ('numeric', 'categorical', 'datetime', 'boolean')
+            str: Column type ('numeric', 'categorical', 'datetime')
         """
         if column_name not in df.columns:
             raise ValueError(f"Column '{column_name}' not found in DataFrame")
-            
-        col = df[column_name]
-        
-        if pd.api.types.is_numeric_dtype(col):
-            # Check if it's really a categorical with numeric codes
-            if col.nunique() < 10 and col.nunique() / len(col) < 0.05:
-                return 'categorical'
-            return 'numeric'
-        elif pd.api.types.is_datetime64_dtype(col):
-            return 'datetime'
-        elif pd.api.types.is_bool_dtype(col):
-            return 'boolean'
-        else:
-            return 'categorical'
-    
+
+        return infer_column_type(df[column_name])
+
     @staticmethod
-    def get_column_stats(df: pd.DataFrame, column_name: str) -> Dict[str, Any]:
+    def get_column_stats(df: pd.DataFrame, column_name: str, profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Get summary statistics for a column based on its type.
-        
+
         Args:
             df: DataFrame containing the column
             column_name: Name of the column to analyze
-            
+            profile: Precomputed profile of the column; computed from ``df`` if omitted
+
         Returns:
             dict: Statistics for the column
         """
-        col_type = ColumnAnalyzer.get_column_type(df, column_name)
+        if profile is None:
+            profile = profile_column(df[column_name])
+        col_type = profile['type']
         stats = {
             'type': col_type,
-            'missing': df[column_name].isna().sum(),
-            'missing_percent': round(df[column_name].isna().sum() / len(df) * 100, 2)
+            'missing': profile['missing'],
+            'missing_percent': profile['missing_percent']
         }
-        
+
         if col_type == 'numeric':
             stats.update({
-                'min': float(df[column_name].min()) if not pd.isna(df[column_name].min()) else None,
-                'max': float(df[column_name].max()) if not pd.isna(df[column_name].max()) else None,
-                'mean': float(df[column_name].mean()) if not pd.isna(df[column_name].mean()) else None,
-                'median': float(df[column_name].median()) if not pd.isna(df[column_name].median()) else None,
-                'std': float(df[column_name].std()) if not pd.isna(df[column_name].std()) else None,
-                'unique_count': int(df[column_name].nunique()),
+                'min': profile['min'],
+                'max': profile['max'],
+                'mean': profile['mean'],
+                'median': profile['median'],
+                'std': profile['std'],
+                'unique_count': profile['unique_count'],
+                'outliers_count': profile['outliers_count'],
+                'has_outliers': profile['outliers_count'] > 0,
             })
-            
-            # Check for outliers using IQR method
-            Q1 = df[column_name].quantile(0.25)
-            Q3 = df[column_name].quantile(0.75)
-            IQR = Q3 - Q1
-            outlier_mask = (df[column_name] < (Q1 - 1.5 * IQR)) | (df[column_name] > (Q3 + 1.5 * IQR))
-            stats['outliers_count'] = int(outlier_mask.sum())
-            stats['has_outliers'] = stats['outliers_count'] > 0
-            
+
         elif col_type == 'categorical':
-            value_counts = df[column_name].value_counts()
+            top_values = profile['top_values']
             stats.update({
-                'unique_count': int(df[column_name].nunique()),
-                'top_value': value_counts.index[0] if not value_counts.empty else None,
-                'top_count': int(value_counts.iloc[0]) if not value_counts.empty else 0,
-                'top_values': {str(k): int(v) for k, v in value_counts.head(5).items()},
+                'unique_count': profile['unique_count'],
+                'top_value': top_values[0][0] if top_values else None,
+                'top_count': top_values[0][1] if top_values else 0,
+                'top_values': {str(label): count for label, count in top_values[:5]},
             })
-            
+
         elif col_type == 'datetime':
             stats.update({
-                'min': df[column_name].min().strftime('%Y-%m-%d') if not pd.isna(df[column_name].min()) else None,
-                'max': df[column_name].max().strftime('%Y-%m-%d') if not pd.isna(df[column_name].max()) else None,
-                'range_days': (df[column_name].max() - df[column_name].min()).days 
-                              if not pd.isna(df[column_name].min()) and not pd.isna(df[column_name].max()) else None
+                'min': profile['min'][:10] if profile['min'] else None,
+                'max': profile['max'][:10] if profile['max'] else None,
+                'range_days': profile['range_days']
             })
-            
+
         return stats
 
 
@@ -107,9 +97,17 @@ class FilterOperation:
     def __init__(self, column_name: str):
         self.column_name = column_name
     
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
+        """Boolean mask of the rows kept by the filter"""
+        raise NotImplementedError("Subclasses must implement this method")
+    
+    def key(self) -> tuple:
+        """Hashable description of the filter, used to cache its mask"""
+        raise NotImplementedError("Subclasses must implement this method")
+    
     def apply(self, df: pd.DataFrame) -> pd.DataFrame:
         """Apply the filter to the dataframe"""
-        raise NotImplementedError("Subclasses must implement this method")
+        return df[self.mask(df)]
     
     def describe(self) -> str:
         """Return a description of the filter"""
@@ -124,17 +122,16 @@ class ValueFilter(FilterOperation):
         self.values = values
         self.include = include  # True for 'in', False for 'not in'
     
-    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
         if self.column_name not in df.columns:
             raise ValueError(f"Column '{self.column_name}' not found in DataFrame")
         
-        # Convert all values to strings for consistent comparison
-        str_values = [str(v) for v in self.values]
-        
-        if self.include:
-            return df[df[self.column_name].astype(str).isin(str_values)]
-        else:
-            return df[~df[self.column_name].astype(str).isin(str_values)]
+        # Values are compared as strings; only the distinct values are converted
+        mask = string_match_mask(df[self.column_name], self.values)
+        return mask if self.include else ~mask
+    
+    def key(self) -> tuple:
+        return ('value', self.column_name, tuple(str(v) for v in self.values), self.include)
     
     def describe(self) -> str:
         op = "in" if self.include else "not in"
@@ -153,25 +150,26 @@ class RangeFilter(FilterOperation):
         self.include_min = include_min
         self.include_max = include_max
     
-    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+    def mask(self, df: pd.DataFrame) -> np.ndarray:
         if self.column_name not in df.columns:
             raise ValueError(f"Column '{self.column_name}' not found in DataFrame")
         
-        filtered_df = df.copy()
+        column = df[self.column_name]
+        mask = np.ones(len(df), dtype=bool)
         
         if self.min_value is not None:
-            if self.include_min:
-                filtered_df = filtered_df[filtered_df[self.column_name] >= self.min_value]
-            else:
-                filtered_df = filtered_df[filtered_df[self.column_name] > self.min_value]
+            above = column >= self.min_value if self.include_min else column > self.min_value
+            mask &= above.to_numpy(dtype=bool, na_value=False)
         
         if self.max_value is not None:
-            if self.include_max:
-                filtered_df = filtered_df[filtered_df[self.column_name] <= self.max_value]
-            else:
-                filtered_df = filtered_df[filtered_df[self.column_name] < self.max_value]
+            below = column <= self.max_value if self.include_max else column < self.max_value
+            mask &= below.to_numpy(dtype=bool, na_value=False)
         
-        return filtered_df
+        return mask
+    
+    def key(self) -> tuple:
+        return ('range', self.column_name, str(self.min_value), str(self.max_value),
+                self.include_min, self.include_max)
     
     def describe(self) -> str:
         result = []
@@ -218,7 +216,8 @@ class NumericComparison(ComparisonOperation):
         self.size_by = size_by
     
     def generate_plot(self, df: pd.DataFrame) -> go.Figure:
-        if self.operation_type == 'scatter':
+        large = len(df) > SCATTER_MAX_POINTS
+        if self.operation_type == 'scatter' and (self.color_by or not large):
             # Use plotly express for scatter plot
             if self.color_by and self.color_by in df.columns:
                 fig = px.scatter(df, x=self.column1, y=self.column2, color=self.color_by,
@@ -229,51 +228,36 @@ class NumericComparison(ComparisonOperation):
                                 title=f'Scatter Plot: {self.column1} vs {self.column2}',
                                 labels={self.column1: self.column1, self.column2: self.column2})
             
-        elif self.operation_type == 'heatmap':
-            # Create heatmap using correlation
-            # Calculate binned correlation
-            x_bins = min(20, df[self.column1].nunique())
-            y_bins = min(20, df[self.column2].nunique())
-            
-            heatmap_data, x_edges, y_edges = np.histogram2d(
-                df[self.column1].dropna(), 
-                df[self.column2].dropna(),
-                bins=[x_bins, y_bins]
-            )
-            
-            # Create heatmap
-            fig = go.Figure(data=go.Heatmap(
-                z=heatmap_data.T,
-                x=[(x_edges[i] + x_edges[i+1])/2 for i in range(len(x_edges)-1)],
-                y=[(y_edges[i] + y_edges[i+1])/2 for i in range(len(y_edges)-1)],
-                colorscale='Viridis'
-            ))
-            
-            fig.update_layout(
+        elif self.operation_type in ('scatter', 'heatmap'):
+            # Counts on a grid binned on the server; rows missing either value are skipped together
+            fig = density_figure(
+                df[self.column1], df[self.column2],
                 title=f'Heatmap: {self.column1} vs {self.column2}',
-                xaxis_title=self.column1,
-                yaxis_title=self.column2
+                colorscale='Viridis'
             )
             
         elif self.operation_type == 'hexbin':
-            # Create a scatter plot with hexbin aggregation
-            fig = px.density_heatmap(
-                df, x=self.column1, y=self.column2, 
-                marginal_x="histogram", marginal_y="histogram",
-                title=f"Hexbin Density: {self.column1} vs {self.column2}"
+            # Density grid with the counts per bin of each column along the edges
+            fig = density_figure(
+                df[self.column1], df[self.column2],
+                title=f"Hexbin Density: {self.column1} vs {self.column2}",
+                marginals=True
             )
             
         elif self.operation_type == 'box':
             # Create box plot comparison
             fig = go.Figure()
             
-            fig.add_trace(go.Box(y=df[self.column1], name=self.column1))
-            fig.add_trace(go.Box(y=df[self.column2], name=self.column2))
+            fig.add_trace(box_trace(df[self.column1], name=self.column1))
+            fig.add_trace(box_trace(df[self.column2], name=self.column2))
             
             fig.update_layout(
                 title=f'Box Plot Comparison: {self.column1} vs {self.column2}',
                 yaxis_title='Value'
             )
+        elif large:
+            fig = density_figure(df[self.column1], df[self.column2],
+                                 title=f'Density: {self.column1} vs {self.column2}')
         else:
             # Default to scatter plot
             fig = px.scatter(df, x=self.column1, y=self.column2,
@@ -343,19 +327,19 @@ class CategoricalNumericComparison(ComparisonOperation):
         elif self.operation_type == 'bar':
             # Aggregate data
             if self.aggregation == 'mean':
-                agg_data = df.groupby(self.column1)[self.column2].mean().reset_index()
+                agg_data = df.groupby(self.column1, observed=True)[self.column2].mean().reset_index()
                 agg_name = 'Mean'
             elif self.aggregation == 'median':
-                agg_data = df.groupby(self.column1)[self.column2].median().reset_index()
+                agg_data = df.groupby(self.column1, observed=True)[self.column2].median().reset_index()
                 agg_name = 'Median'
             elif self.aggregation == 'sum':
-                agg_data = df.groupby(self.column1)[self.column2].sum().reset_index()
+                agg_data = df.groupby(self.column1, observed=True)[self.column2].sum().reset_index()
                 agg_name = 'Sum'
             elif self.aggregation == 'count':
-                agg_data = df.groupby(self.column1)[self.column2].count().reset_index()
+                agg_data = df.groupby(self.column1, observed=True)[self.column2].count().reset_index()
                 agg_name = 'Count'
             else:
-                agg_data = df.groupby(self.column1)[self.column2].mean().reset_index()
+                agg_data = df.groupby(self.column1, observed=True)[self.column2].mean().reset_index()
                 agg_name = 'Mean'
             
             fig = px.bar(agg_data, x=self.column1, y=self.column2,
@@ -379,15 +363,15 @@ class CategoricalNumericComparison(ComparisonOperation):
     def get_comparison_data(self, df: pd.DataFrame) -> Dict[str, Any]:
         # Calculate group statistics
         if self.aggregation == 'mean':
-            agg_data = df.groupby(self.column1)[self.column2].mean()
+            agg_data = df.groupby(self.column1, observed=True)[self.column2].mean()
         elif self.aggregation == 'median':
-            agg_data = df.groupby(self.column1)[self.column2].median()
+            agg_data = df.groupby(self.column1, observed=True)[self.column2].median()
         elif self.aggregation == 'sum':
-            agg_data = df.groupby(self.column1)[self.column2].sum()
+            agg_data = df.groupby(self.column1, observed=True)[self.column2].sum()
         elif self.aggregation == 'count':
-            agg_data = df.groupby(self.column1)[self.column2].count()
+            agg_data = df.groupby(self.column1, observed=True)[self.column2].count()
         else:
-            agg_data = df.groupby(self.column1)[self.column2].mean()
+            agg_data = df.groupby(self.column1, observed=True)[self.column2].mean()
         
         # Convert to dictionary with string keys
         agg_dict = {str(k): float(v) for k, v in agg_data.items()}
@@ -502,23 +486,39 @@ class AnalysisTracker:
     Tracks all filters and comparisons applied to a DataFrame.
     """
     
-    def __init__(self, df: pd.DataFrame):
-        self.original_df = df.copy()
-        self.current_df = df.copy()
+    def __init__(self, df: pd.DataFrame, fingerprint: Optional[str] = None):
+        # Loaded frames are read-only (see dataset_store), so the filtered frame never needs a defensive copy
+        self.original_df = df
+        self.current_df = df
         self.filters: List[FilterOperation] = []
         self.comparisons: List[ComparisonOperation] = []
         self.analysis_history: List[Dict[str, Any]] = []
+        # Per-filter masks over original_df (shared across requests when the
+        # fingerprint of its dataset is given); the chain is combined into one
+        # mask (None while no filter is active)
+        self.filter_masks = FilterMasks(df, fingerprint=fingerprint)
+        self.selection: Optional[np.ndarray] = None
+        
+    def _apply_filters(self) -> None:
+        """Recompute current_df from the filter chain with a single indexing step"""
+        if not self.filters:
+            self.selection = None
+            self.current_df = self.original_df
+            return
+        self.selection = self.filter_masks.combine(self.filters)
+        self.current_df = self.original_df[self.selection]
         
     def add_filter(self, filter_op: FilterOperation) -> None:
         """Add a filter operation"""
+        rows_before = len(self.current_df)
         self.filters.append(filter_op)
-        self.current_df = filter_op.apply(self.current_df)
+        self._apply_filters()
         self.analysis_history.append({
             'type': 'filter',
             'operation': filter_op.describe(),
             'timestamp': pd.Timestamp.now(),
-            'rows_before': len(self.current_df),
-            'rows_after': len(filter_op.apply(self.current_df))
+            'rows_before': rows_before,
+            'rows_after': len(self.current_df)
         })
     
     def add_comparison(self, comparison_op: ComparisonOperation) -> None:
@@ -539,15 +539,16 @@ class AnalysisTracker:
                 'operation': removed.describe(),
                 'timestamp': pd.Timestamp.now()
             })
-            # Reapply all filters
-            self.current_df = self.original_df.copy()
-            for f in self.filters:
-                self.current_df = f.apply(self.current_df)
+            # Recombine the cached masks of the remaining filters
+            if removed.key() not in {f.key() for f in self.filters}:
+                self.filter_masks.discard(removed)
+            self._apply_filters()
     
     def clear_filters(self) -> None:
         """Clear all filters"""
         self.filters = []
-        self.current_df = self.original_df.copy()
+        self.selection = None
+        self.current_df = self.original_df
         self.analysis_history.append({
             'type': 'clear_filters',
             'timestamp': pd.Timestamp.now()
@@ -729,16 +730,12 @@ class AnalysisTracker:
         
         if col_type == 'numeric':
             # Create histogram for numeric column
-            fig = px.histogram(df, x=column_name, 
-                             title=f'Distribution of {column_name}',
-                             labels={column_name: column_name})
+            fig = histogram_figure(df[column_name], title=f'Distribution of {column_name}')
             
             # Add box plot below the histogram
-            fig.add_trace(go.Box(
-                y=[0],  # This doesn't matter and will be hidden
-                x=df[column_name],
+            fig.add_trace(box_trace(
+                df[column_name],
                 name=column_name,
-                boxpoints=False,
                 orientation='h',
                 yaxis='y2'
             ))
@@ -762,7 +759,7 @@ class AnalysisTracker:
             
         elif col_type == 'categorical':
             # Create bar chart for categorical column
-            value_counts = df[column_name].value_counts().reset_index()
+            value_counts = observed_value_counts(df[column_name]).reset_index()
             value_counts.columns = [column_name, 'count']
             
             fig = px.bar(value_counts, x=column_name, y='count',
@@ -777,9 +774,7 @@ class AnalysisTracker:
             
         elif col_type == 'datetime':
             # Create a histogram for datetime column
-            fig = px.histogram(df, x=column_name, 
-                             title=f'Distribution of {column_name}',
-                             labels={column_name: column_name})
+            fig = histogram_figure(df[column_name], title=f'Distribution of {column_name}')
             
             fig.update_layout(
                 template="plotly_white",
@@ -789,7 +784,7 @@ class AnalysisTracker:
             
         else:
             # Default to bar chart for other types
-            value_counts = df[column_name].value_counts().reset_index()
+            value_counts = observed_value_counts(df[column_name]).reset_index()
             value_counts.columns = [column_name, 'count']
             
             fig = px.bar(value_counts, x=column_name, y='count',
@@ -821,17 +816,23 @@ class AnalysisTracker:
         return html
     
     def to_dict(self):
-        """Convert the tracker to a serializable dictionary"""
+        """
+        Convert the tracker to a serializable dictionary.
+        
+        The data itself is not included: the filtered rows are stored as a
+        compressed bitmap over the base frame (see ``row_selection``).
+        """
         return {
-            'original_df': self.original_df.to_json(orient='split'),
-            'current_df': self.current_df.to_json(orient='split'),
+            'selection': encode_selection(self.selection) if self.selection is not None else None,
             'filters': [{
                 'type': f.__class__.__name__,
                 'column_name': f.column_name,
                 'values': getattr(f, 'values', None),
                 'min_value': getattr(f, 'min_value', None),
                 'max_value': getattr(f, 'max_value', None),
-                'include': getattr(f, 'include', None)
+                'include': getattr(f, 'include', None),
+                'include_min': getattr(f, 'include_min', None),
+                'include_max': getattr(f, 'include_max', None)
             } for f in self.filters],
             'comparisons': [{
                 'type': c.__class__.__name__,
@@ -842,10 +843,20 @@ class AnalysisTracker:
         }
     
     @classmethod
-    def from_dict(cls, data):
-        """Create a tracker from a serialized dictionary"""
-        tracker = cls(pd.read_json(io.StringIO(data['original_df']), orient='split'))
-        tracker.current_df = pd.read_json(io.StringIO(data['current_df']), orient='split')
+    def from_dict(cls, data, df: Optional[pd.DataFrame] = None, fingerprint: Optional[str] = None):
+        """
+        Create a tracker from a serialized dictionary
+        
+        Args:
+            data: Output of ``to_dict``
+            df: The unfiltered frame the tracker was built on
+            fingerprint: Fingerprint of the stored dataset ``df`` was loaded from
+        """
+        if df is None:
+            # Trackers serialized before the row bitmaps embedded the frame
+            df = pd.read_json(io.StringIO(data['original_df']), orient='split')
+            fingerprint = None
+        tracker = cls(df, fingerprint)
         
         # Recreate filters
         for f_data in data['filters']:
@@ -859,9 +870,20 @@ class AnalysisTracker:
                 tracker.filters.append(RangeFilter(
                     f_data['column_name'],
                     min_value=f_data['min_value'],
-                    max_value=f_data['max_value']
+                    max_value=f_data['max_value'],
+                    include_min=f_data.get('include_min', True) is not False,
+                    include_max=f_data.get('include_max', True) is not False
                 ))
         
+        # Apply the stored row bitmap; the filters are only re-evaluated when
+        # it does not fit the frame
+        selection = data.get('selection')
+        if tracker.filters and selection and selection.get('rows') == len(df):
+            tracker.selection = decode_selection(selection)
+            tracker.current_df = df[tracker.selection]
+        else:
+            tracker._apply_filters()
+        
         # Recreate comparisons
         for c_data in data['comparisons']:
             if c_data['type'] == 'NumericComparison':
@@ -879,22 +901,26 @@ def get_selected_plots(request):
         try:
             columns = request.GET.getlist('columns[]')
             
-            # Get tracker data from session
+            dataset = get_session_dataset(request)
+            if dataset is None:
+                return JsonResponse({'error': 'No data found'}, status=400)
+            df = load_dataframe(dataset)
+            
+            # Get tracker data from session; its filter masks are shared
+            # with other requests on the same dataset
             tracker_data = request.session.get('analysis_tracker')
             if tracker_data:
-                tracker = AnalysisTracker.from_dict(tracker_data)
+                tracker = AnalysisTracker.from_dict(tracker_data, df, dataset.fingerprint)
             else:
                 # Initialize new tracker if none exists
-                data_json = request.session.get('csv_data')
-                if not data_json:
-                    return JsonResponse({'error': 'No data found'}, status=400)
-                
-                df = pd.read_json(io.StringIO(data_json), orient='split')
-                tracker = AnalysisTracker(df)
+                tracker = AnalysisTracker(df, dataset.fingerprint)
             
             # Use the tracker's current_df which includes filters
             df = tracker.current_df
             
+            # Without filters the stored profile describes exactly this data
+            profile = None if tracker.filters else get_session_profile(request)
+
             # Generate plots and stats
             plots = {}
             stats = {}
@@ -910,7 +936,8 @@ def get_selected_plots(request):
                     }
                     
                     # Generate statistics
-                    stats[col] = ColumnAnalyzer.get_column_stats(df, col)
+                    column_profile = profile['columns'].get(str(col)) if profile else None
+                    stats[col] = ColumnAnalyzer.get_column_stats(df, col, column_profile)
             
             # Store the updated tracker in session
             request.session['analysis_tracker'] = tracker.to_dict()
@@ -928,17 +955,18 @@ def get_selected_plots(request):
 def filter_plot(request):
     if request.method == "GET":
         try:
-            # Get tracker from session or create new one
+            dataset = get_session_dataset(request)
+            if dataset is None:
+                return JsonResponse({'error': 'No data found'}, status=400)
+            df = load_dataframe(dataset)
+            
+            # Get tracker from session or create new one; its filter masks
+            # are shared with other requests on the same dataset
             tracker_data = request.session.get('analysis_tracker')
             if tracker_data:
-                tracker = AnalysisTracker.from_dict(tracker_data)
+                tracker = AnalysisTracker.from_dict(tracker_data, df, dataset.fingerprint)
             else:
-                data_json = request.session.get('csv_data')
-                if not data_json:
-                    return JsonResponse({'error': 'No data found'}, status=400)
-                
-                df = pd.read_json(io.StringIO(data_json), orient='split')
-                tracker = AnalysisTracker(df)
+                tracker = AnalysisTracker(df, dataset.fingerprint)
             
             # Apply the new filter
             target = request.GET.get('target')
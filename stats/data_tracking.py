@@ -3,13 +3,52 @@ import json
 from django.http import JsonResponse
 import plotly.express as px
 from pandas.api.types import is_numeric_dtype, is_datetime64_any_dtype
+from .ingestion import observed_value_counts
+from .aggregation import SCATTER_MAX_POINTS, binned_histogram_figure, density_figure, histogram_bins
+from .filter_engine import ConditionTerm, FilterMasks, condition_mask
+from .sampling import get_max_samples, sample_rows
+
+# Shown in place of the plot when a filter leaves no rows
+NO_MATCHING_ROWS_HTML = """
+<div style='
+    text-align:center; 
+    padding:30px; 
+    font-size:18px; 
+    color:#444; 
+    border:1px dashed #ccc; 
+    border-radius:10px;
+    background-color:#f9f9f9;
+    max-width:600px;
+    margin:30px auto;
+'>
+    <strong>لا يوجد بيانات مطابقة لمعايير الفلتر الخاصة بك.</strong><br><br>
+    يرجى التحقق من التالي:
+    <ul style='text-align:left; max-width:400px; margin:10px auto; font-size:16px;'>
+        <li>1-التحقق من قيم الفلتر (مثل المدى الأدنى/الأقصى أو الفئة المحددة).</li>
+        <li>2-التأكد من أن العمود الذي فلترته يحتوي على قيم متوقعة.</li>
+    </ul>
+</div>
+"""
+
+# Bins of the histogram of a filtered numeric column
+HISTOGRAM_BINS = 50
+# Most frequent values shown for a filtered categorical column
+TOP_VALUES = 10
+
+
 class DataTracker:
-    def __init__(self, df):
-        self.original_df = df.copy()
-        self.current_df = df.copy()
+    def __init__(self, df, fingerprint=None):
+        # Loaded frames are read-only (see dataset_store), so filtering never needs defensive copies
+        self.original_df = df
+        self.current_df = df
         self.columns = df.columns.tolist()
         self.filters = {}
         self.comparisons = {}   
+        # Filter chain compiled to one mask: a condition term per filtered
+        # column, with the term masks cached over original_df (and shared
+        # across requests when the fingerprint of its dataset is given)
+        self.filter_terms = {}
+        self.filter_masks = FilterMasks(df, fingerprint=fingerprint)
 
     def get_type_column(self, column):
         if column in self.original_df.select_dtypes(include=['number']).columns:
@@ -19,51 +58,72 @@ class DataTracker:
         else:
             return 'categorical'
 
-    def add_filter(self, mode, column, condition, values, filter_column=None):
+    def apply_filter(self, mode, column, condition, values, filter_column=None):
+        """
+        Filter the data and build the figure of the filtered column.
+
+        Filtering a column again replaces its previous filter; only the new
+        condition is evaluated, the masks of the other filters are reused.
+
+        Returns:
+            tuple: (figure, or None when no row matches, row count)
+        """
         if column not in self.columns:
             raise ValueError(f"Column '{column}' not found in DataFrame")
-        
-        get_column_type = self.get_type_column(column)
-        df = self.current_df
 
+        dict_filter = {
+            'mode': mode,
+            'column': column,
+            'condition': condition,
+            'values': values
+        }
+        if mode == 'self':
+            term = ConditionTerm(column, condition, values)
+        elif mode == 'other':
+            if filter_column not in self.columns:
+                raise ValueError(f"Column '{filter_column}' not found in DataFrame")
+            dict_filter['filter_column'] = filter_column
+            term = ConditionTerm(filter_column, condition, values)
+        else:
+            raise ValueError(f"Invalid filter mode: {mode}")
+
+        self.filters[column] = dict_filter
+        self.filter_terms[column] = term
+        fig, row_count = self.plot_column(column, filter_column if mode == 'other' else None)
+        return (fig if row_count else None), row_count
+
+    def plot_column(self, column, filter_column=None):
+        """
+        Figure of a column over the rows matching the filter chain.
+
+        Returns:
+            tuple: (figure, row count)
+        """
+        self.current_df = self.filter_masks.filter(self.filter_terms.values())
+
+        get_column_type = self.get_type_column(column)
         if get_column_type == 'numerical':
-            controller = NumericalController(df)
+            controller = NumericalController(self.current_df)
         elif get_column_type == 'categorical':
-            controller = CategoricalController(df)
+            controller = CategoricalController(self.current_df)
         elif get_column_type == 'datetime':
-            controller = DateTimeController(df)
+            controller = DateTimeController(self.current_df)
 
-        if mode == 'self':
-            dict_filter , html, row_count = controller.filter_by_value(column, mode, condition, values)
-        elif mode == 'other':
-            df_sec = self.current_df[[filter_column]]  # Changed to DataFrame
-            filter_column_type = self.get_type_column(filter_column)
-            dict_filter, html, row_count = controller.filter_by_other(column, filter_column, mode, condition, values,df_sec, filter_column_type)
-
-
-        if row_count == 0:
-            html = """
-            <div style='
-                text-align:center; 
-                padding:30px; 
-                font-size:18px; 
-                color:#444; 
-                border:1px dashed #ccc; 
-                border-radius:10px;
-                background-color:#f9f9f9;
-                max-width:600px;
-                margin:30px auto;
-            '>
-                <strong>لا يوجد بيانات مطابقة لمعايير الفلتر الخاصة بك.</strong><br><br>
-                يرجى التحقق من التالي:
-                <ul style='text-align:left; max-width:400px; margin:10px auto; font-size:16px;'>
-                    <li>1-التحقق من قيم الفلتر (مثل المدى الأدنى/الأقصى أو الفئة المحددة).</li>
-                    <li>2-التأكد من أن العمود الذي فلترته يحتوي على قيم متوقعة.</li>
-                </ul>
-            </div>
-            """
-        self.filters[column] = dict_filter
-        return html, row_count
+        return controller.plot(column, filter_column)
+
+    def add_filter(self, mode, column, condition, values, filter_column=None):
+        fig, row_count = self.apply_filter(mode, column, condition, values, filter_column)
+        if fig is None:
+            return NO_MATCHING_ROWS_HTML, row_count
+        return fig.to_html(full_html=False, include_plotlyjs='cdn'), row_count
+
+    def remove_filter(self, column):
+        """Drop the filter of a column; the masks of the other filters are reused"""
+        self.filters.pop(column, None)
+        term = self.filter_terms.pop(column, None)
+        if term is not None:
+            self.filter_masks.discard(term)
+        self.current_df = self.filter_masks.filter(self.filter_terms.values())
     
     def add_comparison(self, column1, column2, plot_type=None):
         """Add comparison plot to tracking"""
@@ -71,7 +131,7 @@ class DataTracker:
             raise ValueError("One or both columns not found in DataFrame")
             
         # Generate comparison plot
-        comparison = ComparisonTracker(self.current_df)
+        comparison = ComparisonTracker(self.comparison_rows(column1, column2))
         html = comparison.get_comparison_plot(column1, column2, plot_type)
         
         # Store comparison and return HTML
@@ -84,146 +144,127 @@ class DataTracker:
         }
         self.comparisons[key] = dict_comparison
         return html
-        
-        
-        
 
-class NumericalController:        
-    def __init__(self, df):
-        self.df = df
+    def comparison_rows(self, column1, column2):
+        """Rows a comparison is drawn from: the filtered data"""
+        return self.current_df
 
-    def filter_by_value(self, column, mode, condition, values):
-        if column not in self.df.columns:
-            available_columns = self.df.columns.tolist()
-            raise ValueError(f"العمود '{column}' غير موجود في DataFrame. الأعمدة المتاحة: {available_columns}")
-
-
-        col_dtype = self.df[column].dtype
-
-        try:
-            if condition == '=':
-                mask = self.df[column].isin([col_dtype.type(v) for v in values])
-            elif condition == '!=':
-                mask = ~self.df[column].isin([col_dtype.type(v) for v in values])
-            elif condition == '>':
-                mask = self.df[column] > col_dtype.type(values[0])
-            elif condition == '<':
-                mask = self.df[column] < col_dtype.type(values[0])
-            elif condition == '>=':
-                mask = self.df[column] >= col_dtype.type(values[0])
-            elif condition == '<=':
-                mask = self.df[column] <= col_dtype.type(values[0])
-            elif condition == 'between':
-                if not isinstance(values, (list, tuple)) or len(values) != 2:
-                    raise ValueError("للفلتر 'between'، يجب أن تكون القيم قائمة أو توربل من عنصرين.")
-                mask = self.df[column].between(col_dtype.type(values[0]), col_dtype.type(values[1]))
-            else:
-                raise ValueError(f"الشرط غير صالح: {condition}")
-        except Exception as e:
-            raise ValueError(f"خطأ أثناء تطبيق الشرط '{condition}' مع القيم {values}: {e}")
 
+class SQLDataTracker(DataTracker):
+    """
+    ``DataTracker`` over the SQL copy of a large dataset (see ``sql_store``).
 
-        filtered_df = self.df[mask]
+    The filter chain is translated to SQL and figures are drawn from the
+    counts the queries return, so the dataset is never loaded into memory.
+    Comparisons use a sample of the filtered rows.
 
-        dict_filter = {
-            'mode': mode,
-            'column': column,
-            'condition': condition,
-            'values': values
-        }
+    Args:
+        store: ``SQLStore`` of the dataset
+    """
 
-        fig = px.histogram(filtered_df, x=column, title=f"المخطط التكراري للعمود {column}", nbins=50)
-        fig.update_layout(xaxis_title=column, yaxis_title="Count")
-        fig.update_layout(
-            showlegend=True,
-            template='plotly_white',
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
+    def __init__(self, store):
+        self.store = store
+        self.columns = list(store.columns)
+        self.filters = {}
+        self.comparisons = {}
+        self.filter_terms = {}
 
-        html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-        row_count = len(filtered_df)
+    def get_type_column(self, column):
+        kind = self.store.column_kind(column)
+        if kind == 'numeric':
+            return 'numerical'
+        # Like select_dtypes(include=['datetime']), which leaves out tz-aware columns
+        elif kind == 'datetime' and not self.store.column_meta(column).get('tz'):
+            return 'datetime'
+        else:
+            return 'categorical'
 
-        return dict_filter, html, row_count
-    
-    def filter_by_other(self, column,filter_column, mode, condition, values,df_sec, filter_column_type):
+    def plot_column(self, column, filter_column=None):
+        terms = list(self.filter_terms.values())
+        get_column_type = self.get_type_column(column)
+        if get_column_type == 'numerical':
+            binned = self.store.histogram(column, terms, bins=HISTOGRAM_BINS)
+            return NumericalController.figure(column, binned, filter_column), self.store.count(terms)
+        if get_column_type == 'datetime':
+            date_counts = self.store.date_counts(column, terms)
+            return DateTimeController.figure(column, date_counts, filter_column), self.store.count(terms)
+
+        value_counts = self.store.value_counts(column, terms, limit=TOP_VALUES)
+        # Rows without a value are not counted when filtering the column itself
+        row_count = self.store.count(terms, column=None if filter_column else column)
+        return CategoricalController.figure(column, value_counts, filter_column), row_count
+
+    def remove_filter(self, column):
+        """Drop the filter of a column"""
+        self.filters.pop(column, None)
+        self.filter_terms.pop(column, None)
+
+    def comparison_rows(self, column1, column2):
+        return self.store.sample([column1, column2], get_max_samples(), self.filter_terms.values())
+        
+        
+        
 
-        if filter_column_type == 'numerical':
-            mask = NumericalController.get_mask(df_sec,filter_column, condition, values)
-        elif filter_column_type == 'categorical':
-            mask = CategoricalController.get_mask(df_sec, filter_column, condition, values)
-        elif filter_column_type == 'datetime':
-            mask = DateTimeController.get_mask(df_sec, filter_column, condition, values)
+class NumericalController:        
+    def __init__(self, df):
+        self.df = df
 
-        filtered_df = self.df[mask]
+    def plot(self, column, filter_column=None):
+        """Histogram of the (already filtered) column"""
+        binned = histogram_bins(self.df[column], bins=HISTOGRAM_BINS)
+        return self.figure(column, binned, filter_column), len(self.df)
 
-        dict_filter = {
-            'mode': mode,
-            'column': column,
-            'filter_column': filter_column,
-            'condition': condition,
-            'values': values
-        }
+    @staticmethod
+    def figure(column, binned, filter_column=None):
+        """Histogram figure from bin edges and counts (see ``histogram_bins``)"""
+        if filter_column:
+            title = f"المخطط التكراري للعمود {column} بعمود مراد تصفيته {filter_column}"
+        else:
+            title = f"المخطط التكراري للعمود {column}"
 
-        fig = px.histogram(filtered_df, x=column, title=f"المخطط التكراري للعمود {column} بعمود مراد تصفيته {filter_column}", nbins=50)
+        fig = binned_histogram_figure(binned, title=title, x_title=str(column))
         fig.update_layout(xaxis_title=column, yaxis_title="Count")
         fig.update_layout(
             showlegend=True,
             template='plotly_white',
             margin=dict(l=40, r=40, t=40, b=40)
         )
-
-        html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-        row_count = len(filtered_df)
-
-        return dict_filter, html, row_count
+        return fig
 
     @staticmethod 
     def get_mask(df, column, condition, values):
-        col_dtype = df[column].dtype
-        if condition == '=':
-            mask =df[column].isin([col_dtype.type(v) for v in values])
-        elif condition == '!=':
-            mask = ~df[column].isin([col_dtype.type(v) for v in values])
-        elif condition == '>':
-            mask = df[column] > col_dtype.type(values[0])
-        elif condition == '<':
-            mask = df[column] < col_dtype.type(values[0])
-        elif condition == '>=':
-            mask = df[column] >= col_dtype.type(values[0])
-        elif condition == '<=':
-            mask = df[column] <= col_dtype.type(values[0])
-        elif condition == 'between':
-            mask = df[column].between(col_dtype.type(values[0]), col_dtype.type(values[1]))
-        else:
-            raise ValueError(f"Invalid condition: {condition}")
-        
-        return mask
-
+        return condition_mask(df[column], condition, values)
 
 
 class CategoricalController:
     def __init__(self, df):
         self.df = df
-    def filter_by_value(self,column,mode,condition,values):
-        if column not in self.df.columns:
-            available_columns = self.df.columns.tolist()
-            raise ValueError(f"العمود '{column}' غير موجود في DataFrame. الأعمدة المتاحة: {available_columns}")
-
-        if condition == '=':
-            mask = self.df[column].isin(values)
-        elif condition == '!=':
-            mask = ~self.df[column].isin(values)
 
-        filtered_df = self.df[mask]
-        filtered_df = filtered_df.dropna(subset=[column])
-        value_counts = filtered_df[column].value_counts().head(10)
+    def plot(self, column, filter_column=None):
+        """Pie or bar chart of the top values of the (already filtered) column"""
+        values = self.df[column]
+        # Rows without a value are not counted when filtering the column itself
+        row_count = len(self.df) if filter_column else int(values.notna().sum())
+        value_counts = observed_value_counts(values).head(TOP_VALUES)
+        return self.figure(column, value_counts, filter_column), row_count
 
-        dict_filter = {
-            'mode': mode,
-            'column': column,
-            'condition': condition,
-            'values': values
-        }
+    @staticmethod
+    def figure(column, value_counts, filter_column=None):
+        """Pie or bar chart of value counts, most frequent first"""
+        if filter_column:
+            if len(value_counts) <= 7:
+                fig = px.pie(names=value_counts.index,values=value_counts.values,title=f"المخطط الدائري للعمود {column} بعمود مراد تصفيته {filter_column}")
+            else:
+                fig = px.bar(x=value_counts.index, 
+                            y=value_counts.values,
+                            title=f"المخطط العمودي لأكثر 10 قيم في {column} بعمود مراد تصفيته {filter_column}")
+            fig.update_layout(xaxis_title=column, yaxis_title="Count")
+            fig.update_layout(
+                showlegend=True,
+                template='plotly_white',
+                margin=dict(l=40, r=40, t=40, b=40)
+            )
+            return fig
 
         if len(value_counts) <= 7:
             fig = px.pie(names=value_counts.index, values=value_counts.values, title=f"المخطط الدائري للعمود {column}")
@@ -251,191 +292,83 @@ class CategoricalController:
             plot_bgcolor='rgba(0,0,0,0)',  # Transparent background
             showlegend=False  # Hide legend if not needed
         )
-
-
-        html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-        row_count = len(filtered_df)
-
-        return dict_filter, html, row_count
-    
+        return fig
 
     @staticmethod
     def get_mask(df, column, condition, values):
-        if condition == '=':
-            mask = df[column].isin(values)
-        elif condition == '!=':
-            mask = ~df[column].isin(values)
-        return mask
-
-    def filter_by_other(self, column, filter_column, mode, condition, values, df_sec, filter_column_type):
-        
-        if filter_column_type == 'numerical':
-            mask = NumericalController.get_mask(df_sec, filter_column, condition, values)
-        elif filter_column_type == 'categorical':
-            mask = CategoricalController.get_mask(df_sec, filter_column, condition, values)
-        elif filter_column_type == 'datetime':
-            mask = DateTimeController.get_mask(df_sec,filter_column, condition, values)
-
-        filtered_df = self.df[mask]
-        
-        dict_filter = {
-            'mode': mode,
-            'column': column,
-            'filter_column': filter_column,
-            'condition': condition,
-            'values': values
-        }
-
-        value_counts = filtered_df[column].value_counts().head(10)
-        if len(value_counts) <= 7:
-            fig = px.pie(names=value_counts.index,values=value_counts.values,title=f"المخطط الدائري للعمود {column} بعمود مراد تصفيته {filter_column}")
-        else:
-            fig = px.bar(x=value_counts.index, 
-                        y=value_counts.values,
-                        title=f"المخطط العمودي لأكثر 10 قيم في {column} بعمود مراد تصفيته {filter_column}")
-        fig.update_layout(xaxis_title=column, yaxis_title="Count")
-        fig.update_layout(
-            showlegend=True,
-            template='plotly_white',
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
-
-        html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-        row_count = len(filtered_df)
-
-        return dict_filter, html, row_count
+        return condition_mask(df[column], condition, values)
 
 
 class DateTimeController:
     def __init__(self, df):
         self.df = df
-    def filter_by_value(self,column,mode,condition,values):
-        if condition == '=':
-            mask = self.df.isin(values)
-        elif condition == '!=':
-            mask = ~self.df.isin(values)
-        elif condition == '>':
-            mask = self.df > values
-        elif condition == '<':
-            mask = self.df < values
-        elif condition == '>=':
-            mask = self.df >= values
-        elif condition == '<=':
-            mask = self.df <= values
-        elif condition == 'between':
-            mask = self.df.between(values[0], values[1])
-        else:
-            raise ValueError(f"Invalid condition: {condition}")
-
-        filtered_df = self.df[mask]
-
-        dict_filter = {
-            'mode': mode,
-            'column': column,
-            'condition': condition,
-            'values': values
-        }
-
-
-        date_counts = filtered_df.value_counts()
-        fig = px.line(x=date_counts.index, y=date_counts.values, title=f"المخطط الزمني للعمود {column}")
-        fig.update_layout(xaxis_title=column, yaxis_title="Count")
-        fig.update_layout(
-            showlegend=True,
-            template='plotly_white',
-            margin=dict(l=40, r=40, t=40, b=40)
-        )
-
-        html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-        row_count = len(filtered_df)
-
-        return dict_filter, html, row_count
 
+    def plot(self, column, filter_column=None):
+        """Counts over time of the (already filtered) column"""
+        date_counts = self.df[column].value_counts().sort_index()
+        return self.figure(column, date_counts, filter_column), len(self.df)
 
     @staticmethod
-    def get_mask(df, condition, values):
-        if condition == '=':
-            mask = df.isin(values)
-        elif condition == '!=':
-            mask = ~df.isin(values)
-        elif condition == '>':
-            mask = df > values
-        elif condition == '<':
-            mask = df < values
-        elif condition == '>=':
-            mask = df >= values
-        elif condition == '<=':
-            mask = df <= values
-        elif condition == 'between':
-            mask = df.between(values[0], values[1])
+    def figure(column, date_counts, filter_column=None):
+        """Line chart of counts per date, in date order"""
+        if filter_column:
+            title = f"المخطط الزمني للعمود {column} بعمود مراد تصفيته {filter_column}"
         else:
-            raise ValueError(f"Invalid condition: {condition}")
-        
-        return mask
-    
-
-    def filter_by_other(self, column, filter_column, mode, condition, values,df_sec, filter_column_type):
+            title = f"المخطط الزمني للعمود {column}"
 
-        if filter_column_type == 'numerical':
-            mask = NumericalController.get_mask(df_sec, condition, values)
-        elif filter_column_type == 'categorical':
-            mask = CategoricalController.get_mask(df_sec, condition, values)
-        elif filter_column_type == 'datetime':
-            mask = DateTimeController.get_mask(df_sec, condition, values)
-
-        filtered_df = self.df[mask]
-        
-        dict_filter = {
-            'mode': mode,
-            'column': column,
-            'filter_column': filter_column,
-            'condition': condition,
-            'values': values
-        }
-
-        fig = px.line(x=filtered_df.value_counts().index, y=filtered_df.value_counts().values, title=f"المخطط الزمني للعمود {column} بعمود مراد تصفيته {filter_column}")
+        fig = px.line(x=date_counts.index, y=date_counts.values, title=title)
         fig.update_layout(xaxis_title=column, yaxis_title="Count")
         fig.update_layout(
             showlegend=True,
             template='plotly_white',
             margin=dict(l=40, r=40, t=40, b=40)
         )
+        return fig
 
-        html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-        row_count = len(filtered_df)
-
-        return dict_filter, html, row_count
+    @staticmethod
+    def get_mask(df, column, condition, values):
+        return condition_mask(df[column], condition, values)
 
 
 class ComparisonTracker:
-    def __init__(self, df, max_samples=100000, max_categories=50):
+    def __init__(self, df, max_samples=None, max_categories=50, stratify_by=None, sample_key=None):
         """
         Initialize the ComparisonTracker with performance safeguards
         
         Parameters:
         - df: DataFrame to analyze
         - max_samples: Maximum number of rows to use for visualization
+          (defaults to STATS_SAMPLE_MAX_ROWS)
         - max_categories: Maximum number of categories to display in categorical plots
+        - stratify_by: Categorical column to stratify the sample by; defaults to
+          the categorical column of the comparison
+        - sample_key: Identifies the contents of df (e.g. dataset fingerprint) so
+          the sample is drawn once and reused by later comparisons
         """
         self.original_df = df
-        self.max_samples = max_samples
+        self.max_samples = max_samples or get_max_samples()
         self.max_categories = max_categories
-        # Create a sampling strategy based on dataset size
-        self.df = self._create_safe_sample(df)
+        self.stratify_by = stratify_by
+        self.sample_key = sample_key
+        self._sample = None
         self.color_theme = px.colors.qualitative.Plotly  # Custom color theme
+
+    @property
+    def df(self):
+        """Rows used for the plots, sampled on first use"""
+        if self._sample is None:
+            self._sample = self._create_safe_sample(self.original_df)
+        return self._sample
         
     def _create_safe_sample(self, df):
-        """Create a performance-safe sample of the dataframe"""
-        if len(df) > self.max_samples:
-            # Use stratified sampling if possible, otherwise random sampling
-            sample_fraction = self.max_samples / len(df)
-            return df.sample(frac=sample_fraction, random_state=42)
-        return df.copy()
+        """Create a performance-safe, deterministic sample of the dataframe"""
+        # Stratified sampling keeps rare categories of the stratifying column visible
+        return sample_rows(df, self.max_samples, stratify_by=self.stratify_by, key=self.sample_key)
         
     def get_column_type(self, column):
-        if is_numeric_dtype(self.df[column]):
+        if is_numeric_dtype(self.original_df[column]):
             return 'numerical'
-        elif is_datetime64_any_dtype(self.df[column]):
+        elif is_datetime64_any_dtype(self.original_df[column]):
             return 'datetime'
         else:
             return 'categorical'
@@ -450,10 +383,24 @@ class ComparisonTracker:
         top_n = value_counts.nlargest(n).index.tolist()
         
         return top_n
+
+    def _group_rare_categories(self, df, column, top_categories):
+        """Replace the values of ``column`` outside ``top_categories`` with 'Other', in place"""
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and 'Other' not in df[column].cat.categories:
+            # Ingested text columns are categorical; 'Other' must be a category before it is assigned
+            df[column] = df[column].cat.add_categories('Other')
+        df.loc[~df[column].isin(top_categories), column] = 'Other'
         
     def get_comparison_plot(self, col1, col2, plot_type=None):
+        fig = self.get_comparison_figure(col1, col2, plot_type)
+        return fig.to_html(full_html=False, include_plotlyjs='cdn')
+
+    def get_comparison_figure(self, col1, col2, plot_type=None):
         col1_type = self.get_column_type(col1)
         col2_type = self.get_column_type(col2)
+        if self.stratify_by is None and self._sample is None:
+            categorical = [col for col, kind in ((col1, col1_type), (col2, col2_type)) if kind == 'categorical']
+            self.stratify_by = categorical[0] if categorical else None
         
         # Check for high cardinality issues before proceeding
         self._check_cardinality_warning(col1, col2)
@@ -493,8 +440,8 @@ class ComparisonTracker:
 
     # --- Enhanced Plot Methods with Performance Optimizations ---
     def _numerical_vs_numerical(self, col1, col2, plot_type):
-        # For extremely large datasets, use datashader or hexbin instead of scatter
-        if len(self.df) > 10000 and (plot_type == 'scatter' or not plot_type):
+        # Large datasets are binned on the server instead of drawing every point
+        if len(self.df) > SCATTER_MAX_POINTS and (plot_type == 'scatter' or not plot_type):
             plot_type = 'hexbin'
             
         if plot_type == 'scatter':
@@ -507,26 +454,18 @@ class ComparisonTracker:
                 hovertemplate=f"<b>{col1}</b>: %{{x}}<br><b>{col2}</b>: %{{y}}<extra></extra>"
             )
         elif plot_type == 'hexbin':
-            # Memory-efficient alternative to scatter for large datasets
-            fig = px.density_heatmap(
-                self.df, x=col1, y=col2,
+            # Grid size adapts to the row count; the payload does not grow with it
+            fig = density_figure(
+                self.df[col1], self.df[col2],
                 title=f"{col1} vs {col2}: Hex Density Plot",
-                color_continuous_scale=self.color_theme,
-                nbinsx=50, nbinsy=50  # Limit bin count for performance
-            )
-            fig.update_traces(
-                hovertemplate=f"<b>{col1}</b>: %{{x}}<br><b>{col2}</b>: %{{y}}<br>Count: %{{z}}<extra></extra>"
+                colorscale=self.color_theme
             )
         elif plot_type == 'heatmap':
-            # Set reasonable bin limits for performance
-            fig = px.density_heatmap(
-                self.df, x=col1, y=col2,
+            fig = density_figure(
+                self.df[col1], self.df[col2],
                 title=f"Density Distribution: {col1} vs {col2}",
-                color_continuous_scale=self.color_theme,
-                nbinsx=40, nbinsy=40  # Limit bin count for performance
-            )
-            fig.update_traces(
-                hovertemplate=f"<b>{col1}</b>: %{{x}}<br><b>{col2}</b>: %{{y}}<br>Density: %{{z}}<extra></extra>"
+                bins=40,
+                colorscale=self.color_theme
             )
 
         fig.update_layout(
@@ -537,7 +476,7 @@ class ComparisonTracker:
             font=dict(family="Arial", size=12),
             title_font=dict(size=16, color="#2c3e50")
         )
-        return fig.to_html(full_html=False, include_plotlyjs='cdn')
+        return fig
 
     def _numerical_vs_categorical(self, numerical_col, categorical_col, plot_type):
         """
@@ -588,7 +527,7 @@ class ComparisonTracker:
             )
         elif plot_type == 'bar':
             # Calculate aggregated statistics instead of using all data points
-            agg_data = filtered_df.groupby(categorical_col)[numerical_col].agg(['mean', 'count']).reset_index()
+            agg_data = filtered_df.groupby(categorical_col, observed=True)[numerical_col].agg(['mean', 'count']).reset_index()
             agg_data.columns = [categorical_col, 'mean', 'count']
             
             fig = px.bar(
@@ -610,7 +549,7 @@ class ComparisonTracker:
             # For large datasets, limit points or use sampling
             if len(filtered_df) > 5000:
                 # Use a smaller sample for strip plots
-                plot_df = filtered_df.groupby(categorical_col).apply(
+                plot_df = filtered_df.groupby(categorical_col, observed=True).apply(
                     lambda x: x.sample(min(1000, len(x)), random_state=42)
                 ).reset_index(drop=True)
             else:
@@ -641,7 +580,7 @@ class ComparisonTracker:
         if unique_cats > 5:
             fig.update_layout(xaxis=dict(tickangle=45))
             
-        return fig.to_html(full_html=False, include_plotlyjs='cdn')
+        return fig
 
     def _categorical_vs_categorical(self, col1, col2, plot_type):
         """
@@ -658,8 +597,8 @@ class ComparisonTracker:
             
             # Filter dataframe to include only top categories (plus 'Other')
             df_filtered = self.df.copy()
-            df_filtered.loc[~df_filtered[col1].isin(top_cats1), col1] = 'Other'
-            df_filtered.loc[~df_filtered[col2].isin(top_cats2), col2] = 'Other'
+            self._group_rare_categories(df_filtered, col1, top_cats1)
+            self._group_rare_categories(df_filtered, col2, top_cats2)
         else:
             df_filtered = self.df
         
@@ -667,14 +606,15 @@ class ComparisonTracker:
         # Using value_counts is more memory efficient than crosstab
         if plot_type == 'heatmap' or not plot_type:
             # Compute counts efficiently
-            grouped = df_filtered.groupby([col1, col2]).size().reset_index(name='count')
+            grouped = df_filtered.groupby([col1, col2], observed=True).size().reset_index(name='count')
             
             # Pivot to create a matrix (much more efficient than pd.crosstab)
             pivot_table = grouped.pivot_table(
                 index=col1, 
                 columns=col2, 
                 values='count', 
-                fill_value=0
+                fill_value=0,
+                observed=True
             )
             
             fig = px.imshow(
@@ -690,7 +630,7 @@ class ComparisonTracker:
             )
         elif plot_type == 'stacked_bar':
             # Use the grouped data for efficient bar chart
-            grouped = df_filtered.groupby([col1, col2]).size().reset_index(name='count')
+            grouped = df_filtered.groupby([col1, col2], observed=True).size().reset_index(name='count')
             
             fig = px.bar(
                 grouped,
@@ -709,7 +649,7 @@ class ComparisonTracker:
         elif plot_type == 'mosaic':
             # More efficient alternative to create_annotated_heatmap
             # Calculate proportions directly
-            grouped = df_filtered.groupby([col1, col2]).size().reset_index(name='count')
+            grouped = df_filtered.groupby([col1, col2], observed=True).size().reset_index(name='count')
             total = grouped['count'].sum()
             grouped['proportion'] = grouped['count'] / total
             
@@ -746,7 +686,7 @@ class ComparisonTracker:
                (plot_type == 'stacked_bar' and col1_nunique > 5):
                 fig.update_layout(xaxis=dict(tickangle=45))
         
-        return fig.to_html(full_html=False, include_plotlyjs='cdn')
+        return fig
 
 
     def _datetime_comparison(self, col1, col2, plot_type):
@@ -787,9 +727,7 @@ class ComparisonTracker:
                 )
             elif plot_type == 'scatter':
                 # For large datasets, sample points
-                plot_df = self.df
-                if len(self.df) > 5000:
-                    plot_df = self.df.sample(5000, random_state=42)
+                plot_df = sample_rows(self.df, 5000)
                     
                 fig = px.scatter(
                     plot_df,
@@ -833,7 +771,7 @@ class ComparisonTracker:
             if other_col_type == 'categorical' and self.df[other_col].nunique() > self.max_categories:
                 top_cats = self._get_top_n_categories(other_col)
                 plot_df = self.df.copy()
-                plot_df.loc[~plot_df[other_col].isin(top_cats), other_col] = 'Other'
+                self._group_rare_categories(plot_df, other_col, top_cats)
             else:
                 plot_df = self.df
                 
@@ -871,7 +809,7 @@ class ComparisonTracker:
                 
                 # Create efficient aggregation
                 plot_df[f"{datetime_col}_period"] = plot_df[datetime_col].dt.to_period(freq)
-                cat_counts = plot_df.groupby([f"{datetime_col}_period", other_col]).size().unstack(fill_value=0)
+                cat_counts = plot_df.groupby([f"{datetime_col}_period", other_col], observed=True).size().unstack(fill_value=0)
                 
                 # Convert period index to datetime for better visualization
                 cat_counts.index = cat_counts.index.to_timestamp()
@@ -904,6 +842,6 @@ class ComparisonTracker:
             hovermode="x unified",
             margin=dict(l=60, r=40, t=60, b=40)
         )
-        return fig.to_html(full_html=False, include_plotlyjs='cdn')
+        return fig
 
 
@@ -0,0 +1,781 @@
+"""
+Columnar on-disk storage for uploaded datasets.
+
+Every upload is written once to ``STATS_DATASET_ROOT/<fingerprint>/`` as one
+``.npy`` file per column plus a ``manifest.json`` describing how to rebuild the
+pandas dtype of each column, a ``profile.json`` with the column statistics
+(see ``profiling``) and an index of the distinct values of each column (see
+``value_index``). Columns are memory-mapped on read, so a request only pays
+for the columns it actually touches. The session only keeps the id of the
+registered ``Dataset`` row.
+"""
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .caching import get_dataframe_cache
+from .models import Dataset
+from .derived import parse_derived_column
+from .ingestion import spool_upload
+from .profiling import build_profile, profile_dataframe, read_profile, write_profile
+from .value_index import ValueIndex, build_value_index, get_value_index_cache, read_value_index, value_index_file, write_value_index, write_value_indexes
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'dataset_id'
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+# Rows decoded at a time when a stored dataset is read in chunks
+READ_CHUNK_ROWS = 100000
+
+# Session keys used before the columnar store existed. They are dropped
+# whenever a new dataset is attached to the session.
+LEGACY_SESSION_KEYS = ('csv_data', 'df_json', 'dataframe', 'filtered_data', 'analysis_tracker', 'analysis_conversation')
+# Session state describing a view of the attached dataset (see row_selection)
+DATASET_VIEW_SESSION_KEYS = ('row_selection',)
+
+
+def get_store_root():
+    """Return the directory holding all columnar datasets."""
+    return getattr(settings, 'STATS_DATASET_ROOT', os.path.join(settings.BASE_DIR, 'dataset_store'))
+
+
+def compute_fingerprint(df):
+    """
+    Compute a content fingerprint for a DataFrame.
+
+    The fingerprint covers column names, dtypes and cell values, so two uploads
+    of the same table map to the same stored copy.
+    """
+    return _fingerprint(df.columns, df.dtypes, [df])
+
+
+def _fingerprint(columns, dtypes, frames):
+    """Fingerprint of the rows of ``frames`` (consecutive row chunks of one table)."""
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps([str(col) for col in columns]).encode('utf-8'))
+    hasher.update(json.dumps([str(dtype) for dtype in dtypes]).encode('utf-8'))
+    for frame in frames:
+        if len(columns) and len(frame):
+            hasher.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return hasher.hexdigest()
+
+
+def _json_safe(values):
+    """Convert an array of labels to JSON-serializable Python objects."""
+    safe = []
+    for value in values:
+        if isinstance(value, (str, bool, int, float)) or value is None:
+            safe.append(value)
+        elif isinstance(value, np.generic):
+            safe.append(value.item())
+        else:
+            safe.append(str(value))
+    return safe
+
+
+def _encode_column(series):
+    """
+    Split a Series into the arrays written to disk.
+
+    Returns:
+        tuple: (meta dict, values ndarray, labels list or None)
+    """
+    dtype = series.dtype
+    meta = {'name': series.name, 'dtype': str(dtype)}
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        meta['kind'] = 'category'
+        meta['ordered'] = bool(dtype.ordered)
+        return meta, series.cat.codes.to_numpy(), _json_safe(dtype.categories)
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        meta['kind'] = 'datetime'
+        tz = getattr(dtype, 'tz', None)
+        if tz is not None:
+            meta['tz'] = str(tz)
+            series = series.dt.tz_convert('UTC').dt.tz_localize(None)
+        return meta, series.to_numpy(dtype='datetime64[ns]'), None
+
+    if pd.api.types.is_bool_dtype(dtype) and not series.isna().any():
+        meta['kind'] = 'bool'
+        return meta, series.to_numpy(dtype=bool), None
+
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        meta['kind'] = 'numeric'
+        if isinstance(dtype, np.dtype):
+            return meta, series.to_numpy(), None
+        # Nullable extension types (Int64, Float32, ...) are stored as plain
+        # numpy arrays; missing values become NaN.
+        if series.isna().any():
+            return meta, series.to_numpy(dtype='float64', na_value=np.nan), None
+        return meta, series.to_numpy(dtype=dtype.numpy_dtype), None
+
+    # Everything else (strings, mixed objects, nullable booleans) is stored
+    # dictionary-encoded: integer codes plus the list of distinct labels.
+    meta['kind'] = 'object'
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    return meta, codes, _json_safe(uniques)
+
+
+def write_columnar(df, directory):
+    """
+    Write a DataFrame to ``directory`` in the columnar layout.
+
+    Args:
+        df: DataFrame to persist
+        directory: Target directory (must not exist yet)
+
+    Returns:
+        dict: The manifest that was written
+    """
+    os.makedirs(directory)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'row_count': int(len(df)),
+        'columns': []
+    }
+
+    for position, column in enumerate(df.columns):
+        meta, values, labels = _encode_column(df[column])
+        meta['name'] = column
+        meta['file'] = f"col_{position:05d}.npy"
+        np.save(os.path.join(directory, meta['file']), np.ascontiguousarray(values), allow_pickle=False)
+        if labels is not None:
+            _write_labels(directory, meta, labels)
+        manifest['columns'].append(meta)
+
+    _write_manifest(directory, manifest)
+    return manifest
+
+
+def _write_labels(directory, meta, labels):
+    meta['labels_file'] = f"{meta['file'][:-len('.npy')]}.labels.json"
+    with open(os.path.join(directory, meta['labels_file']), 'w', encoding='utf-8') as f:
+        json.dump(labels, f, ensure_ascii=False)
+
+
+def _write_manifest(directory, manifest):
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def _piece_encoder(dtype):
+    """
+    How the pieces of a column of ``dtype`` are stored (see ``_encode_column``).
+
+    Returns:
+        tuple: (meta dict, storage dtype, function turning a piece into the
+        stored values, function returning the labels once every piece was
+        encoded, or None)
+    """
+    meta = {'dtype': str(dtype)}
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        meta['kind'] = 'category'
+        meta['ordered'] = bool(dtype.ordered)
+        storage = pd.Categorical([], dtype=dtype).codes.dtype
+        return meta, storage, lambda piece: piece.cat.codes.to_numpy(), lambda: _json_safe(dtype.categories)
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        meta['kind'] = 'datetime'
+        tz = getattr(dtype, 'tz', None)
+        if tz is not None:
+            meta['tz'] = str(tz)
+
+        def encode(piece):
+            if tz is not None:
+                piece = piece.dt.tz_convert('UTC').dt.tz_localize(None)
+            return piece.to_numpy(dtype='datetime64[ns]')
+
+        return meta, np.dtype('datetime64[ns]'), encode, None
+
+    if isinstance(dtype, np.dtype) and dtype.kind == 'b':
+        meta['kind'] = 'bool'
+        return meta, dtype, lambda piece: piece.to_numpy(), None
+
+    if isinstance(dtype, np.dtype) and dtype.kind in 'iuf':
+        meta['kind'] = 'numeric'
+        return meta, dtype, lambda piece: piece.to_numpy(), None
+
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        # Nullable extension types cannot be checked for missing values
+        # up front, so they are always stored as float64 with NaN.
+        meta['kind'] = 'numeric'
+        return meta, np.dtype('float64'), lambda piece: piece.to_numpy(dtype='float64', na_value=np.nan), None
+
+    # Dictionary encoding with one dictionary for the whole column, in order
+    # of first appearance, exactly as pd.factorize on the full column.
+    meta['kind'] = 'object'
+    lookup = {}
+
+    def encode(piece):
+        codes, uniques = pd.factorize(piece, use_na_sentinel=True)
+        mapping = np.fromiter((lookup.setdefault(value, len(lookup)) for value in uniques), dtype=np.intp, count=len(uniques))
+        if not len(mapping):
+            return codes
+        return np.where(codes < 0, -1, mapping.take(np.where(codes < 0, 0, codes)))
+
+    return meta, np.dtype(np.intp), encode, lambda: _json_safe(list(lookup))
+
+
+def write_columns(columns, row_count, directory):
+    """
+    Write columns to ``directory`` in the columnar layout, piece by piece.
+
+    Unlike ``write_columnar`` this never needs a whole column in memory: the
+    pieces are written into memory-mapped ``.npy`` files as they come.
+
+    Args:
+        columns: ``(name, dtype, pieces)`` for every column, where ``pieces``
+            yields consecutive Series of ``dtype`` (see
+            ``ingestion.UploadColumns.iter_columns``)
+        row_count: Number of rows of every column
+        directory: Target directory (must not exist yet)
+
+    Returns:
+        dict: The manifest that was written
+    """
+    os.makedirs(directory)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'row_count': int(row_count),
+        'columns': []
+    }
+
+    for position, (column, dtype, pieces) in enumerate(columns):
+        encoding, storage, encode, labels = _piece_encoder(dtype)
+        meta = {'name': column, **encoding, 'file': f"col_{position:05d}.npy"}
+        path = os.path.join(directory, meta['file'])
+        if row_count:
+            values = np.lib.format.open_memmap(path, mode='w+', dtype=storage, shape=(row_count,))
+            offset = 0
+            for piece in pieces:
+                encoded = encode(piece)
+                values[offset:offset + len(encoded)] = encoded
+                offset += len(encoded)
+            values.flush()
+            del values
+            if offset != row_count:
+                raise ValueError(f"Column {column!r} has {offset} rows, expected {row_count}")
+        else:
+            for piece in pieces:
+                encode(piece)
+            np.save(path, np.empty(0, dtype=storage), allow_pickle=False)
+        if labels is not None:
+            _write_labels(directory, meta, labels())
+        manifest['columns'].append(meta)
+
+    _write_manifest(directory, manifest)
+    return manifest
+
+
+class ColumnarDataset:
+    """
+    Read-only view over a dataset stored in the columnar layout.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_NAME), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self._columns = {meta['name']: meta for meta in self.manifest['columns']}
+        self._profile = None
+
+    @property
+    def columns(self):
+        """Column names in their original order."""
+        return [meta['name'] for meta in self.manifest['columns']]
+
+    @property
+    def row_count(self):
+        return self.manifest['row_count']
+
+    def column_kind(self, column):
+        """Return the storage kind of a column ('numeric', 'datetime', 'bool', 'category', 'object')."""
+        return self._columns[column]['kind']
+
+    def derived_column(self, column):
+        """
+        Definition of ``column`` when it is a derived column of this dataset (see ``derived``).
+
+        Returns:
+            DerivedColumn or None for stored columns and unknown names
+        """
+        if column in self._columns:
+            return None
+        derived = parse_derived_column(column)
+        if derived is None or derived.source not in self._columns:
+            return None
+        return derived
+
+    def has_column(self, column):
+        """Whether ``column`` is a stored column or can be derived from one."""
+        return column in self._columns or self.derived_column(column) is not None
+
+    def read_derived(self, column, read_column=None):
+        """
+        Compute a derived column from its source column.
+
+        Args:
+            column: Derived column name
+            read_column: Optional loader for the source column
+
+        Raises:
+            ValueError: If the transformation does not apply to the source
+        """
+        derived = self.derived_column(column)
+        source = (read_column or self.read_column)(derived.source)
+        return derived.compute(source, self.profile()['columns'].get(str(derived.source)))
+
+    def numeric_columns(self):
+        """Names of the columns stored as numbers."""
+        return [name for name, meta in self._columns.items() if meta['kind'] == 'numeric']
+
+    def profile(self):
+        """
+        Return the column profiles of this dataset.
+
+        Datasets stored before profiles existed are profiled on first use, one
+        column at a time, and the result is saved next to the data.
+        """
+        if self._profile is None:
+            profile = read_profile(self.path)
+            if profile is None:
+                columns = ((name, self.read_column(name)) for name in self.columns)
+                profile = build_profile(self.row_count, columns)
+                try:
+                    write_profile(self.path, profile)
+                except OSError as e:
+                    logger.warning(f"Could not save profile for {self.path}: {str(e)}")
+            self._profile = profile
+        return self._profile
+
+    def value_index(self, column):
+        """
+        Return the distinct-value index of a column (see ``value_index``).
+
+        Columns of datasets stored before indexes existed are indexed on
+        first use and the index is saved next to the data. Indexes are kept
+        in the shared value index cache.
+        """
+        cache = get_value_index_cache()
+        key = (self.path, column)
+        index = cache.get(key)
+        if index is not None:
+            return index
+        if column not in self._columns:
+            # Derived columns are indexed in memory
+            index = ValueIndex(build_value_index(self.read_derived(column)))
+        else:
+            path = os.path.join(self.path, value_index_file(self._columns[column]['file']))
+            stored = read_value_index(path)
+            if stored is None:
+                stored = build_value_index(self.read_column(column))
+                try:
+                    write_value_index(path, stored)
+                except OSError as e:
+                    logger.warning(f"Could not save value index for {self.path}: {str(e)}")
+            index = ValueIndex(stored)
+        cache.set(key, index)
+        return index
+
+    def _load_labels(self, meta):
+        with open(os.path.join(self.path, meta['labels_file']), encoding='utf-8') as f:
+            return json.load(f)
+
+    def column_meta(self, column):
+        """Manifest entry of a column (kind, dtype, tz, ...)."""
+        return self._columns[column]
+
+    def column_labels(self, column):
+        """Distinct values of a dictionary-encoded ('category' or 'object') column."""
+        return self._load_labels(self._columns[column])
+
+    def stored_values(self, column):
+        """
+        The array stored for a column, memory-mapped.
+
+        Holds the values of numeric, boolean and datetime columns (datetimes
+        as naive UTC), and the integer codes into ``column_labels`` of
+        dictionary-encoded columns, with -1 for missing values.
+        """
+        meta = self._columns[column]
+        return np.load(os.path.join(self.path, meta['file']), mmap_mode='r', allow_pickle=False)
+
+    def read_column(self, column):
+        """
+        Load a single column as a Series.
+
+        Numeric, boolean and datetime columns are returned as memory-mapped,
+        read-only arrays; nothing is read from disk until the values are used.
+        """
+        return self.read_rows(column, slice(None))
+
+    def read_rows(self, column, rows, labels=None):
+        """
+        Load part of a column as a Series (with a fresh RangeIndex).
+
+        Only the selected rows are decoded, so a column can be processed in
+        chunks with bounded memory.
+
+        Args:
+            column: Column name
+            rows: Slice or integer positions of the rows to load
+            labels: ``column_labels(column)`` of a dictionary-encoded column,
+                when the caller reads several chunks and already has them
+        """
+        meta = self._columns[column]
+        values = self.stored_values(column)[rows]
+        kind = meta['kind']
+
+        if kind == 'category':
+            categories = pd.Index(self._load_labels(meta) if labels is None else labels)
+            data = pd.Categorical.from_codes(np.asarray(values), categories=categories, ordered=meta.get('ordered', False))
+            return pd.Series(data, name=column)
+
+        if kind == 'object':
+            raw_labels = self._load_labels(meta) if labels is None else labels
+            labels = np.empty(len(raw_labels), dtype=object)
+            labels[:] = raw_labels
+            codes = np.asarray(values)
+            missing = codes < 0
+            if len(labels):
+                data = labels.take(np.where(missing, 0, codes))
+            else:
+                data = np.empty(len(codes), dtype=object)
+            data[missing] = np.nan
+            return pd.Series(data, name=column, dtype=object, copy=False)
+
+        series = pd.Series(values, name=column, copy=False)
+        if kind == 'datetime' and meta.get('tz'):
+            series = series.dt.tz_localize('UTC').dt.tz_convert(meta['tz'])
+        return series
+
+    def iter_frames(self, chunk_rows=READ_CHUNK_ROWS):
+        """Yield the dataset as consecutive DataFrames of at most ``chunk_rows`` rows."""
+        labels = {
+            column: self.column_labels(column)
+            for column in self.columns if self.column_kind(column) in ('category', 'object')
+        }
+        for start in range(0, self.row_count, chunk_rows):
+            rows = slice(start, start + chunk_rows)
+            data = {column: self.read_rows(column, rows, labels.get(column)) for column in self.columns}
+            yield pd.DataFrame(data, columns=self.columns, copy=False)
+
+    def fingerprint(self):
+        """Content fingerprint of the stored data, equal to ``compute_fingerprint`` of the frame."""
+        dtypes = [self.read_rows(column, slice(0, 0)).dtype for column in self.columns]
+        return _fingerprint(self.columns, dtypes, self.iter_frames())
+
+    def select_columns(self, columns=None):
+        """
+        Resolve a requested column list against the stored columns.
+
+        Stored columns come in dataset order, followed by the requested
+        derived columns. Unknown names are ignored so callers can keep their
+        own "column not found" checks.
+        """
+        if columns is None:
+            return self.columns
+        wanted = set(columns)
+        derived = [name for name in dict.fromkeys(columns) if self.derived_column(name) is not None]
+        return [name for name in self.columns if name in wanted] + derived
+
+    def _read_any(self, column):
+        return self.read_column(column) if column in self._columns else self.read_derived(column)
+
+    def to_frame(self, columns=None, read_column=None):
+        """
+        Build a DataFrame from the stored columns.
+
+        Args:
+            columns: Optional list of column names to load
+            read_column: Optional loader used instead of ``self.read_column``
+                (and ``self.read_derived``); it is given every selected name
+
+        Returns:
+            pd.DataFrame: Frame with the requested columns in dataset order
+        """
+        selected = self.select_columns(columns)
+        if not selected:
+            return pd.DataFrame(index=pd.RangeIndex(self.row_count))
+        read_column = read_column or self._read_any
+        data = {name: read_column(name) for name in selected}
+        return pd.DataFrame(data, columns=selected, copy=False)
+
+
+def _storage_directory(fingerprint):
+    return os.path.join(get_store_root(), fingerprint)
+
+
+def persist_dataframe(df, fingerprint=None):
+    """
+    Persist a DataFrame in the columnar store, reusing an existing copy.
+
+    Returns:
+        tuple: (fingerprint, storage directory name relative to the store root)
+    """
+    fingerprint = fingerprint or compute_fingerprint(df)
+    directory = _storage_directory(fingerprint)
+    if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+        return fingerprint, fingerprint
+
+    staging = _staging_directory(fingerprint)
+    try:
+        manifest = write_columnar(df, staging)
+        write_profile(staging, profile_dataframe(df))
+        write_value_indexes(staging, df, manifest)
+        _publish(staging, fingerprint)
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+
+    logger.info(f"Stored dataset {fingerprint} ({len(df)} rows, {len(df.columns)} columns)")
+    return fingerprint, fingerprint
+
+
+def persist_columns(columns, row_count):
+    """
+    Persist streamed columns in the columnar store, reusing an existing copy.
+
+    The columns are written first; the fingerprint, profile and value indexes
+    are then computed from the written copy, one chunk or column at a time.
+
+    Args:
+        columns: ``(name, dtype, pieces)`` for every column (see ``write_columns``)
+        row_count: Number of rows of every column
+
+    Returns:
+        tuple: (fingerprint, storage directory name relative to the store root, manifest)
+    """
+    staging = _staging_directory('upload')
+    try:
+        manifest = write_columns(columns, row_count, staging)
+        stored = ColumnarDataset(staging)
+        fingerprint = stored.fingerprint()
+        if not os.path.exists(os.path.join(_storage_directory(fingerprint), MANIFEST_NAME)):
+            write_profile(staging, build_profile(row_count, ((name, stored.read_column(name)) for name in stored.columns)))
+            for meta in manifest['columns']:
+                index = build_value_index(stored.read_column(meta['name']))
+                write_value_index(os.path.join(staging, value_index_file(meta['file'])), index)
+            _publish(staging, fingerprint)
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+
+    logger.info(f"Stored dataset {fingerprint} ({row_count} rows, {len(manifest['columns'])} columns)")
+    return fingerprint, fingerprint, manifest
+
+
+def _staging_directory(prefix):
+    os.makedirs(get_store_root(), exist_ok=True)
+    return os.path.join(get_store_root(), f".{prefix}.{uuid.uuid4().hex}.tmp")
+
+
+def _publish(staging, fingerprint):
+    """Move a fully written staging directory to its place in the store."""
+    directory = _storage_directory(fingerprint)
+    try:
+        os.replace(staging, directory)
+    except OSError:
+        # Another worker stored the same content first
+        if not os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+            raise
+
+
+def _register_dataset(fingerprint, storage_path, name, user, description, row_count, columns):
+    if user is not None and not user.is_authenticated:
+        user = None
+
+    dataset = Dataset.objects.filter(fingerprint=fingerprint, user=user).first()
+    if dataset is None:
+        dataset = Dataset(fingerprint=fingerprint, user=user)
+    dataset.name = name
+    dataset.description = description
+    dataset.storage_path = storage_path
+    dataset.row_count = row_count
+    dataset.columns = columns
+    dataset.save()
+    return dataset
+
+
+def save_dataset(df, name, user=None, description=None):
+    """
+    Store a DataFrame and register it as a ``Dataset``.
+
+    Args:
+        df: DataFrame to store
+        name: Display name (usually the uploaded file name)
+        user: Owner of the dataset, if authenticated
+
+    Returns:
+        Dataset: The registered dataset
+    """
+    fingerprint, storage_path = persist_dataframe(df)
+    columns = {str(col): str(dtype) for col, dtype in df.dtypes.items()}
+    return _register_dataset(fingerprint, storage_path, name, user, description, len(df), columns)
+
+
+def save_upload(file, name=None, user=None, description=None):
+    """
+    Stream an uploaded CSV/Excel file into the store and register it as a ``Dataset``.
+
+    The upload is never held in memory as a whole: its chunks are spooled
+    to disk (see ``ingestion.spool_upload``) and written column by column.
+
+    Raises:
+        ValueError: If the file is neither CSV nor Excel
+    """
+    with spool_upload(file) as upload:
+        fingerprint, storage_path, manifest = persist_columns(upload.iter_columns(), upload.row_count)
+        row_count = upload.row_count
+    columns = {str(meta['name']): meta['dtype'] for meta in manifest['columns']}
+    return _register_dataset(fingerprint, storage_path, name or file.name, user, description, row_count, columns)
+
+
+@functools.lru_cache(maxsize=64)
+def _open_store(path):
+    return ColumnarDataset(path)
+
+
+def open_dataset(dataset):
+    """Open the columnar copy of a ``Dataset``."""
+    return _open_store(os.path.join(get_store_root(), dataset.storage_path))
+
+
+def get_dataset_profile(dataset):
+    """Return the precomputed column profiles of a ``Dataset``."""
+    return open_dataset(dataset).profile()
+
+
+def _read_only(series):
+    """
+    Make the array behind a cached column read-only.
+
+    Frames handed to views share their column arrays with the dataset cache,
+    so an in-place write (``df.loc[...] = ...``) raises instead of silently
+    changing the cached data for every other view. Code that needs to modify
+    a loaded frame works on ``df.copy()``.
+    """
+    # Numpy-backed, categorical (codes) and datetime arrays all keep their data in _ndarray
+    values = getattr(series.array, '_ndarray', None)
+    if values is not None:
+        values.flags.writeable = False
+    return series
+
+
+def load_dataframe(dataset, columns=None):
+    """
+    Load a ``Dataset`` (or a subset of its columns) as a DataFrame.
+
+    Columns are served from the process-wide dataset cache when possible, so
+    repeated filter/compare/plot calls on the same dataset skip decoding.
+    Derived columns (see ``derived``) are computed from their cached source
+    column once and then cached the same way. Cached columns are read-only
+    (see ``_read_only``).
+    """
+    stored = open_dataset(dataset)
+    cache = get_dataframe_cache()
+
+    def read_cached(column):
+        key = (dataset.fingerprint, column)
+        series = cache.get(key)
+        if series is None:
+            if stored.derived_column(column) is not None:
+                series = stored.read_derived(column, read_cached)
+            else:
+                series = stored.read_column(column)
+            # Sized first: pandas cannot measure read-only object arrays
+            size = cache.sizeof(series)
+            cache.set(key, _read_only(series), size=size)
+        return series
+
+    return stored.to_frame(columns, read_column=read_cached)
+
+
+def store_session_dataset(request, df, name):
+    """
+    Store a DataFrame and attach it to the current session.
+
+    Replaces the old practice of serializing the whole frame into the session.
+    """
+    dataset = save_dataset(df, name, user=getattr(request, 'user', None))
+    return attach_session_dataset(request, dataset)
+
+
+def store_session_upload(request, file):
+    """
+    Stream an uploaded CSV/Excel file into the store and attach it to the session.
+
+    Raises:
+        ValueError: If the file is neither CSV nor Excel
+    """
+    dataset = save_upload(file, user=getattr(request, 'user', None))
+    return attach_session_dataset(request, dataset)
+
+
+def attach_session_dataset(request, dataset):
+    """Make ``dataset`` the dataset of the current session."""
+    for key in LEGACY_SESSION_KEYS + DATASET_VIEW_SESSION_KEYS:
+        request.session.pop(key, None)
+    request.session[SESSION_KEY] = dataset.id
+    request.session['filename'] = dataset.name
+    request.session.modified = True
+
+    # Large datasets are analysed in SQL; build that copy ahead of the first filter
+    from .sql_store import schedule_sql_store
+    schedule_sql_store(dataset)
+    return dataset
+
+
+def get_session_dataset(request):
+    """Return the ``Dataset`` attached to the session, or None."""
+    dataset_id = request.session.get(SESSION_KEY)
+    if not dataset_id:
+        return None
+    dataset = Dataset.objects.filter(id=dataset_id).first()
+    if dataset is None or not dataset.storage_path:
+        return None
+    if not os.path.exists(os.path.join(get_store_root(), dataset.storage_path, MANIFEST_NAME)):
+        logger.warning(f"Columnar data for dataset {dataset_id} is missing")
+        return None
+    return dataset
+
+
+def load_session_dataframe(request, columns=None):
+    """
+    Load the session's dataset as a DataFrame.
+
+    Args:
+        request: Current request
+        columns: Optional list of columns to load; None loads every column
+
+    Returns:
+        pd.DataFrame or None if no dataset is attached to the session
+    """
+    dataset = get_session_dataset(request)
+    if dataset is None:
+        return None
+    return load_dataframe(dataset, columns)
+
+
+def get_session_profile(request):
+    """
+    Return the column profiles of the session's dataset.
+
+    Returns:
+        dict or None if no dataset is attached to the session
+    """
+    dataset = get_session_dataset(request)
+    if dataset is None:
+        return None
+    return get_dataset_profile(dataset)
@@ -1,136 +1,117 @@
 # analysis/deepseek_api.py
-import re
-
-import requests
 import json
-import os
-from django.conf import settings
-from openai import OpenAI
 from django.views.decorators.csrf import csrf_exempt
-import pandas as pd
-import io
-from .insight_generator import generate_summary_statistics
-from django.http import JsonResponse
+from .dataset_store import get_session_dataset
+from .chat_context import (NO_DATA_PROMPT, conversation_messages, get_dataset_context,
+                           get_session_conversation, record_turn)
+from .jobs import submit_job, job_payload
+from .models import InsightJob
+from .correlation import top_correlated_pairs
+from .llm import get_async_llm_client, get_llm_client, get_llm_model, get_response_cache, insights_cache_key
+from .profiling import numeric_column_names, categorical_column_names
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 import logging
 
 logger = logging.getLogger(__name__)
-import environ
-
-env = environ.Env()
-environ.Env.read_env()
-print(env("api_key"))
-
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=env("api_key"),
-)
 
-
-@csrf_exempt
-def get_dataset_insights(request):
-    """API endpoint for generating dataset insights"""
-    if request.method == 'POST':
-        try:
-            logger.info("Dataset insights request received")
-            data = json.loads(request.body) if request.body else {}
-            
-            # Get the dataset data from session
-            data_json = request.session.get('csv_data')
-            
-            if not data_json:
-                return JsonResponse({
-                    'status': 'error',
-                    'message': 'No dataset available. Please upload a dataset first.'
-                }, status=400)
-            
-            # Load dataset from session
-            df = pd.read_json(io.StringIO(data_json), orient='split')
-            
-            # Generate basic statistics
-            try:
-                # Calculate some additional statistics to enrich the insights
-                numeric_columns = df.select_dtypes(include=['number']).columns.tolist()
-                categorical_columns = df.select_dtypes(include=['object']).columns.tolist()
-                
-                # Basic stats dictionary
-                summary_stats = {
-                    'numeric': {},
-                    'categorical': {}
-                }
-                
-                # Calculate numeric stats
-                for col in numeric_columns:
-                    summary_stats['numeric'][col] = {
-                        'mean': float(df[col].mean()) if not pd.isna(df[col].mean()) else 0,
-                        'median': float(df[col].median()) if not pd.isna(df[col].median()) else 0,
-                        'min': float(df[col].min()) if not pd.isna(df[col].min()) else 0,
-                        'max': float(df[col].max()) if not pd.isna(df[col].max()) else 0,
-                        'std': float(df[col].std()) if not pd.isna(df[col].std()) else 0,
-                        'count': int(df[col].count()),
-                        'null_count': int(df[col].isna().sum()),
-                        'null_percentage': float(df[col].isna().mean() * 100)
-                    }
-                
-                # Calculate categorical stats
-                for col in categorical_columns:
-                    value_counts = df[col].value_counts().head(5).to_dict()
-                    summary_stats['categorical'][col] = {
-                        'unique_values': int(df[col].nunique()),
-                        'top_value': df[col].value_counts().index[0] if df[col].value_counts().any() else "",
-                        'top_value_count': int(df[col].value_counts().iloc[0]) if df[col].value_counts().any() else 0,
-                        'null_count': int(df[col].isna().sum()),
-                        'null_percentage': float(df[col].isna().mean() * 100),
-                        'value_counts': {str(k): int(v) for k, v in value_counts.items()}
-                    }
-                
-            except Exception as e:
-                logger.error(f"Error generating custom statistics: {str(e)}")
-                summary_stats = {
-                    'numeric': {},
-                    'categorical': {}
-                }
-            
-            # Find correlations between numeric columns
-            correlations = {}
-            try:
-                if len(numeric_columns) > 1:
-                    corr_matrix = df[numeric_columns].corr().round(2)
-                    for i, col1 in enumerate(numeric_columns):
-                        for col2 in numeric_columns[i+1:]:
-                            corr_value = corr_matrix.loc[col1, col2]
-                            if not pd.isna(corr_value) and abs(corr_value) > 0.5:  # Only strong correlations
-                                correlations[f"{col1}-{col2}"] = float(corr_value)
-            except Exception as e:
-                logger.error(f"Error calculating correlations: {str(e)}")
-            
-            # Find potential outliers in numeric data
-            outliers = {}
-            try:
-                for col in numeric_columns:
-                    Q1 = df[col].quantile(0.25)
-                    Q3 = df[col].quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    outlier_count = ((df[col] < lower_bound) | (df[col] > upper_bound)).sum()
-                    outlier_percentage = outlier_count / len(df) * 100
-                    if outlier_percentage > 1:  # Only mention columns with significant outliers
-                        outliers[col] = {
-                            'count': int(outlier_count),
-                            'percentage': float(outlier_percentage),
-                            'lower_bound': float(lower_bound),
-                            'upper_bound': float(upper_bound)
-                        }
-            except Exception as e:
-                logger.error(f"Error calculating outliers: {str(e)}")
-            
-            # Prepare a data sample - first and last rows
-            data_sample = {
-                'head': df.head(5).to_dict('records'),
-                'tail': df.tail(5).to_dict('records')
+# Strong correlations (|r| > 0.5) listed in the insights prompt
+MAX_PROMPT_CORRELATIONS = 20
+
+
+
+def build_insights_prompt(df, profile):
+    """
+    System prompt asking the model for insights on a dataset.
+
+    Args:
+        df: The dataset
+        profile: Column profiles of the dataset, computed at upload time
+
+    Returns:
+        str
+    """
+    # Basic statistics come from the profile computed at upload time
+    numeric_columns = numeric_column_names(profile)
+    categorical_columns = categorical_column_names(profile)
+    try:
+        # Basic stats dictionary
+        summary_stats = {
+            'numeric': {},
+            'categorical': {}
+        }
+        
+        # Collect numeric stats
+        for col in numeric_columns:
+            column = profile['columns'][col]
+            summary_stats['numeric'][col] = {
+                key: column[key] if column[key] is not None else 0
+                for key in ('mean', 'median', 'min', 'max', 'std')
             }
-            
-            system_prompt = f"""You are Data Analyst, an advanced data analyst expert who provides SPECIFIC and ACTIONABLE insights.
+            summary_stats['numeric'][col].update({
+                'count': column['count'],
+                'null_count': column['missing'],
+                'null_percentage': column['missing_percent']
+            })
+        
+        # Collect categorical stats
+        for col in categorical_columns:
+            column = profile['columns'][col]
+            top_values = column['top_values']
+            summary_stats['categorical'][col] = {
+                'unique_values': column['unique_count'],
+                'top_value': top_values[0][0] if top_values else "",
+                'top_value_count': top_values[0][1] if top_values else 0,
+                'null_count': column['missing'],
+                'null_percentage': column['missing_percent'],
+                'value_counts': {str(label): count for label, count in top_values[:5]}
+            }
+        
+    except Exception as e:
+        logger.error(f"Error generating custom statistics: {str(e)}")
+        summary_stats = {
+            'numeric': {},
+            'categorical': {}
+        }
+    
+    # Find correlations between numeric columns
+    correlations = {}
+    try:
+        if len(numeric_columns) > 1:
+            # Only the strongest pairs go into the prompt, found without building the full matrix
+            for pair in top_correlated_pairs(df, k=MAX_PROMPT_CORRELATIONS, columns=numeric_columns, min_abs=0.5):
+                correlations[f"{pair['col1']}-{pair['col2']}"] = round(pair['corr'], 2)
+    except Exception as e:
+        logger.error(f"Error calculating correlations: {str(e)}")
+    
+    # Find potential outliers in numeric data
+    outliers = {}
+    try:
+        for col in numeric_columns:
+            column = profile['columns'][col]
+            if not column['outlier_bounds']:
+                continue
+            lower_bound, upper_bound = column['outlier_bounds']
+            outlier_count = column['outliers_count']
+            outlier_percentage = outlier_count / len(df) * 100
+            if outlier_percentage > 1:  # Only mention columns with significant outliers
+                outliers[col] = {
+                    'count': outlier_count,
+                    'percentage': float(outlier_percentage),
+                    'lower_bound': lower_bound,
+                    'upper_bound': upper_bound
+                }
+    except Exception as e:
+        logger.error(f"Error calculating outliers: {str(e)}")
+    
+    # Prepare a data sample - first and last rows; to_json turns dates
+    # (parsed at upload) and missing values into JSON
+    data_sample = {
+        'head': json.loads(df.head(5).to_json(orient='records', date_format='iso')),
+        'tail': json.loads(df.tail(5).to_json(orient='records', date_format='iso'))
+    }
+    
+    system_prompt = f"""You are Data Analyst, an advanced data analyst expert who provides SPECIFIC and ACTIONABLE insights.
 
 Dataset Overview:
 - Number of rows: {len(df)}
@@ -182,20 +163,95 @@ EXAMPLE GOOD INSIGHT:
 DO NOT use any headers or section dividers in your response. ONLY bullet points with specific insights.
 Answer in Arabic.
 """
+    return system_prompt
+
+
+def generate_dataset_insights(df, profile, report=None, fingerprint=None):
+    """
+    Ask the model for insights on a dataset, streaming its answer.
+
+    Args:
+        df: The dataset
+        profile: Column profiles of the dataset
+        report: Optional callable ``report(progress, stage, partial=None)``;
+            receives ``{'insights': text so far}`` while the answer streams in
+        fingerprint: Dataset fingerprint; when given, a cached answer is
+            returned without calling the model, and a new one is cached
+
+    Returns:
+        dict: ``{'insights': text}``
+    """
+    report = report or (lambda *args, **kwargs: None)
+    model = get_llm_model()
+    cache_key = insights_cache_key(fingerprint, model) if fingerprint else None
+    if cache_key is not None:
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            return {'insights': cached}
+
+    report(0.1, 'statistics')
+    system_prompt = build_insights_prompt(df, profile)
+
+    report(0.3, 'model')
+    stream = get_llm_client().chat.completions.create(
+        extra_body={},
+        model=model,
+        messages=[
+            {
+                "role": "system",
+                "content": system_prompt
+            }
+        ],
+        stream=True
+    )
+    parts = []
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            report(0.3, 'model', {'insights': ''.join(parts)})
+    text = ''.join(parts)
+    if cache_key is not None and text.strip():
+        get_response_cache().set(cache_key, text)
+    return {'insights': text}
+
+
+@csrf_exempt
+def get_dataset_insights(request):
+    """
+    API endpoint for generating dataset insights
+
+    Insights are generated by a background job and kept with the dataset.
+    A finished result is returned at once; otherwise the response (HTTP 202)
+    carries the job to poll for progress and partial text. Posting
+    ``{"refresh": true}`` generates the insights again.
+    """
+    if request.method == 'POST':
+        try:
+            logger.info("Dataset insights request received")
+            data = json.loads(request.body) if request.body else {}
             
-            completion = client.chat.completions.create(
-                extra_body={},
-                model="deepseek/deepseek-r1-zero:free",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    }
-                ],
-                stream=False
-            )
+            dataset = get_session_dataset(request)
+            if dataset is None:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'No dataset available. Please upload a dataset first.'
+                }, status=400)
             
-            response = completion.choices[0].message.content
+            # Answers are cached per dataset content, prompt version and model
+            refresh = bool(data.get('refresh'))
+            cache_key = insights_cache_key(dataset.fingerprint)
+            response = None if refresh else get_response_cache().get(cache_key)
+            if response is None:
+                if refresh:
+                    get_response_cache().pop(cache_key)
+                job = submit_job(dataset, 'dataset_insights', refresh=refresh)
+                if job.status != InsightJob.STATUS_DONE:
+                    return JsonResponse({
+                        'status': 'pending',
+                        'job': job_payload(job)
+                    }, status=202)
+                response = job.result['insights']
             
             # Store this insight in session for future reference
             request.session['ai_insights'] = response
@@ -219,93 +275,85 @@ Answer in Arabic.
     }, status=405)
 
 
+# Follow-up sent when a chat answer still contains code
+CODE_RETRY_MESSAGE = "أعد صياغة الإجابة بدون أي كود برمجي، فقط اشرح النتائج باللغة العربية بشكل واضح وبسيط"
+
+
+def build_chat_messages(request, user_message):
+    """
+    Messages for the model from a chat message and the session's conversation.
+
+    The dataset is described by its cached chat context (see
+    ``chat_context``), so no rows are loaded for a chat turn.
+
+    Args:
+        request: Current request; its session holds the conversation and dataset
+        user_message: Message typed by the user
+
+    Returns:
+        tuple: (messages, conversation, user message as sent,
+        prefix of the answer, whether a dataset is loaded)
+    """
+    # Add instruction to avoid code unless explicitly asked
+    if "كود" not in user_message and "برمجة" not in user_message and "code" not in user_message.lower():
+        user_message += " (لا تعطي كود برمجي، فقط اشرح باللغة العربية)"
+
+    dataset = get_session_dataset(request)
+    conversation = get_session_conversation(request, dataset)
+    if dataset is None:
+        response_prefix = "لا يوجد مجموعة بيانات حالية للتحليل. "
+        system_prompt = NO_DATA_PROMPT
+    else:
+        system_prompt = get_dataset_context(dataset).text
+        response_prefix = ""
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        *conversation_messages(conversation),
+        {"role": "user", "content": user_message}
+    ]
+    return messages, conversation, user_message, response_prefix, dataset is not None
+
+
+def clean_chat_response(response):
+    """Strip code fences and answer-box markup from a model answer."""
+    response = response.replace('```python', '').replace('```', '').strip()
+    return response.replace('\\boxed{', '').replace('}\n', '\n').strip('}')
+
+
+def contains_code(response):
+    return 'import ' in response or 'def ' in response or 'plt.' in response
+
+
 @csrf_exempt
 def analysis_chat_api(request):
     """API endpoint for processing chat messages in the analysis page"""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            user_message = data.get('message', '')
-            
-            # Add instruction to avoid code unless explicitly asked
-            if "كود" not in user_message and "برمجة" not in user_message and "code" not in user_message.lower():
-                user_message += " (لا تعطي كود برمجي، فقط اشرح باللغة العربية)"
-
-            # Use a separate conversation history for analysis page
-            analysis_conversation = request.session.get('analysis_conversation', [])
-            analysis_conversation.append({"role": "user", "content": user_message})
-
-            # Get the dataset data from session
-            data_json = request.session.get('csv_data')
-            if not data_json:
-                response_prefix = "لا يوجد مجموعة بيانات حالية للتحليل. "
-                system_prompt = """أنت مساعد محلل بيانات ذكي.
-                حالياً لا تتوفر بيانات للتحليل.
-                يُرجى إعلام المستخدم أنه يحتاج إلى تحميل البيانات أولاً.
-                التزم باللغة العربية فقط في الردود.
-                """
-            else:
-                df = pd.read_json(io.StringIO(data_json), orient='split')
-
-                # Generate detailed statistics
-                summary_stats = generate_summary_statistics(df)
-
-                dataset_info = {
-                    "column_names": df.columns.tolist(),
-                    "row_count": len(df),
-                    "numeric_stats": summary_stats.get('numeric', {}),
-                    "categorical_stats": summary_stats.get('categorical', {})
-                }
-
-                system_prompt = f"""أنت مساعد متخصص في تحليل البيانات.
-                مهمتك هي مساعدة المستخدم في فهم وتحليل بياناته.
-
-                نظرة عامة على البيانات:
-                - عدد الصفوف: {dataset_info['row_count']}
-                - الأعمدة: {', '.join(dataset_info['column_names'])}
-
-                قواعد مهمة:
-                1. الردود يجب أن تكون باللغة العربية فقط
-                2. لا تعطي أي كود برمجي إلا إذا طُلب منك ذلك صراحةً
-                3. ركز على الشرح البسيط والواضح
-                4. قدم رؤى عملية من البيانات
-                5. تجنب المصطلحات الفنية المعقدة
-
-                أنواع المساعدة التي يمكنك تقديمها:
-                - شرح أنماط البيانات
-                - تفسير الإحصائيات
-                - تحليل العلاقات بين المتغيرات
-                - الإجابة على أسئلة التحليل
-                """
-
-                response_prefix = ""
-
-            messages = [
-                {"role": "system", "content": system_prompt},
-                *analysis_conversation
-            ]
+            messages, conversation, user_message, response_prefix, has_data = build_chat_messages(
+                request, data.get('message', '')
+            )
             
             # Make the API call directly using the client
-            completion = client.chat.completions.create(
-                model="deepseek/deepseek-r1-zero:free",
+            completion = get_llm_client().chat.completions.create(
+                model=get_llm_model(),
                 messages=messages,
             )
             
             response = completion.choices[0].message.content
             
             # Clean response from code blocks and ensure Arabic
-            full_response = response_prefix + response
-            full_response = full_response.replace('```python', '').replace('```', '').strip()
-            full_response = full_response.replace('\\boxed{', '').replace('}\n', '\n').strip('}')
+            full_response = clean_chat_response(response_prefix + response)
             
             # If response still contains code, regenerate with stricter instructions
-            if 'import ' in full_response or 'def ' in full_response or 'plt.' in full_response:
+            if contains_code(full_response):
                 messages.append({
                     "role": "user", 
-                    "content": "أعد صياغة الإجابة بدون أي كود برمجي، فقط اشرح النتائج باللغة العربية بشكل واضح وبسيط"
+                    "content": CODE_RETRY_MESSAGE
                 })
-                completion = client.chat.completions.create(
-                    model="deepseek/deepseek-r1-zero:free",
+                completion = get_llm_client().chat.completions.create(
+                    model=get_llm_model(),
                     messages=messages,
                     temperature=0.7,
                     max_tokens=1000
@@ -313,16 +361,12 @@ def analysis_chat_api(request):
                 full_response = completion.choices[0].message.content
                 full_response = full_response.replace('```python', '').replace('```', '').strip()
 
-            analysis_conversation.append({"role": "assistant", "content": full_response})
-
-            # Store the conversation in the session
-            request.session['analysis_conversation'] = analysis_conversation
-            request.session.modified = True
+            record_turn(conversation, user_message, full_response)
 
             return JsonResponse({
                 'status': 'success',
                 'response': full_response,
-                'hasData': bool(data_json)
+                'hasData': has_data
             })
         except Exception as e:
             logger.error(f"Error in analysis_chat_api: {str(e)}")
@@ -336,3 +380,84 @@ def analysis_chat_api(request):
         'message': 'Only POST requests are allowed'
     }, status=405)
 
+
+def sse_event(event, data):
+    """One server-sent event carrying a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _stream_completion(messages, **kwargs):
+    """Yield the text deltas of a streamed completion."""
+    stream = await get_async_llm_client().chat.completions.create(
+        model=get_llm_model(),
+        messages=messages,
+        stream=True,
+        **kwargs
+    )
+    async for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+
+@csrf_exempt
+async def analysis_chat_stream(request):
+    """
+    Streaming version of ``analysis_chat_api``.
+
+    The answer is sent as server-sent events while the model writes it: a
+    ``delta`` event per piece of text, ``reset`` when a code-free answer is
+    requested and the text shown so far must be discarded, then ``done``
+    with the cleaned full answer (or ``error``). The view is async, so a
+    chat waiting on the model holds no worker thread.
+    """
+    if request.method != 'POST':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Only POST requests are allowed'
+        }, status=405)
+    try:
+        data = json.loads(request.body)
+        # The conversation and dataset lookups use the synchronous ORM
+        messages, conversation, user_message, response_prefix, has_data = await sync_to_async(build_chat_messages, thread_sensitive=False)(
+            request, data.get('message', '')
+        )
+    except Exception as e:
+        logger.error(f"Error in analysis_chat_stream: {str(e)}")
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
+    async def events():
+        try:
+            parts = [response_prefix] if response_prefix else []
+            if response_prefix:
+                yield sse_event('delta', {'text': response_prefix})
+            async for delta in _stream_completion(messages):
+                parts.append(delta)
+                yield sse_event('delta', {'text': delta})
+            full_response = clean_chat_response(''.join(parts))
+
+            # If response still contains code, regenerate with stricter instructions
+            if contains_code(full_response):
+                yield sse_event('reset', {})
+                messages.append({"role": "user", "content": CODE_RETRY_MESSAGE})
+                parts = []
+                async for delta in _stream_completion(messages, temperature=0.7, max_tokens=1000):
+                    parts.append(delta)
+                    yield sse_event('delta', {'text': delta})
+                full_response = ''.join(parts).replace('```python', '').replace('```', '').strip()
+
+            await sync_to_async(record_turn, thread_sensitive=False)(conversation, user_message, full_response)
+
+            yield sse_event('done', {'response': full_response, 'hasData': has_data})
+        except Exception as e:
+            logger.error(f"Error in analysis_chat_stream: {str(e)}")
+            yield sse_event('error', {'message': str(e)})
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,153 @@
+"""
+Derived columns: transformations of a stored column, computed on demand.
+
+A derived column is named by its expression, such as ``log(price)``,
+``standardize(age)`` or ``bin(income, 5)``. Any place that loads columns of
+a dataset by name (filters, comparisons, value pickers) can ask for one; it
+is computed from its source column the first time and then kept in the
+dataset cache like a stored column, so later requests reuse it and no
+other column is copied. Because the name fully describes the values, the
+cache and the plot cache need no extra invalidation.
+
+The statistics a transformation needs (minimum, maximum, mean, standard
+deviation) come from the source column's profile rather than another pass
+over the data.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+TRANSFORMS = ('log', 'sqrt', 'standardize', 'minmax', 'bin')
+DEFAULT_BINS = 5
+MAX_BINS = 1000
+
+_DERIVED_NAME = re.compile(r'^(log|sqrt|standardize|minmax)\((.+)\)$', re.DOTALL)
+_BINNED_NAME = re.compile(r'^bin\((.+), (\d+)\)$', re.DOTALL)
+
+
+def derived_column_name(source, transform, bins=DEFAULT_BINS):
+    """Name of the column derived from ``source`` by ``transform``."""
+    if transform == 'bin':
+        return f"bin({source}, {int(bins)})"
+    return f"{transform}({source})"
+
+
+def parse_derived_column(name):
+    """
+    Parse a derived column name.
+
+    Returns:
+        DerivedColumn or None if ``name`` is not a derived column expression
+    """
+    if not isinstance(name, str):
+        return None
+    match = _BINNED_NAME.match(name)
+    if match:
+        bins = int(match.group(2))
+        return DerivedColumn(match.group(1), 'bin', bins) if 0 < bins <= MAX_BINS else None
+    match = _DERIVED_NAME.match(name)
+    if match:
+        return DerivedColumn(match.group(2), match.group(1))
+    return None
+
+
+def source_statistics(series, profile=None):
+    """Minimum, maximum, mean and standard deviation of a column, from its profile when it has them."""
+    if profile and profile.get('kind') == 'numeric':
+        return {key: profile.get(key) for key in ('min', 'max', 'mean', 'std')}
+    values = series.to_numpy(dtype='float64', na_value=np.nan)
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'min': None, 'max': None, 'mean': None, 'std': None}
+    return {
+        'min': float(values.min()),
+        'max': float(values.max()),
+        'mean': float(values.mean()),
+        'std': float(values.std(ddof=1)) if len(values) > 1 else None,
+    }
+
+
+class DerivedColumn:
+    """
+    A column computed from a numeric source column by one of ``TRANSFORMS``.
+
+    Args:
+        source: Name of the stored column it is computed from
+        transform: One of ``TRANSFORMS``
+        bins: Number of equal-width bins, for 'bin'
+    """
+
+    def __init__(self, source, transform, bins=DEFAULT_BINS):
+        if transform not in TRANSFORMS:
+            raise ValueError(f"Unknown transformation: {transform}")
+        self.source = source
+        self.transform = transform
+        self.bins = int(bins)
+        if transform == 'bin' and not 0 < self.bins <= MAX_BINS:
+            raise ValueError(f"The number of bins must be between 1 and {MAX_BINS}")
+
+    @property
+    def name(self):
+        return derived_column_name(self.source, self.transform, self.bins)
+
+    def _offset(self, stats):
+        """Shift making the values valid for log (> 0) or sqrt (>= 0)."""
+        minimum = stats['min']
+        if minimum is None:
+            return 0
+        if self.transform == 'log' and minimum <= 0:
+            return abs(minimum) + 1
+        if self.transform == 'sqrt' and minimum < 0:
+            return abs(minimum)
+        return 0
+
+    def label(self, stats):
+        """Readable description of the transformation, given the source statistics."""
+        offset = self._offset(stats)
+        if self.transform in ('log', 'sqrt'):
+            function = 'Log' if self.transform == 'log' else 'Sqrt'
+            return f"{function}({self.source} + {offset})" if offset else f"{function}({self.source})"
+        if self.transform == 'standardize':
+            return f"Standardized {self.source}"
+        if self.transform == 'minmax':
+            return f"Min-Max Scaled {self.source}"
+        return f"{self.source} (Binned to {self.bins} groups)"
+
+    def compute(self, series, profile=None):
+        """
+        Compute the derived values.
+
+        Args:
+            series: The source column
+            profile: The source column's profile, if available
+
+        Returns:
+            pd.Series: Named after the derived column, on the index of ``series``
+
+        Raises:
+            ValueError: If the source is not numeric or the transformation is undefined for it
+        """
+        if not pd.api.types.is_numeric_dtype(series.dtype):
+            raise ValueError(f"Column {self.source} is not numeric and cannot be transformed")
+        stats = source_statistics(series, profile)
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+
+        if self.transform == 'log':
+            values = np.log(values + self._offset(stats))
+        elif self.transform == 'sqrt':
+            values = np.sqrt(values + self._offset(stats))
+        elif self.transform == 'standardize':
+            if not stats['std']:
+                raise ValueError('Standard deviation is zero, cannot standardize')
+            values = (values - stats['mean']) / stats['std']
+        elif self.transform == 'minmax':
+            if stats['min'] is None or not stats['max'] > stats['min']:
+                raise ValueError('Max and min values are equal, cannot scale')
+            values = (values - stats['min']) / (stats['max'] - stats['min'])
+        else:
+            return pd.Series(pd.cut(series, bins=self.bins, labels=False), index=series.index, name=self.name)
+        return pd.Series(values, index=series.index, name=self.name, copy=False)
+
+    def __repr__(self):
+        return f"<DerivedColumn {self.name}>"
@@ -0,0 +1,248 @@
+"""
+Export of the session's dataset as a file download.
+
+Exports read the stored columns in chunks of rows, apply the session's
+filtered view (see ``row_selection``) chunk by chunk and hand each chunk to
+a writer, so rows are never all in memory at once:
+
+- CSV is encoded chunk by chunk and streamed to the client as it is produced.
+- Excel and Parquet are not streamed as they are produced: the whole file
+  is first written to a temporary file on disk (openpyxl in write-only
+  mode; pyarrow, an optional dependency, one row group per chunk) and only
+  then sent in blocks. The response starts once the file is complete and
+  needs that much free temporary disk space.
+"""
+import logging
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .dataset_store import get_session_dataset, open_dataset
+from .row_selection import get_session_selection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_CHUNK_ROWS = 50000
+# Size of the blocks a temporary export file is streamed in
+FILE_BLOCK_BYTES = 1024 * 1024
+# Rows of an Excel worksheet, header included
+EXCEL_MAX_ROWS = 1048576
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def get_export_chunk_rows():
+    return max(1, int(getattr(settings, 'STATS_EXPORT_CHUNK_ROWS', DEFAULT_EXPORT_CHUNK_ROWS)))
+
+
+def iter_export_chunks(stored, columns, mask=None, chunk_rows=None):
+    """
+    Yield the selected rows of a stored dataset as DataFrames of at most ``chunk_rows`` rows.
+
+    Args:
+        stored: ``ColumnarDataset``
+        columns: Columns to export, in order
+        mask: Optional boolean row mask (the session's filtered view)
+        chunk_rows: Rows of the stored dataset read per chunk
+
+    Yields:
+        pd.DataFrame; a single empty one when no row is selected
+    """
+    chunk_rows = chunk_rows or get_export_chunk_rows()
+    # Dictionary-encoded columns share their labels across chunks
+    labels = {
+        column: stored.column_labels(column)
+        for column in columns if stored.column_kind(column) in ('category', 'object')
+    }
+
+    def read(rows):
+        return pd.DataFrame(
+            {column: stored.read_rows(column, rows, labels.get(column)) for column in columns},
+            columns=columns, copy=False,
+        )
+
+    produced = False
+    for start in range(0, stored.row_count, chunk_rows):
+        stop = min(start + chunk_rows, stored.row_count)
+        rows = slice(start, stop)
+        if mask is not None:
+            rows = start + np.flatnonzero(mask[start:stop])
+            if not len(rows):
+                continue
+        produced = True
+        yield read(rows)
+    if not produced:
+        # Keeps the column names and types in the file
+        yield read(slice(0, 0))
+
+
+def iter_csv(chunks):
+    """Encode DataFrame chunks as one CSV document, header first."""
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+
+
+def _cell(value):
+    """Convert a value to something openpyxl can write."""
+    if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        # Excel has no time zones
+        return value.tz_localize(None).to_pydatetime() if value.tz is not None else value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def write_xlsx(chunks, columns, output):
+    """Write DataFrame chunks to ``output`` as a workbook, in openpyxl's write-only mode."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('data')
+    sheet.append([str(column) for column in columns])
+    for chunk in chunks:
+        for row in chunk.itertuples(index=False, name=None):
+            sheet.append([_cell(value) for value in row])
+    workbook.save(output)
+
+
+def _arrow_frame(chunk):
+    """Give text columns a string type, so every chunk has the same Parquet schema."""
+    converted = {}
+    for column in chunk.columns:
+        series = chunk[column]
+        if series.dtype == object:
+            series = series.map(lambda value: value if isinstance(value, str) or pd.isna(value) else str(value))
+            series = series.astype('string')
+        converted[column] = series
+    return pd.DataFrame(converted, columns=chunk.columns, copy=False)
+
+
+def write_parquet(chunks, output):
+    """Write DataFrame chunks to ``output`` as one Parquet file, one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(_arrow_frame(chunk), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _iter_file(file):
+    try:
+        file.seek(0)
+        while True:
+            block = file.read(FILE_BLOCK_BYTES)
+            if not block:
+                break
+            yield block
+    finally:
+        file.close()
+
+
+def _spooled(write):
+    """Write the whole file with ``write(file)`` into a temporary file, then return its blocks."""
+    file = tempfile.TemporaryFile()
+    try:
+        write(file)
+    except BaseException:
+        file.close()
+        raise
+    return _iter_file(file)
+
+
+def export_filename(name, extension):
+    stem = re.sub(r'[^\w.-]+', '_', str(name or 'dataset').rsplit('.', 1)[0]).strip('_') or 'dataset'
+    return f"{stem}.{extension}"
+
+
+def export_response(request, columns=None, export_format='csv'):
+    """
+    Send the session's dataset, filtered like the current view, as a file.
+
+    Args:
+        request: Current request
+        columns: Columns to export, in that order; None exports all
+        export_format: 'csv', 'xlsx' or 'parquet'
+
+    Returns:
+        StreamingHttpResponse, or JsonResponse with an error
+    """
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"Unsupported export format: {export_format}"}, status=400)
+
+    dataset = get_session_dataset(request)
+    if dataset is None:
+        return JsonResponse({'error': 'No data available'}, status=400)
+    stored = open_dataset(dataset)
+
+    if columns:
+        missing = [column for column in columns if column not in stored.columns]
+        if missing:
+            return JsonResponse({'error': f"Columns not found in data: {', '.join(missing)}"}, status=400)
+        # Duplicates would repeat a column in the file
+        columns = list(dict.fromkeys(columns))
+    else:
+        columns = stored.columns
+
+    mask = get_session_selection(request, dataset)
+    chunks = iter_export_chunks(stored, columns, mask)
+    content_type, extension = EXPORT_FORMATS[export_format]
+
+    if export_format == 'csv':
+        content = iter_csv(chunks)
+    elif export_format == 'xlsx':
+        rows = stored.row_count if mask is None else int(np.count_nonzero(mask))
+        if rows + 1 > EXCEL_MAX_ROWS:
+            return JsonResponse({
+                'error': f"{rows} rows do not fit in an Excel worksheet; export CSV or Parquet instead"
+            }, status=400)
+        content = _spooled(lambda file: write_xlsx(chunks, columns, file))
+    else:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return JsonResponse({'error': 'Parquet export requires pyarrow to be installed'}, status=400)
+        content = _spooled(lambda file: write_parquet(chunks, file))
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(dataset.name, extension)}"'
+    logger.info(f"Exporting {len(columns)} columns of dataset {dataset.id} as {export_format}")
+    return response
+
+
+def export_dataset(request):
+    """
+    Download the session's dataset under the current filters.
+
+    Query parameters: ``format`` ('csv', the default, 'xlsx' or 'parquet')
+    and ``columns`` (repeatable; all columns by default).
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+    try:
+        columns = request.GET.getlist('columns') or request.GET.getlist('columns[]')
+        return export_response(request, columns or None, request.GET.get('format', 'csv'))
+    except Exception as e:
+        logger.error(f"Error exporting dataset: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=500)
@@ -0,0 +1,60 @@
+"""
+Compact figure transport for the analysis page.
+
+``fig.to_html(include_plotlyjs='cdn')`` repeats the loader script and the full
+layout template (about three quarters of a small figure) in every chart. The
+endpoints used by the analysis page instead return the figure as plain
+``{'data', 'layout'}`` JSON, with a built-in template replaced by its name.
+The page loads plotly.js once, fetches the shared templates once from
+``plot_templates`` and renders every figure with ``Plotly.newPlot``.
+"""
+import json
+from functools import lru_cache
+
+import plotly.io as pio
+from plotly.io.json import to_json_plotly
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+
+# Templates sent to the page once instead of inside every figure
+SHARED_TEMPLATES = ('plotly', 'plotly_white')
+
+
+@lru_cache(maxsize=None)
+def _template_json(name):
+    return pio.templates[name].to_plotly_json()
+
+
+def _template_name(template):
+    for name in SHARED_TEMPLATES:
+        if template == _template_json(name):
+            return name
+    return None
+
+
+def figure_payload(fig):
+    """
+    Serialize a figure for ``Plotly.newPlot`` on the page.
+
+    Args:
+        fig: Plotly figure
+
+    Returns:
+        dict: JSON-native ``{'data', 'layout'}``; a shared template is sent
+        by name and resolved on the page
+    """
+    figure = fig.to_plotly_json()
+    layout = dict(figure.get('layout', {}))
+    template = layout.pop('template', None)
+    if template is not None:
+        layout['template'] = _template_name(template) or template
+    # Plotly's encoder handles NumPy arrays and dates (and uses orjson when installed)
+    return json.loads(to_json_plotly({'data': figure['data'], 'layout': layout}))
+
+
+@gzip_page
+@cache_control(public=True, max_age=24 * 60 * 60)
+def plot_templates(request):
+    """Layout templates referenced by name in figure payloads."""
+    return JsonResponse({name: _template_json(name) for name in SHARED_TEMPLATES})
@@ -0,0 +1,301 @@
+"""
+Boolean-mask filter engine.
+
+A filter chain is compiled into one NumPy boolean mask over the unfiltered
+frame: every term (one condition on one column) is evaluated once against the
+typed column, the term masks are combined in place, and the frame is indexed
+a single time. Term masks are cached per frame, so adding, changing or
+removing one filter only evaluates that term. Masks over a stored dataset
+are also kept in a process-wide cache keyed by the dataset fingerprint, so
+later requests filtering the same dataset reuse them.
+
+A term is any object with ``key()`` (a hashable description of the
+condition) and ``mask(df)`` (a boolean array with one entry per row).
+
+Settings:
+    STATS_TERM_MASK_CACHE_MAX_BYTES: Memory budget of the shared mask cache
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .caching import LRUCache
+
+DEFAULT_MAX_TERMS = 32
+DEFAULT_TERM_MASK_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+CONDITIONS = ('=', '!=', '>', '<', '>=', '<=', 'between')
+
+_TRUE_STRINGS = {'true', '1', 'yes'}
+_FALSE_STRINGS = {'false', '0', 'no'}
+
+
+def _to_bool_array(result):
+    """Boolean NumPy array from a comparison result; missing values are False."""
+    if isinstance(result, (pd.Series, pd.Index)):
+        return result.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(result, dtype=bool)
+
+
+def string_match_mask(series, values):
+    """
+    Rows whose string form is one of ``values``.
+
+    Same result as ``series.astype(str).isin(values)``, but the strings are
+    built for the distinct values only (the categories of a categorical
+    column) and rows are matched through their integer codes.
+
+    Args:
+        series: Column to match
+        values: Values to look for; compared as strings
+
+    Returns:
+        np.ndarray: Boolean mask
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        labels = series.cat.categories
+    else:
+        codes, labels = pd.factorize(series)
+    matched, match_missing = label_matches(labels, values)
+    # Missing values have code -1, which picks the trailing entry
+    matched = np.append(matched, match_missing)
+    return matched[codes]
+
+
+def label_matches(labels, values):
+    """
+    Which distinct labels of a dictionary-encoded column match ``values``.
+
+    Args:
+        labels: Distinct values of the column
+        values: Values to look for; compared as strings
+
+    Returns:
+        tuple: (boolean array over ``labels``, whether missing values match)
+    """
+    str_values = {str(v) for v in values}
+    matched = np.asarray(pd.Index(labels).astype(str).isin(str_values), dtype=bool)
+    return matched, 'nan' in str_values
+
+
+def coerce_values(series, values):
+    """
+    Convert request values (usually strings) to the type of the column.
+
+    Only the dtype and name of ``series`` are used, so an empty Series of the
+    right dtype will do.
+    """
+    values = list(values)
+    if pd.api.types.is_bool_dtype(series.dtype):
+        coerced = []
+        for value in values:
+            text = str(value).strip().lower()
+            if text in _TRUE_STRINGS:
+                coerced.append(True)
+            elif text in _FALSE_STRINGS:
+                coerced.append(False)
+            else:
+                raise ValueError(f"Invalid boolean value for '{series.name}': {value}")
+        return coerced
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        try:
+            return pd.to_numeric(pd.Series(values, dtype=object)).tolist()
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid numeric value for '{series.name}': {values}")
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        try:
+            coerced = pd.to_datetime(pd.Series(values, dtype=object))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid date value for '{series.name}': {values}")
+        tz = getattr(series.dt, 'tz', None)
+        if tz is not None and coerced.dt.tz is None:
+            coerced = coerced.dt.tz_localize(tz)
+        return list(coerced)
+    return values
+
+
+def condition_mask(series, condition, values):
+    """
+    Evaluate one filter condition against a typed column.
+
+    Values are converted to the column's type once; '=' and '!=' on text and
+    categorical columns compare string forms via ``string_match_mask``.
+    Ordering conditions are only supported for numeric and datetime columns.
+
+    Args:
+        series: Column to test
+        condition: One of ``CONDITIONS``
+        values: Condition values; 'between' takes two, ordering conditions one
+
+    Returns:
+        np.ndarray: Boolean mask; rows with missing values only match '!='
+    """
+    if condition not in CONDITIONS:
+        raise ValueError(f"Invalid condition: {condition}")
+    if not values:
+        raise ValueError(f"No values given for condition '{condition}'")
+
+    ordered = (pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_datetime64_any_dtype(series.dtype))
+    if condition in ('=', '!='):
+        if ordered:
+            mask = _to_bool_array(series.isin(coerce_values(series, values)))
+        else:
+            mask = string_match_mask(series, values)
+        return ~mask if condition == '!=' else mask
+
+    if not ordered or pd.api.types.is_bool_dtype(series.dtype):
+        raise ValueError(f"Condition '{condition}' needs a numeric or date column, '{series.name}' is {series.dtype}")
+
+    if condition == 'between':
+        if len(values) != 2:
+            raise ValueError("The 'between' condition takes exactly two values")
+        low, high = coerce_values(series, values)
+        return _to_bool_array(series.between(low, high))
+
+    value = coerce_values(series, values[:1])[0]
+    if condition == '>':
+        return _to_bool_array(series > value)
+    if condition == '<':
+        return _to_bool_array(series < value)
+    if condition == '>=':
+        return _to_bool_array(series >= value)
+    return _to_bool_array(series <= value)
+
+
+class ConditionTerm:
+    """One ``column <condition> values`` term of a filter chain."""
+
+    def __init__(self, column, condition, values):
+        self.column = column
+        self.condition = condition
+        self.values = list(values) if isinstance(values, (list, tuple)) else [values]
+
+    def key(self):
+        return ('condition', self.column, self.condition, tuple(str(v) for v in self.values))
+
+    def mask(self, df):
+        if self.column not in df.columns:
+            raise ValueError(f"Column '{self.column}' not found in DataFrame")
+        return condition_mask(df[self.column], self.condition, self.values)
+
+    def describe(self):
+        return f"{self.column} {self.condition} {', '.join(str(v) for v in self.values)}"
+
+
+class AnyOf:
+    """Matches the rows matching any of ``terms`` (filters combined with OR)."""
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+
+    def key(self):
+        return ('any',) + tuple(term.key() for term in self.terms)
+
+    def mask(self, df):
+        mask = np.zeros(len(df), dtype=bool)
+        for term in self.terms:
+            np.logical_or(mask, term.mask(df), out=mask)
+        return mask
+
+    def describe(self):
+        return ' or '.join(f"({term.describe()})" for term in self.terms)
+
+
+_term_mask_cache = None
+_term_mask_cache_lock = threading.Lock()
+
+
+def get_term_mask_cache():
+    """
+    Return the process-wide cache of term masks over stored datasets.
+
+    Entries are keyed by ``(dataset fingerprint, term key)``. The memory
+    ceiling is configured with ``STATS_TERM_MASK_CACHE_MAX_BYTES``.
+    """
+    global _term_mask_cache
+    if _term_mask_cache is None:
+        with _term_mask_cache_lock:
+            if _term_mask_cache is None:
+                _term_mask_cache = LRUCache(
+                    max_bytes=getattr(settings, 'STATS_TERM_MASK_CACHE_MAX_BYTES', DEFAULT_TERM_MASK_CACHE_MAX_BYTES),
+                    sizeof=lambda mask: mask.nbytes,
+                    name='term mask cache'
+                )
+    return _term_mask_cache
+
+
+class FilterMasks:
+    """
+    Cached term masks over one (unfiltered) DataFrame.
+
+    The frame must not be modified while the cache is in use; frames loaded
+    by the stats app are read-only (see dataset_store), so they stay intact.
+
+    Args:
+        df: Frame the masks are evaluated against
+        max_terms: Number of term masks to keep
+        fingerprint: Fingerprint of the stored dataset whose rows ``df``
+            holds, in stored order; its masks are then shared with other
+            requests through ``get_term_mask_cache``
+    """
+
+    def __init__(self, df, max_terms=DEFAULT_MAX_TERMS, fingerprint=None):
+        self.df = df
+        self.max_terms = max_terms
+        self.fingerprint = fingerprint
+        self._masks = OrderedDict()
+
+    def term_mask(self, term):
+        """Mask of a single term, evaluated at most once."""
+        key = term.key()
+        mask = self._masks.get(key)
+        if mask is not None:
+            self._masks.move_to_end(key)
+            return mask
+        shared_key = None if self.fingerprint is None else (self.fingerprint, key)
+        if shared_key is not None:
+            mask = get_term_mask_cache().get(shared_key)
+        if mask is None:
+            mask = term.mask(self.df)
+            mask.flags.writeable = False
+            if shared_key is not None:
+                get_term_mask_cache().set(shared_key, mask)
+        self._masks[key] = mask
+        while len(self._masks) > self.max_terms:
+            self._masks.popitem(last=False)
+        return mask
+
+    def combine(self, terms, logic='and'):
+        """
+        Combine the masks of ``terms`` into one mask.
+
+        Args:
+            terms: Filter terms
+            logic: 'and' (every term matches) or 'or' (any term matches)
+
+        Returns:
+            np.ndarray: Boolean mask; all True when there are no terms
+        """
+        terms = list(terms)
+        if not terms:
+            return np.ones(len(self.df), dtype=bool)
+        combined = self.term_mask(terms[0]).copy()
+        merge = np.logical_or if logic == 'or' else np.logical_and
+        for term in terms[1:]:
+            merge(combined, self.term_mask(term), out=combined)
+        return combined
+
+    def discard(self, term):
+        """Forget the mask of a term; a shared mask stays valid for its dataset."""
+        self._masks.pop(term.key(), None)
+
+    def filter(self, terms, logic='and'):
+        """Rows of the frame matching ``terms``, selected with a single indexing step."""
+        terms = list(terms)
+        if not terms:
+            return self.df
+        return self.df[self.combine(terms, logic)]
@@ -0,0 +1,285 @@
+"""
+Form analysis computed in SQL.
+
+Submissions of a form live in a table of their own (see
+``form_builder.cursor_db``). Analysing a form used to select every record,
+rebuild it row by row in Python and profile the resulting DataFrame. The
+summary is now computed by aggregate queries against the form table: one
+scan for the count, extremes and mean of every field, one GROUP BY per text
+field for its distinct and most frequent values, one scan for the centred
+sums behind variances and correlations, and per numeric field a median and
+a bucketed histogram. Only aggregates are read back into Python.
+
+A field is numeric when every value it holds is stored as a number, which
+is what pandas inferred for the same records.
+"""
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+from django.db import connection
+
+from .correlation import correlation_from_sums
+from .profiling import TOP_K
+from .sql_store import bucket_counts, histogram_bucket_sql
+
+logger = logging.getLogger(__name__)
+
+# Columns every form table has; not summarized
+SYSTEM_COLUMNS = ('id', 'created_at')
+# Bins of the histogram reported for a numeric field
+FORM_HISTOGRAM_BINS = 10
+# Column pairs whose sums are computed by one correlation query
+CORRELATION_PAIRS_PER_QUERY = 100
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _fetchall(sql, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def form_columns(form_name):
+    """Columns of a form table, in table order (including ``id`` and ``created_at``)."""
+    with connection.cursor() as cursor:
+        return [column.name for column in connection.introspection.get_table_description(cursor, form_name)]
+
+
+def read_form_frame(form_name, columns=None):
+    """
+    Records of a form as a DataFrame, built column-wise from the cursor.
+
+    Args:
+        form_name: Form (table) name
+        columns: Columns to read; defaults to the fields, without ``SYSTEM_COLUMNS``
+
+    Returns:
+        pd.DataFrame
+    """
+    if columns is None:
+        columns = [column for column in form_columns(form_name) if column not in SYSTEM_COLUMNS]
+    if not columns:
+        return pd.DataFrame()
+    select = ', '.join(_quote(column) for column in columns)
+    rows = _fetchall(f"SELECT {select} FROM {_quote(form_name)}")
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def field_statistics(form_name, columns):
+    """
+    Value count and extremes of every column of a form table, from a single scan.
+
+    SQLite orders text and blobs after every number, so a column holds only
+    numbers exactly when its maximum is a number.
+
+    Returns:
+        tuple: (row count, dict column -> dict with ``count``, ``numeric``,
+        ``min`` and ``max``)
+    """
+    selects = ['COUNT(*)']
+    for column in columns:
+        q = _quote(column)
+        selects += [f"COUNT({q})", f"MIN({q})", f"MAX({q})"]
+    row = _fetchall(f"SELECT {', '.join(selects)} FROM {_quote(form_name)}")[0]
+    statistics = {}
+    for position, column in enumerate(columns):
+        count, minimum, maximum = row[1 + 3 * position:4 + 3 * position]
+        numeric = bool(count) and not isinstance(maximum, (str, bytes))
+        statistics[column] = {
+            'count': count,
+            'numeric': numeric,
+            'min': minimum if numeric else None,
+            'max': maximum if numeric else None,
+        }
+    return row[0], statistics
+
+
+def field_median(form_name, column, count):
+    """Median of a numeric column with ``count`` values; only the middle values are read."""
+    if not count:
+        return None
+    q = _quote(column)
+    rows = _fetchall(f"SELECT {q} FROM {_quote(form_name)} WHERE {q} IS NOT NULL ORDER BY {q} LIMIT %s OFFSET %s",
+                     [2 - count % 2, (count - 1) // 2])
+    return sum(value for value, in rows) / len(rows)
+
+
+def field_histogram(form_name, column, stats, bins=FORM_HISTOGRAM_BINS):
+    """
+    Bucketed histogram of a numeric column, counted with one GROUP BY.
+
+    Returns:
+        dict: ``edges`` and ``counts`` lists, or None when the column is empty
+    """
+    if not stats['count']:
+        return None
+    integer = isinstance(stats['min'], int) and isinstance(stats['max'], int)
+    edges, bucket = histogram_bucket_sql(_quote(column), stats['min'], stats['max'], bins, integer=integer)
+    rows = _fetchall(f"SELECT {bucket} AS bucket, COUNT(*) FROM {_quote(form_name)} GROUP BY bucket")
+    return {'edges': [float(edge) for edge in edges], 'counts': bucket_counts(rows, len(edges) - 1).tolist()}
+
+
+def field_top_values(form_name, column, limit=TOP_K):
+    """
+    Most frequent values of a column, from one GROUP BY.
+
+    Returns:
+        tuple: (number of distinct values, list of (value, count) pairs, most frequent first)
+    """
+    q = _quote(column)
+    rows = _fetchall(f"SELECT {q}, COUNT(*) AS n, COUNT(*) OVER () FROM {_quote(form_name)} "
+                     f"WHERE {q} IS NOT NULL GROUP BY {q} ORDER BY n DESC LIMIT %s", [limit])
+    return (rows[0][2] if rows else 0), [(value, count) for value, count, _ in rows]
+
+
+def field_moments(form_name, statistics, row_count, pairs=True):
+    """
+    Mean and variance of numeric columns and, optionally, the sums behind
+    their pairwise correlations, from one scan.
+
+    Values are centred on the middle of their range in SQL, so the sums do
+    not lose precision to large offsets. A pair of columns without missing values
+    shares their single-column sums and only needs its cross product; pairs
+    involving missing values are summed over the rows where both are set,
+    like the pairwise-complete ``DataFrame.corr()``.
+
+    Args:
+        form_name: Form (table) name
+        statistics: Numeric columns -> statistics from ``field_statistics``
+        row_count: Rows of the table
+        pairs: Also compute the pair sums for correlations
+
+    Returns:
+        tuple: (dict column -> (mean, sample variance or None), and the pair sums
+        ``(n, sx, sy, sxx, syy, sxy)`` as k x k arrays, upper triangle filled,
+        or None without ``pairs``)
+    """
+    columns = list(statistics)
+    centred = {}
+    for column, stats in statistics.items():
+        if stats['min'] == stats['max']:
+            # Constant columns are exact zeros, so their variance is not rounding noise
+            centred[column] = f"({_quote(column)} * 0.0)"
+        else:
+            centred[column] = f"({_quote(column)} - {(stats['min'] + stats['max']) / 2!r})"
+    complete = {column for column, stats in statistics.items() if stats['count'] == row_count}
+
+    size = len(columns)
+    todo = [(i, j) for i in range(size) for j in range(i + 1, size)] if pairs else []
+    selects = [f"TOTAL({centred[column]}), TOTAL({centred[column]} * {centred[column]})" for column in columns]
+    chunks = [todo[start:start + CORRELATION_PAIRS_PER_QUERY]
+              for start in range(0, len(todo), CORRELATION_PAIRS_PER_QUERY)] or [[]]
+    sums = np.zeros((6, size, size))
+    column_sums = None
+    for chunk in chunks:
+        for i, j in chunk:
+            a, b = columns[i], columns[j]
+            if a in complete and b in complete:
+                selects.append(f"TOTAL({centred[a]} * {centred[b]})")
+            else:
+                # Adding 0 * the other column keeps only the rows where both have a value
+                a_pair = f"({centred[a]} + {_quote(b)} * 0)"
+                b_pair = f"({centred[b]} + {_quote(a)} * 0)"
+                selects.append(f"COUNT({a_pair} * {b_pair}), TOTAL({a_pair}), TOTAL({b_pair}), "
+                               f"TOTAL({a_pair} * {a_pair}), TOTAL({b_pair} * {b_pair}), TOTAL({a_pair} * {b_pair})")
+        row = list(_fetchall(f"SELECT {', '.join(selects)} FROM {_quote(form_name)}")[0])
+        selects = []
+        if column_sums is None:
+            column_sums = dict(zip(columns, zip(row[:2 * size:2], row[1:2 * size:2])))
+            row = row[2 * size:]
+        for i, j in chunk:
+            a, b = columns[i], columns[j]
+            if a in complete and b in complete:
+                sxy, row = row[0], row[1:]
+                sums[:, i, j] = (row_count, column_sums[a][0], column_sums[b][0],
+                                 column_sums[a][1], column_sums[b][1], sxy)
+            else:
+                sums[:, i, j], row = row[:6], row[6:]
+
+    moments = {}
+    for column in columns:
+        count = statistics[column]['count']
+        total, squares = column_sums[column]
+        shift = (statistics[column]['min'] + statistics[column]['max']) / 2
+        variance = max(squares - total * total / count, 0.0) / (count - 1) if count > 1 else None
+        moments[column] = (shift + total / count if count else None, variance)
+    return moments, (tuple(sums) if pairs else None)
+
+
+def field_correlations(statistics, sums):
+    """
+    Pearson correlation matrix of numeric columns from their pair sums.
+
+    Args:
+        statistics: Numeric columns -> statistics from ``field_statistics``
+        sums: Pair sums from ``field_moments``
+
+    Returns:
+        dict: column -> {column: coefficient, or None when undefined}
+    """
+    columns = list(statistics)
+    size = len(columns)
+    matrix = correlation_from_sums(*sums)
+    matrix = np.where(np.triu(np.ones((size, size), dtype=bool), 1), matrix, matrix.T)
+    # Same convention as pandas: 1 on the diagonal unless the column has no variance
+    for i, column in enumerate(columns):
+        stats = statistics[column]
+        matrix[i, i] = 1.0 if stats['count'] > 1 and stats['min'] != stats['max'] else np.nan
+    return {
+        col1: {col2: (None if math.isnan(matrix[i, j]) else float(matrix[i, j])) for j, col2 in enumerate(columns)}
+        for i, col1 in enumerate(columns)
+    }
+
+
+def analyze_form(form_name):
+    """
+    Summary statistics and correlations of a form's records.
+
+    Returns:
+        dict: ``row_count``, ``column_count``, ``columns``, ``summary`` (per
+        field: mean, median, min, max, std and histogram for numeric fields,
+        unique_values and top_values otherwise) and ``correlations``
+    """
+    columns = form_columns(form_name)
+    # Submission timestamps are text, never summarized nor correlated
+    row_count, statistics = field_statistics(form_name, [column for column in columns if column != 'created_at'])
+    numeric = {column: stats for column, stats in statistics.items() if stats['numeric']}
+    moments, sums = field_moments(form_name, numeric, row_count, pairs=len(numeric) > 1) if numeric else ({}, None)
+
+    analysis = {
+        'row_count': row_count,
+        'column_count': len(columns),
+        'columns': columns,
+        'summary': {},
+        'correlations': {}
+    }
+    for column in columns:
+        if column.lower() in SYSTEM_COLUMNS:
+            continue
+        stats = statistics[column]
+        if stats['numeric']:
+            mean, variance = moments[column]
+            values = {
+                'mean': mean,
+                'median': field_median(form_name, column, stats['count']),
+                'min': stats['min'],
+                'max': stats['max'],
+                'std': math.sqrt(variance) if variance is not None else None,
+            }
+            analysis['summary'][column] = {key: value if value is not None else 0 for key, value in values.items()}
+            analysis['summary'][column]['histogram'] = field_histogram(form_name, column, stats)
+        else:
+            unique_count, top_values = field_top_values(form_name, column)
+            analysis['summary'][column] = {
+                'unique_values': unique_count,
+                'top_values': {str(label): count for label, count in top_values},
+            }
+
+    if sums is not None:
+        analysis['correlations'] = field_correlations(numeric, sums)
+    return analysis
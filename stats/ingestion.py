@@ -0,0 +1,455 @@
+"""
+Streaming ingestion of uploaded CSV/Excel files.
+
+Uploads are read in chunks of ``STATS_INGEST_CHUNK_ROWS`` rows and every chunk
+is shrunk before the next one is read:
+
+* integer columns are downcast to the smallest integer type holding them,
+* string columns are dictionary-encoded as ``category``.
+
+After the last chunk the string columns are unified; columns that turn out to
+hold dates are parsed once per distinct value, and columns whose cardinality is
+too high to benefit from ``category`` are turned back into plain objects.
+
+``read_upload`` assembles the columns into a DataFrame; ``spool_upload`` keeps
+the shrunk chunks in one temporary file per column instead, so an upload can be
+written to the columnar store without ever being held in memory as a whole.
+"""
+import contextlib
+import functools
+import logging
+import os
+import pickle
+import re
+import tempfile
+import warnings
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 100000
+DEFAULT_CATEGORY_MAX_RATIO = 0.5
+DATE_MIN_PARSED_RATIO = 0.9
+
+CSV_EXTENSIONS = ('.csv',)
+EXCEL_EXTENSIONS = ('.xls', '.xlsx')
+
+_DATE_HINT = re.compile(r'\d{1,4}[-/.:]\d{1,2}|[A-Za-z]{3,}\s+\d{1,2}|\d{1,2}\s+[A-Za-z]{3,}')
+
+
+def is_supported_upload(file_name):
+    """Return True if the file can be ingested (CSV or Excel)."""
+    return file_name.lower().endswith(CSV_EXTENSIONS + EXCEL_EXTENSIONS)
+
+
+def _chunk_rows():
+    return getattr(settings, 'STATS_INGEST_CHUNK_ROWS', DEFAULT_CHUNK_ROWS)
+
+
+def _frame_nbytes(df):
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+
+def _iter_csv_chunks(file, chunk_rows):
+    with pd.read_csv(file, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def _header_names(row):
+    """Turn an Excel header row into unique column names, like pandas does."""
+    names = []
+    seen = {}
+    for position, value in enumerate(row):
+        name = f"Unnamed: {position}" if value is None else value
+        if isinstance(name, float) and name.is_integer():
+            name = int(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _iter_xlsx_chunks(file, chunk_rows):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            yield pd.DataFrame()
+            return
+        columns = _header_names(header)
+        width = len(columns)
+
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            batch.append(row)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch or not columns:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _iter_chunks(file, chunk_rows):
+    file_name = file.name.lower()
+    if file_name.endswith(CSV_EXTENSIONS):
+        return _iter_csv_chunks(file, chunk_rows)
+    if file_name.endswith('.xlsx'):
+        return _iter_xlsx_chunks(file, chunk_rows)
+    if file_name.endswith('.xls'):
+        # Legacy .xls workbooks have no streaming reader; they are small by
+        # nature (65536 rows max), so they are read in one go.
+        return iter([pd.read_excel(file)])
+    raise ValueError(f"Unsupported file format: {file.name}")
+
+
+def _shrink_chunk(chunk):
+    """Downcast integers and dictionary-encode strings in a single chunk."""
+    for column in chunk.columns:
+        series = chunk[column]
+        if pd.api.types.is_integer_dtype(series.dtype) and isinstance(series.dtype, np.dtype):
+            chunk[column] = pd.to_numeric(series, downcast='integer')
+        elif series.dtype == object:
+            chunk[column] = series.astype('category')
+    return chunk
+
+
+class _ColumnPieces:
+    """
+    The pieces of one column, one per chunk, in memory or spooled to a file.
+
+    While pieces are added, the union of their categories (in order of
+    appearance, as ``union_categoricals`` would build it) and the range of
+    their integers are tracked, so the final dtype of the column is known
+    before the pieces are read back.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.rows = 0
+        self.categorical = True
+        self._categories = None
+        self._templates = []
+        self._int_range = None
+        self._pieces = []
+        self._spool = open(path, 'wb') if path else None
+
+    def add(self, piece):
+        self.rows += len(piece)
+        if isinstance(piece.dtype, pd.CategoricalDtype):
+            categories = piece.cat.categories
+            if self._categories is None:
+                self._categories = categories
+            elif categories.dtype != self._categories.dtype:
+                self.categorical = False
+            else:
+                self._categories = self._categories.append(categories[~categories.isin(self._categories)])
+            template = piece.iloc[:0].astype(object)
+        else:
+            self.categorical = False
+            template = piece.iloc[:0]
+            if pd.api.types.is_integer_dtype(piece.dtype) and isinstance(piece.dtype, np.dtype) and len(piece):
+                low, high = int(piece.min()), int(piece.max())
+                if self._int_range is not None:
+                    low, high = min(low, self._int_range[0]), max(high, self._int_range[1])
+                self._int_range = (low, high)
+        if not any(known.dtype == template.dtype for known in self._templates):
+            self._templates.append(template)
+
+        if self._spool is None:
+            self._pieces.append(piece)
+        else:
+            pickle.dump(piece, self._spool, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _iter_pieces(self):
+        if self._spool is None:
+            # Each piece is handed out once, so it can be freed once converted
+            while self._pieces:
+                yield self._pieces.pop(0)
+            return
+        self._spool.close()
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def finalize(self, report, name):
+        """
+        Decide the final dtype of the column.
+
+        String columns holding dates are parsed once per distinct value,
+        columns with too many distinct strings go back to plain objects and
+        integers are downcast over the whole column.
+
+        Returns:
+            tuple: (dtype, iterator over the pieces converted to it)
+        """
+        if self.categorical and self._categories is not None:
+            categories = self._categories
+            dates = _parse_dates(categories)
+            if dates is not None:
+                report['datetime_columns'].append(name)
+                convert = functools.partial(_dates_from_codes, dates, categories)
+                return dates.dtype, map(convert, self._iter_pieces())
+            max_ratio = getattr(settings, 'STATS_INGEST_CATEGORY_MAX_RATIO', DEFAULT_CATEGORY_MAX_RATIO)
+            if self.rows and len(categories) > max_ratio * self.rows:
+                return np.dtype(object), (piece.astype(object) for piece in self._iter_pieces())
+            report['category_columns'].append(name)
+            dtype = pd.CategoricalDtype(categories)
+            return dtype, (piece.cat.set_categories(categories) for piece in self._iter_pieces())
+
+        # Chunks disagree on the kind of column (e.g. a column that is empty in
+        # one chunk and text in another); categorical pieces become plain
+        # objects and the rest are cast to their common dtype.
+        dtype = pd.concat(self._templates).dtype if self._templates else np.dtype(object)
+        if pd.api.types.is_integer_dtype(dtype) and isinstance(dtype, np.dtype):
+            dtype = _smallest_integer_dtype(dtype, self._int_range)
+            if dtype.itemsize < 8:
+                report['downcast_columns'].append(name)
+        return dtype, (piece.astype(object).astype(dtype) if isinstance(piece.dtype, pd.CategoricalDtype) else piece.astype(dtype)
+                       for piece in self._iter_pieces())
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+        self._pieces = []
+
+
+def _smallest_integer_dtype(dtype, int_range):
+    """The integer dtype ``pd.to_numeric(downcast='integer')`` would pick for values in ``int_range``."""
+    low, high = int_range or (0, 0)
+    for candidate in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(candidate)
+        if info.min <= low and high <= info.max:
+            return np.dtype(candidate)
+    return dtype
+
+
+def _looks_like_dates(labels):
+    if not len(labels) or not pd.api.types.is_object_dtype(labels.dtype):
+        return False
+    sample = labels[:1000]
+    if not all(isinstance(value, str) for value in sample):
+        return False
+    if pd.to_numeric(pd.Series(sample), errors='coerce').notna().mean() >= 0.5:
+        return False
+    return np.mean([bool(_DATE_HINT.search(value)) for value in sample]) >= DATE_MIN_PARSED_RATIO
+
+
+def _parse_dates(categories):
+    """
+    Parse the distinct values of a string column as dates.
+
+    Returns:
+        pd.DatetimeIndex aligned with ``categories``, or None if the column
+        does not hold dates
+    """
+    if not _looks_like_dates(categories):
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            parsed = pd.to_datetime(pd.Index(categories), errors='coerce')
+        except (ValueError, TypeError, OverflowError):
+            return None
+    if not isinstance(parsed, pd.DatetimeIndex) or parsed.notna().mean() < DATE_MIN_PARSED_RATIO:
+        return None
+    return parsed
+
+
+def _dates_from_codes(parsed, categories, piece):
+    """Rebuild the rows of a categorical piece from the parsed dates of ``categories``."""
+    codes = piece.cat.set_categories(categories).cat.codes.to_numpy()
+    values = parsed.take(np.where(codes < 0, 0, codes))
+    values = values.where(codes >= 0)
+    return pd.Series(values, name=piece.name)
+
+
+class UploadColumns:
+    """
+    The columns of an upload, read chunk by chunk.
+
+    Every chunk is shrunk (see ``_shrink_chunk``) and split into its columns
+    as soon as it is read. With a ``spool_dir`` the pieces are written to one
+    file per column instead of being kept in memory, so the upload never has
+    to fit in memory as a whole; ``iter_columns`` then reads back one column
+    at a time.
+    """
+
+    def __init__(self, name, spool_dir=None):
+        self.spool_dir = spool_dir
+        self.report = _new_report(name)
+        self.columns = None
+        self._pieces = []
+
+    @property
+    def row_count(self):
+        return self._pieces[0].rows if self._pieces else 0
+
+    def add_chunk(self, chunk):
+        self.report['chunks'] += 1
+        self.report['memory_before'] += _frame_nbytes(chunk)
+        chunk = _shrink_chunk(chunk)
+        if self.columns is None:
+            self.columns = chunk.columns
+            self._pieces = [
+                _ColumnPieces(os.path.join(self.spool_dir, f"col_{position:05d}.pkl") if self.spool_dir else None)
+                for position in range(len(self.columns))
+            ]
+        for position, pieces in enumerate(self._pieces):
+            pieces.add(chunk.iloc[:, position])
+
+    def iter_columns(self):
+        """
+        Yield ``(name, dtype, pieces)`` for every column, in order.
+
+        The pieces of a column are converted to its final dtype as they are
+        read; each column can only be iterated once.
+        """
+        self.report['rows'] = int(self.row_count)
+        self.report['columns'] = len(self._pieces)
+        self.report['memory_after'] = 0
+        for name, pieces in zip(self.columns if self.columns is not None else [], self._pieces):
+            dtype, converted = pieces.finalize(self.report, name)
+            yield name, dtype, self._measured(converted)
+
+    def _measured(self, pieces):
+        for piece in pieces:
+            self.report['memory_after'] += int(piece.memory_usage(index=False, deep=True))
+            yield piece
+
+    def to_frame(self):
+        """Concatenate the columns into one DataFrame."""
+        if self.columns is None:
+            return pd.DataFrame()
+        data = {}
+        for position, (name, dtype, pieces) in enumerate(self.iter_columns()):
+            parts = list(pieces)
+            data[position] = parts[0].reset_index(drop=True) if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+        df = pd.DataFrame(data, copy=False)
+        df.columns = self.columns
+        return df
+
+    def close(self):
+        for pieces in self._pieces:
+            pieces.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _new_report(name):
+    return {
+        'name': name,
+        'rows': 0,
+        'columns': 0,
+        'chunks': 0,
+        'memory_before': 0,
+        'memory_after': 0,
+        'category_columns': [],
+        'datetime_columns': [],
+        'downcast_columns': [],
+    }
+
+
+def _finish_report(report, df=None):
+    if df is not None:
+        report['rows'] = int(len(df))
+        report['columns'] = int(len(df.columns))
+        report['memory_after'] = _frame_nbytes(df)
+    logger.info(
+        f"Ingested {report['name']}: {report['rows']} rows x {report['columns']} columns "
+        f"in {report['chunks']} chunk(s), memory {report['memory_before'] / 1048576:.1f} MB "
+        f"-> {report['memory_after'] / 1048576:.1f} MB"
+    )
+    return report
+
+
+def read_upload(file, chunk_rows=None):
+    """
+    Read an uploaded CSV/Excel file into a memory-optimized DataFrame.
+
+    Args:
+        file: Uploaded file (anything with ``name`` that pandas/openpyxl can read)
+        chunk_rows: Rows per chunk; defaults to ``STATS_INGEST_CHUNK_ROWS``
+
+    Returns:
+        tuple: (DataFrame, report dict with row/column counts, the memory the
+        default pandas dtypes would have used, the memory actually used and
+        the columns that were converted)
+
+    Raises:
+        ValueError: If the file is neither CSV nor Excel
+    """
+    with UploadColumns(file.name) as upload:
+        for chunk in _iter_chunks(file, chunk_rows or _chunk_rows()):
+            upload.add_chunk(chunk)
+        df = upload.to_frame()
+        return df, _finish_report(upload.report, df)
+
+
+@contextlib.contextmanager
+def spool_upload(file, chunk_rows=None):
+    """
+    Read an uploaded CSV/Excel file without building a DataFrame.
+
+    The shrunk chunks are spooled to a temporary directory, one file per
+    column, which is removed on exit. Use this to write an upload straight
+    to the columnar store (see ``dataset_store.save_upload``).
+
+    Yields:
+        UploadColumns: The spooled columns; ``report`` is complete (and
+        logged) once every column has been read back
+
+    Raises:
+        ValueError: If the file is neither CSV nor Excel
+    """
+    with tempfile.TemporaryDirectory(prefix='stats-upload-') as spool_dir:
+        with UploadColumns(file.name, spool_dir) as upload:
+            for chunk in _iter_chunks(file, chunk_rows or _chunk_rows()):
+                upload.add_chunk(chunk)
+            yield upload
+            _finish_report(upload.report)
+
+
+def optimize_dataframe(df, name='dataframe'):
+    """
+    Apply the ingestion dtype optimizations to a DataFrame already in memory.
+
+    Returns:
+        tuple: (optimized DataFrame, report dict as returned by ``read_upload``)
+    """
+    with UploadColumns(name) as upload:
+        upload.add_chunk(df.reset_index(drop=True).copy())
+        optimized = upload.to_frame()
+        return optimized, _finish_report(upload.report, optimized)
+
+
+def observed_value_counts(series):
+    """
+    ``value_counts()`` without the zero counts pandas reports for categories
+    that no longer appear (e.g. after filtering a categorical column).
+    """
+    counts = series.value_counts()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        counts = counts[counts > 0]
+    return counts
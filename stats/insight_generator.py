@@ -17,17 +17,53 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import calendar
 
+from .profiling import profile_dataframe
+from .aggregation import histogram_figure, histogram_trace, box_trace
+
+# Columns read by the donor insights
+DONOR_COLUMNS = ['organization_name', 'donation_amount', 'donation_date', 'donor_type', 'donor_location']
+# Top donors that get a detailed analysis
+TOP_DONOR_COUNT = 3
+
+
+def _donation_frame(df):
+    """
+    Donation rows sorted by date, with the dates as a DatetimeIndex.
+
+    Only the dated rows and the columns used by the donor insights are kept,
+    and the caller's frame is left untouched; 'donation_date' stays
+    available as a column.
+    """
+    frame = df[[col for col in DONOR_COLUMNS if col in df.columns]]
+    dates = frame['donation_date']
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        # Parse each distinct date string once; donation dates repeat heavily
+        codes, uniques = pd.factorize(dates, use_na_sentinel=False)
+        parsed = pd.to_datetime(pd.Index(uniques), dayfirst=True)
+        dates = pd.Series(parsed[codes], index=dates.index, name='donation_date')
+    # Rows without a date cannot be placed on the monthly timelines
+    dated = np.flatnonzero(dates.notna().to_numpy())
+    order = dated[np.argsort(dates.to_numpy()[dated], kind='stable')]
+    frame = frame.iloc[order].assign(donation_date=dates.iloc[order])
+    return frame.set_axis(pd.DatetimeIndex(frame['donation_date']).rename(None), axis=0)
+
+
 def  generate_donor_insights(df, include_figures=False):
-    """Generate comprehensive donor-specific insights, optionally including figure objects."""
+    """
+    Generate comprehensive donor-specific insights, optionally including figure objects.
+
+    Every aggregate is computed in one grouped pass over a date-sorted frame;
+    per-donor monthly figures are only built for the donors that are shown.
+    """
     insights = []
     
     if all(col in df.columns for col in ['organization_name', 'donation_amount', 'donation_date']):
         try:
-            # Convert donation_date to datetime with proper format
-            df['donation_date'] = pd.to_datetime(df['donation_date'], dayfirst=True)
+            # Dates parsed once into a local, date-indexed frame
+            df = _donation_frame(df)
             
             # 1. Top Donors Analysis with Enhanced Details
-            donor_totals = df.groupby('organization_name').agg({
+            donor_totals = df.groupby('organization_name', observed=True).agg({
                 'donation_amount': ['sum', 'count', 'mean', 'std'],
                 'donation_date': ['min', 'max']
             }).round(2)
@@ -43,14 +79,16 @@ def  generate_donor_insights(df, include_figures=False):
             ).round(2)
             
             # Top donors insights with detailed analysis
-            top_donors = donor_totals.head(3)
+            top_donors = donor_totals.head(TOP_DONOR_COUNT)
+            top_rows = df[df['organization_name'].isin(top_donors.index)]
+            top_groups = top_rows.groupby('organization_name', observed=True)['donation_amount']
+            
+            # Monthly donation pattern of every top donor in one grouped resample
+            top_monthly = top_groups.resample('ME').agg(['sum', 'count', 'mean']).fillna(0)
+            top_amounts = {name: amounts for name, amounts in top_groups}
+            
             for name, row in top_donors.iterrows():
-                donor_df = df[df['organization_name'] == name].copy()
-                
-                # Monthly donation pattern
-                monthly_donations = donor_df.set_index('donation_date')['donation_amount'].resample('ME').agg([
-                    'sum', 'count', 'mean'
-                ]).fillna(0)
+                monthly_donations = top_monthly.loc[name]
                 
                 # Create subplot with multiple metrics
                 fig = make_subplots(
@@ -87,22 +125,21 @@ def  generate_donor_insights(df, include_figures=False):
                 
                 # Plot 3: Donation size distribution
                 fig.add_trace(
-                    go.Histogram(
-                        x=donor_df['donation_amount'],
+                    histogram_trace(
+                        top_amounts[name],
+                        bins=20,
                         name='Donation Size',
-                        nbinsx=20,
                         marker_color='orange'
                     ),
                     row=2, col=1
                 )
                 
-                # Plot 4: Cumulative donations
-                cumulative = donor_df.sort_values('donation_date')
-                cumulative['cumulative'] = cumulative['donation_amount'].cumsum()
+                # Plot 4: Cumulative donations, at the end of each month
+                cumulative = monthly_donations['sum'].cumsum()
                 fig.add_trace(
                     go.Scatter(
-                        x=cumulative['donation_date'],
-                        y=cumulative['cumulative'],
+                        x=cumulative.index,
+                        y=cumulative.values,
                         name='Cumulative Total',
                         line=dict(color='red')
                     ),
@@ -147,15 +184,15 @@ def  generate_donor_insights(df, include_figures=False):
                             float(row['avg_donation']),
                             float(row['total_amount'])
                         ),
-                        'figure': fig if include_figures else None,
-                        'data': donor_df.copy()
+                        'figure': fig if include_figures else None
                     }
                 })
                 
             # 2. Donation Trends Analysis
-            monthly_total = df.set_index('donation_date')['donation_amount'].resample('ME').sum()
-            monthly_count = df.set_index('donation_date')['donation_amount'].resample('ME').count()
-            monthly_avg = df.set_index('donation_date')['donation_amount'].resample('ME').mean()
+            monthly = df['donation_amount'].resample('ME').agg(['sum', 'count', 'mean'])
+            monthly_total = monthly['sum']
+            monthly_count = monthly['count']
+            monthly_avg = monthly['mean']
             
             trend_fig = make_subplots(
                 rows=2, cols=1,
@@ -222,8 +259,7 @@ def  generate_donor_insights(df, include_figures=False):
                         f"{'Investigate decline and develop recovery plan' if growth_rate < 0 else 'Maintain positive growth momentum'}",
                         f"Focus on donor retention during {monthly_count.idxmax().strftime('%B')}"
                     ],
-                    'figure': trend_fig if include_figures else None,
-                    'data': df.copy()
+                    'figure': trend_fig if include_figures else None
                 }
             })
             
@@ -239,18 +275,18 @@ def  generate_donor_insights(df, include_figures=False):
             )
             
             dist_fig.add_trace(
-                go.Histogram(
-                    x=df['donation_amount'],
+                histogram_trace(
+                    df['donation_amount'],
+                    bins=30,
                     name='Distribution',
-                    nbinsx=30,
                     marker_color='orange'
                 ),
                 row=1, col=1
             )
             
             dist_fig.add_trace(
-                go.Box(
-                    y=df['donation_amount'],
+                box_trace(
+                    df['donation_amount'],
                     name='Box Plot',
                     marker_color='red'
                 ),
@@ -292,17 +328,12 @@ def  generate_donor_insights(df, include_figures=False):
                         f"Focus on increasing donations below ${percentiles[0.25]:.2f}",
                         f"Create special recognition for donations above ${percentiles[0.9]:.2f}"
                     ],
-                    'figure': dist_fig if include_figures else None,
-                    'data': df.copy()
+                    'figure': dist_fig if include_figures else None
                 }
             })
             
             # 2. Seasonal Patterns Analysis
-            seasonal_df = df.copy()
-            seasonal_df['month'] = seasonal_df['donation_date'].dt.month
-            seasonal_df['year'] = seasonal_df['donation_date'].dt.year
-            
-            monthly_patterns = seasonal_df.groupby('month').agg({
+            monthly_patterns = df.groupby(df.index.month.rename('month')).agg({
                 'donation_amount': ['sum', 'count', 'mean']
             }).round(2)
             
@@ -421,14 +452,13 @@ def  generate_donor_insights(df, include_figures=False):
                                            key=lambda x: (x.startswith('URGENT'),
                                                         'launch' in x.lower(), 
                                                         len(x)))[:5],
-                    'figure': seasonal_fig if include_figures else None,
-                    'data': df.copy()
+                    'figure': seasonal_fig if include_figures else None
                 }
             })
             
             # 3. Donor Segmentation Analysis
             if 'donor_type' in df.columns:
-                segment_analysis = df.groupby('donor_type').agg({
+                segment_analysis = df.groupby('donor_type', observed=True).agg({
                     'donation_amount': ['sum', 'count', 'mean'],
                     'organization_name': 'nunique'
                 }).round(2)
@@ -506,7 +536,6 @@ def  generate_donor_insights(df, include_figures=False):
                             'segment_counts': segment_analysis['unique_donors'].to_dict(),
                             'segment_averages': segment_analysis['avg_donation'].to_dict()
                         },
-                        'data': df.copy(),
                         'recommendations': generate_segment_recommendations(
                             top_segment,
                             growth_segment,
@@ -518,7 +547,7 @@ def  generate_donor_insights(df, include_figures=False):
             
             # 4. Geographic Analysis (if location data available)
             if 'donor_location' in df.columns:
-                location_analysis = df.groupby('donor_location').agg({
+                location_analysis = df.groupby('donor_location', observed=True).agg({
                     'donation_amount': ['sum', 'count', 'mean'],
                     'organization_name': 'nunique'
                 }).round(2)
@@ -549,7 +578,6 @@ def  generate_donor_insights(df, include_figures=False):
                             'location_donors': location_analysis['unique_donors'].to_dict(),
                             'location_averages': location_analysis['avg_donation'].to_dict()
                         },
-                        'data': df.copy(),
                         'recommendations': generate_location_recommendations(location_analysis),
                         'figure': location_fig if include_figures else None
                     }
@@ -565,10 +593,11 @@ def generate_engagement_insights(df):
     insights = []
     
     if 'donation_date' in df.columns and 'organization_name' in df.columns:
-        df['donation_date'] = pd.to_datetime(df['donation_date'])
+        # Parsed into a local frame; the caller's column is left as it is
+        df = df.assign(donation_date=pd.to_datetime(df['donation_date']))
         
         # Donor Loyalty Analysis
-        donor_history = df.groupby('organization_name').agg({
+        donor_history = df.groupby('organization_name', observed=True).agg({
             'donation_date': ['min', 'max', 'count'],
             'donation_amount': ['sum', 'mean']
         })
@@ -595,7 +624,8 @@ def generate_retention_insights(df):
     if 'organization_name' in df.columns:
         # Calculate retention rate
         total_donors = df['organization_name'].nunique()
-        repeat_donors = df['organization_name'].value_counts()[df['organization_name'].value_counts() > 1].count()
+        donor_counts = df['organization_name'].value_counts()
+        repeat_donors = int((donor_counts > 1).sum())
         retention_rate = (repeat_donors / total_donors) * 100 if total_donors > 0 else 0
         
         insights.append({
@@ -817,21 +847,33 @@ def generate_pattern_recommendations(growth_rate, volatility):
         
     return recommendations
 
-def generate_all_insights(df):
-    """Generate all insights for the dataset."""
+# Sections of generate_all_insights, in the order they run
+INSIGHT_SECTIONS = [
+    ('missing_values', generate_missing_value_insights),  # Basic data quality insights
+    ('donors', generate_donor_insights),  # Donor-specific insights
+    ('engagement', generate_engagement_insights),
+    ('retention', generate_retention_insights),
+    ('statistics', generate_statistical_insights),
+    ('donation_patterns', generate_donation_patterns_insights),
+]
+
+
+def generate_all_insights(df, progress=None):
+    """
+    Generate all insights for the dataset.
+
+    Args:
+        df: The dataset
+        progress: Optional callable ``progress(fraction, stage, insights)``
+            called after each section with the insights found so far
+    """
     try:
         all_insights = []
         
-        # Basic data quality insights
-        all_insights.extend(generate_missing_value_insights(df))
-        
-        # Donor-specific insights
-        all_insights.extend(generate_donor_insights(df))
-        
-        all_insights.extend(generate_engagement_insights(df))
-        all_insights.extend(generate_retention_insights(df))
-        all_insights.extend(generate_statistical_insights(df))
-        all_insights.extend(generate_donation_patterns_insights(df))
+        for position, (stage, generate) in enumerate(INSIGHT_SECTIONS, start=1):
+            all_insights.extend(generate(df))
+            if progress is not None:
+                progress(position / len(INSIGHT_SECTIONS), stage, all_insights)
         
         # Sort insights by severity
         severity_order = {'high': 0, 'medium': 1, 'low': 2}
@@ -848,8 +890,8 @@ def generate_overview(df):
         overview = {
             'rows': len(df),
             'columns': df.columns.tolist(),
-            'numeric_columns': df.select_dtypes(include=['float64', 'int64']).columns.tolist(),
-            'categorical_columns': df.select_dtypes(include=['object']).columns.tolist(),
+            'numeric_columns': df.select_dtypes(include=['number']).columns.tolist(),
+            'categorical_columns': df.select_dtypes(include=['object', 'category']).columns.tolist(),
             'missing_values': df.isnull().sum().to_dict()
         }
         return overview
@@ -857,35 +899,41 @@ def generate_overview(df):
         print(f"Error generating overview: {str(e)}")
         return {}
 
-def generate_summary_statistics(df):
-    """Generate summary statistics for numeric columns."""
+def generate_summary_statistics(df, profile=None):
+    """
+    Generate summary statistics for numeric and categorical columns.
+
+    Args:
+        df: DataFrame to summarize
+        profile: Precomputed dataset profile (see ``profiling``); computed from
+            ``df`` if omitted
+    """
     try:
         summary_stats = {}
-        
-        # For numeric columns
-        numeric_cols = df.select_dtypes(include=['float64', 'int64']).columns
-        for col in numeric_cols:
-            stats = df[col].describe()
-            summary_stats[col] = {
-                'mean': stats['mean'],
-                'median': df[col].median(),
-                'std': stats['std'],
-                'min': stats['min'],
-                'max': stats['max'],
-                'q1': stats['25%'],
-                'q3': stats['75%']
-            }
-        
-        # For categorical columns
-        cat_cols = df.select_dtypes(include=['object']).columns
-        for col in cat_cols:
-            value_counts = df[col].value_counts()
-            summary_stats[col] = {
-                'unique_values': df[col].nunique(),
-                'most_common': value_counts.index[0] if not value_counts.empty else None,
-                'most_common_count': value_counts.iloc[0] if not value_counts.empty else 0,
-                'missing_values': df[col].isnull().sum()
-            }
+        profile = profile or profile_dataframe(df)
+
+        for col, column in profile['columns'].items():
+            # For numeric columns
+            if column['kind'] == 'numeric':
+                summary_stats[col] = {
+                    'mean': column['mean'],
+                    'median': column['median'],
+                    'std': column['std'],
+                    'min': column['min'],
+                    'max': column['max'],
+                    'q1': column['q1'],
+                    'q3': column['q3']
+                }
+
+            # For categorical columns
+            elif column['kind'] == 'categorical':
+                top_values = column['top_values']
+                summary_stats[col] = {
+                    'unique_values': column['unique_count'],
+                    'most_common': top_values[0][0] if top_values else None,
+                    'most_common_count': top_values[0][1] if top_values else 0,
+                    'missing_values': column['missing']
+                }
         
         return summary_stats
     except Exception as e:
@@ -898,19 +946,20 @@ def generate_all_plots(df):
         plots = {}
         
         # For numeric columns
-        for col in df.select_dtypes(include=['float64', 'int64']).columns:
+        for col in df.select_dtypes(include=['number']).columns:
             # Distribution plot (histogram)
-            fig = px.histogram(df, x=col, title=f'Distribution of {col}')
+            fig = histogram_figure(df[col], title=f'Distribution of {col}')
             plots[col] = fig.to_html(full_html=False)
             
             # If it's donation_amount, add additional plots
             if col == 'donation_amount':
                 # Box plot
-                fig = px.box(df, y=col, title=f'Box Plot of {col}')
+                fig = go.Figure(box_trace(df[col], name=col))
+                fig.update_layout(title=f'Box Plot of {col}')
                 plots[f'{col}_box'] = fig.to_html(full_html=False)
         
         # For categorical columns
-        for col in df.select_dtypes(include=['object']).columns:
+        for col in df.select_dtypes(include=['object', 'category']).columns:
             # Bar chart of value counts
             value_counts = df[col].value_counts()
             fig = px.bar(x=value_counts.index, 
@@ -0,0 +1,229 @@
+"""
+Background insight generation.
+
+Insight generation can take longer than a proxy will wait for a response,
+so it runs as a job in a worker pool owned by the web process. Job state,
+progress, partial results and the final result are stored in ``InsightJob``
+rows. Any worker process can therefore answer status requests, and a
+finished result is served again for later views of the same dataset.
+
+Jobs of a process that stopped are noticed by their heartbeat (the row's
+``updated_at``): after ``STATS_JOB_STALE_SECONDS`` without an update a
+pending or running job is marked failed and the next request starts a new one.
+
+Settings:
+    STATS_JOB_WORKERS: Jobs run at the same time in each web process
+    STATS_JOB_STALE_SECONDS: Silence after which a job is considered lost
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+from plotly.io.json import to_json_plotly
+
+from .dataset_store import get_dataset_profile, get_session_dataset, load_dataframe
+from .models import InsightJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_STALE_SECONDS = 600
+# Shortest time between two progress writes of a job
+REPORT_INTERVAL = 0.5
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _json_safe(value):
+    """JSON-native copy of a result; NumPy and pandas values become plain JSON."""
+    return json.loads(to_json_plotly(value))
+
+
+def _run_dataset_insights(dataset, report):
+    from .deepseek_api import generate_dataset_insights
+    return generate_dataset_insights(load_dataframe(dataset), get_dataset_profile(dataset), report, dataset.fingerprint)
+
+
+def _run_all_insights(dataset, report):
+    from .insight_generator import generate_all_insights
+
+    def progress(fraction, stage, insights):
+        report(fraction, stage, {'insights': insights})
+
+    return {'insights': generate_all_insights(load_dataframe(dataset), progress)}
+
+
+# Job kind -> callable ``run(dataset, report)`` returning a JSON-serializable result
+JOB_KINDS = {
+    'dataset_insights': _run_dataset_insights,
+    'all_insights': _run_all_insights,
+}
+
+
+class JobReporter:
+    """
+    Progress callback handed to a running job.
+
+    ``report(progress, stage, partial=None)`` saves the job's progress; like
+    the result, ``partial`` may hold NumPy and pandas values. Writes are
+    throttled to one per ``REPORT_INTERVAL`` unless the stage changes.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.stage = None
+        self.last_write = 0.0
+
+    def __call__(self, progress=None, stage=None, partial=None):
+        now = time.monotonic()
+        if stage == self.stage and now - self.last_write < REPORT_INTERVAL:
+            return
+        fields = {'updated_at': timezone.now()}
+        if progress is not None:
+            fields['progress'] = min(max(float(progress), 0.0), 1.0)
+        if stage is not None:
+            fields['stage'] = stage
+            self.stage = stage
+        if partial is not None:
+            fields['partial'] = _json_safe(partial)
+        InsightJob.objects.filter(pk=self.job_id).update(**fields)
+        self.last_write = now
+
+
+def _job_workers():
+    return max(1, int(getattr(settings, 'STATS_JOB_WORKERS', DEFAULT_JOB_WORKERS)))
+
+
+def get_job_executor():
+    """Return the process-wide pool that runs insight jobs."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_job_workers(), thread_name_prefix='stats-jobs')
+                logger.info(f"Started insight job pool with {_job_workers()} workers")
+    return _executor
+
+
+def run_job(job_id):
+    """Run a job to completion in the current thread, recording its outcome."""
+    close_old_connections()
+    try:
+        job = InsightJob.objects.select_related('dataset').get(pk=job_id)
+        InsightJob.objects.filter(pk=job_id).update(status=InsightJob.STATUS_RUNNING, updated_at=timezone.now())
+        started = time.monotonic()
+        result = JOB_KINDS[job.kind](job.dataset, JobReporter(job_id))
+        InsightJob.objects.filter(pk=job_id).update(
+            status=InsightJob.STATUS_DONE,
+            progress=1.0,
+            result=_json_safe(result),
+            partial=None,
+            updated_at=timezone.now(),
+            finished_at=timezone.now(),
+        )
+        logger.info(f"Insight job {job_id} ({job.kind}) finished in {time.monotonic() - started:.1f}s")
+    except Exception as e:
+        logger.exception(f"Insight job {job_id} failed: {str(e)}")
+        InsightJob.objects.filter(pk=job_id).update(
+            status=InsightJob.STATUS_FAILED,
+            error=str(e),
+            updated_at=timezone.now(),
+            finished_at=timezone.now(),
+        )
+    finally:
+        close_old_connections()
+
+
+def _expire_if_stale(job):
+    """Mark an active job whose worker stopped reporting as failed."""
+    stale_after = getattr(settings, 'STATS_JOB_STALE_SECONDS', DEFAULT_JOB_STALE_SECONDS)
+    if job.is_active and job.updated_at < timezone.now() - timedelta(seconds=stale_after):
+        InsightJob.objects.filter(pk=job.pk, updated_at=job.updated_at).update(
+            status=InsightJob.STATUS_FAILED,
+            error='The job stopped responding',
+            finished_at=timezone.now(),
+        )
+        job.refresh_from_db()
+    return job
+
+
+def submit_job(dataset, kind, refresh=False):
+    """
+    Start a job for a dataset, or return the one that already covers it.
+
+    A pending or running job of the same kind is always reused. A finished
+    one is reused unless ``refresh`` is set, so repeat views are instant.
+
+    Args:
+        dataset: ``Dataset`` to generate insights for
+        kind: Key of ``JOB_KINDS``
+        refresh: Start a new job even if a result is stored
+
+    Returns:
+        InsightJob
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    statuses = [InsightJob.STATUS_PENDING, InsightJob.STATUS_RUNNING]
+    if not refresh:
+        statuses.append(InsightJob.STATUS_DONE)
+    for job in InsightJob.objects.filter(dataset=dataset, kind=kind, status__in=statuses).order_by('-created_at')[:1]:
+        if _expire_if_stale(job).status != InsightJob.STATUS_FAILED:
+            return job
+
+    job = InsightJob.objects.create(dataset=dataset, kind=kind)
+    get_job_executor().submit(run_job, job.pk)
+    logger.info(f"Submitted insight job {job.pk} ({kind}) for dataset {dataset.id}")
+    return job
+
+
+def job_payload(job):
+    """JSON description of a job for the analysis page."""
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'stage': job.stage,
+        'partial': job.partial,
+        'result': job.result if job.status == InsightJob.STATUS_DONE else None,
+        'error': job.error,
+        'status_url': reverse('insight_job_status', args=[job.pk]),
+    }
+
+
+@require_POST
+def submit_insight_job(request):
+    """Start (or reuse) an insight job for the session's dataset."""
+    try:
+        data = json.loads(request.body) if request.body else {}
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    dataset = get_session_dataset(request)
+    if dataset is None:
+        return JsonResponse({'error': 'No dataset available. Please upload a dataset first.'}, status=400)
+    kind = data.get('kind', 'all_insights')
+    if kind not in JOB_KINDS:
+        return JsonResponse({'error': f"Unknown job kind: {kind}"}, status=400)
+    job = submit_job(dataset, kind, refresh=bool(data.get('refresh')))
+    return JsonResponse({'job': job_payload(job)}, status=200 if job.status == InsightJob.STATUS_DONE else 202)
+
+
+@require_GET
+def insight_job_status(request, job_id):
+    """Progress, partial results and, once finished, the result of a job."""
+    dataset = get_session_dataset(request)
+    job = InsightJob.objects.filter(pk=job_id, dataset=dataset).first() if dataset is not None else None
+    if job is None:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return JsonResponse({'job': job_payload(_expire_if_stale(job))})
@@ -0,0 +1,88 @@
+"""
+Lazily imported views.
+
+``stats.views`` and the modules behind it pull in pandas, NumPy, SciPy,
+Plotly and the language model client, which take over a second and more
+than 100 MB per worker to import. URL patterns refer to those views through
+``lazy_view`` instead, so the analytics stack is only imported by the first
+request that reaches a stats view. Workers that only serve the rest of the
+DMS never load it.
+"""
+import functools
+import logging
+
+from asgiref.sync import markcoroutinefunction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# View attributes that middleware reads before calling the view; looking one
+# up imports the view. Other lookups on a view not yet imported fail, so URL
+# resolution and system checks never trigger the import.
+VIEW_FLAGS = ('csrf_exempt', 'login_required')
+
+
+class LazyView:
+    """
+    View callable that imports its target on first use.
+
+    Once imported, attribute lookups the instance cannot answer are
+    forwarded to the view. The flags in ``VIEW_FLAGS`` (such as
+    ``csrf_exempt``, checked by the CSRF middleware before the view runs)
+    import it first, so decorators applied to the view keep working.
+
+    Args:
+        path: Dotted path of a view function or class-based view
+        initkwargs: Passed to ``as_view()`` when the target is a class
+    """
+
+    def __init__(self, path, **initkwargs):
+        module, _, name = path.rpartition('.')
+        self.path = path
+        self.initkwargs = initkwargs
+        # Used by URL pattern introspection, which should not trigger the import
+        self.__module__ = module
+        self.__name__ = self.__qualname__ = name
+        self._view = None
+
+    def resolve(self):
+        """Import the target view (once) and return it."""
+        if self._view is None:
+            target = import_string(self.path)
+            view = target.as_view(**self.initkwargs) if hasattr(target, 'as_view') else target
+            functools.update_wrapper(self, view, updated=())
+            self._view = view
+            logger.debug(f"Imported view {self.path}")
+        return self._view
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('path', 'initkwargs', '_view'):
+            raise AttributeError(name)
+        if self._view is None and name not in VIEW_FLAGS:
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __call__(self, request, *args, **kwargs):
+        return self.resolve()(request, *args, **kwargs)
+
+    def __repr__(self):
+        return f"<LazyView {self.path}>"
+
+
+def lazy_view(path, is_async=False, **initkwargs):
+    """
+    View for ``path`` that is imported when it first handles a request.
+
+    Args:
+        path: Dotted path of a view function or class-based view
+        is_async: The target is an ``async def`` view; this has to be known
+            before the import so Django runs it on the event loop
+        initkwargs: Passed to ``as_view()`` for class-based views
+
+    Returns:
+        LazyView
+    """
+    view = LazyView(path, **initkwargs)
+    if is_async:
+        markcoroutinefunction(view)
+    return view
@@ -0,0 +1,220 @@
+"""
+Language model client and response cache for the stats app.
+
+The client is created on first use from settings instead of at import time,
+and can be swapped for ``StubLLMClient``, which answers locally with canned
+text. Both expose the OpenAI ``chat.completions.create`` interface, including
+``stream=True``. ``get_async_llm_client`` returns the asyncio counterpart
+used by the streaming chat view.
+
+Dataset insights are cached under ``(dataset fingerprint, prompt version,
+model)``. The fingerprint identifies the data, so the statistics prompt is
+not even rebuilt for a dataset that was already answered. Bump
+``INSIGHTS_PROMPT_VERSION`` whenever the insights prompt changes, so that
+answers to the old prompt stop being served. Entries expire after
+``STATS_LLM_CACHE_TTL`` seconds, and least recently used entries are
+evicted once the cache outgrows its memory budget.
+
+Settings:
+    STATS_LLM_CLIENT: 'openrouter', 'stub' or the dotted path of a factory
+        ``factory(asynchronous=False)`` returning an OpenAI-compatible client
+    STATS_LLM_BASE_URL: API endpoint of the 'openrouter' client
+    STATS_LLM_API_KEY: API key of the 'openrouter' client
+    STATS_LLM_MODEL: Model used for insights and chat
+    STATS_LLM_CACHE_TTL: Seconds a cached response is served
+    STATS_LLM_CACHE_MAX_BYTES: Memory budget of the response cache
+"""
+import hashlib
+import logging
+import threading
+import time
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LLM_CLIENT = 'openrouter'
+DEFAULT_LLM_BASE_URL = 'https://openrouter.ai/api/v1'
+DEFAULT_LLM_MODEL = 'deepseek/deepseek-r1-zero:free'
+DEFAULT_LLM_CACHE_TTL = 24 * 60 * 60
+DEFAULT_LLM_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Version of the dataset insights prompt; part of every cache key
+INSIGHTS_PROMPT_VERSION = 1
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_llm_model():
+    return getattr(settings, 'STATS_LLM_MODEL', DEFAULT_LLM_MODEL)
+
+
+class StubLLMClient:
+    """
+    Offline stand-in for the OpenAI client.
+
+    Replies are bullet points derived from a digest of the messages, so the
+    same conversation always gets the same answer. ``calls`` counts the
+    completions requested, which shows whether a cache was used.
+    """
+
+    def __init__(self, chunk_size=16):
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def reply(self, messages):
+        digest = hashlib.sha1(repr(messages).encode('utf-8')).hexdigest()[:8]
+        return '\n'.join(f"• Stub insight {i} ({digest})" for i in range(1, 4)) + '\n'
+
+    def _completion(self, model, text):
+        message = SimpleNamespace(role='assistant', content=text)
+        return SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, message=message)])
+
+    def _chunks(self, model, text):
+        return [
+            SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=text[i:i + self.chunk_size]))])
+            for i in range(0, len(text), self.chunk_size)
+        ]
+
+    def _create(self, model=None, messages=(), stream=False, **kwargs):
+        self.calls += 1
+        text = self.reply(list(messages))
+        return iter(self._chunks(model, text)) if stream else self._completion(model, text)
+
+
+class AsyncStubLLMClient(StubLLMClient):
+    """``StubLLMClient`` with the interface of ``openai.AsyncOpenAI``."""
+
+    async def _create(self, model=None, messages=(), stream=False, **kwargs):
+        self.calls += 1
+        text = self.reply(list(messages))
+        if not stream:
+            return self._completion(model, text)
+
+        async def chunks():
+            for chunk in self._chunks(model, text):
+                yield chunk
+        return chunks()
+
+
+def _openrouter_client(asynchronous=False):
+    from openai import AsyncOpenAI, OpenAI
+    return (AsyncOpenAI if asynchronous else OpenAI)(
+        base_url=getattr(settings, 'STATS_LLM_BASE_URL', DEFAULT_LLM_BASE_URL),
+        api_key=getattr(settings, 'STATS_LLM_API_KEY', None),
+    )
+
+
+def _create_client(asynchronous):
+    kind = getattr(settings, 'STATS_LLM_CLIENT', DEFAULT_LLM_CLIENT)
+    if kind == 'openrouter':
+        client = _openrouter_client(asynchronous)
+    elif kind == 'stub':
+        client = AsyncStubLLMClient() if asynchronous else StubLLMClient()
+    else:
+        client = import_string(kind)(asynchronous=asynchronous)
+    logger.info(f"Using language model client '{kind}'{' (async)' if asynchronous else ''}")
+    return client
+
+
+def get_llm_client():
+    """Return the process-wide client selected by ``STATS_LLM_CLIENT``."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client(asynchronous=False)
+    return _client
+
+
+def get_async_llm_client():
+    """
+    Return the process-wide asyncio client selected by ``STATS_LLM_CLIENT``.
+
+    One client, and with it one pool of HTTP connections, serves every
+    streaming chat of the process.
+    """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = _create_client(asynchronous=True)
+    return _async_client
+
+
+def set_llm_client(client=None, async_client=None):
+    """Replace the process-wide clients (None creates them again from settings)."""
+    global _client, _async_client
+    with _client_lock:
+        _client = client
+        _async_client = async_client
+
+
+class ResponseCache:
+    """
+    Model responses kept for a limited time within a memory budget.
+
+    Args:
+        ttl: Seconds an entry is served after it was stored
+        max_bytes: Upper bound for the summed size of the cached texts
+    """
+
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self._entries = LRUCache(
+            max_bytes=max_bytes,
+            sizeof=lambda entry: len(entry[1].encode('utf-8')),
+            name='LLM response cache'
+        )
+
+    def get(self, key):
+        """Return the cached text, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, text = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(key)
+            return None
+        return text
+
+    def set(self, key, text):
+        self._entries.set(key, (time.monotonic() + self.ttl, text))
+
+    def pop(self, key):
+        self._entries.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide cache of model responses."""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    ttl=getattr(settings, 'STATS_LLM_CACHE_TTL', DEFAULT_LLM_CACHE_TTL),
+                    max_bytes=getattr(settings, 'STATS_LLM_CACHE_MAX_BYTES', DEFAULT_LLM_CACHE_MAX_BYTES),
+                )
+    return _response_cache
+
+
+def insights_cache_key(fingerprint, model=None):
+    """Cache key of the dataset insights for a dataset fingerprint."""
+    return ('insights', fingerprint, INSIGHTS_PROMPT_VERSION, model or get_llm_model())
@@ -0,0 +1,100 @@
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+DEFAULT_REPLY = "• هذه إجابة تجريبية من خادم النموذج المحلي.\n• يتم إرسال النص على دفعات لاختبار البث.\n"
+
+
+def make_handler(reply, token_delay, first_token_delay):
+    tokens = reply.split(' ')
+    tokens = [token + ' ' for token in tokens[:-1]] + tokens[-1:]
+
+    class CompletionHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            model = request.get('model', 'fake-model')
+            created = int(time.time())
+            time.sleep(first_token_delay)
+
+            if not request.get('stream'):
+                self._send_json(200, {
+                    'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': reply}}],
+                })
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(token_delay)
+                chunk = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'finish_reason': None, 'delta': {'content': token}}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+
+    return CompletionHandler
+
+
+class CompletionServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for many simultaneous chats, as in a load test
+    request_queue_size = 256
+
+
+class Command(BaseCommand):
+    help = (
+        'Run a local OpenAI-compatible chat completion server with canned answers, '
+        'for exercising the insights and chat views offline '
+        '(set STATS_LLM_BASE_URL to http://<addr>:<port>/v1).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--addr', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+        parser.add_argument('--reply', default=DEFAULT_REPLY, help='Text of every answer')
+        parser.add_argument('--token-delay', type=float, default=0.05, help='Seconds between streamed tokens')
+        parser.add_argument('--first-token-delay', type=float, default=0.2, help='Seconds before the first token')
+
+    def handle(self, *args, **options):
+        handler = make_handler(options['reply'], options['token_delay'], options['first_token_delay'])
+        server = CompletionServer((options['addr'], options['port']), handler)
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake completion server on http://{options['addr']}:{options['port']}/v1"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,101 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Modules whose presence after startup shows the analytics stack was imported
+HEAVY_MODULES = ('numpy', 'pandas', 'scipy', 'plotly', 'plotly.express', 'plotly.figure_factory', 'openai')
+
+# Run in a fresh interpreter for every phase, so nothing is already imported
+PROBE = r'''
+import json, os, resource, sys, time
+phase = sys.argv[1]
+targets = json.loads(sys.argv[2])
+started = time.perf_counter()
+import django
+django.setup()
+setup_done = time.perf_counter()
+if phase in ('urls', 'analytics'):
+    from django.urls import get_resolver
+    get_resolver().url_patterns
+    get_resolver().reverse_dict
+urls_done = time.perf_counter()
+if phase == 'analytics':
+    import importlib
+    for target in targets:
+        importlib.import_module(target)
+done = time.perf_counter()
+print(json.dumps({
+    'setup': setup_done - started,
+    'urls': urls_done - setup_done,
+    'analytics': done - urls_done,
+    'total': done - started,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'heavy': [name for name in json.loads(sys.argv[3]) if name in sys.modules],
+}))
+'''
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure worker startup: time and peak memory of django.setup(), of loading '
+        'the URL configuration, and of importing the analytics modules, each in a '
+        'fresh interpreter. Shows whether the analytics stack is loaded at startup.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per phase; the fastest is reported')
+        parser.add_argument('--top', type=int, default=15,
+                            help='Slowest top-level imports to list for the URL phase (0 to skip)')
+        parser.add_argument('--module', action='append', dest='modules',
+                            default=None, help='Module imported in the analytics phase (repeatable)')
+        parser.add_argument('--json', action='store_true', help='Print the measurements as JSON')
+
+    def _run(self, phase, modules, importtime=False):
+        command = [sys.executable]
+        if importtime:
+            command += ['-X', 'importtime']
+        command += ['-c', PROBE, phase, json.dumps(modules), json.dumps(HEAVY_MODULES)]
+        # The child must find the same modules as this process
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(entry for entry in sys.path if entry)}
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            raise CommandError(f"The {phase} phase failed:\n{result.stderr[-2000:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def handle(self, *args, **options):
+        modules = options['modules'] or ['stats.views', 'stats.deepseek_api']
+        report = {}
+        for phase in ('setup', 'urls', 'analytics'):
+            runs = [self._run(phase, modules)[0] for _ in range(max(1, options['repeat']))]
+            report[phase] = min(runs, key=lambda run: run['total'])
+
+        slowest = []
+        if options['top']:
+            _, stderr = self._run('urls', modules, importtime=True)
+            for line in stderr.splitlines():
+                match = IMPORTTIME_LINE.match(line)
+                # Top-level imports only: their cumulative time includes their dependencies
+                if match and len(match.group(3)) == 1:
+                    slowest.append((int(match.group(2)), match.group(4)))
+            slowest = sorted(slowest, reverse=True)[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps({'phases': report, 'slowest_imports_us': slowest}, indent=2))
+            return
+
+        for phase, run in report.items():
+            self.stdout.write(
+                f"{phase:<10} total {run['total']:.3f}s (setup {run['setup']:.3f}s, urls {run['urls']:.3f}s, "
+                f"analytics {run['analytics']:.3f}s), peak RSS {run['max_rss_kb'] / 1024:.1f} MB"
+            )
+            self.stdout.write(f"{'':<10} heavy modules loaded: {', '.join(run['heavy']) or 'none'}")
+        if slowest:
+            self.stdout.write('Slowest top-level imports while loading the URL configuration:')
+            for micros, name in slowest:
+                self.stdout.write(f"  {micros / 1000:9.1f} ms  {name}")
@@ -7,13 +7,65 @@ class Dataset(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='datasets/')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
+    file = models.FileField(upload_to='datasets/', blank=True)
     columns = models.JSONField(default=dict)   # Store column names and types
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True)  # Content hash of the stored data
+    row_count = models.PositiveIntegerField(default=0)
+    storage_path = models.CharField(max_length=255, blank=True)  # Columnar copy, relative to STATS_DATASET_ROOT
     
     def __str__(self):
         return self.name
 
+class InsightJob(models.Model):
+    """Background insight generation for a dataset; the result is kept for later views"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='insight_jobs')
+    kind = models.CharField(max_length=50)  # Key of stats.jobs.JOB_KINDS
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    progress = models.FloatField(default=0)  # 0 to 1
+    stage = models.CharField(max_length=100, blank=True)
+    partial = models.JSONField(null=True, blank=True)  # Results available before the job finishes
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Doubles as the worker heartbeat
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['dataset', 'kind', 'status'])]
+
+    def __str__(self):
+        return f"{self.kind} for {self.dataset.name} ({self.status})"
+
+    @property
+    def is_active(self):
+        return self.status in (self.STATUS_PENDING, self.STATUS_RUNNING)
+
+
+class ChatConversation(models.Model):
+    """Analysis chat about a dataset; the session only stores ``key``"""
+    key = models.CharField(max_length=32, unique=True)
+    dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, null=True, blank=True, related_name='chat_conversations')
+    summary = models.TextField(blank=True)  # Condensed older turns
+    messages = models.JSONField(default=list)  # Recent turns, sent verbatim
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Chat {self.key}"
+
+
 class Analysis(models.Model):
     """Model to store analysis configurations"""
     dataset = models.ForeignKey(Dataset, on_delete=models.CASCADE, related_name='analyses')
@@ -0,0 +1,194 @@
+"""
+Content-addressed cache of serialized figures.
+
+A figure is identified by the dataset version it was drawn from (the content
+fingerprint), the filter chain applied to it, the columns involved and the plot
+type. Entries live in a size-bounded in-process LRU; entries pushed out of
+memory spill to ``STATS_PLOT_CACHE_DIR``, which is itself bounded and pruned
+oldest-first. A hit returns the stored JSON without touching pandas or Plotly.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLOT_CACHE_MAX_BYTES = 128 * 1024 * 1024
+DEFAULT_PLOT_CACHE_DISK_MAX_BYTES = 1024 * 1024 * 1024
+
+# Bump when the figures produced by the plot code change, so stale figures are
+# not served after an upgrade.
+PLOT_CACHE_VERSION = 2
+
+
+def plot_cache_key(fingerprint, columns, plot_type, filters=None, **options):
+    """
+    Build the cache key of a figure.
+
+    Args:
+        fingerprint: Content fingerprint of the dataset
+        columns: Columns the figure is drawn from
+        plot_type: Kind of figure (e.g. 'distribution', 'filter', 'comparison')
+        filters: JSON-serializable description of the filter chain, if any
+        **options: Any other parameter that changes the figure
+
+    Returns:
+        str: Hex digest identifying the figure
+    """
+    identity = [PLOT_CACHE_VERSION, fingerprint, [str(col) for col in columns], plot_type, filters, options]
+    encoded = json.dumps(identity, sort_keys=True, cls=DjangoJSONEncoder, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class PlotCache:
+    """
+    Two-tier (memory, then disk) cache of JSON-serializable figure payloads.
+
+    Args:
+        max_bytes: Memory budget for serialized figures
+        directory: Spillover directory, or None to keep figures in memory only
+        disk_max_bytes: Disk budget for spilled figures
+    """
+
+    def __init__(self, max_bytes, directory=None, disk_max_bytes=DEFAULT_PLOT_CACHE_DISK_MAX_BYTES):
+        self.memory = LRUCache(max_bytes, sizeof=len, name='plot cache', on_evict=self._spill)
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = None
+        self._disk_lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached payload for ``key`` or None."""
+        text = self.memory.get(key)
+        if text is None:
+            text = self._read_disk(key)
+            if text is None:
+                return None
+            self.memory.set(key, text)
+        return json.loads(text)
+
+    def set(self, key, value):
+        """Cache a JSON-serializable payload."""
+        text = json.dumps(value, cls=DjangoJSONEncoder)
+        if not self.memory.set(key, text):
+            # Larger than the whole memory budget: keep it on disk only
+            self._write_disk(key, text)
+
+    def get_or_build(self, key, build):
+        """Return the cached payload for ``key``, building and caching it on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        self.memory.clear()
+
+    # Disk tier
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return None
+        try:
+            # Refresh the modification time so pruning removes the least recently used files
+            os.utime(path)
+        except OSError:
+            pass
+        return text
+
+    def _spill(self, key, text):
+        if self.directory and not os.path.exists(self._path(key)):
+            self._write_disk(key, text)
+
+    def _write_disk(self, key, text):
+        if not self.directory:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            staging = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(staging, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(staging, path)
+        except OSError as e:
+            logger.warning(f"Could not spill figure {key} to disk: {str(e)}")
+            return
+
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, _, size in self._disk_files())
+            else:
+                self._disk_bytes += len(text)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._prune_disk()
+
+    def _disk_files(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        return files
+
+    def _prune_disk(self):
+        """Remove the least recently used files until the disk tier is under 90% of its budget."""
+        files = sorted(self._disk_files())
+        total = sum(size for _, _, size in files)
+        target = self.disk_max_bytes * 0.9
+        for _, path, size in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+
+_plot_cache = None
+_plot_cache_lock = threading.Lock()
+
+
+def get_plot_cache():
+    """
+    Return the process-wide figure cache.
+
+    Configured with ``STATS_PLOT_CACHE_MAX_BYTES`` (memory),
+    ``STATS_PLOT_CACHE_DIR`` (spillover directory, None to disable) and
+    ``STATS_PLOT_CACHE_DISK_MAX_BYTES``.
+    """
+    global _plot_cache
+    if _plot_cache is None:
+        with _plot_cache_lock:
+            if _plot_cache is None:
+                _plot_cache = PlotCache(
+                    max_bytes=getattr(settings, 'STATS_PLOT_CACHE_MAX_BYTES', DEFAULT_PLOT_CACHE_MAX_BYTES),
+                    directory=getattr(settings, 'STATS_PLOT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'plot_cache')),
+                    disk_max_bytes=getattr(settings, 'STATS_PLOT_CACHE_DISK_MAX_BYTES', DEFAULT_PLOT_CACHE_DISK_MAX_BYTES)
+                )
+    return _plot_cache
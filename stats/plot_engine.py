@@ -0,0 +1,311 @@
+"""
+Parallel per-column plot generation.
+
+Building a Plotly figure and serializing it is CPU bound, so the figures for a
+set of columns are fanned out over a worker pool and handed back as soon as
+each one is ready. The pool is created lazily and shared by all requests of
+the process.
+
+Settings:
+    STATS_PLOT_EXECUTOR: 'thread' (default) or 'process'. A process pool
+        sidesteps the GIL, but every web worker then starts its own pool and
+        each child imports Django, pandas and Plotly again.
+    STATS_PLOT_WORKERS: Number of workers; 1 disables the pool
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+from django.conf import settings
+
+from .aggregation import binned_histogram_figure, histogram_bins, histogram_figure
+from .figure_transport import figure_payload
+from .plot_cache import get_plot_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PLOT_EXECUTOR = 'thread'
+DEFAULT_PLOT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Bins of the distribution figures of numeric and datetime columns
+NUMERIC_BINS = 50
+DATETIME_BINS = 100
+# Most frequent values shown for a categorical column
+TOP_VALUES = 10
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def column_figure(df, column):
+    """Build the distribution figure of a single column."""
+    if pd.api.types.is_numeric_dtype(df[column]):
+        return aggregated_column_figure(column, "numeric", histogram_bins(df[column], bins=NUMERIC_BINS))
+    elif pd.api.types.is_datetime64_any_dtype(df[column]):
+        return aggregated_column_figure(column, "datetime", histogram_bins(df[column], bins=DATETIME_BINS))
+    return aggregated_column_figure(column, "categorical", df[column].value_counts().head(TOP_VALUES))
+
+
+def store_column_figure(store, column):
+    """
+    Build the distribution figure of a column from the SQL copy of its dataset.
+
+    Same figure as ``column_figure``; only the bin counts or the top value
+    counts are read back (see ``sql_store.SQLStore``).
+    """
+    kind = store.column_kind(column)
+    if kind in ('numeric', 'bool'):
+        return aggregated_column_figure(column, "numeric", store.histogram(column, bins=NUMERIC_BINS))
+    elif kind == 'datetime':
+        binned = store.histogram(column, bins=DATETIME_BINS)
+        if len(binned['edges']):
+            binned['edges'] = pd.to_datetime(np.asarray(binned['edges']).astype('int64'))
+        return aggregated_column_figure(column, "datetime", binned)
+    return aggregated_column_figure(column, "categorical", store.value_counts(column, limit=TOP_VALUES))
+
+
+def aggregated_column_figure(column, type, aggregate):
+    """
+    Distribution figure of a column from its aggregates.
+
+    Args:
+        column: Column name
+        type: 'numeric', 'datetime' or 'categorical'
+        aggregate: Bins (see ``histogram_bins``) of numeric and datetime
+            columns, top value counts of categorical ones
+
+    Returns:
+        tuple: (figure, type)
+    """
+    if type == "numeric":
+        fig = binned_histogram_figure(aggregate, title=f"المخطط التكراري للعمود {column}", x_title=str(column))
+    elif type == "datetime":
+        # Counts per time bin rather than per distinct timestamp
+        edges = aggregate['edges']
+        centers = edges[:-1] + (edges[1:] - edges[:-1]) / 2 if len(edges) else edges
+        fig = go.Figure(go.Scatter(x=centers, y=aggregate['counts'], mode='lines'))
+        fig.update_layout(title=f"التوزيع الزمني للعمود {column}", xaxis_title=column, yaxis_title="Count")
+
+    else:
+        value_counts = aggregate
+        if len(value_counts) <= 7:
+            fig = px.pie(names=value_counts.index, values=value_counts.values, title=f"المخطط الدائري للعمود {column}")
+        else:
+            fig = px.bar(x=value_counts.index,
+                         y=value_counts.values,
+                         title=f"المخطط العمودي لأكثر 10 قيم في {column}")
+        fig.update_layout(xaxis_title=column, yaxis_title="Count")
+
+    fig.update_layout(
+        showlegend=True,
+        template='plotly_white',
+        margin=dict(l=40, r=40, t=40, b=40)
+    )
+
+    logger.debug(f"Plot for {column} ({type}) generated")
+
+    return fig, type
+
+
+def generate_plot(df, column):
+    """Generate a plot for a single column as embeddable HTML."""
+    fig, type = column_figure(df, column)
+    return fig.to_html(full_html=False, include_plotlyjs='cdn'), type
+
+
+def generate_plot_figure(df, column):
+    """Generate a plot for a single column as figure JSON for the page."""
+    fig, type = column_figure(df, column)
+    return figure_payload(fig), type
+
+
+def generate_store_plot_figure(store, column):
+    """Like ``generate_plot_figure``, from the SQL copy of the dataset."""
+    fig, type = store_column_figure(store, column)
+    return figure_payload(fig), type
+
+
+def distribution_plot(df, column, include_plotlyjs=True):
+    """Histogram for numeric columns, bar chart of value counts otherwise."""
+    if pd.api.types.is_numeric_dtype(df[column]):
+        fig = histogram_figure(df[column], title=f"Distribution of {column}")
+    else:
+        value_counts = df[column].value_counts()
+        fig = px.bar(x=value_counts.index,
+                     y=value_counts.values,
+                     title=f"Distribution of {column}")
+    return fig.to_html(full_html=False, include_plotlyjs=include_plotlyjs)
+
+
+def _worker_count():
+    return max(1, int(getattr(settings, 'STATS_PLOT_WORKERS', DEFAULT_PLOT_WORKERS)))
+
+
+def get_plot_executor():
+    """
+    Return the shared plot worker pool, or None when it is disabled.
+
+    Process pools use the 'spawn' start method: forking a threaded web server
+    can copy locks held by other threads into the children.
+    """
+    global _executor
+    workers = _worker_count()
+    if workers <= 1:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                kind = getattr(settings, 'STATS_PLOT_EXECUTOR', DEFAULT_PLOT_EXECUTOR)
+                if kind == 'process':
+                    _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stats-plot')
+                logger.info(f"Started plot {kind} pool with {workers} workers")
+    return _executor
+
+
+def _reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _build(builder, frame, column):
+    try:
+        return column, builder(frame, column), None
+    except Exception as e:
+        logger.error(f"Error generating plot for {column}: {str(e)}")
+        return column, None, str(e)
+
+
+def iter_column_plots(df, columns, builder):
+    """
+    Build one plot per column in parallel, yielding results as they complete.
+
+    Args:
+        df: DataFrame holding the columns
+        columns: Columns to plot; names missing from ``df`` are skipped
+        builder: Picklable callable ``builder(frame, column)``; ``frame`` only
+            holds the column being plotted. Use ``functools.partial`` to pass
+            extra options.
+
+    Yields:
+        tuple: (column, result, error message or None), in completion order
+    """
+    columns = [col for col in columns if col in df.columns]
+    executor = get_plot_executor() if len(columns) > 1 else None
+    if executor is None:
+        for col in columns:
+            yield _build(builder, df[[col]], col)
+        return
+
+    futures = {executor.submit(builder, df[[col]], col): col for col in columns}
+    pending = set(columns)
+    try:
+        for future in as_completed(futures):
+            col = futures[future]
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                logger.error(f"Error generating plot for {col}: {str(e)}")
+                pending.discard(col)
+                yield col, None, str(e)
+                continue
+            pending.discard(col)
+            yield col, result, None
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); rebuild the pool next time
+        # and finish the remaining columns in this process.
+        logger.error("Plot worker pool broke, finishing plots serially")
+        _reset_executor(executor)
+        for col in columns:
+            if col in pending:
+                yield _build(builder, df[[col]], col)
+
+
+def build_column_plots(df, columns, builder):
+    """
+    Build one plot per column in parallel and return them in column order.
+
+    Columns whose plot failed are left out.
+
+    Returns:
+        dict: column -> builder result
+    """
+    results = {col: result for col, result, error in iter_column_plots(df, columns, builder) if error is None}
+    return {col: results[col] for col in columns if col in results}
+
+
+
+def iter_store_column_plots(store, columns, builder):
+    """
+    Build one plot per column of a dataset's SQL copy, yielding results as they complete.
+
+    The queries run on the plot pool when it uses threads (SQLite releases
+    the GIL while it scans); a process pool cannot share the store's
+    connections, so the plots are then built one after the other.
+
+    Args:
+        store: ``SQLStore`` of the dataset
+        columns: Columns to plot
+        builder: Callable ``builder(store, column)``
+    """
+    executor = get_plot_executor() if len(columns) > 1 else None
+    if not isinstance(executor, ThreadPoolExecutor):
+        for col in columns:
+            yield _build(builder, store, col)
+        return
+    futures = [executor.submit(_build, builder, store, col) for col in columns]
+    for future in as_completed(futures):
+        yield future.result()
+
+
+def iter_cached_column_plots(columns, builder, cache_key, load_frame, plot_missing=None):
+    """
+    Like ``iter_column_plots``, but serve figures from the plot cache first.
+
+    Args:
+        columns: Columns to plot
+        builder: Picklable callable ``builder(frame, column)`` returning a
+            JSON-serializable result
+        cache_key: Callable returning the plot cache key of a column
+        load_frame: Callable ``load_frame(columns)`` returning a DataFrame with
+            the columns that were not cached; only called on a miss
+        plot_missing: Optional callable ``plot_missing(columns)`` yielding
+            results like ``iter_column_plots``; used instead of ``builder``
+            and ``load_frame`` for data that is not loaded as a DataFrame
+
+    Yields:
+        tuple: (column, result, error message or None); cached results first
+    """
+    cache = get_plot_cache()
+    keys = {col: cache_key(col) for col in columns}
+    missing = []
+    for col in columns:
+        result = cache.get(keys[col])
+        if result is None:
+            missing.append(col)
+        else:
+            yield col, result, None
+
+    if not missing:
+        return
+    if plot_missing is not None:
+        results = plot_missing(missing)
+    else:
+        results = iter_column_plots(load_frame(missing), missing, builder)
+    for col, result, error in results:
+        if error is None:
+            cache.set(keys[col], result)
+        yield col, result, error
@@ -0,0 +1,195 @@
+"""
+Column profiles computed once per dataset version.
+
+A profile holds everything the stats endpoints and the assistant prompts used
+to recompute on every request (type, null counts, quantiles, top values,
+cardinality, outlier bounds). Profiles of stored datasets are written next to
+the columnar data as ``profile.json``; since the storage directory is named
+after the content fingerprint, a profile always matches its data.
+"""
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PROFILE_NAME = 'profile.json'
+PROFILE_VERSION = 1
+TOP_K = 10
+OUTLIER_IQR_FACTOR = 1.5
+
+
+def _scalar(value):
+    """Convert numpy/pandas scalars to JSON-friendly Python values."""
+    if value is None:
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        value = pd.Timestamp(value)
+        return None if pd.isna(value) else str(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    return str(value)
+
+
+def infer_column_type(series, unique_count=None):
+    """
+    Classify a column as 'numeric', 'categorical' or 'datetime'.
+
+    Booleans and numeric columns with only a handful of distinct values
+    (codes, ratings) are treated as categorical.
+    """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return 'categorical'
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        if unique_count is None:
+            unique_count = series.nunique()
+        if len(series) and unique_count < 10 and unique_count / len(series) < 0.05:
+            return 'categorical'
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return 'datetime'
+    return 'categorical'
+
+
+def _storage_kind(series):
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return 'boolean'
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return 'numeric'
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return 'datetime'
+    return 'categorical'
+
+
+def profile_column(series, top_k=TOP_K):
+    """
+    Compute the profile of a single column.
+
+    ``value_counts`` is evaluated once and provides the cardinality and the top
+    values; numeric statistics are computed on the non-null values only.
+
+    Returns:
+        dict: JSON-serializable column profile
+    """
+    row_count = len(series)
+    missing = int(series.isna().sum())
+    counts = series.value_counts(dropna=True)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        counts = counts[counts > 0]
+    unique_count = int(len(counts))
+
+    profile = {
+        'name': _scalar(series.name),
+        'dtype': str(series.dtype),
+        'kind': _storage_kind(series),
+        'type': infer_column_type(series, unique_count),
+        'count': row_count - missing,
+        'missing': missing,
+        'missing_percent': round(missing / row_count * 100, 2) if row_count else 0.0,
+        'unique_count': unique_count,
+        'top_values': [[_scalar(label), int(count)] for label, count in counts.head(top_k).items()],
+    }
+
+    if profile['kind'] == 'numeric':
+        values = series.to_numpy(dtype='float64', na_value=np.nan)
+        values = values[~np.isnan(values)]
+        if len(values):
+            q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+            iqr = q3 - q1
+            lower = q1 - OUTLIER_IQR_FACTOR * iqr
+            upper = q3 + OUTLIER_IQR_FACTOR * iqr
+            profile.update({
+                'min': _scalar(values.min()),
+                'max': _scalar(values.max()),
+                'mean': _scalar(values.mean()),
+                'std': _scalar(values.std(ddof=1)) if len(values) > 1 else None,
+                'sum': _scalar(values.sum()),
+                'q1': _scalar(q1),
+                'median': _scalar(median),
+                'q3': _scalar(q3),
+                'outlier_bounds': [_scalar(lower), _scalar(upper)],
+                'outliers_count': int(np.count_nonzero((values < lower) | (values > upper))),
+            })
+        else:
+            profile.update({
+                'min': None, 'max': None, 'mean': None, 'std': None, 'sum': None,
+                'q1': None, 'median': None, 'q3': None,
+                'outlier_bounds': None, 'outliers_count': 0,
+            })
+
+    elif profile['kind'] == 'datetime':
+        minimum, maximum = series.min(), series.max()
+        profile.update({
+            'min': _scalar(minimum),
+            'max': _scalar(maximum),
+            'range_days': (maximum - minimum).days if not pd.isna(minimum) and not pd.isna(maximum) else None,
+        })
+
+    return profile
+
+
+def profile_dataframe(df, top_k=TOP_K):
+    """
+    Profile every column of a DataFrame.
+
+    Returns:
+        dict: ``{'version', 'row_count', 'columns': {name: column profile}}``
+    """
+    return build_profile(len(df), ((column, df[column]) for column in df.columns), top_k)
+
+
+def build_profile(row_count, columns, top_k=TOP_K):
+    """
+    Build a dataset profile from ``(name, series)`` pairs.
+
+    Accepting an iterable lets callers load one column at a time.
+    """
+    return {
+        'version': PROFILE_VERSION,
+        'row_count': int(row_count),
+        'columns': {str(name): profile_column(series, top_k) for name, series in columns},
+    }
+
+
+def write_profile(directory, profile):
+    """Write a profile into a dataset directory."""
+    with open(os.path.join(directory, PROFILE_NAME), 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False)
+
+
+def read_profile(directory):
+    """
+    Read the profile stored in a dataset directory.
+
+    Returns:
+        dict or None if there is no profile or it was written by another version
+    """
+    path = os.path.join(directory, PROFILE_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read profile {path}: {str(e)}")
+        return None
+    if profile.get('version') != PROFILE_VERSION:
+        return None
+    return profile
+
+
+def numeric_column_names(profile):
+    """Names of the numeric (non-boolean) columns in a profile."""
+    return [name for name, column in profile['columns'].items() if column['kind'] == 'numeric']
+
+
+def categorical_column_names(profile):
+    """Names of the text/categorical columns in a profile."""
+    return [name for name, column in profile['columns'].items() if column['kind'] == 'categorical']
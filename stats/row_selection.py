@@ -0,0 +1,126 @@
+"""
+Filtered views stored as row-selection bitmaps.
+
+A filtered view of a dataset is kept as one bit per row of the base dataset,
+packed with ``np.packbits`` and zlib-compressed, instead of a serialized copy
+of the filtered frame. The selection of a 1M-row dataset takes 125 KB before
+compression; selections that are sparse, dense or made of runs of rows
+compress to a few KB. It is applied lazily: only the columns a request needs
+are loaded, then indexed with the decoded mask.
+"""
+import base64
+import hashlib
+import logging
+import zlib
+
+import numpy as np
+
+from .dataset_store import get_session_dataset, load_dataframe
+
+logger = logging.getLogger(__name__)
+
+SESSION_KEY = 'row_selection'
+
+
+def encode_selection(mask):
+    """
+    Encode a boolean row mask compactly.
+
+    Returns:
+        dict: JSON-serializable ``{'rows', 'selected', 'bitmap'}``
+    """
+    mask = np.asarray(mask, dtype=bool)
+    packed = np.packbits(mask)
+    return {
+        'rows': int(len(mask)),
+        'selected': int(np.count_nonzero(mask)),
+        'bitmap': base64.b64encode(zlib.compress(packed.tobytes(), 6)).decode('ascii'),
+    }
+
+
+def decode_selection(data):
+    """Decode the output of ``encode_selection`` back into a boolean mask."""
+    packed = np.frombuffer(zlib.decompress(base64.b64decode(data['bitmap'])), dtype=np.uint8)
+    return np.unpackbits(packed, count=data['rows']).astype(bool)
+
+
+def store_session_selection(request, dataset, mask, filters=None):
+    """
+    Attach a filtered view of ``dataset`` to the session.
+
+    Args:
+        request: Current request
+        dataset: ``Dataset`` the mask selects rows of
+        mask: Boolean mask with one entry per row of the dataset
+        filters: Optional JSON-serializable description of the filters
+    """
+    request.session[SESSION_KEY] = {
+        'fingerprint': dataset.fingerprint,
+        'filters': filters or [],
+        **encode_selection(mask),
+    }
+    request.session.modified = True
+
+
+def clear_session_selection(request):
+    """Drop the filtered view from the session."""
+    request.session.pop(SESSION_KEY, None)
+
+
+def get_session_selection(request, dataset=None):
+    """
+    Return the session's row mask over its dataset.
+
+    Returns:
+        np.ndarray or None when no filter is active, or the stored selection
+        belongs to another dataset
+    """
+    data = request.session.get(SESSION_KEY)
+    if not data:
+        return None
+    dataset = dataset or get_session_dataset(request)
+    if dataset is None or data.get('fingerprint') != dataset.fingerprint or data.get('rows') != dataset.row_count:
+        return None
+    try:
+        return decode_selection(data)
+    except (KeyError, ValueError, zlib.error) as e:
+        logger.warning(f"Discarding unreadable row selection: {str(e)}")
+        return None
+
+
+def session_selection_key(request, dataset=None):
+    """
+    Short digest identifying the session's filtered view.
+
+    Lets caches key results by the current filters without decoding the
+    bitmap.
+
+    Returns:
+        str or None when no valid selection is stored for ``dataset``
+    """
+    data = request.session.get(SESSION_KEY)
+    if not data or 'bitmap' not in data:
+        return None
+    dataset = dataset or get_session_dataset(request)
+    if dataset is None or data.get('fingerprint') != dataset.fingerprint or data.get('rows') != dataset.row_count:
+        return None
+    return hashlib.sha1(data['bitmap'].encode('ascii')).hexdigest()
+
+
+def load_session_selection(request, columns=None):
+    """
+    Load the session's dataset with its filtered view applied.
+
+    Args:
+        request: Current request
+        columns: Optional list of columns to load; None loads every column
+
+    Returns:
+        pd.DataFrame or None if no dataset is attached to the session
+    """
+    dataset = get_session_dataset(request)
+    if dataset is None:
+        return None
+    df = load_dataframe(dataset, columns)
+    mask = get_session_selection(request, dataset)
+    return df if mask is None else df[mask]
@@ -0,0 +1,188 @@
+"""
+Deterministic row sampling for charts of large datasets.
+
+Samples are drawn from a seeded generator, so the same dataset view always
+yields the same rows, and the chosen row positions are cached by the caller's
+key (usually the dataset fingerprint and row selection). Comparisons on the
+same view therefore reuse one sample instead of drawing a new one per chart.
+
+Stratified samples keep at least ``min_per_stratum`` rows of every category
+of a column (all of its rows when it has fewer), and share the rest of the
+budget in proportion to the category sizes. Datasets too large to load are
+sampled by the SQL store instead (see ``SQLStore.sample``).
+
+Settings:
+    STATS_SAMPLE_MAX_ROWS: Default sample size
+    STATS_SAMPLE_MIN_PER_STRATUM: Rows guaranteed to each category
+    STATS_SAMPLE_SEED: Seed of the sampling generator
+"""
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_MAX_ROWS = 100000
+DEFAULT_SAMPLE_MIN_PER_STRATUM = 50
+DEFAULT_SAMPLE_SEED = 42
+SAMPLE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+def get_max_samples():
+    return int(getattr(settings, 'STATS_SAMPLE_MAX_ROWS', DEFAULT_SAMPLE_MAX_ROWS))
+
+
+def _min_per_stratum():
+    return int(getattr(settings, 'STATS_SAMPLE_MIN_PER_STRATUM', DEFAULT_SAMPLE_MIN_PER_STRATUM))
+
+
+def _seed():
+    return int(getattr(settings, 'STATS_SAMPLE_SEED', DEFAULT_SAMPLE_SEED))
+
+
+def random_positions(rows, size, seed=None):
+    """
+    Positions of a uniform sample of ``size`` out of ``rows`` rows.
+
+    Returns:
+        np.ndarray: Sorted positions, so sampled rows keep their order
+    """
+    if size >= rows:
+        return np.arange(rows)
+    rng = np.random.default_rng(_seed() if seed is None else seed)
+    return np.sort(rng.choice(rows, size=size, replace=False))
+
+
+def stratum_allocation(counts, size, min_per_stratum):
+    """
+    Split a sample budget between strata.
+
+    Every stratum first gets ``min_per_stratum`` rows (or all its rows). The
+    rest of the budget is shared in proportion to the stratum sizes, by
+    largest remainder. When the minimums alone exceed the budget they are
+    lowered to an equal share, but never below one row.
+
+    Args:
+        counts: Rows in each stratum
+        size: Total sample size
+        min_per_stratum: Rows guaranteed to each stratum
+
+    Returns:
+        np.ndarray: Rows to draw from each stratum
+    """
+    counts = np.asarray(counts, dtype='int64')
+    if size >= counts.sum():
+        return counts.copy()
+    minimum = min(min_per_stratum, max(1, size // max(len(counts), 1)))
+    allocation = np.minimum(counts, minimum)
+    remaining = size - allocation.sum()
+    spare = counts - allocation
+    if remaining > 0 and spare.sum() > 0:
+        share = spare * (remaining / spare.sum())
+        extra = np.minimum(np.floor(share).astype('int64'), spare)
+        leftover = remaining - extra.sum()
+        if leftover > 0:
+            # Largest fractional parts first, among strata with rows left
+            order = np.argsort(-(share - extra), kind='stable')
+            order = order[(spare - extra)[order] > 0][:leftover]
+            extra[order] += 1
+        allocation += extra
+    return allocation
+
+
+def stratified_positions(strata, size, min_per_stratum=None, seed=None):
+    """
+    Positions of a stratified sample.
+
+    Args:
+        strata: Column whose categories are the strata; missing values form
+            their own stratum
+        size: Total sample size
+        min_per_stratum: Rows guaranteed to each category; defaults to
+            ``STATS_SAMPLE_MIN_PER_STRATUM``
+        seed: Generator seed; defaults to ``STATS_SAMPLE_SEED``
+
+    Returns:
+        np.ndarray: Sorted positions
+    """
+    rows = len(strata)
+    if size >= rows:
+        return np.arange(rows)
+    if min_per_stratum is None:
+        min_per_stratum = _min_per_stratum()
+    codes, _ = pd.factorize(strata, use_na_sentinel=False)
+    counts = np.bincount(codes)
+    allocation = stratum_allocation(counts, size, min_per_stratum)
+
+    # Shuffle rows within each stratum, then keep the first rows of each
+    rng = np.random.default_rng(_seed() if seed is None else seed)
+    order = np.lexsort((rng.random(rows), codes))
+    sorted_codes = codes[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.arange(rows) - starts[sorted_codes]
+    return np.sort(order[rank < allocation[sorted_codes]])
+
+
+_sample_cache = None
+_sample_cache_lock = threading.Lock()
+
+
+def get_sample_cache():
+    """Process-wide cache of sampled row positions."""
+    global _sample_cache
+    if _sample_cache is None:
+        with _sample_cache_lock:
+            if _sample_cache is None:
+                _sample_cache = LRUCache(
+                    max_bytes=SAMPLE_CACHE_MAX_BYTES,
+                    sizeof=lambda positions: positions.nbytes,
+                    name='sample cache'
+                )
+    return _sample_cache
+
+
+def sample_rows(df, size=None, stratify_by=None, min_per_stratum=None, seed=None, key=None):
+    """
+    Deterministic sample of the rows of a frame.
+
+    Args:
+        df: Frame to sample
+        size: Sample size; defaults to ``STATS_SAMPLE_MAX_ROWS``
+        stratify_by: Optional categorical column to stratify by
+        min_per_stratum: Rows guaranteed to each category of ``stratify_by``
+        seed: Generator seed
+        key: Hashable identifying the contents of ``df`` (e.g. dataset
+            fingerprint and row selection); the positions are cached under it
+
+    Returns:
+        pd.DataFrame: ``df`` itself when it is no larger than ``size``,
+        otherwise the sampled rows in their original order
+    """
+    size = get_max_samples() if size is None else size
+    if len(df) <= size:
+        return df
+    if stratify_by is not None and stratify_by not in df.columns:
+        raise ValueError(f"Column '{stratify_by}' not found in DataFrame")
+
+    cache_key = None
+    if key is not None:
+        cache_key = (key, len(df), size, stratify_by, min_per_stratum, seed)
+        positions = get_sample_cache().get(cache_key)
+        if positions is not None:
+            return df.iloc[positions]
+
+    if stratify_by is None:
+        positions = random_positions(len(df), size, seed)
+    else:
+        positions = stratified_positions(df[stratify_by], size, min_per_stratum, seed)
+    positions.flags.writeable = False
+    if cache_key is not None:
+        get_sample_cache().set(cache_key, positions)
+    logger.debug(f"Sampled {len(positions)} of {len(df)} rows (stratified by {stratify_by})")
+    return df.iloc[positions]
+
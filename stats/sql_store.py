@@ -0,0 +1,698 @@
+"""
+Embedded SQL backend for datasets too large to filter in memory.
+
+The in-memory ``DataTracker`` loads the columns it needs and filters them
+with NumPy masks, which holds every row of those columns in the worker. For
+large datasets the filter views, the column plots, comparisons and grouped
+bar charts run on a SQLite copy of the dataset instead (``data.v1.sqlite``
+next to the columnar files). The copy is built once from the memory-mapped
+columns, one block of rows at a time, so the whole frame is never assembled. Filter chains become a WHERE clause, and value counts,
+histograms and group-bys become GROUP BY queries; only the aggregated rows
+come back into Python.
+
+Columns are stored the way the columnar store holds them: numbers as INTEGER
+or REAL, booleans as 0/1, datetimes as INTEGER nanoseconds (UTC), and text
+and categorical columns as their integer codes, which are matched and decoded
+against the stored labels in Python. Missing values are NULL. Every column
+gets an index, up to ``STATS_SQL_INDEXED_COLUMNS``.
+
+Settings:
+    STATS_ANALYSIS_BACKEND: 'auto', 'memory' or 'sqlite'
+    STATS_SQL_MIN_ROWS: Rows from which 'auto' uses the SQL backend
+    STATS_SQL_INDEXED_COLUMNS: Columns that get an index, in dataset order
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .caching import LRUCache
+from .dataset_store import open_dataset
+from .data_filter import ValueFilter
+from .filter_engine import CONDITIONS, AnyOf, coerce_values, label_matches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ANALYSIS_BACKEND = 'auto'
+DEFAULT_SQL_MIN_ROWS = 1000000
+DEFAULT_SQL_INDEXED_COLUMNS = 64
+DEFAULT_BINS = 50
+
+SQL_FILE_NAME = 'data.v1.sqlite'
+TABLE = 'data'
+# Rows converted and inserted at a time while building the SQL copy
+BUILD_BLOCK_ROWS = 50000
+# Samples keep the rows whose hashed rowid falls below a threshold of this modulus
+SAMPLE_HASH_MODULUS = 1000003
+SAMPLE_HASH_MULTIPLIER = 2654435761
+
+# A filter keeping less than this share of the rows is searched through its
+# index before grouping, instead of scanning the rows in the order of the key
+SELECTIVE_FILTER_FRACTION = 0.1
+
+SQL_AGGREGATES = {'count': 'COUNT', 'sum': 'SUM', 'mean': 'AVG', 'min': 'MIN', 'max': 'MAX'}
+
+NAT = np.iinfo('int64').min
+
+# SQL stores kept open per process; evicted stores close their connections
+OPEN_SQL_STORES = 16
+
+# One build lock per dataset directory, so building one dataset's copy does
+# not hold up the others
+_build_locks = {}
+_build_locks_lock = threading.Lock()
+
+
+def _sql_type(kind, dtype):
+    if kind == 'numeric' and (dtype.kind == 'f' or (dtype.kind == 'u' and dtype.itemsize == 8)):
+        return 'REAL'
+    return 'INTEGER'
+
+
+def _block_to_sql(kind, values):
+    """Python values of a block of a stored column; missing values become None."""
+    values = np.asarray(values)
+    if kind in ('category', 'object'):
+        missing = values < 0
+    elif kind == 'datetime':
+        values = values.view('int64')
+        missing = values == NAT
+    elif kind == 'bool':
+        return values.astype('int64').tolist()
+    elif values.dtype.kind == 'f':
+        missing = np.isnan(values)
+    elif values.dtype.kind == 'u' and values.dtype.itemsize == 8:
+        return values.astype('float64').tolist()
+    else:
+        return values.tolist()
+    if not missing.any():
+        return values.tolist()
+    converted = values.astype(object)
+    converted[missing] = None
+    return converted.tolist()
+
+
+def histogram_bucket_sql(expr, low, high, bins=DEFAULT_BINS, integer=False):
+    """
+    Bin edges of a numeric column and the SQL expression of each value's bin.
+
+    The bins are those of ``aggregation.histogram_bins`` for values ranging
+    from ``low`` to ``high``: one per integer for integer columns spanning
+    fewer than ``bins`` values, ``bins`` equal-width bins otherwise.
+
+    Args:
+        expr: SQL expression of the column
+        low, high: Smallest and largest value of the column
+        bins: Number of bins
+        integer: The column holds integers
+
+    Returns:
+        tuple: (edges, SQL expression giving the 0-based bin; NULL for missing values)
+    """
+    if integer and high - low < bins:
+        return np.arange(low - 0.5, high + 1.5), f"({expr} - {int(low)})"
+    edges = np.histogram_bin_edges(np.array([low, high], dtype='float64'), bins=bins)
+    first = float(edges[0])
+    # np.linspace computes the inner edges as k * step + first
+    step = (float(edges[-1]) - first) / bins
+    scale = bins / (float(edges[-1]) - first)
+    # The maximum belongs to the last bin, which is closed on the right
+    guess = f"MIN(CAST(({expr} - {first!r}) * {scale!r} AS INTEGER), {bins - 1})"
+    # Like np.histogram, move values that rounding put on the wrong side of an edge
+    below = f"{expr} < {guess} * {step!r} + {first!r}"
+    above = f"({guess} < {bins - 1} AND {expr} >= ({guess} + 1) * {step!r} + {first!r})"
+    return edges, f"({guess} - ({below}) + {above})"
+
+
+def bucket_counts(rows, bins):
+    """Counts per bin from ``(bin, count)`` rows grouped by a ``histogram_bucket_sql`` expression."""
+    counts = np.zeros(bins, dtype='int64')
+    for position, count in rows:
+        if position is not None:
+            counts[int(position)] = count
+    return counts
+
+
+def build_sql_store(stored, path):
+    """
+    Write the SQLite copy of a columnar dataset.
+
+    The file is written under a temporary name and moved into place when
+    complete, so readers never see a partial copy.
+
+    Args:
+        stored: ``ColumnarDataset`` to copy
+        path: Target file
+    """
+    started = time.monotonic()
+    columns = stored.columns
+    arrays = [(stored.column_kind(name), stored.stored_values(name)) for name in columns]
+    staging = f"{path}.{uuid.uuid4().hex}.tmp"
+    connection = sqlite3.connect(staging)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        definitions = ', '.join(f"c{position} {_sql_type(kind, values.dtype)}"
+                                for position, (kind, values) in enumerate(arrays))
+        connection.execute(f"CREATE TABLE {TABLE} ({definitions})")
+        insert = f"INSERT INTO {TABLE} VALUES ({', '.join('?' * len(arrays))})"
+        for start in range(0, stored.row_count, BUILD_BLOCK_ROWS):
+            stop = min(start + BUILD_BLOCK_ROWS, stored.row_count)
+            blocks = [_block_to_sql(kind, values[start:stop]) for kind, values in arrays]
+            connection.executemany(insert, zip(*blocks))
+
+        indexed = int(getattr(settings, 'STATS_SQL_INDEXED_COLUMNS', DEFAULT_SQL_INDEXED_COLUMNS))
+        for position in range(min(indexed, len(arrays))):
+            connection.execute(f"CREATE INDEX ix_c{position} ON {TABLE} (c{position})")
+        connection.commit()
+        # Statistics for the query planner
+        connection.execute('ANALYZE')
+        connection.commit()
+        connection.close()
+        os.replace(staging, path)
+    except BaseException:
+        connection.close()
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+    logger.info(f"Built SQL copy of {stored.path} ({stored.row_count} rows, {len(columns)} columns) "
+                f"in {time.monotonic() - started:.1f}s")
+
+
+class SQLStore:
+    """
+    Aggregating queries over the SQLite copy of a stored dataset.
+
+    Filters are ``ConditionTerm`` and ``ValueFilter`` objects, or ``AnyOf``
+    combinations of them (see ``filter_engine``), combined with AND like the
+    filter chain of ``DataTracker``. They match exactly the rows their
+    ``mask`` would select.
+
+    Args:
+        stored: The ``ColumnarDataset`` that was copied
+        path: The SQLite file
+    """
+
+    def __init__(self, stored, path):
+        self.stored = stored
+        self.path = path
+        self.columns = stored.columns
+        self._positions = {name: position for position, name in enumerate(self.columns)}
+        self._labels = {}
+        # Idle read-only connections; a query borrows one and puts it back
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def row_count(self):
+        return self.stored.row_count
+
+    def column_kind(self, column):
+        """Storage kind of a column (see ``ColumnarDataset.column_kind``)."""
+        return self.stored.column_kind(column)
+
+    def column_meta(self, column):
+        """Manifest entry of a column (see ``ColumnarDataset.column_meta``)."""
+        return self.stored.column_meta(column)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        # Connections move between the threads that borrow them, one at a time
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+
+    def _release(self, connection):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        """Close the idle connections; connections in use are closed when their query ends."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _expr(self, column):
+        if column not in self._positions:
+            raise ValueError(f"Column '{column}' not found in DataFrame")
+        return f"c{self._positions[column]}"
+
+    def _iter_query(self, sql, params=(), batch_rows=BUILD_BLOCK_ROWS):
+        """Rows of a query, fetched ``batch_rows`` at a time."""
+        connection = self._acquire()
+        try:
+            cursor = connection.execute(sql, list(params))
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            self._release(connection)
+
+    def _query(self, sql, params=()):
+        started = time.monotonic()
+        connection = self._acquire()
+        try:
+            rows = connection.execute(sql, list(params)).fetchall()
+        finally:
+            self._release(connection)
+        logger.debug(f"SQL query took {time.monotonic() - started:.3f}s: {sql}")
+        return rows
+
+    def labels(self, column):
+        """Distinct values of a dictionary-encoded column, as an Index."""
+        labels = self._labels.get(column)
+        if labels is None:
+            raw_labels = self.stored.column_labels(column)
+            # Same Index types as ``ColumnarDataset.read_column`` builds
+            if self.column_kind(column) == 'category':
+                labels = pd.Index(raw_labels)
+            else:
+                labels = pd.Index(raw_labels, dtype=object)
+            self._labels[column] = labels
+        return labels
+
+    def _template(self, column):
+        """Empty Series with the dtype of the column, for ``coerce_values``."""
+        meta = self.stored.column_meta(column)
+        kind = meta['kind']
+        if kind == 'bool':
+            dtype = 'bool'
+        elif kind == 'numeric':
+            dtype = 'float64'
+        elif kind == 'datetime':
+            dtype = f"datetime64[ns, {meta['tz']}]" if meta.get('tz') else 'datetime64[ns]'
+        else:
+            dtype = object
+        return pd.Series([], dtype=dtype, name=column)
+
+    @staticmethod
+    def _sql_value(kind, value):
+        if pd.isna(value):
+            return None
+        if kind == 'datetime':
+            value = pd.Timestamp(value)
+            if value.tzinfo is not None:
+                value = value.tz_convert('UTC').tz_localize(None)
+            return int(value.value)
+        if kind == 'bool':
+            return int(value)
+        return value
+
+    @staticmethod
+    def _match_sql(expr, keys, match_missing, negate=False):
+        """
+        SQL matching the rows holding one of ``keys`` (stored values).
+
+        Args:
+            match_missing: Missing values match too
+            negate: Match the other rows instead, like ``~mask``
+        """
+        params = [json.dumps(keys)]
+        if not negate:
+            match = f"{expr} IN (SELECT value FROM json_each(?))"
+            return (f"({match} OR {expr} IS NULL)" if match_missing else match), params
+        mismatch = f"{expr} NOT IN (SELECT value FROM json_each(?))"
+        if match_missing:
+            return f"({expr} IS NOT NULL AND {mismatch})", params
+        return f"({expr} IS NULL OR {mismatch})", params
+
+    def value_filter_sql(self, column, values, include=True):
+        """
+        Translate a ``ValueFilter`` (rows whose string form is one of ``values``) into SQL.
+
+        Dictionary-encoded columns match their labels as strings. Other
+        columns look the strings up in the column's value index, which holds
+        the string forms ``string_match_mask`` compares, and match the
+        values they stand for.
+
+        Returns:
+            tuple: (SQL expression, list of parameters)
+        """
+        expr = self._expr(column)
+        kind = self.column_kind(column)
+        if kind in ('category', 'object'):
+            matched, match_missing = label_matches(self.labels(column), values)
+            keys = np.flatnonzero(matched).tolist()
+        else:
+            str_values = {str(v) for v in values}
+            index = self.stored.value_index(column)
+            present = [value for value in str_values if value != 'nan' and value in index]
+            keys = [self._sql_value(kind, value) for value in coerce_values(self._template(column), present)]
+            match_missing = 'nan' in str_values
+        return self._match_sql(expr, keys, match_missing, negate=not include)
+
+    def term_sql(self, term):
+        """
+        Translate one filter term into SQL.
+
+        Args:
+            term: ``ConditionTerm``, ``ValueFilter`` or ``AnyOf`` of those
+
+        Returns:
+            tuple: (SQL expression, list of parameters)
+        """
+        if isinstance(term, AnyOf):
+            if not term.terms:
+                return '0', []
+            expressions, params = [], []
+            for part in term.terms:
+                expression, part_params = self.term_sql(part)
+                expressions.append(expression)
+                params.extend(part_params)
+            return '(' + ' OR '.join(expressions) + ')', params
+        if isinstance(term, ValueFilter):
+            return self.value_filter_sql(term.column_name, term.values, term.include)
+        return self.condition_sql(term.column, term.condition, term.values)
+
+    def condition_sql(self, column, condition, values):
+        """
+        Translate one filter condition into SQL.
+
+        Args:
+            column: Column tested
+            condition: One of ``CONDITIONS``
+            values: Condition values, as given to ``condition_mask``
+
+        Returns:
+            tuple: (SQL expression, list of parameters)
+        """
+        if condition not in CONDITIONS:
+            raise ValueError(f"Invalid condition: {condition}")
+        if not values:
+            raise ValueError(f"No values given for condition '{condition}'")
+
+        expr = self._expr(column)
+        meta = self.stored.column_meta(column)
+        kind = meta['kind']
+        if condition in ('=', '!='):
+            if kind in ('category', 'object'):
+                # Match the labels as strings, then the rows by their codes
+                matched, match_missing = label_matches(self.labels(column), values)
+                keys = np.flatnonzero(matched).tolist()
+            else:
+                keys, match_missing = [], False
+                for value in coerce_values(self._template(column), values):
+                    if pd.isna(value):
+                        match_missing = True
+                    else:
+                        keys.append(self._sql_value(kind, value))
+            return self._match_sql(expr, keys, match_missing, negate=condition == '!=')
+
+        if kind not in ('numeric', 'datetime'):
+            raise ValueError(f"Condition '{condition}' needs a numeric or date column, '{column}' is {meta['dtype']}")
+
+        template = self._template(column)
+        if condition == 'between':
+            if len(values) != 2:
+                raise ValueError("The 'between' condition takes exactly two values")
+            low, high = (self._sql_value(kind, value) for value in coerce_values(template, values))
+            return f"{expr} BETWEEN ? AND ?", [low, high]
+
+        value = self._sql_value(kind, coerce_values(template, values[:1])[0])
+        return f"{expr} {condition} ?", [value]
+
+    def where(self, terms=(), clauses=()):
+        """
+        WHERE clause of a filter chain.
+
+        Args:
+            terms: Filter terms, combined with AND
+            clauses: Extra (SQL expression, parameters) pairs to combine with them
+
+        Returns:
+            tuple: (clause starting with 'WHERE', or '' when there is nothing
+            to filter, list of parameters)
+        """
+        expressions, params = [], []
+        for term in terms:
+            expression, term_params = self.term_sql(term)
+            expressions.append(expression)
+            params.extend(term_params)
+        for expression, clause_params in clauses:
+            expressions.append(expression)
+            params.extend(clause_params)
+        if not expressions:
+            return '', params
+        return 'WHERE ' + ' AND '.join(expressions), params
+
+    def count(self, terms=(), column=None):
+        """Rows matching ``terms``; with ``column``, only those where it has a value."""
+        where, params = self.where(terms)
+        target = self._expr(column) if column is not None else '*'
+        return self._query(f"SELECT COUNT({target}) FROM {TABLE} {where}", params)[0][0]
+
+    def decode(self, column, values):
+        """
+        Series of a column from values read back from SQL.
+
+        Rebuilds the dtype ``ColumnarDataset.read_column`` gives the column.
+        """
+        meta = self.stored.column_meta(column)
+        kind = meta['kind']
+        values = list(values)
+        if kind in ('category', 'object'):
+            codes = np.array([-1 if value is None else value for value in values], dtype='int64')
+            labels = self.labels(column)
+            if kind == 'category':
+                data = pd.Categorical.from_codes(codes, categories=labels, ordered=meta.get('ordered', False))
+                return pd.Series(data, name=column)
+            data = labels.to_numpy().take(np.where(codes < 0, 0, codes)) if len(labels) else np.empty(len(codes), dtype=object)
+            data[codes < 0] = np.nan
+            return pd.Series(data, name=column, dtype=object)
+        if kind == 'datetime':
+            data = np.array([NAT if value is None else value for value in values], dtype='int64')
+            series = pd.Series(data.view('datetime64[ns]'), name=column)
+            if meta.get('tz'):
+                series = series.dt.tz_localize('UTC').dt.tz_convert(meta['tz'])
+            return series
+        if kind == 'bool':
+            return pd.Series(np.array(values, dtype=bool), name=column)
+        dtype = self.stored.stored_values(column).dtype
+        if None in values:
+            return pd.Series(np.array(values, dtype='float64'), name=column)
+        return pd.Series(np.array(values, dtype=dtype), name=column)
+
+    def group_by(self, by, terms=(), column=None, agg='count', limit=None, sort='result'):
+        """
+        Aggregate per distinct value of a column, over the rows matching ``terms``.
+
+        Args:
+            by: Column to group by; rows where it is missing are left out
+            terms: Filter terms
+            column: Column aggregated; not needed for 'count'
+            agg: 'count', 'sum', 'mean', 'min' or 'max'
+            limit: Keep only this many groups
+            sort: 'result' (largest result first) or 'key' (in key order)
+
+        Returns:
+            pd.Series: Result per group, indexed by the values of ``by``
+        """
+        if agg not in SQL_AGGREGATES:
+            raise ValueError(f"Invalid aggregation: {agg}")
+        terms = list(terms)
+        key = self._expr(by)
+        if agg == 'count':
+            target = '*'
+        elif column is None:
+            raise ValueError(f"The '{agg}' aggregation needs a column")
+        else:
+            if self.column_kind(column) != 'numeric':
+                raise ValueError(f"The '{agg}' aggregation needs a numeric column, '{column}' is not")
+            target = self._expr(column)
+
+        if terms and self.count(terms) < self.row_count * SELECTIVE_FILTER_FRACTION:
+            # The unary plus keeps SQLite from walking the index of the key
+            key = f"+{key}"
+        where, params = self.where(terms)
+        order = 'result DESC, key' if sort == 'result' else 'key'
+        sql = (f"SELECT {key} AS key, {SQL_AGGREGATES[agg]}({target}) AS result FROM {TABLE} {where} "
+               f"GROUP BY key ORDER BY {order}")
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit) + 1)
+        # The group of missing keys is dropped here: excluding NULL in SQL lets
+        # SQLite pick the index of the key over a more selective filter index
+        rows = [row for row in self._query(sql, params) if row[0] is not None][:limit]
+        keys = [row[0] for row in rows]
+        results = [row[1] for row in rows]
+        index = pd.Index(self.decode(by, keys), name=by)
+        name = 'count' if agg == 'count' else f"{column}_{agg}"
+        return pd.Series(results, index=index, name=name, dtype='int64' if agg == 'count' else 'float64')
+
+    def grouped(self, by, terms=(), column=None, agg='count'):
+        """
+        Aggregate per combination of the values of several columns.
+
+        Gives ``df.groupby(by, observed=True)[column].agg(agg).reset_index()``,
+        or ``.size().reset_index(name='count')`` without a column: combinations
+        with a missing key are left out and rows come in key order.
+
+        Args:
+            by: Columns to group by
+            terms: Filter terms
+            column: Column aggregated; without it the rows are counted
+            agg: 'count', 'sum', 'mean', 'min' or 'max'
+
+        Returns:
+            pd.DataFrame: One column per key, then the result (named ``column``,
+            or 'count' when rows are counted)
+        """
+        if agg not in SQL_AGGREGATES:
+            raise ValueError(f"Invalid aggregation: {agg}")
+        by = list(by)
+        keys = [self._expr(key) for key in by]
+        if column is None:
+            if agg != 'count':
+                raise ValueError(f"The '{agg}' aggregation needs a column")
+            target, name = '*', 'count'
+        else:
+            if agg != 'count' and self.column_kind(column) != 'numeric':
+                raise ValueError(f"The '{agg}' aggregation needs a numeric column, '{column}' is not")
+            target, name = self._expr(column), column
+
+        not_missing = [(f"{key} IS NOT NULL", []) for key in keys]
+        where, params = self.where(terms, not_missing)
+        key_list = ', '.join(keys)
+        rows = self._query(f"SELECT {key_list}, {SQL_AGGREGATES[agg]}({target}) FROM {TABLE} {where} "
+                           f"GROUP BY {key_list}", params)
+        values = list(zip(*rows)) if rows else [[] for _ in range(len(by) + 1)]
+        result = pd.DataFrame({key: self.decode(key, key_values) for key, key_values in zip(by, values)}, columns=by)
+        result[name] = pd.Series(values[-1], dtype='int64' if agg == 'count' else 'float64')
+        # Decoded keys sort like pandas does (categories in category order)
+        return result.sort_values(by, kind='stable', ignore_index=True)
+
+    def row_mask(self, terms=()):
+        """
+        Boolean mask over the dataset of the rows matching ``terms``.
+
+        Only the rowids of the matching rows come back, in batches.
+        """
+        mask = np.zeros(self.row_count, dtype=bool)
+        where, params = self.where(terms)
+        # Rowids run from 1 in the order the rows were inserted
+        for rows in self._iter_query(f"SELECT rowid FROM {TABLE} {where}", params):
+            mask[np.fromiter((row[0] for row in rows), dtype='int64', count=len(rows)) - 1] = True
+        return mask
+
+    def value_counts(self, column, terms=(), limit=None):
+        """Rows per distinct value of a column, most frequent first (like ``value_counts``)."""
+        return self.group_by(column, terms, limit=limit)
+
+    def date_counts(self, column, terms=()):
+        """Rows per distinct value of a datetime column, in date order."""
+        return self.group_by(column, terms, sort='key')
+
+    def _is_integer(self, column):
+        return self.stored.stored_values(column).dtype.kind in 'iu'
+
+    def histogram(self, column, terms=(), bins=DEFAULT_BINS):
+        """
+        Bin a numeric column over the rows matching ``terms``.
+
+        Gives the bins of ``aggregation.histogram_bins``: only the minimum, the
+        maximum and one count per bin are read back.
+
+        Returns:
+            dict: ``edges`` (bins + 1 values) and ``counts`` (bins values)
+        """
+        expr = self._expr(column)
+        where, params = self.where(terms)
+        low, high = self._query(f"SELECT MIN({expr}), MAX({expr}) FROM {TABLE} {where}", params)[0]
+        if low is None:
+            return {'edges': np.array([]), 'counts': np.array([], dtype='int64')}
+
+        edges, bin_sql = histogram_bucket_sql(expr, low, high, bins, integer=self._is_integer(column))
+        rows = self._query(f"SELECT {bin_sql} AS bin, COUNT(*) FROM {TABLE} {where} GROUP BY bin", params)
+        return {'edges': edges, 'counts': bucket_counts(rows, len(edges) - 1)}
+
+    def sample(self, columns, size, terms=()):
+        """
+        Up to ``size`` rows of ``columns`` matching ``terms``, as a DataFrame.
+
+        When more rows match, rows are kept by a hash of their rowid: the same
+        filters give the same sample, drawn in a single scan.
+        """
+        clauses = []
+        matching = self.count(terms)
+        if matching > size:
+            threshold = int(SAMPLE_HASH_MODULUS * size / matching)
+            clauses.append((f"(rowid * {SAMPLE_HASH_MULTIPLIER}) % {SAMPLE_HASH_MODULUS} < ?", [threshold]))
+        where, params = self.where(terms, clauses)
+        select = ', '.join(self._expr(column) for column in columns)
+        rows = self._query(f"SELECT {select} FROM {TABLE} {where} LIMIT ?", params + [int(size)])
+        values = list(zip(*rows)) if rows else [[] for _ in columns]
+        return pd.DataFrame({column: self.decode(column, column_values)
+                             for column, column_values in zip(columns, values)}, columns=list(columns))
+
+
+_open_stores = LRUCache(max_bytes=OPEN_SQL_STORES, name='SQL stores', on_evict=lambda path, store: store.close())
+_open_stores_lock = threading.Lock()
+
+
+def _build_lock(directory):
+    with _build_locks_lock:
+        return _build_locks.setdefault(directory, threading.Lock())
+
+
+def _ensure_sql_file(stored):
+    path = os.path.join(stored.path, SQL_FILE_NAME)
+    if not os.path.exists(path):
+        with _build_lock(stored.path):
+            if not os.path.exists(path):
+                build_sql_store(stored, path)
+        with _build_locks_lock:
+            _build_locks.pop(stored.path, None)
+    return path
+
+
+def open_sql_store(dataset):
+    """SQL copy of a ``Dataset``, built on first use."""
+    stored = open_dataset(dataset)
+    store = _open_stores.get(stored.path)
+    if store is None:
+        path = _ensure_sql_file(stored)
+        with _open_stores_lock:
+            store = _open_stores.get(stored.path)
+            if store is None:
+                store = SQLStore(stored, path)
+                _open_stores.set(stored.path, store)
+    return store
+
+
+def use_sql_backend(dataset):
+    """Whether analysis of a ``Dataset`` runs in SQL, per ``STATS_ANALYSIS_BACKEND``."""
+    backend = getattr(settings, 'STATS_ANALYSIS_BACKEND', DEFAULT_ANALYSIS_BACKEND)
+    if backend == 'sqlite':
+        return True
+    if backend == 'memory':
+        return False
+    return (dataset.row_count or 0) >= getattr(settings, 'STATS_SQL_MIN_ROWS', DEFAULT_SQL_MIN_ROWS)
+
+
+def _build_in_background(dataset):
+    try:
+        open_sql_store(dataset)
+    except Exception as e:
+        logger.exception(f"Could not build the SQL copy of dataset {dataset.id}: {str(e)}")
+
+
+def schedule_sql_store(dataset):
+    """Build the SQL copy of a large dataset in the background, before it is first filtered."""
+    if use_sql_backend(dataset):
+        from .jobs import get_job_executor
+        get_job_executor().submit(_build_in_background, dataset)
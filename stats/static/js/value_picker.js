@@ -0,0 +1,112 @@
+/*
+ * Filter value pickers backed by the paged distinct-value endpoints
+ * (get_unique_values and get_column_values).
+ *
+ * A picker shows the first page of a column's values and loads the next
+ * page when its list is scrolled to the bottom. Typing in the search box
+ * placed above it restarts from the first page of the values starting with
+ * the typed text; values already selected are kept.
+ */
+(function (window, $) {
+  // Values per request; cursors are offsets, so select2 pages are cursor = (page - 1) * size
+  const VALUE_PAGE_SIZE = 100;
+  const SEARCH_DELAY_MS = 250;
+  const SCROLL_MARGIN_PX = 24;
+
+  function attachValuePicker(select, url, column, options) {
+    options = options || {};
+    select = $(select);
+
+    let search = select.prev('.value-search');
+    if (!search.length) {
+      search = $('<input type="search" class="value-search w-full p-2 border rounded-md mb-2">');
+      select.before(search);
+    }
+    search.attr('placeholder', options.placeholder || 'Search values').val('');
+
+    const state = { q: '', cursor: 0, loading: false, request: 0 };
+
+    function load(reset) {
+      if (reset) {
+        state.cursor = 0;
+        state.loading = false;
+        select.find('option:not(:selected)').remove();
+      }
+      if (state.cursor === null || state.loading) {
+        return;
+      }
+      state.loading = true;
+      const request = ++state.request;
+      $.get(url, { column: column, q: state.q, cursor: state.cursor, limit: VALUE_PAGE_SIZE })
+        .done(function (data) {
+          if (request !== state.request) {
+            return;
+          }
+          const present = new Set(select.find('option').map(function () { return this.value; }).get());
+          (data.values || []).forEach(function (value) {
+            if (!present.has(value)) {
+              select.append(new Option(value, value));
+            }
+          });
+          state.cursor = data.next_cursor;
+          if (options.onPage) {
+            options.onPage(data);
+          }
+        })
+        .fail(function (xhr, status, error) {
+          if (request === state.request && options.onError) {
+            options.onError(error);
+          }
+        })
+        .always(function () {
+          if (request === state.request) {
+            state.loading = false;
+          }
+        });
+    }
+
+    select.off('scroll.valuePicker').on('scroll.valuePicker', function () {
+      if (this.scrollTop + this.clientHeight >= this.scrollHeight - SCROLL_MARGIN_PX) {
+        load(false);
+      }
+    });
+
+    let timer = null;
+    search.off('input.valuePicker').on('input.valuePicker', function () {
+      clearTimeout(timer);
+      timer = setTimeout(function () {
+        state.q = search.val().trim();
+        load(true);
+      }, SEARCH_DELAY_MS);
+    });
+
+    select.empty();
+    load(true);
+  }
+
+  // select2 options loading a column's values page by page as the user types and scrolls
+  function valuePickerAjax(url, column) {
+    return {
+      url: url,
+      dataType: 'json',
+      delay: SEARCH_DELAY_MS,
+      data: function (params) {
+        return {
+          column: column,
+          q: params.term || '',
+          cursor: ((params.page || 1) - 1) * VALUE_PAGE_SIZE,
+          limit: VALUE_PAGE_SIZE
+        };
+      },
+      processResults: function (data) {
+        return {
+          results: (data.values || []).map(function (value) { return { id: value, text: value }; }),
+          pagination: { more: data.next_cursor !== null && data.next_cursor !== undefined }
+        };
+      }
+    };
+  }
+
+  window.attachValuePicker = attachValuePicker;
+  window.valuePickerAjax = valuePickerAjax;
+})(window, jQuery);
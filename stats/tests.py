@@ -1,3 +1,691 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .caching import LRUCache
+from .correlation import compute_correlation, get_session_correlation, top_correlated_pairs, update_correlation
+from .dataset_store import compute_fingerprint, load_dataframe, open_dataset, save_dataset, save_upload, store_session_dataset
+from .data_filter import ValueFilter
+from .data_tracking import ComparisonTracker
+from .deepseek_api import build_insights_prompt, generate_dataset_insights
+from .derived import DerivedColumn, parse_derived_column
+from .export import export_dataset
+from .filter_engine import AnyOf, ConditionTerm, FilterMasks, get_term_mask_cache
+from .ingestion import read_upload
+from .jobs import JOB_KINDS, run_job, submit_job
+from .llm import ResponseCache, StubLLMClient, get_response_cache, insights_cache_key, set_llm_client
+from .models import InsightJob
+from .plot_cache import PlotCache, plot_cache_key
+from .profiling import profile_dataframe
+from .row_selection import decode_selection, encode_selection, get_session_selection, load_session_selection, store_session_selection
+from .sampling import stratified_positions, stratum_allocation
+from .sql_store import open_sql_store
+from .value_index import DEFAULT_PAGE_SIZE, ValueIndex, build_value_index, get_value_index_cache
+from .views import export_column_data, get_column_values
+
+
+def donors_csv(rows=100):
+    lines = ['donor,city,amount,count,date']
+    for i in range(rows):
+        # A new city and a count out of int16 range only appear in later chunks
+        city = ['Aleppo', 'Homs'][i % 2] if i < 50 else 'Idlib'
+        lines.append(f"d{i},{city},{i / 4},{i if i < 90 else 40000},2024-01-{i % 28 + 1:02d}")
+    return '\n'.join(lines).encode('utf-8')
+
+
+def sample_frame():
+    return pd.DataFrame({
+        'amount': [1.5, np.nan, 3.0, 4.25, 10.0, 2.5],
+        'count': np.array([1, 2, 3, 4, 5, 6], dtype='int16'),
+        'city': pd.Categorical(['Aleppo', 'Homs', None, 'Aleppo', 'Idlib', 'Homs']),
+        'donor': ['a', np.nan, 'c', 'a', 'b', 'a'],
+        'date': pd.to_datetime(['2024-01-01', None, '2024-03-01', '2024-04-01', '2024-04-02', '2024-05-01']),
+        'flag': [True, False, True, False, False, True],
+    })
+
+
+def session_request(**params):
+    request = RequestFactory().get('/', params)
+    request.session = SessionStore()
+    return request
+
+
+class TemporaryStoreMixin:
+    """Store datasets in a temporary directory removed after each test."""
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp(prefix='stats-test-')
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        store_settings = override_settings(STATS_DATASET_ROOT=root)
+        store_settings.enable()
+        self.addCleanup(store_settings.disable)
+
+
+class InsightsPromptTests(SimpleTestCase):
+    def test_prompt_sample_serializes_dates(self):
+        df = pd.DataFrame({
+            'date': pd.date_range('2024-01-01', periods=12, freq='D'),
+            'amount': np.arange(12, dtype='float64'),
+            'donor': ['a', 'b', 'c'] * 4,
+        })
+        df.loc[3, 'amount'] = np.nan
+
+        prompt = build_insights_prompt(df, profile_dataframe(df))
+
+        head = prompt.split('Data Sample (first 5 rows):\n', 1)[1].split('\n\nData Sample', 1)[0]
+        rows = json.loads(head)
+        self.assertEqual(rows[0]['date'], '2024-01-01T00:00:00.000')
+        self.assertIsNone(rows[3]['amount'])
+
+
+class ColumnarStoreTests(TemporaryStoreMixin, TestCase):
+    def test_round_trip_keeps_values_and_dtypes(self):
+        df = sample_frame()
+        dataset = save_dataset(df, 'donors.csv')
+
+        loaded = load_dataframe(dataset)
+
+        pd.testing.assert_frame_equal(loaded.copy(), df)
+        self.assertEqual(dataset.fingerprint, compute_fingerprint(df))
+
+    def test_same_content_is_stored_once(self):
+        dataset = save_dataset(sample_frame(), 'donors.csv')
+
+        again = save_dataset(sample_frame(), 'copy.csv')
+
+        self.assertEqual(again.pk, dataset.pk)
+        self.assertEqual(again.storage_path, dataset.storage_path)
+
+    def test_loaded_columns_are_read_only(self):
+        loaded = load_dataframe(save_dataset(sample_frame(), 'donors.csv'))
+
+        with self.assertRaises(ValueError):
+            loaded.loc[0, 'amount'] = 9
+
+    def test_profile_is_stored_with_the_dataset(self):
+        profile = open_dataset(save_dataset(sample_frame(), 'donors.csv')).profile()['columns']['amount']
+
+        self.assertEqual(profile['kind'], 'numeric')
+        self.assertEqual(profile['missing'], 1)
+        self.assertAlmostEqual(profile['mean'], 4.25)
+
+
+class IngestedComparisonTests(SimpleTestCase):
+    def test_high_cardinality_categorical_columns_group_rare_values(self):
+        rng = np.random.default_rng(0)
+        rows = 5000
+        raw = pd.DataFrame({
+            'donor': rng.choice([f"donor {i}" for i in range(80)], rows),
+            'region': rng.choice([f"region {i}" for i in range(60)], rows),
+            'date': (pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 300, rows), unit='D')).strftime('%Y-%m-%d'),
+        })
+        df, _ = read_upload(SimpleUploadedFile('donors.csv', raw.to_csv(index=False).encode('utf-8')))
+        self.assertIsInstance(df['donor'].dtype, pd.CategoricalDtype)
+
+        for col1, col2, plot_type in [('donor', 'region', None), ('donor', 'region', 'stacked_bar'),
+                                      ('date', 'donor', None), ('date', 'donor', 'heatmap')]:
+            with self.subTest(col1=col1, col2=col2, plot_type=plot_type):
+                tracker = ComparisonTracker(df, max_categories=10)
+
+                figure = tracker.get_comparison_figure(col1, col2, plot_type)
+
+                self.assertIn('Other', figure.to_json())
+                self.assertNotIn('Other', df[col2].cat.categories)
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used_entries_to_stay_in_budget(self):
+        evicted = []
+        cache = LRUCache(10, sizeof=len, on_evict=lambda key, value: evicted.append(key))
+        cache.set('a', 'xxxx')
+        cache.set('b', 'xxxx')
+        cache.get('a')
+
+        cache.set('c', 'xxxx')
+
+        self.assertEqual(evicted, ['b'])
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.current_bytes, 8)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_replacing_a_key_updates_its_size(self):
+        cache = LRUCache(10, sizeof=len)
+        cache.set('a', 'xxxx')
+
+        cache.set('a', 'xx')
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.current_bytes, 2)
+        self.assertEqual(cache.get('a'), 'xx')
+
+    def test_rejects_values_larger_than_the_budget(self):
+        cache = LRUCache(10, sizeof=len)
+        cache.set('a', 'xxxx')
+
+        self.assertFalse(cache.set('b', 'x' * 11))
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.stats()['rejected'], 1)
+
+    def test_counts_hits_and_misses(self):
+        cache = LRUCache(10)
+        cache.set('a', 1)
+
+        cache.get('a')
+        cache.get('b')
+
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+
+class IngestionTests(SimpleTestCase):
+    def test_chunked_read_matches_pandas_with_smaller_dtypes(self):
+        data = donors_csv()
+
+        df, report = read_upload(SimpleUploadedFile('donors.csv', data), chunk_rows=30)
+
+        expected = pd.read_csv(io.BytesIO(data), parse_dates=['date'])
+        self.assertEqual(report['chunks'], 4)
+        self.assertEqual(list(df['city'].cat.categories), ['Aleppo', 'Homs', 'Idlib'])
+        self.assertEqual(df['count'].dtype, np.dtype('int32'))
+        self.assertEqual(report['category_columns'], ['city'])
+        self.assertEqual(report['datetime_columns'], ['date'])
+        self.assertLess(report['memory_after'], report['memory_before'])
+        pd.testing.assert_frame_equal(df.astype({'city': object, 'count': 'int64'}), expected)
+
+
+class PlotCacheTests(SimpleTestCase):
+    def test_key_depends_on_everything_that_changes_the_figure(self):
+        key = plot_cache_key('abc', ['amount'], 'distribution', [{'column': 'city', 'values': ['Homs']}], bins=50, log=False)
+
+        self.assertEqual(key, plot_cache_key('abc', ['amount'], 'distribution', [{'column': 'city', 'values': ['Homs']}], log=False, bins=50))
+        self.assertEqual(len({
+            key,
+            plot_cache_key('abd', ['amount'], 'distribution', [{'column': 'city', 'values': ['Homs']}], bins=50, log=False),
+            plot_cache_key('abc', ['count'], 'distribution', [{'column': 'city', 'values': ['Homs']}], bins=50, log=False),
+            plot_cache_key('abc', ['amount'], 'filter', [{'column': 'city', 'values': ['Homs']}], bins=50, log=False),
+            plot_cache_key('abc', ['amount'], 'distribution', [{'column': 'city', 'values': ['Idlib']}], bins=50, log=False),
+            plot_cache_key('abc', ['amount'], 'distribution', [{'column': 'city', 'values': ['Homs']}], bins=20, log=False),
+        }), 6)
+
+    def test_evicted_figures_are_served_from_disk(self):
+        directory = tempfile.mkdtemp(prefix='stats-plot-cache-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cache = PlotCache(max_bytes=64, directory=directory)
+        first = {'data': [{'x': list(range(5))}]}
+        cache.set('a' * 64, first)
+
+        cache.set('b' * 64, {'data': [{'x': list(range(6))}]})
+        cache.set('c' * 64, {'data': [{'x': 'x' * 100}]})
+
+        self.assertNotIn('a' * 64, cache.memory)
+        self.assertEqual(cache.get('a' * 64), first)
+        self.assertEqual(cache.get('c' * 64), {'data': [{'x': 'x' * 100}]})
+        self.assertIsNone(cache.get('d' * 64))
+
+
+class FilterMaskTests(SimpleTestCase):
+    def test_term_masks_are_evaluated_once(self):
+        df = sample_frame()
+        masks = FilterMasks(df)
+        term = ConditionTerm('amount', '>', 2)
+        calls = []
+        original = term.mask
+        term.mask = lambda frame: calls.append(1) or original(frame)
+
+        first = masks.term_mask(term)
+        second = masks.term_mask(term)
+
+        self.assertIs(first, second)
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(first.flags.writeable)
+
+    def test_masks_of_a_dataset_are_shared_across_requests(self):
+        df = sample_frame()
+        fingerprint = compute_fingerprint(df)
+        term = ConditionTerm('amount', '>', 2)
+        calls = []
+        original = term.mask
+        term.mask = lambda frame: calls.append(1) or original(frame)
+        get_term_mask_cache().pop((fingerprint, term.key()))
+
+        first = FilterMasks(df, fingerprint=fingerprint).term_mask(term)
+        second = FilterMasks(df, fingerprint=fingerprint).term_mask(term)
+        FilterMasks(df).term_mask(term)
+
+        self.assertIs(first, second)
+        self.assertEqual(len(calls), 2)
+        self.assertIs(get_term_mask_cache().get((fingerprint, term.key())), first)
+
+    def test_combines_terms_like_chained_filters(self):
+        df = sample_frame()
+        masks = FilterMasks(df)
+        terms = [ValueFilter('city', ['Homs', 'Idlib']), ConditionTerm('amount', '>=', 2.5)]
+
+        self.assertEqual(masks.combine(terms).tolist(), [False, False, False, False, True, True])
+        self.assertEqual(masks.combine(terms, 'or').tolist(), [False, True, True, True, True, True])
+        self.assertEqual(AnyOf(terms).mask(df).tolist(), masks.combine(terms, 'or').tolist())
+        pd.testing.assert_frame_equal(masks.filter(terms), df.iloc[[4, 5]])
+        self.assertTrue(masks.combine([]).all())
+
+    def test_missing_values_only_match_not_equal(self):
+        df = sample_frame()
+
+        self.assertFalse(ConditionTerm('amount', '>', 0).mask(df)[1])
+        self.assertTrue(ConditionTerm('amount', '!=', 3).mask(df)[1])
+        self.assertEqual(ValueFilter('donor', ['a'], include=False).mask(df).tolist(), [False, True, True, False, True, False])
+
+
+class RowSelectionTests(TemporaryStoreMixin, TestCase):
+    def test_bitmap_round_trip(self):
+        rng = np.random.default_rng(0)
+        for mask in (np.zeros(0, dtype=bool), np.ones(1, dtype=bool), rng.random(13) < 0.5,
+                     rng.random(10007) < 0.01, np.repeat([True, False], 5000)):
+            encoded = encode_selection(mask)
+
+            self.assertEqual(encoded['selected'], int(mask.sum()))
+            np.testing.assert_array_equal(decode_selection(json.loads(json.dumps(encoded))), mask)
+
+    def test_session_view_applies_the_stored_selection(self):
+        request = session_request()
+        df = sample_frame()
+        dataset = store_session_dataset(request, df, 'donors.csv')
+        mask = (df['city'] == 'Homs').to_numpy()
+
+        store_session_selection(request, dataset, mask)
+
+        np.testing.assert_array_equal(get_session_selection(request), mask)
+        pd.testing.assert_frame_equal(load_session_selection(request, ['amount']).copy(), df.loc[mask, ['amount']])
+
+    def test_selection_of_another_dataset_is_ignored(self):
+        request = session_request()
+        dataset = store_session_dataset(request, sample_frame(), 'donors.csv')
+        store_session_selection(request, dataset, np.ones(dataset.row_count, dtype=bool))
+
+        other = store_session_dataset(request, sample_frame().head(4), 'head.csv')
+
+        self.assertIsNone(get_session_selection(request, other))
+        self.assertEqual(len(load_session_selection(request)), 4)
+
+
+def correlated_frame(rows=300):
+    rng = np.random.default_rng(3)
+    base = rng.normal(size=rows)
+    df = pd.DataFrame({
+        'amount': np.exp(base),
+        'gifts': base * 2 + rng.normal(scale=0.5, size=rows),
+        'noise': rng.normal(size=rows),
+        'constant': np.full(rows, 7.0),
+    })
+    # Missing values in different rows, so each pair has its own complete rows
+    df.loc[rng.random(rows) < 0.2, 'amount'] = np.nan
+    df.loc[rng.random(rows) < 0.1, 'gifts'] = np.nan
+    df.loc[:rows // 2, 'noise'] = np.nan
+    return df
+
+
+class CorrelationTests(TemporaryStoreMixin, TestCase):
+    def test_matches_pandas_with_missing_values(self):
+        df = correlated_frame()
+
+        corr = compute_correlation(df)
+
+        pd.testing.assert_frame_equal(corr.to_frame(), df.corr(), check_exact=False, rtol=1e-9, atol=1e-12)
+        self.assertEqual(corr.counts[0, 2], int((df['amount'].notna() & df['noise'].notna()).sum()))
+
+    def test_top_pairs_follow_the_full_matrix(self):
+        df = correlated_frame()
+        df['amount_copy'] = df['amount'] * 3 + 1
+        expected = df.corr().where(np.triu(np.ones((5, 5), dtype=bool), k=1)).stack()
+        expected = expected.reindex(expected.abs().sort_values(ascending=False).index)
+
+        pairs = top_correlated_pairs(df, k=3, block_size=2)
+
+        self.assertEqual([(p['col1'], p['col2']) for p in pairs], [tuple(sorted(pair, key=df.columns.get_loc)) for pair in expected.index[:3]])
+        np.testing.assert_allclose([p['corr'] for p in pairs], expected.iloc[:3].to_numpy())
+        self.assertEqual(top_correlated_pairs(df, k=10, min_abs=0.99)[0]['col2'], 'amount_copy')
+
+    def test_added_column_matches_a_full_computation(self):
+        df = correlated_frame()
+        corr = compute_correlation(df, ['amount', 'noise'])
+
+        updated = update_correlation(corr, df, 'gifts').select(['amount', 'gifts', 'noise'])
+
+        full = compute_correlation(df, ['amount', 'gifts', 'noise'])
+        np.testing.assert_allclose(updated.matrix, full.matrix)
+        np.testing.assert_array_equal(updated.counts, full.counts)
+
+    def test_session_matrix_reuses_the_cached_one_for_an_added_column(self):
+        request = session_request()
+        df = correlated_frame()
+        dataset = store_session_dataset(request, df, 'donors.csv')
+        get_session_correlation(request, ['amount', 'gifts', 'noise'])
+        columns = ['amount', 'log(amount)', 'gifts', 'noise']
+
+        with mock.patch('stats.correlation.compute_correlation') as compute:
+            corr = get_session_correlation(request, columns)
+
+        compute.assert_not_called()
+        expected = load_dataframe(dataset, columns)[columns].corr()
+        pd.testing.assert_frame_equal(corr.to_frame(), expected, check_exact=False, rtol=1e-9)
+
+
+class SamplingTests(SimpleTestCase):
+    def test_allocation_guarantees_a_minimum_then_shares_by_size(self):
+        allocation = stratum_allocation([1000, 100, 10, 3], 200, 20)
+
+        self.assertEqual(allocation.tolist(), [156, 31, 10, 3])
+
+    def test_allocation_lowers_minimums_that_exceed_the_budget(self):
+        self.assertEqual(stratum_allocation([1000, 100, 10, 3], 8, 20).tolist(), [2, 2, 2, 2])
+        self.assertEqual(stratum_allocation([5, 5], 20, 3).tolist(), [5, 5])
+
+    def test_stratified_positions_are_deterministic_and_keep_small_strata(self):
+        strata = pd.Series(['a'] * 900 + ['b'] * 90 + ['c'] * 10)
+
+        positions = stratified_positions(strata, 100, min_per_stratum=5, seed=7)
+
+        self.assertEqual(len(positions), 100)
+        self.assertTrue((np.diff(positions) > 0).all())
+        self.assertGreaterEqual(strata.iloc[positions].value_counts()['c'], 5)
+        np.testing.assert_array_equal(positions, stratified_positions(strata, 100, min_per_stratum=5, seed=7))
+
+
+class InsightJobTests(TemporaryStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dataset = save_dataset(sample_frame(), 'donors.csv')
+        self.submitted = []
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda function, job_id: self.submitted.append(job_id)
+        for patcher in (mock.patch('stats.jobs.get_job_executor', return_value=executor),
+                        # Closing the connection would break the test transaction
+                        mock.patch('stats.jobs.close_old_connections')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def use_kind(self, run):
+        patcher = mock.patch.dict(JOB_KINDS, {'test': run})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_job_runs_to_completion_and_is_reused(self):
+        def run(dataset, report):
+            report(0.5, 'halfway', {'rows': np.int64(3)})
+            job = InsightJob.objects.get(pk=self.submitted[0])
+            self.assertEqual((job.status, job.progress, job.stage, job.partial), ('running', 0.5, 'halfway', {'rows': 3}))
+            return {'rows': np.int64(dataset.row_count)}
+        self.use_kind(run)
+
+        job = submit_job(self.dataset, 'test')
+        self.assertEqual((job.status, self.submitted), ('pending', [job.pk]))
+        self.assertEqual(submit_job(self.dataset, 'test').pk, job.pk)
+        run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress, job.result, job.partial), ('done', 1.0, {'rows': 6}, None))
+        self.assertEqual(submit_job(self.dataset, 'test').pk, job.pk)
+        self.assertNotEqual(submit_job(self.dataset, 'test', refresh=True).pk, job.pk)
+
+    def test_failed_job_records_the_error_and_is_not_reused(self):
+        def run(dataset, report):
+            raise ValueError('No numeric columns')
+        self.use_kind(run)
+        job = submit_job(self.dataset, 'test')
+
+        with self.assertLogs('stats.jobs', 'ERROR'):
+            run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), ('failed', 'No numeric columns'))
+        self.assertIsNotNone(job.finished_at)
+        self.assertNotEqual(submit_job(self.dataset, 'test').pk, job.pk)
+
+    def test_silent_job_is_marked_failed_and_replaced(self):
+        self.use_kind(lambda dataset, report: {})
+        job = submit_job(self.dataset, 'test')
+        InsightJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        replacement = submit_job(self.dataset, 'test')
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertNotEqual(replacement.pk, job.pk)
+        self.assertEqual(self.submitted, [job.pk, replacement.pk])
+
+
+class InsightsCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.llm = StubLLMClient()
+        set_llm_client(self.llm)
+        self.addCleanup(set_llm_client)
+        get_response_cache().clear()
+        self.addCleanup(get_response_cache().clear)
+
+    def test_key_names_the_dataset_prompt_version_and_model(self):
+        with override_settings(STATS_LLM_MODEL='model-a'):
+            key = insights_cache_key('abc')
+
+        self.assertEqual(key, insights_cache_key('abc', 'model-a'))
+        self.assertNotEqual(key, insights_cache_key('abd', 'model-a'))
+        self.assertNotEqual(key, insights_cache_key('abc', 'model-b'))
+        with mock.patch('stats.llm.INSIGHTS_PROMPT_VERSION', -1):
+            self.assertNotEqual(key, insights_cache_key('abc', 'model-a'))
+
+    def test_model_is_asked_once_per_dataset_and_model(self):
+        df = sample_frame()
+        profile = profile_dataframe(df)
+
+        first = generate_dataset_insights(df, profile, fingerprint='abc')
+        again = generate_dataset_insights(df, profile, fingerprint='abc')
+        generate_dataset_insights(df, profile, fingerprint='abd')
+        with override_settings(STATS_LLM_MODEL='another-model'):
+            generate_dataset_insights(df, profile, fingerprint='abc')
+
+        self.assertEqual(first, again)
+        self.assertEqual(self.llm.calls, 3)
+
+    def test_entries_expire_after_their_ttl(self):
+        cache = ResponseCache(ttl=60, max_bytes=1024)
+        with mock.patch('stats.llm.time.monotonic', return_value=1000.0):
+            cache.set('key', 'text')
+        with mock.patch('stats.llm.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('key'), 'text')
+        with mock.patch('stats.llm.time.monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get('key'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+class SQLStoreTests(TemporaryStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(1)
+        rows = 2000
+        df = pd.DataFrame({
+            'city': pd.Categorical(rng.choice(['Aleppo', 'Homs', 'Idlib', None], rows)),
+            'donor': rng.choice(['a', 'b', 'cc'], rows).astype(object),
+            'count': rng.integers(0, 20, rows),
+            'amount': np.round(rng.random(rows) * 10, 1),
+            'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 30, rows), unit='D'),
+            'flag': rng.random(rows) > 0.3,
+        })
+        df.loc[::11, 'amount'] = np.nan
+        df.loc[::13, 'donor'] = np.nan
+        self.dataset = save_dataset(df, 'donors.csv')
+        self.frame = load_dataframe(self.dataset)
+        self.store = open_sql_store(self.dataset)
+
+    def test_filters_select_the_same_rows_as_masks(self):
+        masks = FilterMasks(self.frame)
+        chains = [
+            [ValueFilter('city', ['Aleppo', 'nan'])],
+            [ValueFilter('donor', ['a', 'None'])],
+            [ValueFilter('count', ['3', '5', '17'])],
+            [ValueFilter('amount', ['1.5', '2', 'nan'])],
+            [ValueFilter('date', ['2024-01-05', '2024-01-07 00:00:00'])],
+            [ValueFilter('flag', ['True'])],
+            [ValueFilter('amount', ['nan'], include=False)],
+            [ConditionTerm('amount', 'between', [2, 5]), ConditionTerm('date', '>', '2024-01-20')],
+            [ConditionTerm('city', '!=', 'Homs'), ValueFilter('count', ['1', '2'])],
+        ]
+        for terms in chains:
+            for logic in ('and', 'or'):
+                with self.subTest(terms=[term.describe() for term in terms], logic=logic):
+                    sql_terms = [AnyOf(terms)] if logic == 'or' else terms
+                    expected = masks.combine(terms, logic)
+                    np.testing.assert_array_equal(self.store.row_mask(sql_terms), expected)
+                    self.assertEqual(self.store.count(sql_terms), int(expected.sum()))
+
+    def test_grouped_aggregates_match_pandas(self):
+        for by, column, agg in [(['city'], 'amount', 'mean'), (['donor', 'city'], 'count', 'sum'),
+                                (['date'], 'amount', 'count'), (['city', 'donor'], None, 'count')]:
+            with self.subTest(by=by, column=column, agg=agg):
+                groups = self.frame.groupby(by, observed=True)
+                if column is None:
+                    expected = groups.size().reset_index(name='count')
+                else:
+                    expected = groups[column].agg(agg).reset_index()
+
+                pd.testing.assert_frame_equal(self.store.grouped(by, column=column, agg=agg), expected,
+                                              check_dtype=False, check_categorical=False)
+
+
+class UploadStoreTests(TemporaryStoreMixin, TestCase):
+    def test_streamed_upload_matches_the_stored_frame(self):
+        data = donors_csv()
+
+        with override_settings(STATS_INGEST_CHUNK_ROWS=30):
+            dataset = save_upload(SimpleUploadedFile('donors.csv', data))
+
+        df, _ = read_upload(SimpleUploadedFile('donors.csv', data), chunk_rows=30)
+        self.assertEqual(dataset.fingerprint, compute_fingerprint(df))
+        self.assertEqual(dataset.row_count, len(df))
+        pd.testing.assert_frame_equal(load_dataframe(dataset).copy(), df)
+        self.assertEqual(open_dataset(dataset).profile()['columns']['city']['unique_count'], 3)
+
+
+class ValueIndexTests(TemporaryStoreMixin, TestCase):
+    def test_pages_by_prefix_in_either_order(self):
+        index = ValueIndex(build_value_index(pd.Series(['Homs', 'homs', 'Hama', 'Aleppo', 'Homs', None, 'Hama', 'Homs'])))
+
+        self.assertEqual(index.missing, 1)
+        self.assertEqual(index.page('HO', order='value'),
+                         {'values': ['Homs', 'homs'], 'counts': [3, 1], 'total': 2, 'next_cursor': None})
+        first = index.page('h', limit=2)
+        self.assertEqual((first['values'], first['total'], first['next_cursor']), (['Homs', 'Hama'], 3, 2))
+        self.assertEqual(index.page('h', cursor=first['next_cursor'], limit=2)['values'], ['homs'])
+        self.assertIn('homs', index)
+        self.assertNotIn('HOMS', index)
+
+    def test_picker_requests_are_bounded_and_paged(self):
+        request = session_request(column='donor')
+        donors = pd.DataFrame({'donor': [f"donor {i:03d}" for i in range(250)] * 2})
+        store_session_dataset(request, donors, 'donors.csv')
+
+        def page(**params):
+            request.GET = request.GET.copy()
+            request.GET.update(params)
+            return json.loads(get_column_values(request).content)
+
+        first = page()
+        second = page(cursor=str(first['next_cursor']))
+        last = page(cursor=str(second['next_cursor']))
+        search = page(q='DONOR 1', cursor='0', limit='20')
+
+        self.assertEqual((len(first['values']), first['total'], first['next_cursor']), (DEFAULT_PAGE_SIZE, 250, DEFAULT_PAGE_SIZE))
+        self.assertEqual(len(set(first['values'] + second['values'] + last['values'])), 250)
+        self.assertIsNone(last['next_cursor'])
+        self.assertEqual((len(search['values']), search['total'], search['next_cursor']), (20, 100, 20))
+        self.assertTrue(all(value.startswith('donor 1') for value in search['values']))
+
+    def test_indexes_are_kept_in_the_shared_cache(self):
+        stored = open_dataset(save_dataset(sample_frame(), 'donors.csv'))
+        cache = get_value_index_cache()
+
+        index = stored.value_index('city')
+        derived = stored.value_index('bin(amount, 3)')
+
+        self.assertIs(cache.get((stored.path, 'city')), index)
+        self.assertIs(stored.value_index('city'), index)
+        self.assertEqual(sum(derived.counts) + derived.missing, 6)
+        self.assertIn((stored.path, 'bin(amount, 3)'), cache)
+
+
+class DerivedColumnTests(TemporaryStoreMixin, TestCase):
+    def test_log_and_sqrt_shift_values_below_their_domain(self):
+        series = pd.Series([-2.0, 0.0, 3.0, np.nan])
+
+        log = DerivedColumn('x', 'log')
+        sqrt = DerivedColumn('x', 'sqrt')
+
+        np.testing.assert_allclose(log.compute(series), np.log([1.0, 3.0, 6.0, np.nan]))
+        np.testing.assert_allclose(sqrt.compute(series), np.sqrt([0.0, 2.0, 5.0, np.nan]))
+        self.assertEqual(log.label({'min': -2.0}), 'Log(x + 3.0)')
+        self.assertEqual(DerivedColumn('x', 'log').label({'min': 1.0}), 'Log(x)')
+
+    def test_constant_columns_cannot_be_scaled(self):
+        series = pd.Series([4.0, 4.0, 4.0])
+
+        with self.assertRaisesMessage(ValueError, 'Standard deviation is zero'):
+            DerivedColumn('x', 'standardize').compute(series)
+        with self.assertRaisesMessage(ValueError, 'Max and min values are equal'):
+            DerivedColumn('x', 'minmax').compute(series)
+        with self.assertRaises(ValueError):
+            DerivedColumn('x', 'log').compute(pd.Series(['a', 'b']))
+
+    def test_names_round_trip(self):
+        for column in (DerivedColumn('price (USD)', 'bin', 7), DerivedColumn('log(x)', 'sqrt')):
+            parsed = parse_derived_column(column.name)
+            self.assertEqual((parsed.source, parsed.transform, parsed.bins), (column.source, column.transform, column.bins))
+        self.assertIsNone(parse_derived_column('bin(x, 0)'))
+        self.assertIsNone(parse_derived_column('amount'))
+
+    def test_derived_columns_load_like_stored_ones(self):
+        df = sample_frame()
+        dataset = save_dataset(df, 'donors.csv')
+
+        loaded = load_dataframe(dataset, ['standardize(amount)', 'bin(count, 3)'])
+
+        amount = df['amount']
+        np.testing.assert_allclose(loaded['standardize(amount)'], (amount - amount.mean()) / amount.std())
+        self.assertEqual(loaded['bin(count, 3)'].tolist(), [0, 0, 1, 1, 2, 2])
+
+
+class ExportTests(TemporaryStoreMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.df = sample_frame()
+        self.mask = (self.df['city'] == 'Homs').to_numpy()
+
+    def request(self, **params):
+        request = session_request(**params)
+        dataset = store_session_dataset(request, self.df, 'donors.csv')
+        store_session_selection(request, dataset, self.mask)
+        return request
+
+    def test_dataset_download_streams_the_filtered_rows(self):
+        with override_settings(STATS_EXPORT_CHUNK_ROWS=1):
+            response = export_dataset(self.request(columns=['donor', 'amount']))
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="donors.csv"')
+        self.assertEqual(b''.join(response.streaming_content).decode('utf-8'),
+                         self.df.loc[self.mask, ['donor', 'amount']].to_csv(index=False))
+
+    def test_column_export_returns_csv_in_json(self):
+        response = export_column_data(self.request(column='amount'))
+
+        self.assertEqual(json.loads(response.content), {'csv_data': self.df.loc[self.mask, ['amount']].to_csv(index=False)})
+        self.assertEqual(export_column_data(self.request(column='missing')).status_code, 400)
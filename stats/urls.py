@@ -1,11 +1,34 @@
 from django.urls import path
-from .views import (analyze_csv, get_unique_values, filter_plot, 
-                   apply_global_filters, reset_filters, get_column_types, get_selected_plots, get_column_values, 
-                   compare_columns, get_column_type, get_column_types_compare)
-
-from .deepseek_api import get_dataset_insights, analysis_chat_api
 from form_builder.views import ListForms, FormDetailView, CreateFormView, CreateRecordView, DeleteRecordView, UpdateRecordView, FormsActionView
-from .views import AnalysisView, SaveAnalysisView, DeleteAnalysisView, analyze_form_view, home
+from .lazy import lazy_view
+
+# The analytics views are imported by the first request that uses them (see lazy.py)
+analyze_csv = lazy_view('stats.views.analyze_csv')
+get_unique_values = lazy_view('stats.views.get_unique_values')
+filter_plot = lazy_view('stats.views.filter_plot')
+apply_global_filters = lazy_view('stats.views.apply_global_filters')
+reset_filters = lazy_view('stats.views.reset_filters')
+get_column_types = lazy_view('stats.views.get_column_types')
+get_selected_plots = lazy_view('stats.views.get_selected_plots')
+get_column_values = lazy_view('stats.views.get_column_values')
+compare_columns = lazy_view('stats.views.compare_columns')
+get_column_type = lazy_view('stats.views.get_column_type')
+get_column_types_compare = lazy_view('stats.views.get_column_types_compare')
+export_column_data = lazy_view('stats.views.export_column_data')
+export_dataset = lazy_view('stats.export.export_dataset')
+
+get_dataset_insights = lazy_view('stats.deepseek_api.get_dataset_insights')
+analysis_chat_api = lazy_view('stats.deepseek_api.analysis_chat_api')
+analysis_chat_stream = lazy_view('stats.deepseek_api.analysis_chat_stream', is_async=True)
+plot_templates = lazy_view('stats.figure_transport.plot_templates')
+submit_insight_job = lazy_view('stats.jobs.submit_insight_job')
+insight_job_status = lazy_view('stats.jobs.insight_job_status')
+
+analysis_view = lazy_view('stats.views.AnalysisView')
+save_analysis_view = lazy_view('stats.views.SaveAnalysisView')
+delete_analysis_view = lazy_view('stats.views.DeleteAnalysisView')
+analyze_form_view = lazy_view('stats.views.analyze_form_view')
+home = lazy_view('stats.views.home')
 
 urlpatterns = [
     path('analyze/', analyze_csv, name='analyze_csv'),
@@ -20,7 +43,13 @@ urlpatterns = [
     path('compare_columns/', compare_columns, name='compare_columns'),
     path('get_dataset_insights/', get_dataset_insights, name='get_dataset_insights'),
     path('analysis_chat_api/', analysis_chat_api, name='analysis_chat_api'),
+    path('analysis_chat_stream/', analysis_chat_stream, name='analysis_chat_stream'),
     path('get_column_types_compare/', get_column_types_compare, name='get_column_types_compare'),
+    path('plot_templates/', plot_templates, name='plot_templates'),
+    path('insight_jobs/', submit_insight_job, name='submit_insight_job'),
+    path('insight_jobs/<int:job_id>/', insight_job_status, name='insight_job_status'),
+    path('export_column_data/', export_column_data, name='export_column_data'),
+    path('export_dataset/', export_dataset, name='export_dataset'),
 
 
     #views for analysis page
@@ -33,9 +62,9 @@ urlpatterns = [
     # path('forms/action/', FormsActionView.as_view(), name='forms_action'),
     
     # New URL for analysis
-    path('', AnalysisView.as_view(), name='analysis'),
-    path('stats/save/', SaveAnalysisView.as_view(), name='save_analysis'),
-    path('stats/delete/<int:pk>/', DeleteAnalysisView.as_view(), name='delete_analysis'),
+    path('', analysis_view, name='analysis'),
+    path('stats/save/', save_analysis_view, name='save_analysis'),
+    path('stats/delete/<int:pk>/', delete_analysis_view, name='delete_analysis'),
     path('stats/form-analysis/', analyze_form_view, name='analyze_form'),
     path('upload/', home, name='upload_file'),
     path('upload_file2/', home, name='upload_file2'),
@@ -0,0 +1,209 @@
+"""
+Distinct-value indexes for filter pickers.
+
+Filter dropdowns list the values of a column. Building that list from the
+column on every request reads the whole column and, for free-text or id
+columns, sends hundreds of thousands of strings in one response. Instead,
+the distinct values of every column are indexed once when the dataset is
+stored: their string form (the form the filters match on), sorted
+case-insensitively, with the number of rows holding each one. Pickers then
+ask for one page at a time, by value or by frequency, optionally narrowed
+to a prefix.
+
+Indexes live next to the columnar data as ``<column file>.values.json``.
+Datasets stored before indexes existed are indexed on first use. Loaded
+indexes, and the in-memory indexes of derived columns, are kept in a
+process-wide cache bounded by ``STATS_VALUE_INDEX_CACHE_MAX_BYTES``.
+"""
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .caching import LRUCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VALUE_INDEX_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+VALUE_INDEX_VERSION = 1
+VALUE_INDEX_SUFFIX = '.values.json'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+ORDERS = ('frequency', 'value')
+
+
+def value_index_file(column_file):
+    """Name of the index file of the column stored in ``column_file``."""
+    return os.path.splitext(column_file)[0] + VALUE_INDEX_SUFFIX
+
+
+def build_value_index(series):
+    """
+    Index the distinct values of a column.
+
+    Values are keyed by their string form, as the filters compare them, so
+    values with the same string form are counted together.
+
+    Returns:
+        dict: JSON-serializable index with ``keys`` (sorted case-insensitively),
+        ``counts`` (rows per key) and ``missing`` (rows without a value)
+    """
+    counts = series.value_counts(dropna=True, sort=False)
+    counts = counts[counts > 0]
+    totals = {}
+    for key, count in zip(pd.Index(counts.index).astype(str), counts.to_numpy()):
+        totals[key] = totals.get(key, 0) + int(count)
+    entries = sorted((key.casefold(), key, count) for key, count in totals.items())
+    return {
+        'version': VALUE_INDEX_VERSION,
+        'keys': [key for _, key, _ in entries],
+        'counts': [count for _, _, count in entries],
+        'missing': int(series.isna().sum()),
+    }
+
+
+def write_value_index(path, index):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False)
+
+
+def write_value_indexes(directory, df, manifest):
+    """Write the value index of every column of ``df`` into a dataset directory."""
+    for meta in manifest['columns']:
+        index = build_value_index(df[meta['name']])
+        write_value_index(os.path.join(directory, value_index_file(meta['file'])), index)
+
+
+def read_value_index(path):
+    """
+    Read a stored value index.
+
+    Returns:
+        dict or None if there is none or it was written by another version
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read value index {path}: {str(e)}")
+        return None
+    if index.get('version') != VALUE_INDEX_VERSION:
+        return None
+    return index
+
+
+class ValueIndex:
+    """
+    Distinct values of a column, searchable by prefix and pageable.
+
+    Pages are addressed by a cursor: the offset of their first entry in the
+    requested ordering. A stored dataset never changes, so cursors stay
+    valid for as long as the dataset exists.
+    """
+
+    def __init__(self, index):
+        self.keys = index['keys']
+        self.counts = np.asarray(index['counts'], dtype='int64')
+        self.missing = index['missing']
+        self._folded = [key.casefold() for key in self.keys]
+        self._by_frequency = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the index, including its frequency ordering."""
+        strings = sum(sys.getsizeof(key) for key in self.keys) + sum(sys.getsizeof(key) for key in self._folded)
+        # Two lists of pointers, the counts and the int64 frequency ordering
+        return strings + 16 * len(self.keys) + self.counts.nbytes + 8 * len(self.keys)
+
+    def __contains__(self, key):
+        folded = key.casefold()
+        position = bisect.bisect_left(self._folded, folded)
+        while position < len(self.keys) and self._folded[position] == folded:
+            if self.keys[position] == key:
+                return True
+            position += 1
+        return False
+
+    def prefix_range(self, prefix):
+        """Positions ``[start, stop)`` of the keys starting with ``prefix`` (case-insensitive)."""
+        if not prefix:
+            return 0, len(self.keys)
+        folded = prefix.casefold()
+        start = bisect.bisect_left(self._folded, folded)
+        stop = bisect.bisect_left(self._folded, folded + '\U0010ffff', start)
+        return start, stop
+
+    def _frequency_order(self, start, stop):
+        if (start, stop) == (0, len(self.keys)):
+            if self._by_frequency is None:
+                # Stable, so equally frequent values stay in value order
+                self._by_frequency = np.argsort(-self.counts, kind='stable')
+            return self._by_frequency
+        return start + np.argsort(-self.counts[start:stop], kind='stable')
+
+    def page(self, prefix='', order='frequency', cursor=0, limit=DEFAULT_PAGE_SIZE):
+        """
+        One page of distinct values.
+
+        Args:
+            prefix: Only values starting with it (case-insensitive)
+            order: 'frequency' (most frequent first) or 'value' (alphabetical)
+            cursor: Offset of the page in that ordering
+            limit: Page size, at most ``MAX_PAGE_SIZE``
+
+        Returns:
+            dict: ``values``, ``counts``, ``total`` (matching values) and
+            ``next_cursor`` (None on the last page)
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order '{order}'; expected one of {', '.join(ORDERS)}")
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        cursor = max(0, int(cursor))
+        start, stop = self.prefix_range(prefix)
+        total = stop - start
+
+        if order == 'value':
+            positions = range(start + cursor, min(start + cursor + limit, stop))
+        else:
+            positions = self._frequency_order(start, stop)[cursor:cursor + limit].tolist()
+        end = cursor + len(positions)
+        return {
+            'values': [self.keys[position] for position in positions],
+            'counts': [int(self.counts[position]) for position in positions],
+            'total': total,
+            'next_cursor': end if end < total else None,
+        }
+
+
+_value_index_cache = None
+_value_index_cache_lock = threading.Lock()
+
+
+def get_value_index_cache():
+    """
+    Return the process-wide cache of loaded value indexes.
+
+    Keys are ``(dataset directory, column name)``.
+    """
+    global _value_index_cache
+    if _value_index_cache is None:
+        with _value_index_cache_lock:
+            if _value_index_cache is None:
+                _value_index_cache = LRUCache(
+                    max_bytes=getattr(settings, 'STATS_VALUE_INDEX_CACHE_MAX_BYTES', DEFAULT_VALUE_INDEX_CACHE_MAX_BYTES),
+                    sizeof=lambda index: index.nbytes,
+                    name='value index cache'
+                )
+    return _value_index_cache
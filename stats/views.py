@@ -3,7 +3,7 @@ import pandas as pd
 import plotly.express as px
 from django.shortcuts import render, redirect
 from .forms import CsvUploadForm
-from django.http import JsonResponse, FileResponse, HttpResponse
+from django.http import JsonResponse, FileResponse, HttpResponse, StreamingHttpResponse
 from django.template.loader import render_to_string
 import io
 import json
@@ -15,6 +15,7 @@ from django import template
 import os
 import logging
 import traceback
+import functools
 import plotly.io as pio
 import plotly.graph_objects as go
 from PIL import Image
@@ -25,12 +26,30 @@ import queue
 from pathlib import Path
 from datetime import datetime
 from django.views.decorators.csrf import csrf_exempt
-from .data_tracking import DataTracker, ComparisonTracker
+from django.views.decorators.gzip import gzip_page
+from .data_tracking import DataTracker, SQLDataTracker, ComparisonTracker, NO_MATCHING_ROWS_HTML
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views import View
 from .models import CustomForm, AnalysisReport  
-from form_builder.cursor_db import get_form, get_form_fields
+from .dataset_store import store_session_dataset, store_session_upload, get_session_dataset, get_session_profile, get_dataset_profile, load_dataframe, load_session_dataframe, open_dataset
+from .ingestion import read_upload, optimize_dataframe, is_supported_upload, observed_value_counts
+from .profiling import profile_column, profile_dataframe
+from .derived import DEFAULT_BINS, TRANSFORMS, DerivedColumn, source_statistics
+from .plot_engine import generate_plot, generate_plot_figure, generate_store_plot_figure, distribution_plot, build_column_plots, iter_cached_column_plots, iter_store_column_plots
+from .figure_transport import figure_payload
+from .plot_cache import get_plot_cache, plot_cache_key
+from .aggregation import SCATTER_MAX_POINTS, binned_histogram_figure, density_figure, histogram_bins, histogram_figure
+from .data_filter import ValueFilter
+from .filter_engine import AnyOf, FilterMasks
+from .sql_store import SQL_AGGREGATES, open_sql_store, use_sql_backend
+from .sampling import get_max_samples
+from .row_selection import store_session_selection, clear_session_selection, get_session_selection, load_session_selection
+from .correlation import compute_correlation, get_session_correlation
+from .value_index import DEFAULT_PAGE_SIZE
+from .export import iter_csv, iter_export_chunks
+from form_builder.cursor_db import count_records
+from .form_analysis import analyze_form, read_form_frame
 from django.core.paginator import Paginator
 
 
@@ -55,58 +74,33 @@ def generate_overview(df):
         'dtypes': df.dtypes.astype(str).to_dict()
     }
 
-def generate_summary_statistics(df):
+def generate_summary_statistics(df, profile=None):
     """Generate summary statistics for numeric columns."""
-    numeric_stats = df.describe().to_dict()
-    categorical_stats = {
-        col: {
-            'unique_values': df[col].nunique(),
-            'top_values': df[col].value_counts().head(5).to_dict()
-        }
-        for col in df.select_dtypes(include=['object', 'category']).columns
-    }
+    profile = profile or profile_dataframe(df)
+    numeric_stats = {}
+    categorical_stats = {}
+    for col, column in profile['columns'].items():
+        if column['kind'] == 'numeric':
+            numeric_stats[col] = {
+                'count': column['count'],
+                'mean': column['mean'],
+                'std': column['std'],
+                'min': column['min'],
+                '25%': column['q1'],
+                '50%': column['median'],
+                '75%': column['q3'],
+                'max': column['max'],
+            }
+        elif column['kind'] == 'categorical':
+            categorical_stats[col] = {
+                'unique_values': column['unique_count'],
+                'top_values': dict(column['top_values'][:5])
+            }
     return {'numeric': numeric_stats, 'categorical': categorical_stats}
 
-def generate_plot(df, column):
-    """Generate a plot for a single column."""
-    type=""
-    fig=None
-    if pd.api.types.is_numeric_dtype(df[column]):
-        type = "numeric"
-        fig = px.histogram(df, x=column, nbins=50,title=f"المخطط التكراري للعمود {column}")
-    elif pd.api.types.is_datetime64_any_dtype(df[column]):
-        type = "datetime"
-        date_counts = df[column].value_counts()
-        fig = px.line(x=date_counts.index, y=date_counts.values, title=f"التوزيع الزمني للعمود {column}")
-        fig.update_layout(xaxis_title=column, yaxis_title="Count")
-
-    else:
-        type = "categorical"
-        value_counts = df[column].value_counts().head(10)
-        if len(value_counts) <= 7:
-            fig = px.pie(names=value_counts.index,values=value_counts.values,title=f"المخطط الدائري للعمود {column}")
-        else:
-            fig = px.bar(x=value_counts.index, 
-                        y=value_counts.values,
-                        title=f"المخطط العمودي لأكثر 10 قيم في {column}")
-        fig.update_layout(xaxis_title=column, yaxis_title="Count")
-
-    print(f"{column} is {type}")
-    fig.update_layout(
-        showlegend=True,
-        template='plotly_white',
-        margin=dict(l=40, r=40, t=40, b=40)
-    )
-
-    html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-
-    print(f"{column} is finished")
-
-    return html,type
-
 def generate_all_plots(df):
     """Generate plots for all columns."""
-    return {col: generate_plot(df, col) for col in df.columns}
+    return build_column_plots(df, df.columns, generate_plot)
 
 def get_html_plots_folder(filename):
     """
@@ -176,8 +170,8 @@ def save_html_plot(fig, column_name, plot_type='distribution', index=None, filen
             
         html_path = plots_folder / html_filename
         
-        # Add a div with the raw data in JSON format (helps with extraction)
-        plot_data = fig.to_json()
+        # Compact figure JSON, stored once in a JSON script block (helps with extraction)
+        plot_data = pio.to_json(fig, validate=False).replace('</', '<\\/')
         
         # Create custom HTML with embedded data for easier extraction
         custom_html = f"""
@@ -191,9 +185,7 @@ def save_html_plot(fig, column_name, plot_type='distribution', index=None, filen
             <div id="plot-div" style="width: 800px; height: 500px;"></div>
             
             <!-- Data storage for PDF extraction -->
-            <div id="plot-data" style="display:none;">
-                {plot_data}
-            </div>
+            <script type="application/json" id="plot-data">{plot_data}</script>
             
             <script>
                 var plotData = JSON.parse(document.getElementById('plot-data').textContent);
@@ -221,12 +213,10 @@ def analyze_csv(request):
             try:
                 # Read CSV file
                 csv_file = form.cleaned_data['csv_file']
-                df = pd.read_csv(csv_file)
-                
-                # Store DataFrame in session
-                request.session['csv_data'] = df.to_json(orient='split')
-                request.session['filename'] = csv_file.name
-                request.session.modified = True  # Mark session as modified
+
+                # Stream the file into the store and keep only its id in the session
+                dataset = store_session_upload(request, csv_file)
+                stored = open_dataset(dataset)
                     
                 
 
@@ -235,9 +225,9 @@ def analyze_csv(request):
                
                 context = {
                     'form': form,
-                    'columns': df.columns.tolist(),
-                    'numeric_columns': [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])],
-                    'categorical_columns': [col for col in df.columns if not pd.api.types.is_numeric_dtype(df[col])],
+                    'columns': stored.columns,
+                    'numeric_columns': [col for col in stored.columns if stored.column_kind(col) in ('numeric', 'bool')],
+                    'categorical_columns': [col for col in stored.columns if stored.column_kind(col) not in ('numeric', 'bool')],
                 }
                 
                 
@@ -253,6 +243,30 @@ def analyze_csv(request):
     
     return render(request, 'stats/upload.html', {'form': form})
 
+def _value_index_page(request, index):
+    """
+    Page of a column's distinct values for a filter picker.
+
+    Query parameters: ``q`` (prefix, case-insensitive), ``order``
+    ('frequency', the default, or 'value'), ``cursor`` (the ``next_cursor``
+    of the previous page) and ``limit``. Without ``limit`` a page holds
+    ``DEFAULT_PAGE_SIZE`` values; pickers load the following pages with
+    ``next_cursor`` (see static/js/value_picker.js).
+
+    Returns:
+        dict: ``values`` (as strings) with their ``counts``, ``total``,
+        ``next_cursor`` and ``missing`` (rows without a value)
+    """
+    page = index.page(
+        prefix=request.GET.get('q', ''),
+        order=request.GET.get('order', 'frequency'),
+        cursor=request.GET.get('cursor') or 0,
+        limit=request.GET.get('limit') or DEFAULT_PAGE_SIZE,
+    )
+    page['missing'] = index.missing
+    return page
+
+
 def get_unique_values(request):
     if request.method == "GET":
         try:
@@ -260,22 +274,18 @@ def get_unique_values(request):
             if not column:
                 return JsonResponse({'error': 'No column specified'}, status=400)
             
-            # Get data from session
-            data_json = request.session.get('csv_data')
-            if not data_json:
+            dataset = get_session_dataset(request)
+            if dataset is None:
                 return JsonResponse({'error': 'No data found in session'}, status=400)
-            
-            df = pd.read_json(io.StringIO(data_json), orient='split')
-            
-            if column not in df.columns:
+
+            stored = open_dataset(dataset)
+            if not stored.has_column(column):
                 return JsonResponse({
                     'error': f'Column "{column}" not found'
                 }, status=400)
             
-            # Get unique values
-            unique_values = df[column].astype(str).unique().tolist()[:100]
-            
-            return JsonResponse({'values': unique_values})
+            # One page of the column's distinct-value index, built when the dataset was stored
+            return JsonResponse(_value_index_page(request, stored.value_index(column)))
             
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
@@ -338,49 +348,68 @@ def get_unique_values(request):
     
 #     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
+@gzip_page
 def apply_global_filters(request):
     if request.method == "POST":
         try:
             filters = json.loads(request.POST.get('filters', '[]'))
             logic = request.POST.get('logic', 'AND').upper()
             
-            csv_json = request.session.get('csv_data')
-            if not csv_json:
+            dataset = get_session_dataset(request)
+            if dataset is None:
                 return JsonResponse({'error': 'No data found in session'}, status=400)
             
-            df = pd.read_json(io.StringIO(csv_json), orient='split')
-            
-            # Apply global filters
-            query_parts = []
-            for filt in filters:
-                column = filt.get('column')
-                values = filt.get('values', [])
-                if column and values:
-                    quoted_vals = ", ".join(["'{}'".format(v) for v in values])
-                    query_parts.append("`{}` in ({})".format(column, quoted_vals))
-            
-            if query_parts:
-                query_str = (" " + logic + " ").join(query_parts)
-                try:
-                    filtered_df = df.query(query_str)
-                except Exception as e:
-                    return JsonResponse({'error': 'Query error: ' + str(e)}, status=400)
+            # Apply global filters: one mask per filter, combined with the chosen logic
+            terms = [ValueFilter(filt['column'], filt['values']) for filt in filters
+                     if filt.get('column') and filt.get('values')]
+            stored = open_dataset(dataset)
+            # Large datasets are filtered and aggregated in SQL, out of memory
+            # (see filter_plot); the SQLite copy only has the stored columns
+            if use_sql_backend(dataset) and not any(stored.derived_column(term.column_name) for term in terms):
+                store = open_sql_store(dataset)
+                sql_terms = [AnyOf(terms)] if logic == 'OR' and terms else terms
+                mask = store.row_mask(sql_terms)
+            else:
+                store = None
+                filter_columns = list(dict.fromkeys(term.column_name for term in terms))
+                # Term masks are shared across requests on the same dataset
+                masks = FilterMasks(load_dataframe(dataset, filter_columns), fingerprint=dataset.fingerprint)
+                mask = masks.combine(terms, logic='or' if logic == 'OR' else 'and')
+
+            # Keep the filtered view as a row bitmap over the stored dataset
+            request.session.pop('filtered_data', None)
+            if terms:
+                store_session_selection(request, dataset, mask, filters)
+            else:
+                clear_session_selection(request)
+
+            # Bins of numeric columns, value counts of the others, over the filtered rows
+            aggregates = {}
+            if store is not None:
+                for col in store.columns:
+                    if store.column_kind(col) in ('numeric', 'bool'):
+                        aggregates[col] = ('histogram', store.histogram(col, sql_terms))
+                    else:
+                        aggregates[col] = ('counts', store.value_counts(col, sql_terms))
             else:
-                filtered_df = df
+                df = load_dataframe(dataset)
+                filtered_df = df[mask] if terms else df
+                for col in filtered_df.columns:
+                    if pd.api.types.is_numeric_dtype(filtered_df[col]):
+                        aggregates[col] = ('histogram', histogram_bins(filtered_df[col]))
+                    else:
+                        aggregates[col] = ('counts', observed_value_counts(filtered_df[col]))
 
-            # Store the filtered DataFrame in the session
-            request.session['filtered_data'] = filtered_df.to_json(orient='split')
-            
             # Generate plots using the filtered data
             plots = {}
-            for col in filtered_df.columns:
-                if pd.api.types.is_numeric_dtype(filtered_df[col]):
-                    fig = px.histogram(filtered_df, x=col, title=f"Distribution of {col}")
+            for col, (kind, aggregate) in aggregates.items():
+                if kind == 'histogram':
+                    fig = binned_histogram_figure(aggregate, title=f"Distribution of {col}", x_title=str(col))
                 else:
-                    counts = filtered_df[col].value_counts().reset_index()
+                    counts = aggregate.reset_index()
                     counts.columns = [col, 'count']
                     fig = px.bar(counts, x=col, y='count', title=f"Distribution of {col}")
-                plots[col] = fig.to_html(full_html=False)
+                plots[col] = figure_payload(fig)
             
             return JsonResponse({'plots': plots})
             
@@ -394,12 +423,11 @@ def get_column_types(request):
         target = request.GET.get('target')
         compare_column = request.GET.get('compare_column')
         
-        data_json = request.session.get('filtered_data') or request.session.get('csv_data')
-        if not data_json:
+        # Column types do not depend on the active filters
+        df = load_session_dataframe(request, [target, compare_column])
+        if df is None:
             return JsonResponse({'error': 'No data found'}, status=400)
         
-        df = pd.read_json(io.StringIO(data_json), orient='split')
-        
         column_types = {
             'target': 'numeric' if pd.api.types.is_numeric_dtype(df[target]) else 'categorical',
             'compare': 'numeric' if pd.api.types.is_numeric_dtype(df[compare_column]) else 'categorical'
@@ -409,6 +437,34 @@ def get_column_types(request):
     
     return JsonResponse({'error': 'Invalid request method'}, status=400)
 
+def _sql_group_store(request, columns, target, agg_method):
+    """
+    SQL copy to group a comparison in, or None to group the loaded rows.
+
+    Large datasets are grouped in SQL when no filter is active (the filtered
+    view is a row bitmap the SQL copy cannot use) and the aggregation exists
+    in SQL.
+    """
+    dataset = get_session_dataset(request)
+    if dataset is None or not use_sql_backend(dataset) or get_session_selection(request, dataset) is not None:
+        return None
+    stored = open_dataset(dataset)
+    if not all(col in stored.columns for col in columns) or stored.column_kind(target) == 'bool':
+        return None
+    if stored.column_kind(target) == 'numeric' and agg_method not in SQL_AGGREGATES:
+        return None
+    return open_sql_store(dataset)
+
+
+def _grouped(df, store, by, column=None, agg='count'):
+    """``df.groupby(by)`` aggregate (row counts without ``column``), computed in SQL when ``store`` is given."""
+    if store is not None:
+        return store.grouped(by, column=column, agg=agg)
+    if column is None:
+        return df.groupby(by, observed=True).size().reset_index(name='count')
+    return df.groupby(by, observed=True)[column].agg(agg).reset_index()
+
+
 def compare_plot(request):
     if request.method == "GET":
         try:
@@ -418,31 +474,37 @@ def compare_plot(request):
             agg_method = request.GET.get('agg_method', 'mean')
             color_column = request.GET.get('color_column')
             
-            data_json = request.session.get('filtered_data') or request.session.get('csv_data')
-            if not data_json:
+            # Only the plotted columns are loaded; active filters are applied to them.
+            # Bar charts only need the groups, which large datasets compute in SQL
+            columns = [col for col in [target, compare_column, color_column] if col]
+            store = _sql_group_store(request, columns, target, agg_method) if plot_type == 'bar' else None
+            df = load_session_selection(request, columns) if store is None else None
+            if df is None and store is None:
                 return JsonResponse({'error': 'No data found'}, status=400)
             
-            df = pd.read_json(io.StringIO(data_json), orient='split')
-            
             # Determine column types
-            target_is_numeric = pd.api.types.is_numeric_dtype(df[target])
-            compare_is_numeric = pd.api.types.is_numeric_dtype(df[compare_column])
+            if store is not None:
+                target_is_numeric = store.column_kind(target) == 'numeric'
+                compare_is_numeric = store.column_kind(compare_column) in ('numeric', 'bool')
+            else:
+                target_is_numeric = pd.api.types.is_numeric_dtype(df[target])
+                compare_is_numeric = pd.api.types.is_numeric_dtype(df[compare_column])
             
             if plot_type == 'bar':
                 if target_is_numeric:
                     if color_column:
                         # Group by both comparison column and color column
-                        agg_df = df.groupby([compare_column, color_column])[target].agg(agg_method).reset_index()
+                        agg_df = _grouped(df, store, [compare_column, color_column], target, agg_method)
                         fig = px.bar(agg_df, x=compare_column, y=target, color=color_column,
                                    barmode='group',
                                    title=f"{target} by {compare_column} grouped by {color_column} ({agg_method})")
                     else:
-                        agg_df = df.groupby(compare_column)[target].agg(agg_method).reset_index()
+                        agg_df = _grouped(df, store, [compare_column], target, agg_method)
                         fig = px.bar(agg_df, x=compare_column, y=target,
                                    title=f"{target} by {compare_column} ({agg_method})")
                 else:
                     # For categorical target, count occurrences
-                    counts = df.groupby([compare_column, target]).size().reset_index(name='count')
+                    counts = _grouped(df, store, [compare_column, target])
                     fig = px.bar(counts, x=compare_column, y='count', color=target,
                                barmode='group',
                                title=f"Count of {target} by {compare_column}")
@@ -560,6 +622,10 @@ def compare_plot(request):
                     fig = px.scatter(df, x=target, y=compare_column,
                                    color=color_column,
                                    title=f"{target} vs {compare_column} (colored by {color_column})")
+                elif target_is_numeric and compare_is_numeric and len(df) > SCATTER_MAX_POINTS:
+                    # Binned on the server rather than sending every point
+                    fig = density_figure(df[target], df[compare_column],
+                                         title=f"{target} vs {compare_column}")
                 else:
                     fig = px.scatter(df, x=target, y=compare_column,
                                    title=f"{target} vs {compare_column}")
@@ -589,25 +655,24 @@ def compare_plot(request):
 def reset_filters(request):
     if request.method == "POST":
         try:
-            # Remove the filtered data from session
-            if 'filtered_data' in request.session:
-                del request.session['filtered_data']
+            # Remove the filtered view from the session
+            request.session.pop('filtered_data', None)
+            clear_session_selection(request)
             
             # Return original plots
-            csv_json = request.session.get('csv_data')
-            if not csv_json:
+            df = load_session_dataframe(request)
+            if df is None:
                 return JsonResponse({'error': 'No data found in session'}, status=400)
             
-            df = pd.read_json(io.StringIO(csv_json), orient='split')
             plots = {}
             for col in df.columns:
                 if pd.api.types.is_numeric_dtype(df[col]):
-                    fig = px.histogram(df, x=col, title=f"Distribution of {col}")
+                    fig = histogram_figure(df[col], title=f"Distribution of {col}")
                 else:
                     counts = df[col].value_counts().reset_index()
                     counts.columns = [col, 'count']
                     fig = px.bar(counts, x=col, y='count', title=f"Distribution of {col}")
-                plots[col] = fig.to_html(full_html=False)
+                plots[col] = figure_payload(fig)
             
             return JsonResponse({'plots': plots})
             
@@ -621,29 +686,15 @@ def upload_file(request):
         try:
             file = request.FILES['file']
             if file.name.endswith('.csv'):
-                # Read the CSV file
-                df = pd.read_csv(file)
-                
-                # Store the original data in session
-                request.session['csv_data'] = df.to_json(orient='split')
+                # Stream the CSV file into the store and keep its id in the session
+                dataset = store_session_upload(request, file)
+                df = load_dataframe(dataset)
                 
                 # Store column information
                 request.session['columns'] = df.columns.tolist()
                 
-                # Store filename for later use
-                request.session['filename'] = file.name
-                
                 # Generate initial plots
-                plots = {}
-                for col in df.columns:
-                    if pd.api.types.is_numeric_dtype(df[col]):
-                        fig = px.histogram(df, x=col, title=f"Distribution of {col}")
-                    else:
-                        value_counts = df[col].value_counts()
-                        fig = px.bar(x=value_counts.index, 
-                                    y=value_counts.values,
-                                    title=f"Distribution of {col}")
-                    plots[col] = fig.to_html(full_html=False)
+                plots = build_column_plots(df, df.columns, distribution_plot)
                 
                 # Store the plots in session
                 request.session['plots'] = plots
@@ -661,26 +712,15 @@ def upload_file(request):
 def analysis(request):  # or whatever your analysis view is named
     try:
         # Get data from session
-        data_json = request.session.get('csv_data')
-        if not data_json:
+        df = load_session_dataframe(request)
+        if df is None:
             return redirect('upload')  # or your upload page URL
         
-        df = pd.read_json(io.StringIO(data_json), orient='split')
-        
         # Get filename for client-side plot saving
         filename = request.session.get('filename', 'data.csv')
         
         # Generate plots
-        plots = {}
-        for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                fig = px.histogram(df, x=col, title=f"Distribution of {col}")
-            else:
-                value_counts = df[col].value_counts()
-                fig = px.bar(x=value_counts.index, 
-                            y=value_counts.values,
-                            title=f"Distribution of {col}")
-            plots[col] = fig.to_html(full_html=False, include_plotlyjs='cdn')
+        plots = build_column_plots(df, df.columns, functools.partial(distribution_plot, include_plotlyjs='cdn'))
         
         context = {
             'plots': plots,
@@ -708,21 +748,13 @@ def analyze_file(request):
             file = request.FILES['file']
             
             # Read the file into a DataFrame
-            if file.name.endswith('.csv'):
-                df = pd.read_csv(file)
-            elif file.name.endswith(('.xls', '.xlsx')):
-                df = pd.read_excel(file)
-            else:
+            if not is_supported_upload(file.name):
                 return JsonResponse({'error': 'Unsupported file format'}, status=400)
+            # Stream the file into the store and keep only its id in the session
+            dataset = store_session_upload(request, file)
+            df = load_dataframe(dataset)
             
-            # Store DataFrame in session in multiple formats to ensure compatibility
-            request.session['df_json'] = df.to_json()
-            request.session['filename'] = file.name
-            
-            # Also save as csv_data format used by other functions
-            request.session['csv_data'] = df.to_json(orient='split')
-            
-            logger.info(f"DataFrame stored in session with keys: df_json, csv_data. Shape: {df.shape}")
+            logger.info(f"Dataset {dataset.id} attached to session. Shape: {df.shape}")
             
             # Generate insights
             insights = generate_donor_insights(df)
@@ -812,69 +844,87 @@ def save_client_plot(request):
     
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
+def _selected_column_stats(column):
+    """Statistics shown under a plot, read from the column's profile."""
+    if column['kind'] == 'numeric':
+        return {
+            'mean': column['mean'],
+            'median': column['median'],
+            'std': column['std'],
+            'min': column['min'],
+            'max': column['max'],
+            'missing': column['missing'],
+            'type': 'numeric'
+        }
+    return {
+        'unique': column['unique_count'],
+        'top_values': {str(label): count for label, count in column['top_values'][:5]},
+        'missing': column['missing'],
+        'type': 'categorical'
+    }
+
+
 def get_selected_plots(request):
     """Get plots for selected columns."""
     if request.method == "GET":
-        time_now = datetime.now()
-        print(f"get_selected_plots function called at {time_now}")
+        started = datetime.now()
         try:
             columns = request.GET.getlist('columns[]')
             if not columns:
                 return JsonResponse({'error': 'No columns specified'}, status=400)
             
-            # Get data from session
-            data_json = request.session.get('csv_data')
-            if not data_json:
+            # Get the dataset attached to the session
+            dataset = get_session_dataset(request)
+            if dataset is None:
                 return JsonResponse({'error': 'No data found in session'}, status=400)
             
-            df = pd.read_json(io.StringIO(data_json), orient='split')
-            
+            # Column statistics come from the profile computed at upload time
+            profile = get_dataset_profile(dataset)
+            columns = [col for col in columns if str(col) in profile['columns']]
+            stats = {col: _selected_column_stats(profile['columns'][str(col)]) for col in columns}
+
+            # Figures already drawn for this dataset version come from the plot
+            # cache; only the remaining columns are loaded and plotted
+            plot_results = iter_cached_column_plots(
+                columns,
+                generate_plot_figure,
+                cache_key=lambda col: plot_cache_key(dataset.fingerprint, [col], 'distribution'),
+                load_frame=lambda missing: load_dataframe(dataset, missing),
+                # Large datasets are aggregated in SQL rather than loaded
+                plot_missing=(lambda missing: iter_store_column_plots(open_sql_store(dataset), missing, generate_store_plot_figure))
+                if use_sql_backend(dataset) else None
+            )
+
+            # Plots are built in parallel. With ?stream=1 every plot is sent as
+            # one JSON line as soon as it is ready, so the page fills in
+            # progressively instead of waiting for the slowest column. The
+            # stream is not gzipped: the compressor would hold lines back.
+            if request.GET.get('stream'):
+                def stream():
+                    for col, result, error in plot_results:
+                        if error is not None:
+                            yield json.dumps({'column': col, 'error': error}) + '\n'
+                            continue
+                        figure, type = result
+                        message = {'column': col, 'plot': {'figure': figure, 'type': type}, 'stats': stats[col]}
+                        yield json.dumps(message, cls=DjangoJSONEncoder) + '\n'
+
+                response = StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+                response['X-Accel-Buffering'] = 'no'
+                return response
+
             # Generate plots for selected columns
+            results = {col: result for col, result, error in plot_results if error is None}
             plots = {}
-            stats = {}
-           
             for col in columns:
-                if col in df.columns:
-                    logger.debug(f"Generating plot for column: {col}")
-                    
-                    
-                    # Convert to JSON for client-side rendering
-                    
-                    html ,type =generate_plot(df,col)
-                    
-                    # Store both the JSON and HTML versions
+                if col in results:
+                    figure, type = results[col]
                     plots[col] = {
-                        'html': html,
+                        'figure': figure,
                         'type': type
                     }
-                    
-                    # Generate statistics
-                    if pd.api.types.is_numeric_dtype(df[col]):
-                        stats[col] = {
-                            'mean': float(df[col].mean()) if not pd.isna(df[col].mean()) else None,
-                            'median': float(df[col].median()) if not pd.isna(df[col].median()) else None,
-                            'std': float(df[col].std()) if not pd.isna(df[col].std()) else None,
-                            'min': float(df[col].min()) if not pd.isna(df[col].min()) else None,
-                            'max': float(df[col].max()) if not pd.isna(df[col].max()) else None,
-                            'missing': int(df[col].isna().sum()),
-                            'type': 'numeric'
-                        }
-                    else:
-                        value_counts = df[col].value_counts().head(5).to_dict()
-                        # Convert keys to strings for JSON serialization
-                        value_counts = {str(k): int(v) for k, v in value_counts.items()}
-                        
-                        stats[col] = {
-                            'unique': int(df[col].nunique()),
-                            'top_values': value_counts,
-                            'missing': int(df[col].isna().sum()),
-                            'type': 'categorical'
-                        }
-            
-            print(f"plots are sending")
-            time_after = datetime.now()
-            print(f"plots are finished at {time_after.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(f"time taken: {time_after - time_now}")
+            
+            logger.debug(f"Plots for {len(plots)} columns built in {datetime.now() - started}")
             return JsonResponse({
                 'plots': plots,
                 'stats': stats
@@ -892,12 +942,8 @@ def generate_plot_for_column(df, column):
     try:
         if pd.api.types.is_numeric_dtype(df[column]):
             # For numeric columns, create a histogram
-            fig = px.histogram(
-                df, 
-                x=column,
-                title=f"Distribution of {column}",
-                height=500
-            )
+            fig = histogram_figure(df[column], title=f"Distribution of {column}")
+            fig.update_layout(height=500)
         else:
             # For categorical columns, create a bar chart
             value_counts = df[column].value_counts().head(30)
@@ -939,38 +985,17 @@ def get_column_values(request):
         if not column:
             return JsonResponse({'error': 'No column specified'}, status=400)
             
-        # Get the DataFrame from session
-        data_sources = [
-            ('df_json', lambda x: pd.read_json(x)),
-            ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-            ('dataframe', lambda x: pd.read_json(x))
-        ]
-        
-        df = None
-        for key, loader in data_sources:
-            data = request.session.get(key)
-            if data:
-                try:
-                    df = loader(data)
-                    break
-                except Exception as e:
-                    logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
+        dataset = get_session_dataset(request)
         
-        if df is None:
+        if dataset is None:
             return JsonResponse({'error': 'No data available'}, status=400)
-            
-        if column not in df.columns:
+
+        stored = open_dataset(dataset)
+        if not stored.has_column(column):
             return JsonResponse({'error': f'Column {column} not found in data'}, status=400)
             
-        # Get unique values, limited to 100 to prevent overwhelming the UI
-        unique_values = df[column].dropna().unique().tolist()
-        if len(unique_values) > 100:
-            unique_values = unique_values[:100]
-            
-        # Convert non-string values to strings for JSON
-        unique_values = [str(val) for val in unique_values]
-            
-        return JsonResponse({'values': unique_values})
+        # Pages of distinct values keep dropdowns small on high-cardinality columns
+        return JsonResponse(_value_index_page(request, stored.value_index(column)))
         
     except Exception as e:
         logger.error(f"Error getting column values: {str(e)}")
@@ -985,22 +1010,8 @@ def get_column_types(request):
         if not target_column or not compare_column:
             return JsonResponse({'error': 'Missing required parameters'}, status=400)
             
-        # Get the DataFrame from session
-        data_sources = [
-            ('df_json', lambda x: pd.read_json(x)),
-            ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-            ('dataframe', lambda x: pd.read_json(x))
-        ]
-        
-        df = None
-        for key, loader in data_sources:
-            data = request.session.get(key)
-            if data:
-                try:
-                    df = loader(data)
-                    break
-                except Exception as e:
-                    logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
+        # Get the needed columns from the session dataset
+        df = load_session_dataframe(request, [target_column, compare_column])
         
         if df is None:
             return JsonResponse({'error': 'No data available'}, status=400)
@@ -1024,6 +1035,7 @@ def get_column_types(request):
         logger.error(f"Error getting column types: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@gzip_page
 def filter_plot(request):
     """Filter a plot by column values"""
     try:
@@ -1033,48 +1045,52 @@ def filter_plot(request):
         filter_values = request.GET.getlist('filter_values[]') # values
         filter_column = request.GET.get('filter_column') #filter_column
         
-        print(f"filter_mode: {filter_mode}")
-        print(f"target_column: {target_column}")
-        print(f"condition: {condition}")
-        print(f"filter_values: {filter_values}")
-        print(f"filter_column: {filter_column}")
+        logger.debug(f"filter_plot: mode={filter_mode} target={target_column} condition={condition} "
+                     f"values={filter_values} filter_column={filter_column}")
         
         if not target_column or not filter_mode:
             return JsonResponse({'error': 'Missing required parameters'}, status=400)
             
-        # Get the DataFrame from session
-        data_sources = [
-            ('df_json', lambda x: pd.read_json(x)),
-            ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-            ('dataframe', lambda x: pd.read_json(x))
-        ]
-        
-        df = None
-        for key, loader in data_sources:
-            data = request.session.get(key)
-            if data:
-                try:
-                    df = loader(data)
-                    break
-                except Exception as e:
-                    logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
-        
-        if df is None:
+        dataset = get_session_dataset(request)
+        if dataset is None:
             return JsonResponse({'error': 'No data available'}, status=400)
-            
-        # Filter dataframe based on mode
-        data_tracker = DataTracker(df)
-        html, row_count = data_tracker.add_filter(filter_mode, target_column, condition, filter_values, filter_column)
-        print(f"row_count: {row_count}")
-        return JsonResponse({
-            'html': html,
-            'row_count': row_count
-        })
+
+        needed_columns = [target_column, filter_column] if filter_column else [target_column]
+        filters = [{
+            'mode': filter_mode,
+            'column': target_column,
+            'condition': condition,
+            'values': filter_values,
+            'filter_column': filter_column
+        }]
+
+        def build():
+            stored = open_dataset(dataset)
+            # Large datasets are filtered and aggregated in SQL, out of memory; the
+            # SQLite copy only has the stored columns, so derived ones use pandas
+            if use_sql_backend(dataset) and not any(stored.derived_column(column) for column in needed_columns):
+                data_tracker = SQLDataTracker(open_sql_store(dataset))
+            else:
+                # Get the needed columns from the session dataset
+                df = load_dataframe(dataset, needed_columns)
+                data_tracker = DataTracker(df, dataset.fingerprint)
+
+            # Filter based on mode
+            fig, row_count = data_tracker.apply_filter(filter_mode, target_column, condition, filter_values, filter_column)
+            if fig is None:
+                return {'figure': None, 'html': NO_MATCHING_ROWS_HTML, 'row_count': row_count}
+            return {'figure': figure_payload(fig), 'row_count': row_count}
+
+        key = plot_cache_key(dataset.fingerprint, needed_columns, 'filter', filters=filters)
+        result = get_plot_cache().get_or_build(key, build)
+        logger.debug(f"filter_plot: {result['row_count']} matching rows")
+        return JsonResponse(result)
         
     except Exception as e:
         logger.error(f"Error filtering plot: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+@gzip_page
 def compare_columns(request):
     """Create a comparison plot between two columns"""
     try:
@@ -1087,40 +1103,48 @@ def compare_columns(request):
         if not target_column or not compare_column:
             return JsonResponse({'error': 'Missing target or comparison column'}, status=400)
 
-        # Get the DataFrame from session
-        df = None
-        data_sources = [
-            ('df_json', lambda x: pd.read_json(x)),
-            ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-            ('dataframe', lambda x: pd.read_json(x))
-        ]
-        
-        for key, loader in data_sources:
-            if data := request.session.get(key):
-                try:
-                    df = loader(data)
-                    break
-                except Exception as e:
-                    logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
-
-        if df is None or df.empty:
+        dataset = get_session_dataset(request)
+        if dataset is None or not dataset.row_count:
             return JsonResponse({'error': 'No valid data available'}, status=400)
 
-        # Validate columns exist in DataFrame
+        # Serve the figure from the plot cache when it was already drawn
+        key = plot_cache_key(dataset.fingerprint, [target_column, compare_column], 'comparison', variant=plot_type)
+        figure = get_plot_cache().get(key)
+        if figure is not None:
+            return JsonResponse({'figure': figure})
+
+        # Validate columns exist in the dataset
+        stored = open_dataset(dataset)
         missing_cols = [col for col in [target_column, compare_column] 
-                       if col and col not in df.columns]
+                       if col and not stored.has_column(col)]
         if missing_cols:
             return JsonResponse({'error': f"Columns not found: {', '.join(missing_cols)}"}, status=400)
 
+        columns = list(dict.fromkeys([target_column, compare_column]))
+        if use_sql_backend(dataset) and not any(stored.derived_column(col) for col in columns):
+            # Large datasets are compared on a sample drawn in SQL
+            df = open_sql_store(dataset).sample(columns, get_max_samples())
+            sample_key = None
+        else:
+            # Get the needed columns from the session dataset
+            df = load_dataframe(dataset, columns)
+            # Samples of large datasets are drawn once per dataset and shared by comparisons
+            sample_key = dataset.fingerprint
+
+        if df.empty:
+            return JsonResponse({'error': 'No valid data available'}, status=400)
+
         # Generate comparison plot
-        comparison_tracker = ComparisonTracker(df)
-        html = comparison_tracker.get_comparison_plot(
+        comparison_tracker = ComparisonTracker(df, sample_key=sample_key)
+        fig = comparison_tracker.get_comparison_figure(
             col1=target_column,
             col2=compare_column,
             plot_type=plot_type if plot_type != 'auto' else None,
         )
+        figure = figure_payload(fig)
+        get_plot_cache().set(key, figure)
         
-        return JsonResponse({'plot_html': html})
+        return JsonResponse({'figure': figure})
 
     except Exception as e:
         logger.error(f"Comparison error: {str(e)}\n{traceback.format_exc()}")
@@ -1133,113 +1157,60 @@ def transform_column(request):
         
         if not target_column or not transform_type:
             return JsonResponse({'error': 'Missing required parameters'}, status=400)
+
+        if transform_type not in TRANSFORMS:
+            return JsonResponse({'error': f'Unknown transformation: {transform_type}'}, status=400)
         
         logger.info(f"Applying transformation {transform_type} to column {target_column}")
         
-        # Get the DataFrame from session
-        data_sources = [
-            ('df_json', lambda x: pd.read_json(x)),
-            ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-            ('dataframe', lambda x: pd.read_json(x))
-        ]
-        
-        df = None
-        for key, loader in data_sources:
-            data = request.session.get(key)
-            if data:
-                try:
-                    df = loader(data)
-                    break
-                except Exception as e:
-                    logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
+        dataset = get_session_dataset(request)
         
-        if df is None:
+        if dataset is None:
             return JsonResponse({'error': 'No data available'}, status=400)
+
+        stored = open_dataset(dataset)
             
         # Check if column exists
-        if target_column not in df.columns:
+        if target_column not in stored.columns:
             return JsonResponse({'error': f'Column {target_column} not found in data'}, status=400)
             
         # Check if column is numeric
-        if not pd.api.types.is_numeric_dtype(df[target_column]):
+        if stored.column_kind(target_column) not in ('numeric', 'bool'):
             return JsonResponse({'error': f'Column {target_column} is not numeric and cannot be transformed'}, status=400)
+
+        # The transformed values are a derived column: computed once, cached with
+        # the dataset and usable by name in filters and comparisons
+        try:
+            derived = DerivedColumn(target_column, transform_type, request.GET.get('bins', DEFAULT_BINS))
+            frame = load_dataframe(dataset, [target_column, derived.name])
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        transformed = frame[derived.name]
+        source_profile = stored.profile()['columns'].get(str(target_column))
+        transform_name = derived.label(source_statistics(frame[target_column], source_profile))
+
+        # Statistics of the transformed values, in one pass
+        profile = profile_column(transformed)
         
-        # Make a copy to avoid modifying the original
-        df_copy = df.copy()
-        
-        # Apply transformation
-        if transform_type == 'log':
-            # Handle zero and negative values
-            min_value = df_copy[target_column].min()
-            if min_value <= 0:
-                offset = abs(min_value) + 1
-                df_copy[target_column] = np.log(df_copy[target_column] + offset)
-                transform_name = f"Log({target_column} + {offset})"
-            else:
-                df_copy[target_column] = np.log(df_copy[target_column])
-                transform_name = f"Log({target_column})"
-                
-        elif transform_type == 'sqrt':
-            # Handle negative values
-            min_value = df_copy[target_column].min()
-            if min_value < 0:
-                offset = abs(min_value)
-                df_copy[target_column] = np.sqrt(df_copy[target_column] + offset)
-                transform_name = f"Sqrt({target_column} + {offset})"
-            else:
-                df_copy[target_column] = np.sqrt(df_copy[target_column])
-                transform_name = f"Sqrt({target_column})"
-                
-        elif transform_type == 'standardize':
-            mean = df_copy[target_column].mean()
-            std = df_copy[target_column].std()
-            if std > 0:
-                df_copy[target_column] = (df_copy[target_column] - mean) / std
-                transform_name = f"Standardized {target_column}"
-            else:
-                return JsonResponse({'error': 'Standard deviation is zero, cannot standardize'}, status=400)
-                
-        elif transform_type == 'minmax':
-            min_val = df_copy[target_column].min()
-            max_val = df_copy[target_column].max()
-            if max_val > min_val:
-                df_copy[target_column] = (df_copy[target_column] - min_val) / (max_val - min_val)
-                transform_name = f"Min-Max Scaled {target_column}"
-            else:
-                return JsonResponse({'error': 'Max and min values are equal, cannot scale'}, status=400)
-                
-        elif transform_type == 'bin':
-            bins = int(request.GET.get('bins', 5))
-            df_copy[target_column] = pd.cut(df_copy[target_column], bins=bins, labels=False)
-            transform_name = f"{target_column} (Binned to {bins} groups)"
-            
-        else:
-            return JsonResponse({'error': f'Unknown transformation: {transform_type}'}, status=400)
-        
-        # Generate plot with the transformed data
-        fig = None
-        
-        # Check if it's categorical after transformation
-        if pd.api.types.is_categorical_dtype(df_copy[target_column]) or df_copy[target_column].nunique() < 15:
-            # Create a categorical plot
-            value_counts = df_copy[target_column].value_counts().reset_index()
-            value_counts.columns = [target_column, 'count']
+        # Few distinct values (e.g. bins) are drawn as categories
+        if profile['unique_count'] < 15:
+            value_counts = transformed.value_counts().reset_index()
+            value_counts.columns = [derived.name, 'count']
             
             fig = px.bar(
                 value_counts, 
-                x=target_column, 
+                x=derived.name, 
                 y='count',
                 title=f"Distribution of {transform_name}",
-                labels={target_column: transform_name, 'count': 'Count'}
+                labels={derived.name: transform_name, 'count': 'Count'}
             )
         else:
             # Create numeric distribution
-            fig = px.histogram(
-                df_copy, 
-                x=target_column,
+            fig = histogram_figure(
+                transformed,
                 title=f"Distribution of {transform_name}",
-                labels={target_column: transform_name},
-                marginal="box"  # Add box plot on the marginal
+                x_title=transform_name,
+                box=True  # Add box plot on the marginal
             )
         
         # Add explanatory text
@@ -1263,20 +1234,16 @@ def transform_column(request):
         # Generate plot HTML
         plot_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
         
-        # Calculate basic stats for the transformed column
-        stats = {
-            'mean': float(df_copy[target_column].mean()) if not pd.api.types.is_categorical_dtype(df_copy[target_column]) else None,
-            'median': float(df_copy[target_column].median()) if not pd.api.types.is_categorical_dtype(df_copy[target_column]) else None,
-            'std': float(df_copy[target_column].std()) if not pd.api.types.is_categorical_dtype(df_copy[target_column]) else None,
-            'min': float(df_copy[target_column].min()) if not pd.api.types.is_categorical_dtype(df_copy[target_column]) else None,
-            'max': float(df_copy[target_column].max()) if not pd.api.types.is_categorical_dtype(df_copy[target_column]) else None,
-            'missing_count': int(df_copy[target_column].isna().sum()),
-            'missing_percent': float(df_copy[target_column].isna().mean() * 100)
-        }
+        stats = {key: profile.get(key) for key in ('mean', 'median', 'std', 'min', 'max')}
+        stats.update({
+            'missing_count': profile['missing'],
+            'missing_percent': profile['missing_percent'],
+        })
         
         return JsonResponse({
             'plot_html': plot_html,
             'transform_name': transform_name,
+            'column': derived.name,
             'stats': stats
         })
         
@@ -1286,43 +1253,24 @@ def transform_column(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 def export_column_data(request):
-    """Export column data as CSV"""
+    """Export column data as CSV, under the current filters"""
     try:
         column = request.GET.get('column')
         
         if not column:
             return JsonResponse({'error': 'No column specified'}, status=400)
         
-        # Get the DataFrame from session
-        data_sources = [
-            ('df_json', lambda x: pd.read_json(x)),
-            ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-            ('dataframe', lambda x: pd.read_json(x))
-        ]
-        
-        df = None
-        for key, loader in data_sources:
-            data = request.session.get(key)
-            if data:
-                try:
-                    df = loader(data)
-                    break
-                except Exception as e:
-                    logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
-        
-        if df is None:
+        dataset = get_session_dataset(request)
+        if dataset is None:
             return JsonResponse({'error': 'No data available'}, status=400)
-            
-        if column not in df.columns:
+        
+        stored = open_dataset(dataset)
+        if column not in stored.columns:
             return JsonResponse({'error': f'Column {column} not found in data'}, status=400)
-            
-        # Extract the column and generate CSV
-        df_export = df[[column]].copy()
         
-        # Convert to CSV
-        csv_buffer = io.StringIO()
-        df_export.to_csv(csv_buffer, index=False)
-        csv_data = csv_buffer.getvalue()
+        # Read in chunks from the store; file downloads go through export_dataset
+        chunks = iter_export_chunks(stored, [column], get_session_selection(request, dataset))
+        csv_data = b''.join(iter_csv(chunks)).decode('utf-8')
         
         return JsonResponse({'csv_data': csv_data})
         
@@ -1331,40 +1279,36 @@ def export_column_data(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 def get_correlation_matrix(request):
-    """Generate a correlation matrix plot"""
+    """
+    Generate a correlation matrix plot
+
+    Query parameters: ``columns`` (repeatable) adds columns to the numeric
+    ones, such as derived columns like ``log(amount)``.
+    """
     try:
-        # Get the DataFrame from session
-        data_sources = [
-            ('df_json', lambda x: pd.read_json(x)),
-            ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-            ('dataframe', lambda x: pd.read_json(x))
-        ]
-        
-        df = None
-        for key, loader in data_sources:
-            data = request.session.get(key)
-            if data:
-                try:
-                    df = loader(data)
-                    break
-                except Exception as e:
-                    logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
-        
-        if df is None:
+        dataset = get_session_dataset(request)
+        if dataset is None:
+            return JsonResponse({'error': 'No data available'}, status=400)
+        stored = open_dataset(dataset)
+        columns = stored.numeric_columns()
+        for column in request.GET.getlist('columns'):
+            if not stored.has_column(column):
+                return JsonResponse({'error': f'Column {column} not found in data'}, status=400)
+            if column not in columns:
+                columns.append(column)
+        
+        # Computed once per dataset and filter selection, then served from cache;
+        # an added column only computes its own coefficients
+        corr = get_session_correlation(request, columns)
+        if corr is None:
             return JsonResponse({'error': 'No data available'}, status=400)
-            
-        # Select only numeric columns
-        numeric_df = df.select_dtypes(include=['number'])
         
-        if numeric_df.shape[1] < 2:
+        if len(corr.columns) < 2:
             return JsonResponse({'error': 'Need at least 2 numeric columns to create correlation matrix'}, status=400)
-            
-        # Compute correlation matrix
-        corr_matrix = numeric_df.corr()
         
         # Create heatmap
         fig = px.imshow(
-            corr_matrix,
+            corr.to_frame(),
             text_auto='.2f',
             color_continuous_scale=px.colors.diverging.RdBu_r,
             title="Correlation Matrix of Numeric Variables"
@@ -1381,18 +1325,15 @@ def get_correlation_matrix(request):
         plot_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
         
         # Get column pairs with high correlation
-        high_corr_pairs = []
-        for i, col1 in enumerate(corr_matrix.columns):
-            for j, col2 in enumerate(corr_matrix.columns):
-                if i < j:  # Only look at upper triangle
-                    corr_value = corr_matrix.iloc[i, j]
-                    if abs(corr_value) > 0.7:  # High correlation threshold
-                        high_corr_pairs.append({
-                            'col1': col1,
-                            'col2': col2,
-                            'corr': float(corr_value),
-                            'type': 'positive' if corr_value > 0 else 'negative'
-                        })
+        high_corr_pairs = [
+            {
+                'col1': col1,
+                'col2': col2,
+                'corr': corr_value,
+                'type': 'positive' if corr_value > 0 else 'negative'
+            }
+            for col1, col2, corr_value in corr.pairs(0.7)  # High correlation threshold
+        ]
         
         return JsonResponse({
             'plot_html': plot_html,
@@ -1424,22 +1365,8 @@ def get_column_type(request):
     if not column:
         return JsonResponse({'error': 'No column specified'}, status=400)
     
-    # Get the DataFrame from session
-    data_sources = [
-        ('df_json', lambda x: pd.read_json(x)),
-        ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-        ('dataframe', lambda x: pd.read_json(x))
-    ]
-
-    df = None
-    for key, loader in data_sources:
-        data = request.session.get(key)
-        if data:
-            try:
-                df = loader(data)
-                break
-            except Exception as e:
-                logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
+    # Get the needed columns from the session dataset
+    df = load_session_dataframe(request, [column])
 
     if df is None:
         return JsonResponse({'error': 'No data available'}, status=400)
@@ -1461,22 +1388,8 @@ def get_column_types_compare(request):
     target_col = request.GET.get('target')
     compare_col = request.GET.get('compare_column')
 
-    # Get the DataFrame from session
-    data_sources = [
-        ('df_json', lambda x: pd.read_json(x)),
-        ('csv_data', lambda x: pd.read_json(io.StringIO(x), orient='split')),
-        ('dataframe', lambda x: pd.read_json(x))
-    ]
-
-    df = None
-    for key, loader in data_sources:
-        data = request.session.get(key)
-        if data:
-            try:
-                df = loader(data)
-                break
-            except Exception as e:
-                logger.warning(f"Could not load DataFrame from {key}: {str(e)}")
+    # Get the needed columns from the session dataset
+    df = load_session_dataframe(request, [target_col, compare_col])
     
     # Get column types using ComparisonTracker
     tracker = ComparisonTracker(df)
@@ -1520,13 +1433,13 @@ def get_column_types_compare(request):
 class AnalysisView(View):
     def get(self, request):
         # Get all available forms for analysis
-        forms = CustomForm.objects.all()
+        forms = CustomForm.objects.select_related('statistics')
         
-        # Add record count to each form
+        # Add record count to each form; kept up to date as records are submitted
         for form in forms:
             try:
-                form_data = get_form(form.name)
-                form.record_count = len(form_data)
+                statistics = getattr(form, 'statistics', None)
+                form.record_count = statistics.row_count if statistics else count_records(form.name)
             except:
                 form.record_count = 0
         
@@ -1563,15 +1476,12 @@ class AnalysisView(View):
         file_name = file.name
         
         # Check file extension
-        if file_name.endswith('.csv'):
-            df = pd.read_csv(file)
-        elif file_name.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(file)
-        else:
+        if not is_supported_upload(file_name):
             return JsonResponse({
                 'success': False,
                 'error': 'Unsupported file format. Please upload CSV or Excel file.'
             })
+        df, _ = read_upload(file)
         
         # Generate basic analysis
         analysis_results = self._analyze_dataframe(df)
@@ -1593,27 +1503,9 @@ class AnalysisView(View):
         
         try:
             form = CustomForm.objects.get(id=form_id)
-            form_name = form.name
-            form_data = get_form(form_name)
-            form_fields = get_form_fields(form_name)
-            
-            # Convert form data to DataFrame
-            records = []
-            for record in form_data:
-                record_dict = {
-                    'id': record[0],
-                    'created_at': record[1],
-                }
-                # Add the dynamic field values
-                for i, field in enumerate(form_fields, start=2):
-                    if i < len(record):
-                        record_dict[field] = record[i]
-                records.append(record_dict)
-            
-            df = pd.DataFrame(records)
-            
-            # Generate analysis
-            analysis_results = self._analyze_dataframe(df)
+
+            # Aggregated in SQL against the form table; no records are loaded
+            analysis_results = analyze_form(form.name)
             
             return JsonResponse({
                 'success': True,
@@ -1637,34 +1529,30 @@ class AnalysisView(View):
         }
         
         # Add summary statistics for numeric columns
+        profile = profile_dataframe(df)
         for column in df.columns:
             # Skip ID and date columns
             if column.lower() in ['id', 'created_at']:
                 continue
                 
+            stats = profile['columns'][str(column)]
             # Check if column is numeric
-            if pd.api.types.is_numeric_dtype(df[column]):
+            if stats['kind'] == 'numeric':
                 analysis['summary'][column] = {
-                    'mean': float(df[column].mean()) if not pd.isna(df[column].mean()) else 0,
-                    'median': float(df[column].median()) if not pd.isna(df[column].median()) else 0,
-                    'min': float(df[column].min()) if not pd.isna(df[column].min()) else 0,
-                    'max': float(df[column].max()) if not pd.isna(df[column].max()) else 0,
-                    'std': float(df[column].std()) if not pd.isna(df[column].std()) else 0
+                    key: stats[key] if stats[key] is not None else 0
+                    for key in ('mean', 'median', 'min', 'max', 'std')
                 }
             else:
-                # For categorical columns, count unique values
-                value_counts = df[column].value_counts().to_dict()
-                # Convert any non-serializable keys to strings
-                clean_counts = {str(k): int(v) for k, v in value_counts.items()}
+                # For categorical columns, report the most frequent values
                 analysis['summary'][column] = {
-                    'unique_values': len(clean_counts),
-                    'top_values': clean_counts
+                    'unique_values': stats['unique_count'],
+                    'top_values': {str(label): count for label, count in stats['top_values']}
                 }
         
         # Calculate correlations between numeric columns
         numeric_cols = df.select_dtypes(include=['number']).columns
         if len(numeric_cols) > 1:
-            corr_matrix = df[numeric_cols].corr().to_dict()
+            corr_matrix = compute_correlation(df, numeric_cols).to_frame().to_dict()
             # Clean up correlation matrix for JSON serialization
             for col1, values in corr_matrix.items():
                 analysis['correlations'][col1] = {str(col2): float(val) for col2, val in values.items()}
@@ -1739,23 +1627,12 @@ def analyze_form_view(request):
         try:
             form = CustomForm.objects.get(id=form_id)
             form_name = form.name
-            form_data = get_form(form_name)
-            form_fields = get_form_fields(form_name)
-
-            # Convert to DataFrame
-            records = []
-            for record in form_data:
-                record_dict = {}
-                for i, field in enumerate(form_fields, start=2):
-                    if i < len(record):
-                        record_dict[field] = record[i]
-                records.append(record_dict)
-
-            df = pd.DataFrame(records)
-
-            # Store in session like in analyze_csv
-            request.session['csv_data'] = df.to_json(orient='split')
-            request.session['filename'] = form_name
+
+            # The analysis page draws charts from the records, so they are loaded here
+            df, _ = optimize_dataframe(read_form_frame(form_name), form_name)
+
+            # Store the dataset like in analyze_csv
+            store_session_dataset(request, df, form_name)
             request.session['images_pending'] = True
             request.session.modified = True
 